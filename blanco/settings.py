@@ -171,6 +171,64 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Durée de conservation des clés d'idempotence des ventes (heures)
+SALE_IDEMPOTENCY_TTL_HOURS = config("SALE_IDEMPOTENCY_TTL_HOURS", default=24, cast=int)
+
+# Numéros réservés par processus pour les références d'écritures et factures
+# (1 = numérotation strictement continue ; > 1 = moins de contention, trous possibles)
+REFERENCE_SEQUENCE_BLOCK_SIZE = config("REFERENCE_SEQUENCE_BLOCK_SIZE", default=1, cast=int)
+
+# Nombre de fiches produit sérialisées gardées en mémoire par worker (scan caisse)
+PRODUCT_PAYLOAD_CACHE_SIZE = config("PRODUCT_PAYLOAD_CACHE_SIZE", default=2048, cast=int)
+
+# Marge (secondes) de la synchronisation incrémentale du catalogue, retranchée au début de la plus
+# ancienne transaction d'écriture en cours. Sans accès à INNODB_TRX (SQLite, droit PROCESS manquant
+# sous MySQL), elle doit dépasser la plus longue transaction d'écriture du catalogue (imports en masse)
+CATALOG_SYNC_LAG_SECONDS = config("CATALOG_SYNC_LAG_SECONDS", default=2, cast=int)
+
+# TVA différée à la clôture du Daily : taille des lots de ventes passés ensemble,
+# et écriture unique pour toute la journée (True) au lieu d'une écriture par vente
+DEFERRED_TVA_BATCH_SIZE = config("DEFERRED_TVA_BATCH_SIZE", default=500, cast=int)
+DEFERRED_TVA_CONSOLIDATED = config("DEFERRED_TVA_CONSOLIDATED", default=False, cast=bool)
+
+# Intervalle (secondes) de vérification de la version du plan comptable en cache par worker
+CHART_CACHE_CHECK_SECONDS = config("CHART_CACHE_CHECK_SECONDS", default=5, cast=int)
+
+# Rapprochement bancaire automatique : écart de dates toléré (jours) entre relevé
+# et écriture, et confiance minimale (0-100) pour appliquer une paire
+BANK_MATCH_DATE_WINDOW_DAYS = config("BANK_MATCH_DATE_WINDOW_DAYS", default=5, cast=int)
+BANK_MATCH_MIN_CONFIDENCE = config("BANK_MATCH_MIN_CONFIDENCE", default=60, cast=int)
+
+# Durée (secondes) de conservation par worker des indicateurs de la page Statistiques
+# (invalidés de toute façon à chaque vente, approvisionnement ou inventaire)
+STATISTICS_CACHE_TTL_SECONDS = config("STATISTICS_CACHE_TTL_SECONDS", default=60, cast=int)
+
+# Cache des rapports financiers (compte de résultat, bilan, balance âgée, marges, TVA) :
+# 'locmem' (par worker), 'file' (partagé entre workers, REPORT_CACHE_LOCATION = répertoire),
+# 'redis' (REPORT_CACHE_LOCATION = redis://…, paquet `redis` requis) ou chemin d'un backend Django
+REPORT_CACHE_BACKEND = config("REPORT_CACHE_BACKEND", default="locmem")
+REPORT_CACHE_LOCATION = config("REPORT_CACHE_LOCATION", default="")
+REPORT_CACHE_TIMEOUT_SECONDS = config("REPORT_CACHE_TIMEOUT_SECONDS", default=3600, cast=int)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': {
+            'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+            'redis': 'django.core.cache.backends.redis.RedisCache',
+        }.get(REPORT_CACHE_BACKEND, REPORT_CACHE_BACKEND),
+        'LOCATION': REPORT_CACHE_LOCATION or {
+            'file': os.path.join(BASE_DIR, 'cache', 'reports'),
+            'redis': 'redis://127.0.0.1:6379/1',
+        }.get(REPORT_CACHE_BACKEND, 'blanco-reports'),
+        'TIMEOUT': REPORT_CACHE_TIMEOUT_SECONDS,
+        'KEY_PREFIX': 'blanco',
+    },
+}
+
 # Login URL
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -20,7 +20,9 @@ from .models import (
     # Phase 2 — Paiements & Factures
     Payment, SupplierPayment, Invoice,
     # Phase 4 — TVA, Rapprochement, Clôture
-    TaxRate, BankStatement, ExerciseClosing,
+    TaxRate, BankStatement, BankReconciliationRun, ExerciseClosing,
+    # Outbox comptable
+    AccountingOutbox,
     # Settings models
     SystemSettings, AppModule,
 )
@@ -393,6 +395,13 @@ class BankStatementAdmin(admin.ModelAdmin):
     ordering = ('-statement_date',)
 
 
+@admin.register(BankReconciliationRun)
+class BankReconciliationRunAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'account', 'matched_count', 'min_confidence', 'created_by', 'undone_at')
+    list_filter = ('account', 'undone_at')
+    ordering = ('-created_at',)
+
+
 @admin.register(ExerciseClosing)
 class ExerciseClosingAdmin(admin.ModelAdmin):
     list_display = ('exercise', 'closed_at', 'closed_by', 'result_amount', 'new_exercise')
@@ -401,6 +410,14 @@ class ExerciseClosingAdmin(admin.ModelAdmin):
     ordering = ('-closed_at',)
 
 
+@admin.register(AccountingOutbox)
+class AccountingOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'status', 'attempts', 'next_attempt_at', 'create_at', 'processed_at')
+    list_filter = ('event_type', 'status')
+    search_fields = ('last_error',)
+    ordering = ('-id',)
+
+
 # Phase 5 — Modules applicatifs
 @admin.register(AppModule)
 class AppModuleAdmin(admin.ModelAdmin):
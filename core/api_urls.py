@@ -30,6 +30,8 @@ urlpatterns = [
     # ── Products ───────────────────────────────────────────────────
     # Flask: GET /get_product_list/<page>/<count>
     path('products/list/', product_views.get_product_list, name='product_list'),
+    # Synchronisation incrémentale du catalogue (terminaux mobiles)
+    path('products/changes/', product_views.get_catalog_changes, name='catalog_changes'),
     # Flask: GET /search_product
     path('products/search/', product_views.search_products, name='search_products'),
     # Flask: GET /get_product_by_id/<product_id>
@@ -61,6 +63,8 @@ urlpatterns = [
     # Flask: POST /sale
     path('sales/', sale_views.create_sale, name='create_sale'),
     path('sales/create/', sale_views.create_sale, name='create_sale'),
+    # Synchronisation par lot des ventes enregistrées hors-ligne
+    path('sales/batch/', sale_views.create_sales_batch, name='create_sales_batch'),
     # Recherche de ventes
     path('sales/search/', sale_views.search_sales, name='search_sales'),
     # Détails d'une vente
@@ -8,6 +8,7 @@ Correspond aux anciens endpoints Flask:
   - GET  /get_product_by_name/<product_name>
   - GET  /image/<folder>/<image>
   - POST /create_product
+Ainsi que le flux de synchronisation incrémentale du catalogue (GET /api/products/changes/).
 """
 
 import mimetypes
@@ -25,6 +26,8 @@ from core.serializers.product_serializers import (
     ProductUpdateSerializer,
 )
 from core.services.product_service import ProductService
+from core.services.product_cache_service import ProductCacheService
+from core.services.catalog_sync_service import CatalogSyncService, InvalidSyncCursor
 from core.services.daily_service import DailyService
 
 
@@ -34,7 +37,21 @@ def get_product_list(request):
     """
     Liste paginée des produits.
     Ancien Flask: GET /get_product_list/<page>/<count>
-    """
+    Avec le paramètre `cursor` (vide pour la première page), pagination par
+    curseur : {'results', 'next_cursor', 'has_next'}, sans OFFSET.
+    """
+    if 'cursor' in request.GET:
+        try:
+            count = min(max(int(request.GET.get('count', 20)), 1), 500)
+            page = ProductService.get_product_page(cursor=request.GET.get('cursor'), count=count)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'results': ProductListSerializer(page.object_list, many=True).data,
+            'next_cursor': page.next_cursor,
+            'has_next': page.has_next,
+        })
+
     page = int(request.GET.get('page', 0))
     count = int(request.GET.get('count', 20))
     print(f"get_product_list: page={page}, count={count}")
@@ -43,6 +60,23 @@ def get_product_list(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_catalog_changes(request):
+    """
+    Modifications du catalogue depuis le curseur de la dernière synchronisation.
+    GET /api/products/changes/?cursor=...&limit=500
+    Sans curseur : catalogue complet (première installation). Rappeler avec le
+    curseur renvoyé tant que `has_more` est vrai.
+    """
+    try:
+        limit = int(request.GET.get('limit', CatalogSyncService.DEFAULT_LIMIT))
+        changes = CatalogSyncService.get_changes(cursor=request.GET.get('cursor'), limit=limit)
+    except (InvalidSyncCursor, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(changes)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def search_products(request):
@@ -71,11 +105,10 @@ def get_product_by_id(request, product_id):
     Détails d'un produit par ID.
     Ancien Flask: GET /get_product_by_id/<product_id>
     """
-    product = ProductService.get_by_id(product_id)
-    if not product:
+    payload = ProductCacheService.get_payload(request, product_id=product_id)
+    if payload is None:
         return Response(None, status=status.HTTP_404_NOT_FOUND)
-    serializer = ProductDetailSerializer(product, context={'request': request})
-    return Response(serializer.data)
+    return Response(payload)
 
 
 @api_view(['GET'])
@@ -85,16 +118,7 @@ def get_product_by_code(request, product_code):
     Détails d'un produit par code.
     Ancien Flask: GET /get_product_by_code/<product_code>
     """
-    product = ProductService.get_by_code(product_code)
-    if not product:
-        return Response(None)
-
-    return_all = request.GET.get('return_all', '0')
-    if return_all == '1':
-        serializer = ProductDetailSerializer(product, context={'request': request})
-    else:
-        serializer = ProductDetailSerializer(product, context={'request': request})
-    return Response(serializer.data)
+    return Response(ProductCacheService.get_payload(request, code=product_code))
 
 
 @api_view(['GET'])
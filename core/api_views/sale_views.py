@@ -3,6 +3,9 @@ Vues pour la gestion des ventes.
 Correspond à l'ancien endpoint Flask: POST /sale
 """
 
+import uuid
+
+from django.db import IntegrityError, transaction
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
@@ -11,6 +14,13 @@ from rest_framework.response import Response
 from core.serializers.sale_serializers import SaleCreateSerializer, SaleSerializer
 from core.services.sale_service import SaleService
 
+# Synchronisation hors-ligne : nombre maximal de ventes par requête et
+# nombre de ventes traitées par transaction
+SALE_BATCH_MAX_SIZE = 500
+SALE_BATCH_CHUNK_SIZE = 25
+# Longueur maximale d'une clé d'idempotence (SaleIdempotencyKey.key)
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -18,20 +28,57 @@ def create_sale(request):
     """
     Créer une vente.
     Ancien Flask: POST /sale
+
+    Idempotence : le client peut fournir une clé (en-tête « Idempotency-Key »
+    ou champ « idempotency_key »). Une requête rejouée avec la même clé
+    renvoie la vente d'origine sans repasser par le chemin d'écriture.
     """
+    body = request.data if isinstance(request.data, dict) else {}
+    idempotency_key = request.headers.get('Idempotency-Key') or body.get('idempotency_key') or ''
+    if not isinstance(idempotency_key, str):
+        return Response({
+            'status': 0,
+            'error': "La clé d'idempotence doit être une chaîne de caractères.",
+        }, status=status.HTTP_400_BAD_REQUEST)
+    idempotency_key = idempotency_key.strip()
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return Response({
+            'status': 0,
+            'error': f"La clé d'idempotence ne peut pas dépasser {IDEMPOTENCY_KEY_MAX_LENGTH} caractères.",
+        }, status=status.HTTP_400_BAD_REQUEST)
+    request_hash = SaleService.compute_request_hash(body) if idempotency_key else ''
+
+    if idempotency_key:
+        replayed_response = _idempotent_response(idempotency_key, request.user, request_hash)
+        if replayed_response:
+            return replayed_response
+
     serializer = SaleCreateSerializer(data=request.data)
     if serializer.is_valid():
         try:
             sale = SaleService.create_sale(
                 validated_data=serializer.validated_data,
                 staff=request.user,
+                idempotency_key=idempotency_key or None,
+                request_hash=request_hash,
             )
+            # Recharger avec les lignes préchargées : la sérialisation reste
+            # en nombre de requêtes constant quelle que soit la taille du panier
+            sale = SaleService.get_by_id(sale.id)
             sale_data = SaleSerializer(sale).data
             return Response({
                 'status': 1,
                 'message': 'Vente créée avec succès',
                 'sale': sale_data,
             }, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            # Requête concurrente avec la même clé : elle a gagné, on renvoie sa vente
+            if not idempotency_key:
+                raise
+            return _idempotent_response(idempotency_key, request.user, request_hash) or Response({
+                'status': 0,
+                'error': "Vente en cours d'enregistrement, veuillez réessayer.",
+            }, status=status.HTTP_409_CONFLICT)
         except ValueError as e:
             return Response({
                 'status': 0,
@@ -44,6 +91,118 @@ def create_sale(request):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _idempotent_response(idempotency_key, staff, request_hash):
+    """
+    Réponse pour une clé d'idempotence déjà utilisée, ou None si la clé est libre.
+    """
+    try:
+        sale = SaleService.find_replayed_sale(idempotency_key, staff, request_hash)
+    except ValueError as e:
+        return Response({
+            'status': 0,
+            'error': str(e),
+        }, status=status.HTTP_409_CONFLICT)
+    if sale is None:
+        return None
+    response = Response({
+        'status': 1,
+        'message': 'Vente déjà enregistrée',
+        'replayed': True,
+        'sale': SaleSerializer(sale).data,
+    }, status=status.HTTP_200_OK)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_sales_batch(request):
+    """
+    Synchronise un lot ordonné de ventes enregistrées hors-ligne.
+    Corps : {"sales": [{"client_uuid": "<uuid>", "items": [...], ...}, ...]}
+
+    Chaque vente est validée comme dans create_sale (SaleCreateSerializer).
+    Les ventes sont traitées par blocs de SALE_BATCH_CHUNK_SIZE dans une
+    transaction, chaque vente dans son propre point de sauvegarde : un conflit
+    (stock insuffisant, produit supprimé...) est signalé pour cette vente sans
+    interrompre le lot. Le client_uuid sert de clé d'idempotence, un lot
+    renvoyé après une coupure ne crée donc aucun doublon.
+    """
+    sales_data = request.data.get('sales')
+    if not isinstance(sales_data, list) or not sales_data:
+        return Response({
+            'status': 0,
+            'error': "Le champ « sales » doit être une liste non vide.",
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(sales_data) > SALE_BATCH_MAX_SIZE:
+        return Response({
+            'status': 0,
+            'error': f"Un lot ne peut pas dépasser {SALE_BATCH_MAX_SIZE} ventes.",
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    results = []
+    for start in range(0, len(sales_data), SALE_BATCH_CHUNK_SIZE):
+        with transaction.atomic():
+            for sale_data in sales_data[start:start + SALE_BATCH_CHUNK_SIZE]:
+                results.append(_sync_batch_sale(sale_data, request.user))
+
+    summary = {
+        result_status: sum(1 for result in results if result['status'] == result_status)
+        for result_status in ('created', 'replayed', 'error')
+    }
+    return Response({
+        'status': 1,
+        'summary': summary,
+        'results': results,
+    }, status=status.HTTP_200_OK)
+
+
+def _sync_batch_sale(sale_data, staff):
+    """Traite une vente d'un lot et retourne son résultat individuel."""
+    client_uuid = sale_data.get('client_uuid') if isinstance(sale_data, dict) else None
+    try:
+        client_uuid = str(uuid.UUID(str(client_uuid)))
+    except ValueError:
+        return {
+            'client_uuid': client_uuid,
+            'status': 'error',
+            'errors': {'client_uuid': "Identifiant UUID client invalide ou manquant."},
+        }
+
+    request_hash = SaleService.compute_request_hash(sale_data)
+    try:
+        sale = SaleService.find_replayed_sale(client_uuid, staff, request_hash)
+    except ValueError as e:
+        return {'client_uuid': client_uuid, 'status': 'error', 'errors': {'client_uuid': str(e)}}
+    if sale:
+        return _batch_sale_result(client_uuid, 'replayed', sale)
+
+    serializer = SaleCreateSerializer(data=sale_data)
+    if not serializer.is_valid():
+        return {'client_uuid': client_uuid, 'status': 'error', 'errors': serializer.errors}
+
+    try:
+        sale = SaleService.create_sale(
+            validated_data=serializer.validated_data,
+            staff=staff,
+            idempotency_key=client_uuid,
+            request_hash=request_hash,
+        )
+    except (ValueError, IntegrityError) as e:
+        return {'client_uuid': client_uuid, 'status': 'error', 'errors': {'non_field_errors': str(e)}}
+    return _batch_sale_result(client_uuid, 'created', sale)
+
+
+def _batch_sale_result(client_uuid, result_status, sale):
+    return {
+        'client_uuid': client_uuid,
+        'status': result_status,
+        'sale_id': sale.id,
+        'total': str(sale.total),
+        'create_at': sale.create_at.isoformat(),
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def search_sales(request):
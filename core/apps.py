@@ -9,10 +9,30 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         """
-        Génère le QR code du serveur au démarrage.
+        Branche la création de l'index de recherche produits et le remplissage
+        initial des soldes de comptes, des marges produits, des faits
+        statistiques, des compteurs de journée et des empreintes de relevés
+        bancaires après `migrate`, les signaux d'invalidation de cache et de
+        soldes, puis génère le QR code du serveur au démarrage.
         On évite la double exécution en ne lançant que dans le processus principal
         (pas dans le reloader de runserver).
         """
+        from django.db.models.signals import post_migrate
+        from core.services.account_balance_service import ensure_account_balances
+        from core.services.bank_statement_import_service import ensure_bank_statement_hashes
+        from core.services.daily_counters_service import ensure_daily_counters
+        from core.services.daily_fact_service import ensure_daily_facts
+        from core.services.product_margin_service import ensure_product_margins
+        from core.services.product_search_service import ensure_product_search_index
+
+        post_migrate.connect(ensure_product_search_index, sender=self)
+        post_migrate.connect(ensure_account_balances, sender=self)
+        post_migrate.connect(ensure_bank_statement_hashes, sender=self)
+        post_migrate.connect(ensure_product_margins, sender=self)
+        post_migrate.connect(ensure_daily_facts, sender=self)
+        post_migrate.connect(ensure_daily_counters, sender=self)
+        import core.signals  # noqa: F401  (invalidation des caches, soldes de comptes)
+
         # En mode runserver, Django lance 2 processus : le reloader et le serveur.
         # RUN_MAIN='true' indique qu'on est dans le processus fils (le vrai serveur).
         # En production (gunicorn, etc.), RUN_MAIN n'existe pas, donc on exécute aussi.
@@ -0,0 +1,55 @@
+"""
+Contrôle l'intégrité du journal : écritures déséquilibrées, lignes orphelines,
+écritures rattachées à une vente ou un approvisionnement annulé sans
+contrepassation complète. Rapport JSON sur la sortie standard ou dans un fichier.
+Usage : python manage.py check_journal_integrity [--exercise ID] [--chunk-size N] [--output FICHIER] [--strict]
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.models import Exercise
+from core.services.journal_integrity_service import JournalIntegrityService
+
+
+class Command(BaseCommand):
+    help = "Contrôle l'intégrité du journal comptable (requêtes groupées, par tranches)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, help="Limiter le contrôle à un exercice")
+        parser.add_argument('--chunk-size', type=int, help="Taille des tranches d'ids (défaut : 50000)")
+        parser.add_argument('--max-items', type=int, help="Anomalies détaillées par contrôle (défaut : 1000)")
+        parser.add_argument('--output', help="Écrire le rapport JSON dans ce fichier")
+        parser.add_argument('--strict', action='store_true', help="Échouer (code de sortie non nul) en cas d'anomalie")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size doit être strictement positif.")
+        if options['max_items'] is not None and options['max_items'] < 0:
+            raise CommandError("--max-items doit être positif.")
+        exercise = None
+        if options['exercise']:
+            exercise = Exercise.objects.filter(pk=options['exercise']).first()
+            if exercise is None:
+                raise CommandError(f"Exercice {options['exercise']} introuvable.")
+
+        report = JournalIntegrityService(
+            exercise, chunk_size=options['chunk_size'], max_items=options['max_items'],
+        ).run()
+        payload = json.dumps(report, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                handle.write(payload)
+            summary = ', '.join(f"{name} : {check['count']}" for name, check in report['checks'].items())
+            self.stdout.write(f"{summary} ({report['duration_ms']} ms, {report['queries']} requêtes)")
+        else:
+            self.stdout.write(payload)
+
+        if report['is_clean']:
+            self.stderr.write(self.style.SUCCESS("Journal intègre."))
+        elif options['strict']:
+            raise CommandError(f"{report['anomalies']} anomalie(s) détectée(s) dans le journal.")
+        else:
+            self.stderr.write(self.style.WARNING(f"{report['anomalies']} anomalie(s) détectée(s)."))
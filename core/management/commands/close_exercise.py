@@ -0,0 +1,49 @@
+"""
+Clôture l'exercice en cours et ouvre le suivant, avec suivi de progression.
+Reprend une clôture interrompue avant l'écriture d'ouverture.
+Usage : python manage.py close_exercise [--exercise ID] [--dry-run]
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Exercise
+from core.services.accounting_outbox_service import AccountingOutboxService
+from core.services.excercise_service import ExerciseService
+from core.services.exercise_closing_service import ExerciseClosingService
+
+
+class Command(BaseCommand):
+    help = "Clôture l'exercice comptable et ouvre le suivant (report à nouveau)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, help="Exercice à clôturer (défaut : exercice en cours)")
+        parser.add_argument('--dry-run', action='store_true', help="Afficher l'écriture de clôture sans l'enregistrer")
+
+    def handle(self, *args, **options):
+        if options['exercise']:
+            exercise = Exercise.objects.filter(pk=options['exercise']).first()
+            if exercise is None:
+                raise CommandError(f"Exercice {options['exercise']} introuvable.")
+        else:
+            pending = ExerciseClosingService.get_pending_closing()
+            exercise = pending.exercise if pending else ExerciseService.get_or_create_current_exercise()
+
+        if options['dry_run']:
+            self.stdout.write(json.dumps(ExerciseClosingService.preview(exercise), ensure_ascii=False, indent=2))
+            return
+
+        def progress(step, total, message):
+            self.stdout.write(f"[{step}/{total}] {message}")
+
+        AccountingOutboxService.process_pending()
+        try:
+            AccountingOutboxService.ensure_exercise_posted(exercise)
+            closing, new_exercise = ExerciseClosingService.close_and_open(exercise, progress=progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Exercice {closing.exercise} clôturé (résultat : {closing.result_amount} FCFA), "
+            f"exercice {new_exercise} ouvert."
+        ))
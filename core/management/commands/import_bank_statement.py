@@ -0,0 +1,38 @@
+"""
+Importe un relevé bancaire CSV ou OFX, en flux, sans doublons.
+Usage : python manage.py import_bank_statement FICHIER [--account 521] [--format csv|ofx] [--encoding utf-8-sig]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Account
+from core.services.bank_statement_import_service import BankStatementImportService
+
+
+class Command(BaseCommand):
+    help = "Importe un relevé bancaire (CSV ou OFX) en ignorant les opérations déjà importées."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier du relevé")
+        parser.add_argument('--account', default='521', help="Code du compte bancaire (défaut : 521)")
+        parser.add_argument('--format', choices=['csv', 'ofx'], help="Format (déduit de l'extension par défaut)")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Encodage du fichier (défaut : utf-8-sig)")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as handle:
+                result = BankStatementImportService.import_file(
+                    options['account'], handle, options['path'],
+                    file_format=options['format'], encoding=options['encoding'],
+                )
+        except OSError as e:
+            raise CommandError(f"Lecture du fichier impossible : {e}")
+        except (ValueError, Account.DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['imported']} opération(s) importée(s), {result['duplicates']} doublon(s) ignoré(s), "
+            f"{result['error_count']} ligne(s) rejetée(s)."
+        ))
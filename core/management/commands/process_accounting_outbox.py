@@ -0,0 +1,44 @@
+"""
+Génère les écritures comptables en attente dans l'outbox.
+Usage : python manage.py process_accounting_outbox [--loop] [--interval 5]
+                                                   [--batch-size 50] [--retry-failed] [--status]
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.accounting_outbox_service import AccountingOutboxService
+
+
+class Command(BaseCommand):
+    help = "Génère les écritures comptables en attente dans l'outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Traiter en continu (mode worker).")
+        parser.add_argument('--interval', type=float, default=5, help="Pause en secondes quand la file est vide.")
+        parser.add_argument('--batch-size', type=int, default=AccountingOutboxService.BATCH_SIZE,
+                            help="Nombre d'événements traités par lot.")
+        parser.add_argument('--retry-failed', action='store_true', help="Remettre en file les événements en échec.")
+        parser.add_argument('--status', action='store_true', help="Afficher l'état de l'outbox (JSON) et quitter.")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.stdout.write(json.dumps(AccountingOutboxService.get_status(), default=str))
+            return
+
+        if options['retry_failed']:
+            count = AccountingOutboxService.retry_failed()
+            self.stdout.write(f"{count} événement(s) en échec remis en file.")
+
+        while True:
+            result = AccountingOutboxService.process_batch(batch_size=options['batch_size'])
+            if result['processed'] or result['failed']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{result['processed']} écriture(s) générée(s), {result['failed']} échec(s)."
+                ))
+            if not options['loop']:
+                break
+            if not result['processed'] and not result['failed']:
+                time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+"""
+Supprime les clés d'idempotence de vente expirées.
+Usage : python manage.py purge_sale_idempotency_keys
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import SaleIdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Supprime les clés d'idempotence de vente expirées."
+
+    def handle(self, *args, **options):
+        deleted = SaleIdempotencyKey.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} clé(s) d'idempotence expirée(s) supprimée(s)."))
@@ -0,0 +1,25 @@
+"""
+Reconstruit les soldes journaliers de comptes (AccountBalance) depuis le journal.
+Usage : python manage.py rebuild_account_balances [--exercise ID]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Exercise
+from core.services.account_balance_service import AccountBalanceService
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les soldes journaliers de comptes depuis les écritures validées."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, help="Limiter la reconstruction à un exercice")
+
+    def handle(self, *args, **options):
+        exercise = None
+        if options['exercise']:
+            exercise = Exercise.objects.filter(pk=options['exercise']).first()
+            if exercise is None:
+                raise CommandError(f"Exercice {options['exercise']} introuvable.")
+        written = AccountBalanceService.rebuild(exercise)
+        self.stdout.write(self.style.SUCCESS(f"Soldes de comptes reconstruits ({written} ligne(s))."))
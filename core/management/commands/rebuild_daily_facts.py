@@ -0,0 +1,32 @@
+"""
+Reconstruit la table de faits des statistiques (DailyFact) depuis les ventes,
+approvisionnements, dépenses et recettes, ou la rapproche sur une période.
+Usage : python manage.py rebuild_daily_facts [--from AAAA-MM-JJ] [--to AAAA-MM-JJ]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.services.daily_fact_service import DailyFactService
+
+
+class Command(BaseCommand):
+    help = "Reconstruit (ou rapproche sur une période) les faits statistiques journaliers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="Premier jour à rapprocher (AAAA-MM-JJ)")
+        parser.add_argument('--to', dest='date_to', help="Dernier jour à rapprocher (AAAA-MM-JJ)")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('date_from', 'date_to'):
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if dates[name] is None:
+                    raise CommandError(f"Date invalide : {options[name]}")
+        if not dates:
+            written = DailyFactService.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Faits statistiques reconstruits ({written} ligne(s))."))
+            return
+        corrected = DailyFactService.reconcile(**dates)
+        self.stdout.write(self.style.SUCCESS(f"Faits statistiques rapprochés ({corrected} ligne(s) corrigée(s))."))
@@ -0,0 +1,27 @@
+"""
+Reconstruit les marges journalières par produit (ProductDailyMargin) depuis les ventes.
+Usage : python manage.py rebuild_product_margins [--exercise ID]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Exercise
+from core.services.product_margin_service import ProductMarginService
+from core.services.report_cache_service import SALES_VERSION_KEY, ReportCacheService
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les marges journalières par produit depuis les lignes de vente actives."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, help="Limiter la reconstruction à un exercice")
+
+    def handle(self, *args, **options):
+        exercise = None
+        if options['exercise']:
+            exercise = Exercise.objects.filter(pk=options['exercise']).first()
+            if exercise is None:
+                raise CommandError(f"Exercice {options['exercise']} introuvable.")
+        written = ProductMarginService.rebuild(exercise)
+        ReportCacheService.invalidate(SALES_VERSION_KEY)
+        self.stdout.write(self.style.SUCCESS(f"Marges produits reconstruites ({written} ligne(s))."))
@@ -0,0 +1,16 @@
+"""
+Recalcule le texte de recherche des produits et reconstruit l'index plein texte.
+Usage : python manage.py rebuild_product_search_index
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.services.product_search_service import ProductSearchService
+
+
+class Command(BaseCommand):
+    help = "Recalcule le texte de recherche des produits et reconstruit l'index plein texte."
+
+    def handle(self, *args, **options):
+        updated = ProductSearchService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Index de recherche reconstruit ({updated} produit(s))."))
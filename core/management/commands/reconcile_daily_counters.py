@@ -0,0 +1,40 @@
+"""
+Rapproche les compteurs du tableau de bord (DailyCounters) des ventes,
+approvisionnements, dépenses et recettes, et corrige toute dérive.
+À planifier chaque nuit (cron) ; par défaut, les journées ouvertes et celles
+des deux derniers jours.
+Usage : python manage.py reconcile_daily_counters [--days N | --all]
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Daily
+from core.services.daily_counters_service import DailyCountersService
+
+
+class Command(BaseCommand):
+    help = "Vérifie et corrige les compteurs de journée du tableau de bord."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=2,
+            help="Journées commencées ou clôturées depuis N jours, en plus des journées ouvertes (défaut : 2)",
+        )
+        parser.add_argument('--all', action='store_true', help="Rapprocher toutes les journées")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            corrected = DailyCountersService.reconcile()
+        else:
+            if options['days'] < 0:
+                raise CommandError("--days doit être positif.")
+            since = timezone.now() - timedelta(days=options['days'])
+            daily_ids = Daily.objects.filter(
+                Q(end_date__isnull=True) | Q(start_date__gte=since) | Q(end_date__gte=since),
+            ).values_list('pk', flat=True)
+            corrected = DailyCountersService.reconcile(daily_ids)
+        self.stdout.write(self.style.SUCCESS(f"Compteurs de journée rapprochés ({corrected} journée(s) corrigée(s))."))
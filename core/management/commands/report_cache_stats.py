@@ -0,0 +1,31 @@
+"""
+Affiche le taux de succès du cache des rapports financiers, et le remet à zéro
+ou vide le cache à la demande.
+Usage : python manage.py report_cache_stats [--reset] [--clear]
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.services.report_cache_service import ReportCacheService
+
+
+class Command(BaseCommand):
+    help = "Taux de succès du cache des rapports financiers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Remettre les compteurs à zéro après affichage")
+        parser.add_argument('--clear', action='store_true', help="Vider le cache des rapports après affichage")
+
+    def handle(self, *args, **options):
+        stats = ReportCacheService.stats()
+        self.stdout.write(
+            f"Cache des rapports ({getattr(settings, 'REPORT_CACHE_BACKEND', 'locmem')}) : "
+            f"{stats['hits']} succès, {stats['misses']} échec(s), taux de succès {stats['hit_rate']} %"
+        )
+        if options['clear']:
+            ReportCacheService.clear()
+            self.stdout.write(self.style.SUCCESS("Cache des rapports vidé."))
+        elif options['reset']:
+            ReportCacheService.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Compteurs remis à zéro."))
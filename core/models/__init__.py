@@ -34,8 +34,11 @@ __all__ = [
     'SaleProduct',
     'SaleReturn',
     'SaleReturnLine',
+    'ProductDailyMargin',
+    'DailyFact',
     'CreditSale',
     'Refund',
+    'SaleIdempotencyKey',
 
     # Inventory models
     'Supply',
@@ -50,8 +53,10 @@ __all__ = [
     'Account',
     'JournalEntry',
     'JournalEntryLine',
+    'AccountBalance',
     'Exercise',
     'Daily',
+    'DailyCounters',
     'ExpenseType',
     'RecipeType',
     'DailyExpense',
@@ -64,10 +69,15 @@ __all__ = [
     'PAYMENT_METHOD_ACCOUNT_MAP',
     'TaxRate',
     'BankStatement',
+    'BankReconciliationRun',
+    'BankReconciliationMatch',
     'ExerciseClosing',
+    'AccountingOutbox',
+    'ReferenceSequence',
 
     # Settings models
     'SystemSettings',
     'AppModule',
+    'DataVersion',
 ]
 
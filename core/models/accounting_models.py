@@ -1,9 +1,11 @@
 """
 Accounting-related models: Exercise, Daily, ExpenseType, RecipeType, DailyExpense, DailyRecipe, ProductExpense,
-Account, JournalEntry, JournalEntryLine, Payment, SupplierPayment, Invoice.
+Account, JournalEntry, JournalEntryLine, AccountBalance, DailyCounters, Payment, SupplierPayment, Invoice,
+AccountingOutbox, ReferenceSequence.
 """
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.conf import settings
 
 from core.models.base_models import SoftDeleteModel
@@ -45,29 +47,15 @@ class Account(SoftDeleteModel):
     def __str__(self):
         return f"{self.code} - {self.name}"
 
-    def get_balance(self, exercise=None):
+    def get_balance(self, exercise=None, date_from=None, date_to=None):
         """
-        Calcule le solde du compte.
+        Calcule le solde du compte à partir des soldes journaliers (AccountBalance).
         Pour ACTIF/CHARGE : solde = total débits − total crédits
         Pour PASSIF/PRODUIT : solde = total crédits − total débits
         """
-        from django.db.models import Sum
+        from core.services.account_balance_service import AccountBalanceService
 
-        filters = {'entry__is_validated': True, 'account': self}
-        if exercise:
-            filters['entry__exercise'] = exercise
-
-        totals = JournalEntryLine.objects.filter(**filters).aggregate(
-            total_debit=Sum('debit'),
-            total_credit=Sum('credit'),
-        )
-        total_debit = totals['total_debit'] or 0
-        total_credit = totals['total_credit'] or 0
-
-        if self.account_type in ('ACTIF', 'CHARGE'):
-            return total_debit - total_credit
-        else:
-            return total_credit - total_debit
+        return AccountBalanceService.get_balance(self, exercise, date_from=date_from, date_to=date_to)
 
 
 class JournalEntry(SoftDeleteModel):
@@ -122,6 +110,20 @@ class JournalEntry(SoftDeleteModel):
         return self.lines.aggregate(total=Sum('debit'))['total'] or 0
 
 
+class JournalEntryLineQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Insère les lignes, reporte leurs montants dans AccountBalance et invalide les totaux du journal."""
+        from core.services.account_balance_service import AccountBalanceService
+        from core.services.journal_service import JournalService
+
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            AccountBalanceService.record_lines(created)
+            JournalService.invalidate()
+        return created
+
+
 class JournalEntryLine(SoftDeleteModel):
     """
     Ligne d'écriture comptable (débit OU crédit sur un compte).
@@ -132,6 +134,8 @@ class JournalEntryLine(SoftDeleteModel):
     credit = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Crédit")
     description = models.CharField(max_length=255, null=True, blank=True, verbose_name="Libellé ligne")
 
+    objects = JournalEntryLineQuerySet.as_manager()
+
     class Meta:
         db_table = 'journal_entry_line'
         verbose_name = "Ligne d'écriture"
@@ -144,6 +148,30 @@ class JournalEntryLine(SoftDeleteModel):
         return f"{self.account.code} — Crédit {self.credit}"
 
 
+class AccountBalance(models.Model):
+    """
+    Totaux débit/crédit des écritures validées, par compte, exercice et jour.
+    Tenu à jour à chaque passation d'écriture (voir AccountBalanceService) :
+    le solde d'un compte est la somme de quelques lignes journalières au lieu
+    d'une agrégation de toutes ses lignes d'écriture.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='daily_balances', verbose_name="Compte")
+    exercise = models.ForeignKey('Exercise', on_delete=models.CASCADE, related_name='account_balances', verbose_name="Exercice")
+    day = models.DateField(verbose_name="Jour")
+    debit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total débit")
+    credit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total crédit")
+
+    class Meta:
+        db_table = 'account_balance'
+        verbose_name = 'Solde journalier de compte'
+        verbose_name_plural = 'Soldes journaliers de comptes'
+        unique_together = [('account', 'exercise', 'day')]
+        indexes = [models.Index(fields=['exercise', 'day'], name='account_balance_ex_day_idx')]
+
+    def __str__(self):
+        return f"{self.account_id} {self.day} : D {self.debit} / C {self.credit}"
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Modèles existants
 # ──────────────────────────────────────────────────────────────────────────────
@@ -193,6 +221,35 @@ class Daily(SoftDeleteModel):
         return self.end_date is None
 
 
+class DailyCounters(models.Model):
+    """
+    Compteurs du tableau de bord pour une journée de caisse : chiffre
+    d'affaires, ventes, produits vendus, dépenses, recettes et
+    approvisionnements. Incrémentés par `F()` à chaque vente, annulation,
+    retour, approvisionnement, dépense ou recette (voir DailyCountersService) :
+    le tableau de bord lit une seule ligne au lieu de réagréger la journée.
+    """
+    daily = models.OneToOneField(Daily, on_delete=models.CASCADE, related_name='counters', verbose_name="Journée")
+    revenue = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Chiffre d'affaires")
+    sales_count = models.IntegerField(default=0, verbose_name="Nombre de ventes")
+    cancelled_sales_count = models.IntegerField(default=0, verbose_name="Ventes annulées")
+    products_sold = models.IntegerField(default=0, verbose_name="Produits vendus")
+    expenses_total = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total des dépenses")
+    recipes_total = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total des recettes")
+    supplies_count = models.IntegerField(default=0, verbose_name="Nombre d'approvisionnements")
+    supplies_total = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total des approvisionnements")
+    first_sale_at = models.DateTimeField(null=True, blank=True, verbose_name="Première vente")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'daily_counters'
+        verbose_name = 'Compteurs de journée'
+        verbose_name_plural = 'Compteurs de journées'
+
+    def __str__(self):
+        return f"Journée #{self.daily_id} : {self.sales_count} vente(s) — CA {self.revenue}"
+
+
 class ExpenseType(SoftDeleteModel):
     """
     Type of expense model.
@@ -443,17 +500,8 @@ class Invoice(SoftDeleteModel):
     @staticmethod
     def generate_invoice_number():
         """Génère un numéro de facture unique : FAC-YYYYMMDD-001"""
-        from datetime import date as date_cls
-        today = date_cls.today().strftime('%Y%m%d')
-        prefix = f"FAC-{today}"
-        last = Invoice.objects.filter(
-            invoice_number__startswith=prefix
-        ).order_by('-invoice_number').first()
-        if last:
-            seq = int(last.invoice_number.split('-')[-1]) + 1
-        else:
-            seq = 1
-        return f"{prefix}-{seq:03d}"
+        from core.services.sequence_service import SequenceService
+        return SequenceService.next_reference('FAC')
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -526,17 +574,90 @@ class BankStatement(SoftDeleteModel):
         related_name='reconciled_statements',
         verbose_name="Rapproché par"
     )
+    content_hash = models.CharField(
+        max_length=64, null=True, blank=True,
+        verbose_name="Empreinte de la ligne",
+        help_text="SHA-256 de (compte, date, type, montant, référence, rang) — détection des doublons à l'import"
+    )
 
     class Meta:
         db_table = 'bank_statement'
         verbose_name = 'Relevé bancaire'
         verbose_name_plural = 'Relevés bancaires'
         ordering = ['-statement_date', '-create_at']
+        indexes = [
+            models.Index(fields=['account', 'content_hash'], name='bank_statement_hash_idx'),
+        ]
 
     def __str__(self):
         return f"{self.statement_date} — {self.description} — {self.amount} FCFA"
 
 
+class BankReconciliationRun(models.Model):
+    """
+    Journal d'un rapprochement automatique : les paires appliquées ensemble,
+    pour pouvoir annuler l'opération en bloc.
+    """
+    account = models.ForeignKey(
+        Account, on_delete=models.CASCADE,
+        related_name='reconciliation_runs',
+        verbose_name="Compte bancaire"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date d'exécution")
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='reconciliation_runs',
+        verbose_name="Exécuté par"
+    )
+    matched_count = models.PositiveIntegerField(default=0, verbose_name="Lignes rapprochées")
+    min_confidence = models.PositiveSmallIntegerField(verbose_name="Confiance minimale (%)")
+    undone_at = models.DateTimeField(null=True, blank=True, verbose_name="Annulé le")
+    undone_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='undone_reconciliation_runs',
+        verbose_name="Annulé par"
+    )
+
+    class Meta:
+        db_table = 'bank_reconciliation_run'
+        verbose_name = 'Rapprochement automatique'
+        verbose_name_plural = 'Rapprochements automatiques'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Rapprochement {self.account.code} du {self.created_at:%d/%m/%Y %H:%M} ({self.matched_count} lignes)"
+
+
+class BankReconciliationMatch(models.Model):
+    """Paire (ligne de relevé, ligne d'écriture) appliquée par un rapprochement automatique."""
+    run = models.ForeignKey(
+        BankReconciliationRun, on_delete=models.CASCADE,
+        related_name='matches',
+        verbose_name="Rapprochement"
+    )
+    statement = models.ForeignKey(
+        BankStatement, on_delete=models.CASCADE,
+        related_name='reconciliation_matches',
+        verbose_name="Ligne de relevé"
+    )
+    entry_line = models.ForeignKey(
+        JournalEntryLine, on_delete=models.CASCADE,
+        related_name='reconciliation_matches',
+        verbose_name="Ligne d'écriture"
+    )
+    confidence = models.PositiveSmallIntegerField(verbose_name="Confiance (%)")
+
+    class Meta:
+        db_table = 'bank_reconciliation_match'
+        verbose_name = 'Paire rapprochée'
+        verbose_name_plural = 'Paires rapprochées'
+
+    def __str__(self):
+        return f"{self.statement_id} ↔ {self.entry_line_id} ({self.confidence} %)"
+
+
 class ExerciseClosing(SoftDeleteModel):
     """
     Historique de clôture d'exercice.
@@ -587,3 +708,96 @@ class ExerciseClosing(SoftDeleteModel):
     def __str__(self):
         return f"Clôture {self.exercise} — Résultat: {self.result_amount} FCFA"
 
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Outbox comptable — écritures à générer de façon asynchrone
+# ──────────────────────────────────────────────────────────────────────────────
+
+class AccountingOutbox(models.Model):
+    """
+    Événement comptable en attente de comptabilisation.
+    Écrit dans la même transaction que l'opération métier (vente, achat,
+    paiement), puis traité par le worker `process_accounting_outbox` qui crée
+    l'écriture avec reprise et délai exponentiel en cas d'échec.
+    """
+    EVENT_TYPE_CHOICES = [
+        ('SALE', 'Vente'),
+        ('SUPPLY', 'Approvisionnement'),
+        ('CREDIT_PAYMENT', 'Paiement crédit client'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'En attente'),
+        ('DONE', 'Comptabilisé'),
+        ('FAILED', 'En échec'),
+    ]
+
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES, verbose_name="Type d'événement")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="Statut")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Paramètres")
+    sale = models.ForeignKey('Sale', on_delete=models.CASCADE, null=True, blank=True, related_name='accounting_events', verbose_name="Vente")
+    supply = models.ForeignKey('Supply', on_delete=models.CASCADE, null=True, blank=True, related_name='accounting_events', verbose_name="Approvisionnement")
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, null=True, blank=True, related_name='accounting_events', verbose_name="Paiement")
+    daily = models.ForeignKey(Daily, on_delete=models.SET_NULL, null=True, blank=True, related_name='accounting_events', verbose_name="Journée")
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='accounting_events', verbose_name="Exercice")
+    journal_entry = models.ForeignKey(JournalEntry, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Écriture générée")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    next_attempt_at = models.DateTimeField(auto_now_add=True, verbose_name="Prochaine tentative")
+    last_error = models.TextField(null=True, blank=True, verbose_name="Dernière erreur")
+    create_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Comptabilisé le")
+
+    class Meta:
+        db_table = 'accounting_outbox'
+        verbose_name = 'Événement comptable en attente'
+        verbose_name_plural = 'Événements comptables en attente'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='acc_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_event_type_display()} #{self.id} ({self.get_status_display()})"
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Compteurs de numérotation (références d'écritures, numéros de facture)
+# ──────────────────────────────────────────────────────────────────────────────
+
+class ReferenceSequence(models.Model):
+    """
+    Dernier numéro attribué pour un journal (VE, AC, OD, FAC…) et un jour.
+    L'incrément est un UPDATE atomique sur une seule ligne indexée.
+    """
+    journal = models.CharField(max_length=10, verbose_name="Journal")
+    day = models.DateField(verbose_name="Jour")
+    last_value = models.PositiveIntegerField(default=0, verbose_name="Dernier numéro")
+
+    class Meta:
+        db_table = 'reference_sequence'
+        verbose_name = 'Compteur de numérotation'
+        verbose_name_plural = 'Compteurs de numérotation'
+        unique_together = [('journal', 'day')]
+
+    def __str__(self):
+        return f"{self.journal} {self.day} : {self.last_value}"
+
+    @classmethod
+    def allocate(cls, journal, day, count=1, initial=None):
+        """
+        Réserve `count` numéros consécutifs et retourne le premier.
+        `initial` (callable) fournit la valeur de départ lors de la création
+        du compteur, pour reprendre après une numérotation existante.
+        """
+        with transaction.atomic():
+            counter = cls.objects.filter(journal=journal, day=day)
+            if not counter.update(last_value=F('last_value') + count):
+                start = initial() if initial else 0
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(journal=journal, day=day, last_value=start + count)
+                    return start + 1
+                except IntegrityError:
+                    # Créé entre-temps par un autre processus
+                    counter.update(last_value=F('last_value') + count)
+            return counter.values_list('last_value', flat=True).get() - count + 1
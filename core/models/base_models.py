@@ -48,3 +48,20 @@ class SoftDeleteModel(models.Model):
         """Check if the object is soft deleted."""
         return self.delete_at is not None
 
+
+class SyncedSoftDeleteModel(SoftDeleteModel):
+    """
+    Abstract soft-delete model tracking its last modification (indexed),
+    used by the catalog delta sync ("changed since").
+    """
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # Un save partiel doit aussi dater la modification
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'updated_at'}
+        super().save(*args, **kwargs)
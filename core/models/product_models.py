@@ -1,12 +1,26 @@
 """
 Product-related models: Category, Gamme, Rayon, GrammageType, Product, ProductImage.
+All of them track `updated_at` for the catalog delta sync.
 """
 
+import re
+import unicodedata
+
 from django.db import models
-from .base_models import SoftDeleteModel
+from .base_models import SyncedSoftDeleteModel
+
+
+SEARCH_TEXT_FIELDS = ('code', 'name', 'brand')
+
+
+def normalize_search_text(text):
+    """Minuscules, sans accents, ponctuation remplacée par des espaces : 'Café-Crème' → 'cafe creme'."""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[\W_]+', ' ', text.lower()).split())
 
 
-class Category(SoftDeleteModel):
+class Category(SyncedSoftDeleteModel):
     """
     Product category model.
     """
@@ -23,7 +37,7 @@ class Category(SoftDeleteModel):
         return self.name
 
 
-class Gamme(SoftDeleteModel):
+class Gamme(SyncedSoftDeleteModel):
     """
     Product range/line model.
     """
@@ -40,7 +54,7 @@ class Gamme(SoftDeleteModel):
         return self.name
 
 
-class Rayon(SoftDeleteModel):
+class Rayon(SyncedSoftDeleteModel):
     """
     Product department/section model.
     """
@@ -57,7 +71,7 @@ class Rayon(SoftDeleteModel):
         return self.name
 
 
-class GrammageType(SoftDeleteModel):
+class GrammageType(SyncedSoftDeleteModel):
     """
     Grammage/Weight type model (e.g., kg, g, L, ml).
     """
@@ -74,7 +88,7 @@ class GrammageType(SoftDeleteModel):
         return self.name
 
 
-class Product(SoftDeleteModel):
+class Product(SyncedSoftDeleteModel):
     """
     Main product model.
     """
@@ -98,6 +112,9 @@ class Product(SoftDeleteModel):
     gamme = models.ForeignKey(Gamme, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Gamme", related_name='products', help_text="Gamme du produit")
     grammage_type = models.ForeignKey(GrammageType, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Type de grammage", related_name='products', help_text="Type de grammage du produit")
     rayon = models.ForeignKey(Rayon, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Rayon", related_name='products', help_text="Rayon du produit")
+
+    # Texte normalisé (code, nom, marque) indexé pour la recherche plein texte
+    search_text = models.CharField(max_length=800, blank=True, default='', editable=False)
     
     class Meta:
         db_table = 'product'
@@ -109,14 +126,42 @@ class Product(SoftDeleteModel):
     def __str__(self):
         return f"{self.code} - {self.name}"
     
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(SEARCH_TEXT_FIELDS):
+            kwargs['update_fields'] = set(update_fields) | {'search_text'}
+        super().save(*args, **kwargs)
+
+    def build_search_text(self):
+        """Texte indexé : code, nom et marque sans accents ni casse."""
+        return normalize_search_text(' '.join(
+            str(getattr(self, field)) for field in SEARCH_TEXT_FIELDS if getattr(self, field)
+        ))
+
     def is_low_stock(self):
         """Check if product stock is below the limit."""
         if self.stock_limit:
             return self.stock <= self.stock_limit
         return False
 
+    def check_sale_item(self, quantity, unit_price):
+        """
+        Vérifie qu'une ligne de vente (quantité, prix unitaire) est autorisée.
+        Retourne un dict {champ: message} vide si la ligne est valide.
+        """
+        if quantity > self.stock:
+            return {'quantity': f"Stock insuffisant. Disponible : {self.stock}"}
+        if self.max_salable_price and unit_price > self.max_salable_price:
+            return {'unit_price': f"Prix trop élevé. Maximum : {self.max_salable_price}"}
+        if (self.actual_price
+                and unit_price < self.actual_price
+                and not self.is_price_reducible):
+            return {'unit_price': "Le prix de ce produit ne peut pas être réduit."}
+        return {}
+
 
-class ProductImage(SoftDeleteModel):
+class ProductImage(SyncedSoftDeleteModel):
     """
     Product images model.
     """
@@ -1,9 +1,13 @@
 """
-Sale-related models: Sale, SaleProduct, SaleReturn, SaleReturnLine, CreditSale, Refund.
+Sale-related models: Sale, SaleProduct, SaleReturn, SaleReturnLine, CreditSale, Refund,
+SaleIdempotencyKey.
 """
 
+from datetime import timedelta
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 from core.models.base_models import SoftDeleteModel
 
@@ -64,6 +68,11 @@ class SaleProduct(SoftDeleteModel):
     product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='sale_products')
     quantity = models.IntegerField(default=1)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True,
+        verbose_name="Coût d'achat unitaire",
+        help_text="Prix d'achat du produit au moment de la vente"
+    )
     
     class Meta:
         db_table = 'sale_product'
@@ -117,6 +126,79 @@ class SaleReturnLine(SoftDeleteModel):
         return self.quantity * self.unit_price
 
 
+class ProductDailyMargin(models.Model):
+    """
+    Quantité vendue, chiffre d'affaires et coût d'achat par produit, exercice
+    et jour de vente. Tenu à jour à la vente, au retour et à l'annulation
+    (voir ProductMarginService) : la marge d'une période est la somme de
+    quelques lignes journalières.
+    """
+    product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='daily_margins', verbose_name="Produit")
+    exercise = models.ForeignKey('Exercise', on_delete=models.CASCADE, related_name='product_margins', verbose_name="Exercice")
+    day = models.DateField(verbose_name="Jour")
+    quantity = models.IntegerField(default=0, verbose_name="Quantité vendue")
+    revenue = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Chiffre d'affaires")
+    cost = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Coût d'achat")
+
+    class Meta:
+        db_table = 'product_daily_margin'
+        verbose_name = 'Marge journalière produit'
+        verbose_name_plural = 'Marges journalières produits'
+        unique_together = [('product', 'exercise', 'day')]
+        indexes = [models.Index(fields=['exercise', 'day'], name='product_margin_ex_day_idx')]
+
+    def __str__(self):
+        return f"{self.product_id} {self.day} : {self.quantity} — CA {self.revenue} / coût {self.cost}"
+
+
+class DailyFact(models.Model):
+    """
+    Table de faits des statistiques, pré-agrégée par jour × produit ×
+    personnel × client × type de paiement (comptant / crédit), plus le
+    fournisseur et le type de dépense ou de recette pour les mouvements qui en
+    ont. Tenue à jour à chaque écriture et rapprochée à la clôture de la
+    journée (voir DailyFactService) : les pages de statistiques sont des
+    sommes sur quelques lignes journalières.
+    """
+    KIND_SALE = 'SALE'
+    KIND_ITEM = 'ITEM'
+    KIND_SUPPLY = 'SUPPLY'
+    KIND_EXPENSE = 'EXPENSE'
+    KIND_RECIPE = 'RECIPE'
+    KIND_CHOICES = [
+        (KIND_SALE, 'Vente'),
+        (KIND_ITEM, 'Ligne de vente'),
+        (KIND_SUPPLY, 'Approvisionnement'),
+        (KIND_EXPENSE, 'Dépense'),
+        (KIND_RECIPE, 'Recette'),
+    ]
+
+    # Clé composite (type, jour, dimensions) : les dimensions nullables ne
+    # peuvent pas porter une contrainte d'unicité portable
+    key = models.CharField(max_length=150, unique=True, verbose_name="Clé")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Type de fait")
+    day = models.DateField(verbose_name="Jour")
+    product = models.ForeignKey('Product', on_delete=models.CASCADE, null=True, blank=True, related_name='daily_facts', verbose_name="Produit")
+    staff = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_facts', verbose_name="Personnel")
+    client = models.ForeignKey('Client', on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_facts', verbose_name="Client")
+    supplier = models.ForeignKey('Supplier', on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_facts', verbose_name="Fournisseur")
+    expense_type = models.ForeignKey('ExpenseType', on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_facts', verbose_name="Type de dépense")
+    recipe_type = models.ForeignKey('RecipeType', on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_facts', verbose_name="Type de recette")
+    is_credit = models.BooleanField(default=False, verbose_name="À crédit")
+    count = models.IntegerField(default=0, verbose_name="Nombre d'opérations")
+    quantity = models.IntegerField(default=0, verbose_name="Quantité")
+    amount = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Montant")
+
+    class Meta:
+        db_table = 'daily_fact'
+        verbose_name = 'Fait statistique journalier'
+        verbose_name_plural = 'Faits statistiques journaliers'
+        indexes = [models.Index(fields=['kind', 'day'], name='daily_fact_kind_day_idx')]
+
+    def __str__(self):
+        return f"{self.kind} {self.day} : {self.count} op. — {self.quantity} u. / {self.amount}"
+
+
 class CreditSale(SoftDeleteModel):
     """
     Credit sale model for tracking sales on credit.
@@ -158,3 +240,41 @@ class Refund(SoftDeleteModel):
     def __str__(self):
         return f"Remboursement {self.value} pour Vente #{self.sale.id}"
 
+
+
+class SaleIdempotencyKey(models.Model):
+    """
+    Clé d'idempotence fournie par un terminal de caisse (en-tête Idempotency-Key).
+    Associe la clé à la vente créée pour qu'une requête rejouée renvoie la vente
+    d'origine au lieu d'en créer une nouvelle. Les clés expirent après
+    SALE_IDEMPOTENCY_TTL_HOURS heures.
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name="Clé d'idempotence")
+    request_hash = models.CharField(max_length=64, verbose_name="Empreinte de la requête")
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='idempotency_keys', verbose_name="Vente")
+    staff = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name="Personnel")
+    create_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Expire le")
+
+    class Meta:
+        db_table = 'sale_idempotency_key'
+        verbose_name = "Clé d'idempotence de vente"
+        verbose_name_plural = "Clés d'idempotence de vente"
+
+    def __str__(self):
+        return f"{self.key} → Vente #{self.sale_id}"
+
+    @staticmethod
+    def compute_expiry():
+        """Date d'expiration d'une clé créée maintenant."""
+        ttl_hours = getattr(settings, 'SALE_IDEMPOTENCY_TTL_HOURS', 24)
+        return timezone.now() + timedelta(hours=ttl_hours)
+
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    @classmethod
+    def purge_expired(cls):
+        """Supprime les clés expirées. Retourne le nombre de clés supprimées."""
+        deleted, _ = cls.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
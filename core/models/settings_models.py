@@ -1,8 +1,10 @@
 """
 System settings model for storing configurable application parameters.
+Also holds DataVersion, the shared data-version counters used to invalidate caches.
 """
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -190,3 +192,47 @@ class SystemSettings(models.Model):
         """Empêcher la suppression de l'instance unique."""
         pass
 
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Versions de données — invalidation des caches entre processus (workers)
+# ──────────────────────────────────────────────────────────────────────────────
+
+class DataVersion(models.Model):
+    """
+    Compteur de version par domaine de données (catalogue, ventes, journal…).
+    Chaque écriture du domaine incrémente la version ; un cache dont la
+    version ne correspond plus est ignoré, quel que soit le worker.
+    """
+    key = models.CharField(max_length=50, primary_key=True, verbose_name="Domaine")
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Version")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Dernière modification")
+
+    class Meta:
+        verbose_name = "Version de données"
+        verbose_name_plural = "Versions de données"
+        db_table = "data_version"
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+    @classmethod
+    def current(cls, key):
+        """Version actuelle du domaine (0 si jamais modifié)."""
+        return cls.objects.filter(key=key).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, key):
+        """Incrémente la version du domaine (UPDATE atomique)."""
+        from django.utils import timezone
+        if cls.objects.filter(key=key).update(version=F('version') + 1, updated_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(key=key, version=1)
+        except IntegrityError:
+            cls.objects.filter(key=key).update(version=F('version') + 1, updated_at=timezone.now())
+
+    @classmethod
+    def bump_on_commit(cls, key):
+        """Incrémente la version une fois la transaction courante validée."""
+        transaction.on_commit(lambda: cls.bump(key))
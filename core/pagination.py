@@ -0,0 +1,213 @@
+"""
+Pagination par curseur (keyset) sur (create_at, id), ou sur (champ, id) pour
+un autre champ date/heure (annotation comprise).
+
+Contrairement au Paginator de Django, le coût d'une page ne dépend pas de sa
+profondeur : la page suivante est lue avec `WHERE (create_at, id) < (…)`
+au lieu d'un OFFSET, et le comptage total est optionnel (exact, plafonné
+ou absent). Utilisée par les vues d'historique HTML et par l'API DRF.
+"""
+
+import base64
+import json
+import math
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.http import urlencode
+
+
+class InvalidCursor(ValueError):
+    """Curseur de pagination illisible."""
+
+
+COUNT_EXACT = 'exact'
+COUNT_APPROXIMATE = 'approximate'
+COUNT_NONE = 'none'
+
+
+def encode_cursor(values, direction, number):
+    raw = json.dumps({'v': values, 'd': direction, 'n': number}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Retourne ((valeur du champ de tri, id), direction, numéro de page)."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        created, pk = data['v']
+        direction = data['d']
+        if direction not in ('next', 'previous'):
+            raise ValueError(direction)
+        return (datetime.fromisoformat(created), int(pk)), direction, max(int(data['n']), 1)
+    except (ValueError, TypeError, KeyError, AttributeError) as exc:
+        raise InvalidCursor("Curseur de pagination invalide.") from exc
+
+
+class KeysetPage:
+    """Une page de résultats, avec les curseurs vers les pages voisines."""
+
+    def __init__(self, object_list, number, per_page, has_next, has_previous,
+                 next_cursor, previous_cursor, count, count_is_approximate, base_params=None):
+        self.object_list = object_list
+        self.number = number
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_approximate = count_is_approximate
+        self.base_params = base_params or {}
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.per_page + 1
+
+    @property
+    def end_index(self):
+        return self.start_index + len(self.object_list) - 1 if self.object_list else 0
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(math.ceil(self.count / self.per_page), 1)
+
+    @property
+    def count_display(self):
+        if self.count is None:
+            return ''
+        return f"{self.count}+" if self.count_is_approximate else str(self.count)
+
+    @property
+    def num_pages_display(self):
+        if self.num_pages is None:
+            return ''
+        return f"{self.num_pages}+" if self.count_is_approximate else str(self.num_pages)
+
+    def _querystring(self, cursor=None):
+        params = dict(self.base_params)
+        if cursor:
+            params['cursor'] = cursor
+        return urlencode(params)
+
+    @property
+    def first_querystring(self):
+        return self._querystring()
+
+    @property
+    def next_querystring(self):
+        return self._querystring(self.next_cursor)
+
+    @property
+    def previous_querystring(self):
+        return self._querystring(self.previous_cursor)
+
+
+class KeysetPaginator:
+    """
+    Pagine un queryset trié par (order_field, id), décroissant par défaut.
+    `order_field` (create_at par défaut) est un champ date/heure non nul du
+    modèle ou une annotation du queryset.
+
+    count_mode :
+      - 'exact'       : COUNT(*) complet ;
+      - 'approximate' : COUNT(*) plafonné à `count_cap` lignes (affiché « N+ ») ;
+      - 'none'        : pas de comptage.
+    """
+
+    def __init__(self, queryset, per_page=20, descending=True,
+                 count_mode=COUNT_APPROXIMATE, count_cap=1000, order_field='create_at'):
+        self.queryset = queryset
+        self.order_field = order_field
+        self.per_page = per_page
+        self.descending = descending
+        self.count_mode = count_mode
+        self.count_cap = count_cap
+
+    def _ordered(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return self.queryset.order_by(f'{prefix}{self.order_field}', f'{prefix}id'), descending
+
+    def _after(self, position, descending):
+        value, pk = position
+        field = self.order_field
+        lookup = 'lt' if descending else 'gt'
+        return Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': pk})
+
+    def _position(self, obj):
+        return [getattr(obj, self.order_field).isoformat(), obj.pk]
+
+    def _count(self):
+        if self.count_mode == COUNT_NONE:
+            return None, False
+        if self.count_mode == COUNT_EXACT:
+            return self.queryset.order_by().count(), False
+        # Comptage borné : SELECT COUNT(*) FROM (… LIMIT cap + 1)
+        capped = self.queryset.order_by().values('pk')[:self.count_cap + 1].count()
+        if capped > self.count_cap:
+            return self.count_cap, True
+        return capped, False
+
+    def get_page(self, cursor=None, base_params=None):
+        """
+        Page désignée par `cursor` (première page si absent).
+        Lève InvalidCursor si le curseur est illisible.
+        """
+        position, direction, number = (None, 'next', 1)
+        if cursor:
+            position, direction, number = decode_cursor(cursor)
+
+        if direction == 'previous':
+            queryset, descending = self._ordered(reverse=True)
+            rows = list(queryset.filter(self._after(position, descending))[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            queryset, descending = self._ordered()
+            if position:
+                queryset = queryset.filter(self._after(position, descending))
+            rows = list(queryset[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = position is not None
+
+        if direction == 'previous' and not has_previous:
+            number = 1
+        next_cursor = encode_cursor(self._position(rows[-1]), 'next', number + 1) if rows and has_next else None
+        previous_cursor = (
+            encode_cursor(self._position(rows[0]), 'previous', number - 1) if rows and has_previous else None
+        )
+        count, approximate = self._count()
+        return KeysetPage(
+            rows, number, self.per_page, has_next, has_previous,
+            next_cursor, previous_cursor, count, approximate, base_params,
+        )
+
+
+def paginate_request(request, queryset, per_page=20, count_mode=COUNT_APPROXIMATE, **kwargs):
+    """
+    Raccourci pour les vues HTML : lit `?cursor=`, conserve les autres
+    paramètres GET dans les liens et revient à la première page si le
+    curseur est invalide.
+    """
+    base_params = {
+        key: value for key, value in request.GET.items()
+        if key not in ('cursor', 'page')
+    }
+    paginator = KeysetPaginator(queryset, per_page=per_page, count_mode=count_mode, **kwargs)
+    try:
+        return paginator.get_page(request.GET.get('cursor'), base_params=base_params)
+    except InvalidCursor:
+        return paginator.get_page(None, base_params=base_params)
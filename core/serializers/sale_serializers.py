@@ -60,36 +60,15 @@ class SaleSerializer(serializers.ModelSerializer):
 # ── Écriture ──────────────────────────────────────────────────────────
 
 class SaleItemCreateSerializer(serializers.Serializer):
-    """Serializer pour un article dans une création de vente."""
+    """
+    Serializer pour un article dans une création de vente.
+    Les contrôles liés au produit (existence, stock, prix) sont faits en une
+    seule requête par SaleCreateSerializer.validate pour tout le panier.
+    """
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
     unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
 
-    def validate_product_id(self, value):
-        try:
-            Product.objects.get(id=value, delete_at__isnull=True)
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("Produit introuvable.")
-        return value
-
-    def validate(self, data):
-        product = Product.objects.get(id=data['product_id'])
-        if data['quantity'] > product.stock:
-            raise serializers.ValidationError({
-                'quantity': f"Stock insuffisant. Disponible : {product.stock}"
-            })
-        if product.max_salable_price and data['unit_price'] > product.max_salable_price:
-            raise serializers.ValidationError({
-                'unit_price': f"Prix trop élevé. Maximum : {product.max_salable_price}"
-            })
-        if (product.actual_price
-                and data['unit_price'] < product.actual_price
-                and not product.is_price_reducible):
-            raise serializers.ValidationError({
-                'unit_price': "Le prix de ce produit ne peut pas être réduit."
-            })
-        return data
-
 
 class SaleCreateSerializer(serializers.Serializer):
     """
@@ -104,6 +83,8 @@ class SaleCreateSerializer(serializers.Serializer):
         default='CASH', required=False,
     )
     items = SaleItemCreateSerializer(many=True)
+    # Alternative à l'en-tête HTTP « Idempotency-Key »
+    idempotency_key = serializers.CharField(required=False, allow_blank=True, max_length=100)
 
     # Alias accepté par l'ancienne app mobile
     sale_products = SaleItemCreateSerializer(many=True, required=False)
@@ -125,5 +106,20 @@ class SaleCreateSerializer(serializers.Serializer):
             raise serializers.ValidationError({
                 'due_date': "Date d'échéance obligatoire pour une vente à crédit."
             })
+
+        # Un seul SELECT pour tout le panier (au lieu de deux par article)
+        products = Product.objects.filter(
+            id__in={item['product_id'] for item in items},
+            delete_at__isnull=True,
+        ).in_bulk()
+        item_errors = []
+        for item in items:
+            product = products.get(item['product_id'])
+            if product is None:
+                item_errors.append({'product_id': "Produit introuvable."})
+            else:
+                item_errors.append(product.check_sale_item(item['quantity'], item['unit_price']))
+        if any(item_errors):
+            raise serializers.ValidationError({'items': item_errors})
         return data
 
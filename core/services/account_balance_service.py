@@ -0,0 +1,182 @@
+"""
+Soldes de comptes matérialisés (table AccountBalance).
+
+Chaque ligne d'écriture validée (et non supprimée) est reportée, au moment
+où elle est passée, dans le total débit/crédit de son (compte, exercice,
+jour). Le solde d'un compte sur un exercice ou une période est alors la
+somme de ses lignes journalières.
+
+Les lignes créées en masse (bulk_create) sont reportées par incrément ; les
+modifications ponctuelles (admin, saisie manuelle, changement de date ou de
+validation d'une écriture) recalculent les seuls jours concernés. La
+commande `rebuild_account_balances` reconstruit la table depuis le journal.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from core.models import AccountBalance, JournalEntry, JournalEntryLine
+
+
+class AccountBalanceService:
+
+    REBUILD_BATCH_SIZE = 1000
+
+    # ── Mise à jour ──────────────────────────────────────────────────
+
+    @staticmethod
+    def _add(key, debit, credit):
+        """Ajoute (debit, credit) au solde journalier `key` = (compte, exercice, jour)."""
+        account_id, exercise_id, day = key
+        rows = AccountBalance.objects.filter(account_id=account_id, exercise_id=exercise_id, day=day)
+        if rows.update(debit=F('debit') + debit, credit=F('credit') + credit):
+            return
+        try:
+            with transaction.atomic():
+                AccountBalance.objects.create(
+                    account_id=account_id, exercise_id=exercise_id, day=day,
+                    debit=debit, credit=credit,
+                )
+        except IntegrityError:
+            # Créé entre-temps par un autre processus
+            rows.update(debit=F('debit') + debit, credit=F('credit') + credit)
+
+    @classmethod
+    def record_lines(cls, lines):
+        """
+        Reporte des lignes nouvellement créées. L'écriture de chaque ligne doit
+        être chargée (cas des lignes construites avec `entry=...`).
+        """
+        totals = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+        for line in lines:
+            entry = line.entry
+            if not entry.is_validated or line.delete_at is not None:
+                continue
+            key = (line.account_id, entry.exercise_id, entry.date)
+            totals[key][0] += Decimal(line.debit or 0)
+            totals[key][1] += Decimal(line.credit or 0)
+        if not totals:
+            return
+        with transaction.atomic():
+            # Ordre fixe : deux passations concurrentes verrouillent les lignes dans le même ordre
+            for key in sorted(totals, key=lambda k: (k[0], k[1], k[2])):
+                cls._add(key, *totals[key])
+
+    @staticmethod
+    def refresh(keys):
+        """Recalcule depuis le journal les soldes journaliers (compte, exercice, jour) donnés."""
+        with transaction.atomic():
+            for account_id, exercise_id, day in sorted(set(keys), key=lambda k: (k[0], k[1], k[2])):
+                totals = JournalEntryLine.objects.filter(
+                    account_id=account_id,
+                    entry__exercise_id=exercise_id,
+                    entry__date=day,
+                    entry__is_validated=True,
+                    delete_at__isnull=True,
+                ).aggregate(debit=Sum('debit'), credit=Sum('credit'))
+                if totals['debit'] is None:
+                    AccountBalance.objects.filter(
+                        account_id=account_id, exercise_id=exercise_id, day=day,
+                    ).delete()
+                    continue
+                AccountBalance.objects.update_or_create(
+                    account_id=account_id, exercise_id=exercise_id, day=day,
+                    defaults={'debit': totals['debit'], 'credit': totals['credit'] or 0},
+                )
+
+    @staticmethod
+    def keys_for_entry(entry_id, exercise_id, day):
+        """Soldes journaliers touchés par une écriture, pour un (exercice, jour) donné."""
+        account_ids = JournalEntryLine.objects.filter(entry_id=entry_id).values_list('account_id', flat=True)
+        return {(account_id, exercise_id, day) for account_id in account_ids}
+
+    @classmethod
+    def rebuild(cls, exercise=None):
+        """
+        Reconstruit les soldes journaliers (d'un exercice ou de tous) en une
+        seule agrégation GROUP BY. Retourne le nombre de lignes écrites.
+        """
+        lines = JournalEntryLine.objects.filter(entry__is_validated=True, delete_at__isnull=True)
+        balances = AccountBalance.objects.all()
+        if exercise is not None:
+            lines = lines.filter(entry__exercise=exercise)
+            balances = balances.filter(exercise=exercise)
+
+        grouped = lines.order_by().values('account_id', 'entry__exercise_id', 'entry__date').annotate(
+            total_debit=Sum('debit'), total_credit=Sum('credit'),
+        )
+        written = 0
+        with transaction.atomic():
+            balances.delete()
+            batch = []
+            for row in grouped.iterator():
+                batch.append(AccountBalance(
+                    account_id=row['account_id'],
+                    exercise_id=row['entry__exercise_id'],
+                    day=row['entry__date'],
+                    debit=row['total_debit'] or 0,
+                    credit=row['total_credit'] or 0,
+                ))
+                if len(batch) >= cls.REBUILD_BATCH_SIZE:
+                    AccountBalance.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            AccountBalance.objects.bulk_create(batch)
+            written += len(batch)
+        return written
+
+    # ── Lecture ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def get_totals(account_ids=None, exercise=None, date_from=None, date_to=None):
+        """
+        {account_id: (total débit, total crédit)} en une requête, pour les
+        comptes donnés ou pour tous les comptes mouvementés (account_ids=None).
+        """
+        rows = AccountBalance.objects.all()
+        if account_ids is not None:
+            rows = rows.filter(account_id__in=account_ids)
+        if exercise is not None:
+            rows = rows.filter(exercise=exercise)
+        if date_from:
+            rows = rows.filter(day__gte=date_from)
+        if date_to:
+            rows = rows.filter(day__lte=date_to)
+        return {
+            row['account_id']: (row['total_debit'] or Decimal('0'), row['total_credit'] or Decimal('0'))
+            for row in rows.order_by().values('account_id').annotate(
+                total_debit=Sum('debit'), total_credit=Sum('credit'),
+            )
+        }
+
+    @staticmethod
+    def signed_balance(account, total_debit, total_credit):
+        if account.account_type in ('ACTIF', 'CHARGE'):
+            return total_debit - total_credit
+        return total_credit - total_debit
+
+    @classmethod
+    def get_balances(cls, accounts, exercise=None, date_from=None, date_to=None):
+        """{account_id: solde} pour plusieurs comptes, en une requête."""
+        accounts = list(accounts)
+        totals = cls.get_totals([a.id for a in accounts], exercise, date_from, date_to)
+        return {
+            account.id: cls.signed_balance(account, *totals.get(account.id, (Decimal('0'), Decimal('0'))))
+            for account in accounts
+        }
+
+    @classmethod
+    def get_balance(cls, account, exercise=None, date_from=None, date_to=None):
+        return cls.get_balances([account], exercise, date_from, date_to)[account.id]
+
+
+def ensure_account_balances(sender, **kwargs):
+    """
+    Handler post_migrate : à la première installation de la table, la remplit
+    depuis le journal existant.
+    """
+    if not AccountBalance.objects.exists() and JournalEntry.objects.exists():
+        AccountBalanceService.rebuild()
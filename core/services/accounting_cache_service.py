@@ -0,0 +1,120 @@
+"""
+Cache en mémoire (par processus) du plan comptable et des taux de TVA, pour
+les passations d'écritures.
+
+Le plan comptable entier (code → Account) et les taux de TVA sont chargés en
+une requête chacun, puis servis sans accès à la base. Toute modification d'un
+compte ou d'un taux vide le cache du processus (signaux) et incrémente la
+version 'chart_of_accounts' (DataVersion) ; les autres workers relisent cette
+version au plus toutes les CHART_CACHE_CHECK_SECONDS secondes.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+from core.models import Account, DataVersion, TaxRate
+
+
+CHART_VERSION_KEY = 'chart_of_accounts'
+
+
+class AccountingCacheService:
+    """Comptes par code, taux de TVA par id et taux par défaut."""
+
+    _accounts = None
+    _tax_rates = None
+    _default_tax_rate_id = None
+    _version = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _check_interval():
+        return getattr(settings, 'CHART_CACHE_CHECK_SECONDS', 5)
+
+    @classmethod
+    def _ensure_fresh(cls):
+        """Vide le cache si un autre worker a modifié le plan comptable ou les taux."""
+        now = time.monotonic()
+        if cls._version is not None and now - cls._checked_at < cls._check_interval():
+            return
+        version = DataVersion.current(CHART_VERSION_KEY)
+        with cls._lock:
+            if version != cls._version:
+                cls._accounts = None
+                cls._tax_rates = None
+                cls._default_tax_rate_id = None
+                cls._version = version
+            cls._checked_at = now
+
+    @classmethod
+    def _load_accounts(cls):
+        accounts = {account.code: account for account in Account.objects.all()}
+        with cls._lock:
+            cls._accounts = accounts
+        return accounts
+
+    @classmethod
+    def _load_tax_rates(cls):
+        rates = {rate.id: rate for rate in TaxRate.objects.all()}
+        default = next(
+            (rate.id for rate in sorted(rates.values(), key=lambda r: (r.rate, r.id))
+             if rate.is_default and rate.is_active and rate.delete_at is None),
+            None,
+        )
+        with cls._lock:
+            cls._tax_rates = rates
+            cls._default_tax_rate_id = default
+        return rates
+
+    @classmethod
+    def get_account(cls, code):
+        """Compte par code. Lève Account.DoesNotExist si absent."""
+        cls._ensure_fresh()
+        accounts = cls._accounts
+        if accounts is None or code not in accounts:
+            # Compte créé depuis le chargement : relecture du plan complet
+            accounts = cls._load_accounts()
+        try:
+            return accounts[code]
+        except KeyError:
+            raise Account.DoesNotExist(f"Compte {code} introuvable.") from None
+
+    @classmethod
+    def get_tax_rate(cls, tax_rate_id):
+        """Taux de TVA par id. Lève TaxRate.DoesNotExist si absent."""
+        cls._ensure_fresh()
+        rates = cls._tax_rates
+        if rates is None or tax_rate_id not in rates:
+            rates = cls._load_tax_rates()
+        try:
+            return rates[tax_rate_id]
+        except KeyError:
+            raise TaxRate.DoesNotExist(f"Taux de TVA {tax_rate_id} introuvable.") from None
+
+    @classmethod
+    def get_default_tax_rate(cls):
+        """Taux de TVA par défaut actif, ou None."""
+        cls._ensure_fresh()
+        rates = cls._tax_rates
+        if rates is None:
+            rates = cls._load_tax_rates()
+        return rates.get(cls._default_tax_rate_id)
+
+    @classmethod
+    def invalidate(cls):
+        """Vide le cache du processus et invalide celui des autres workers."""
+        cls.clear()
+        DataVersion.bump_on_commit(CHART_VERSION_KEY)
+
+    @classmethod
+    def clear(cls):
+        """Vide le cache du processus courant."""
+        with cls._lock:
+            cls._accounts = None
+            cls._tax_rates = None
+            cls._default_tax_rate_id = None
+            cls._version = None
+            cls._checked_at = 0.0
@@ -0,0 +1,239 @@
+"""
+Service d'outbox comptable : les opérations métier (vente, achat, paiement
+crédit) enregistrent un événement dans la même transaction que la ligne
+métier ; le worker `process_accounting_outbox` génère ensuite les écritures
+par lots, avec reprise et délai exponentiel en cas d'échec.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from core.models.accounting_models import AccountingOutbox
+from core.services.accounting_cache_service import AccountingCacheService
+from core.services.accounting_service import AccountingService
+
+
+class AccountingOutboxService:
+    """Mise en file et comptabilisation différée des écritures."""
+
+    BATCH_SIZE = 50
+    MAX_ATTEMPTS = 8
+    BACKOFF_BASE_SECONDS = 30
+    BACKOFF_MAX_SECONDS = 3600
+
+    # ── Mise en file (appelée dans la transaction métier) ─────────────
+
+    @staticmethod
+    def enqueue_sale(sale, daily, exercise, payment_method='CASH', apply_tax=False):
+        return AccountingOutbox.objects.create(
+            event_type='SALE',
+            sale=sale,
+            daily=daily,
+            exercise=exercise,
+            payload={'payment_method': payment_method, 'apply_tax': apply_tax},
+        )
+
+    @staticmethod
+    def enqueue_supply(supply, daily, exercise, payment_method='CASH', is_credit=False, tax_rate=None):
+        return AccountingOutbox.objects.create(
+            event_type='SUPPLY',
+            supply=supply,
+            daily=daily,
+            exercise=exercise,
+            payload={
+                'payment_method': payment_method,
+                'is_credit': is_credit,
+                'tax_rate_id': tax_rate.id if tax_rate else None,
+            },
+        )
+
+    @staticmethod
+    def enqueue_credit_payment(payment, daily, exercise):
+        return AccountingOutbox.objects.create(
+            event_type='CREDIT_PAYMENT',
+            payment=payment,
+            daily=daily,
+            exercise=exercise,
+        )
+
+    # ── Comptabilisation ──────────────────────────────────────────────
+
+    @staticmethod
+    def _post_sale(event):
+        sale = event.sale
+        apply_tax = event.payload.get('apply_tax', False)
+        entry = AccountingService.record_sale(
+            sale=sale,
+            daily=event.daily,
+            exercise=event.exercise,
+            payment_method=event.payload.get('payment_method', 'CASH'),
+            apply_tax=apply_tax,
+        )
+        # Marquer les écritures TVA comme créées si on est en mode immédiat
+        if apply_tax and not sale.tva_accounting_created:
+            sale.tva_accounting_created = True
+            sale.save(update_fields=['tva_accounting_created'])
+        return entry
+
+    @staticmethod
+    def _post_supply(event):
+        tax_rate_id = event.payload.get('tax_rate_id')
+        return AccountingService.record_supply(
+            supply=event.supply,
+            daily=event.daily,
+            exercise=event.exercise,
+            payment_method=event.payload.get('payment_method', 'CASH'),
+            is_credit=event.payload.get('is_credit', False),
+            tax_rate=AccountingCacheService.get_tax_rate(tax_rate_id) if tax_rate_id else None,
+        )
+
+    @staticmethod
+    def _post_credit_payment(event):
+        return AccountingService.record_credit_payment(
+            payment=event.payment,
+            daily=event.daily,
+            exercise=event.exercise,
+        )
+
+    HANDLERS = {
+        'SALE': '_post_sale',
+        'SUPPLY': '_post_supply',
+        'CREDIT_PAYMENT': '_post_credit_payment',
+    }
+
+    @classmethod
+    def _backoff(cls, attempts):
+        delay = cls.BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+        return timedelta(seconds=min(delay, cls.BACKOFF_MAX_SECONDS))
+
+    @classmethod
+    def process_event(cls, event_id):
+        """
+        Comptabilise un événement. L'écriture et le passage à DONE sont faits
+        dans la même transaction : un événement n'est jamais comptabilisé deux
+        fois. En cas d'échec, l'erreur est conservée et une nouvelle tentative
+        est planifiée. Retourne True si l'écriture a été générée.
+        """
+        try:
+            with transaction.atomic():
+                event = (
+                    AccountingOutbox.objects
+                    .select_for_update(skip_locked=True)
+                    .select_related('sale', 'supply__product', 'payment__credit_sale', 'daily', 'exercise')
+                    .filter(id=event_id, status='PENDING')
+                    .first()
+                )
+                if event is None:
+                    return False  # Déjà traité ou pris par un autre worker
+                handler = getattr(cls, cls.HANDLERS[event.event_type])
+                entry = handler(event)
+                event.status = 'DONE'
+                event.journal_entry = entry
+                event.attempts += 1
+                event.processed_at = timezone.now()
+                event.last_error = None
+                event.save(update_fields=['status', 'journal_entry', 'attempts', 'processed_at', 'last_error'])
+                return True
+        except Exception as e:
+            event = AccountingOutbox.objects.filter(id=event_id).first()
+            if event is None:
+                return False
+            event.attempts += 1
+            event.last_error = f"{type(e).__name__}: {e}"
+            if event.attempts >= cls.MAX_ATTEMPTS:
+                event.status = 'FAILED'
+            event.next_attempt_at = timezone.now() + cls._backoff(event.attempts)
+            event.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+            return False
+
+    @classmethod
+    def process_batch(cls, batch_size=None):
+        """
+        Traite un lot d'événements arrivés à échéance.
+        Retourne un dict {'processed': n, 'failed': n}.
+        """
+        event_ids = list(
+            AccountingOutbox.objects.filter(
+                status='PENDING', next_attempt_at__lte=timezone.now(),
+            ).order_by('id').values_list('id', flat=True)[:batch_size or cls.BATCH_SIZE]
+        )
+        processed = sum(1 for event_id in event_ids if cls.process_event(event_id))
+        return {'processed': processed, 'failed': len(event_ids) - processed}
+
+    @classmethod
+    def process_pending(cls, sale=None, supply=None, daily=None):
+        """
+        Comptabilise immédiatement les événements en attente d'une opération
+        (sans tenir compte du délai de reprise). Appelé avant une annulation,
+        un retour ou une clôture pour que l'écriture d'origine existe toujours
+        avant sa contrepassation.
+        """
+        filters = Q(status='PENDING')
+        if sale is not None:
+            filters &= Q(sale=sale) | Q(payment__credit_sale__sale=sale)
+        if supply is not None:
+            filters &= Q(supply=supply)
+        if daily is not None:
+            filters &= Q(daily=daily)
+        event_ids = AccountingOutbox.objects.filter(filters).order_by('id').values_list('id', flat=True)
+        return sum(1 for event_id in list(event_ids) if cls.process_event(event_id))
+
+    @staticmethod
+    def unposted_count(sale=None, exercise=None):
+        """
+        Nombre d'événements encore en attente ou en échec pour une vente ou
+        un exercice : leurs écritures manquent au journal.
+        """
+        filters = Q(status__in=('PENDING', 'FAILED'))
+        if sale is not None:
+            filters &= Q(sale=sale) | Q(payment__credit_sale__sale=sale)
+        if exercise is not None:
+            filters &= Q(exercise=exercise)
+        return AccountingOutbox.objects.filter(filters).count()
+
+    @classmethod
+    def ensure_exercise_posted(cls, exercise):
+        """
+        Refuse la clôture d'un exercice dont des événements sont encore en
+        attente ou en échec : ses écritures manqueraient au bilan.
+        """
+        status = cls.get_status(exercise=exercise)
+        if status['pending'] or status['failed']:
+            raise ValueError(
+                f"Clôture impossible : {status['pending']} événement(s) comptable(s) en attente et "
+                f"{status['failed']} en échec pour cet exercice. Traitez l'outbox "
+                f"(process_accounting_outbox --retry-failed) avant de clôturer."
+            )
+
+    @staticmethod
+    def retry_failed():
+        """Remet en file les événements en échec. Retourne leur nombre."""
+        return AccountingOutbox.objects.filter(status='FAILED').update(
+            status='PENDING', attempts=0, next_attempt_at=timezone.now(),
+        )
+
+    # ── Supervision ───────────────────────────────────────────────────
+
+    @staticmethod
+    def get_status(exercise=None):
+        """
+        État de l'outbox en une requête : volumes par statut, ancienneté du
+        plus vieil événement en attente (retard) et dernier traitement.
+        `exercise` restreint l'état aux événements de cet exercice.
+        """
+        events = AccountingOutbox.objects.all()
+        if exercise is not None:
+            events = events.filter(exercise=exercise)
+        stats = events.aggregate(
+            pending=Count('id', filter=Q(status='PENDING')),
+            failed=Count('id', filter=Q(status='FAILED')),
+            done=Count('id', filter=Q(status='DONE')),
+            oldest_pending_at=Min('create_at', filter=Q(status='PENDING')),
+            last_processed_at=Max('processed_at'),
+        )
+        oldest = stats['oldest_pending_at']
+        stats['lag_seconds'] = int((timezone.now() - oldest).total_seconds()) if oldest else 0
+        return stats
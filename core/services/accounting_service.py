@@ -3,18 +3,26 @@ Service comptable : initialisation du plan comptable OHADA et génération
 automatique des écritures comptables (partie double).
 """
 
-from datetime import date, timedelta
+from datetime import timedelta
 from decimal import Decimal
 
 from django.db import transaction
-from django.db.models import Sum, Q, F, DecimalField, Value
+from django.db.models import Sum, Q, DecimalField
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from core.models.accounting_models import (
     Account, JournalEntry, JournalEntryLine,
-    PAYMENT_METHOD_ACCOUNT_MAP, TaxRate,
+    PAYMENT_METHOD_ACCOUNT_MAP,
 )
+from core.services.accounting_cache_service import AccountingCacheService
+from core.services.aged_balance_service import AgedBalanceService
+from core.services.bank_statement_import_service import BankStatementImportService
+from core.services.financial_report_service import FinancialReportService
+from core.services.product_margin_service import ProductMarginService
+from core.services.exercise_closing_service import ExerciseClosingService
+from core.services.general_ledger_service import GeneralLedgerService
+from core.services.sequence_service import SequenceService
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -94,35 +102,21 @@ class AccountingService:
     @staticmethod
     def _generate_reference(journal_code: str) -> str:
         """Génère une référence unique : VE-20260225-001"""
-        today = date.today().strftime('%Y%m%d')
-        prefix = f"{journal_code}-{today}"
-        last = (
-            JournalEntry.objects
-            .filter(reference__startswith=prefix)
-            .order_by('-reference')
-            .first()
-        )
-        if last:
-            seq = int(last.reference.split('-')[-1]) + 1
-        else:
-            seq = 1
-        return f"{prefix}-{seq:03d}"
+        return SequenceService.next_reference(journal_code)
 
     # ── Helpers pour récupérer un compte ──────────────────────────────
 
     @staticmethod
     def get_account(code: str) -> Account:
-        """Récupère un compte par son code. Lève DoesNotExist si absent."""
-        return Account.objects.get(code=code)
+        """Récupère un compte par son code (cache du plan comptable). Lève DoesNotExist si absent."""
+        return AccountingCacheService.get_account(code)
 
     # ── Helper TVA ──────────────────────────────────────────────────
 
     @staticmethod
     def get_default_tax_rate():
         """Récupère le taux de TVA par défaut (ou None si pas de TVA active)."""
-        return TaxRate.objects.filter(
-            is_default=True, is_active=True, delete_at__isnull=True
-        ).first()
+        return AccountingCacheService.get_default_tax_rate()
 
     @staticmethod
     def compute_tax(amount_ttc, tax_rate):
@@ -633,88 +627,135 @@ class AccountingService:
     # ── Écritures TVA différées pour un Daily ─────────────────────────────
 
     @classmethod
-    def record_deferred_tva_for_daily(cls, daily):
+    def record_deferred_tva_for_daily(cls, daily, consolidated=None):
         """
         Enregistre les écritures de TVA différée pour toutes les ventes du Daily
         qui n'ont pas encore eu leurs écritures TVA créées.
-        
+
         Utilisé en mode DEFERRED lors de la clôture du Daily.
-        
+
         :param daily: Objet Daily pour lequel créer les écritures TVA
+        :param consolidated: une seule écriture pour la journée (défaut : DEFERRED_TVA_CONSOLIDATED)
         :return: Nombre d'écritures créées
         """
+        return cls.post_deferred_tva(daily, consolidated=consolidated)['entries']
+
+    @classmethod
+    def post_deferred_tva(cls, daily, consolidated=None):
+        """
+        Passation groupée de la TVA différée d'un Daily, par lots de
+        DEFERRED_TVA_BATCH_SIZE ventes. Pour chaque lot (une transaction) :
+        un incrément du compteur de références, deux bulk_create (écritures
+        puis lignes) et un seul UPDATE ... WHERE id IN des ventes traitées.
+        En mode consolidé, une seule écriture porte la TVA de toute la journée.
+
+        :return: {'entries', 'sales', 'tva', 'duration_ms'}
+        """
+        import time
+        from django.conf import settings
         from core.models import Sale
-        
+
+        started = time.monotonic()
+        stats = {'entries': 0, 'sales': 0, 'tva': Decimal('0'), 'duration_ms': 0}
+        if consolidated is None:
+            consolidated = getattr(settings, 'DEFERRED_TVA_CONSOLIDATED', False)
+        batch_size = max(getattr(settings, 'DEFERRED_TVA_BATCH_SIZE', 500), 1)
+
+        tax_rate = cls.get_default_tax_rate()
+        if not tax_rate:
+            return stats
+
         # Récupérer les ventes avec TVA qui n'ont pas encore d'écritures TVA
-        sales_with_tva = Sale.objects.filter(
+        pending = list(Sale.objects.filter(
             daily=daily,
             has_vat=True,
             tva_accounting_created=False,
             delete_at__isnull=True,
-        )
-        
-        if not sales_with_tva.exists():
-            return 0
-        
-        tax_rate = cls.get_default_tax_rate()
-        if not tax_rate:
-            return 0
-        
-        entries_created = 0
-        
-        with transaction.atomic():
-            for sale in sales_with_tva:
-                try:
-                    amount = Decimal(str(sale.total or 0))
-                    if amount <= 0:
-                        continue
-                        
-                    ht, tva = cls.compute_tax(amount, tax_rate)
-                    
-                    if tva <= 0:
-                        continue
-                    
-                    # Créer une écriture de TVA collectée
-                    ref = cls._generate_reference('VE')
+        ).order_by('id').values_list('id', 'total'))
+        if not pending:
+            return stats
+
+        sales_tva = []
+        for sale_id, total in pending:
+            amount = Decimal(str(total or 0))
+            if amount <= 0:
+                continue
+            _, tva = cls.compute_tax(amount, tax_rate)
+            if tva > 0:
+                sales_tva.append((sale_id, tva))
+
+        account_701 = cls.get_account('701')
+        account_4431 = cls.get_account('4431')
+        today = timezone.now().date()
+
+        if consolidated:
+            batches = [sales_tva] if sales_tva else []
+        else:
+            batches = [sales_tva[i:i + batch_size] for i in range(0, len(sales_tva), batch_size)]
+
+        for batch in batches:
+            with transaction.atomic():
+                if consolidated:
+                    total_tva = sum((tva for _, tva in batch), Decimal('0'))
+                    reference = SequenceService.next_reference('VE', today)
                     entry = JournalEntry.objects.create(
-                        reference=ref,
-                        date=timezone.now().date(),
-                        description=f"TVA collectée - Vente #{sale.id} (clôture daily)",
+                        reference=reference,
+                        date=today,
+                        description=f"TVA collectée - {len(batch)} vente(s) (clôture daily #{daily.id})",
                         journal='VE',
                         exercise=daily.exercise,
                         daily=daily,
-                        sale=sale,
                     )
-                    
                     JournalEntryLine.objects.bulk_create([
                         JournalEntryLine(
-                            entry=entry,
-                            account=cls.get_account('701'),
-                            debit=tva,
-                            credit=0,
-                            description=f"Constatation TVA différée – vente #{sale.id}",
+                            entry=entry, account=account_701, debit=total_tva, credit=0,
+                            description=f"Constatation TVA différée – clôture daily #{daily.id}",
                         ),
                         JournalEntryLine(
-                            entry=entry,
-                            account=cls.get_account('4431'),
-                            debit=0,
-                            credit=tva,
-                            description=f"TVA collectée – vente #{sale.id}",
+                            entry=entry, account=account_4431, debit=0, credit=total_tva,
+                            description=f"TVA collectée – clôture daily #{daily.id}",
                         ),
                     ])
-                    
-                    # Marquer la vente comme ayant ses écritures TVA créées
-                    sale.tva_accounting_created = True
-                    sale.save(update_fields=['tva_accounting_created'])
-                    
-                    entries_created += 1
-                    
-                except Exception as e:
-                    # Log l'erreur mais continuer avec les autres ventes
-                    print(f"Erreur lors de la création des écritures TVA pour la vente #{sale.id}: {e}")
-                    continue
-        
-        return entries_created
+                    stats['entries'] += 1
+                else:
+                    references = SequenceService.next_references('VE', len(batch), today)
+                    entries = JournalEntry.objects.bulk_create([
+                        JournalEntry(
+                            reference=reference,
+                            date=today,
+                            description=f"TVA collectée - Vente #{sale_id} (clôture daily)",
+                            journal='VE',
+                            exercise=daily.exercise,
+                            daily=daily,
+                            sale_id=sale_id,
+                        )
+                        for reference, (sale_id, _) in zip(references, batch)
+                    ])
+                    if any(entry.pk is None for entry in entries):
+                        # MySQL ne renvoie pas les clés des lignes insérées en masse
+                        ids = dict(JournalEntry.objects.filter(reference__in=references).values_list('reference', 'id'))
+                        for entry in entries:
+                            entry.pk = ids[entry.reference]
+                    lines = []
+                    for entry, (sale_id, tva) in zip(entries, batch):
+                        lines.append(JournalEntryLine(
+                            entry=entry, account=account_701, debit=tva, credit=0,
+                            description=f"Constatation TVA différée – vente #{sale_id}",
+                        ))
+                        lines.append(JournalEntryLine(
+                            entry=entry, account=account_4431, debit=0, credit=tva,
+                            description=f"TVA collectée – vente #{sale_id}",
+                        ))
+                    JournalEntryLine.objects.bulk_create(lines)
+                    stats['entries'] += len(entries)
+
+                # Marquer les ventes comme ayant leurs écritures TVA créées
+                Sale.objects.filter(id__in=[sale_id for sale_id, _ in batch]).update(tva_accounting_created=True)
+                stats['sales'] += len(batch)
+                stats['tva'] += sum((tva for _, tva in batch), Decimal('0'))
+
+        stats['duration_ms'] = int((time.monotonic() - started) * 1000)
+        return stats
 
     # ── Écriture pour un ACHAT / Approvisionnement ────────────────────
 
@@ -975,442 +1016,65 @@ class AccountingService:
     # ── Utilitaires pour les rapports ─────────────────────────────────
 
     @staticmethod
-    def get_trial_balance(exercise=None):
+    def get_trial_balance(exercise=None, date_from=None, date_to=None):
         """
         Retourne la balance générale : liste de comptes avec
         total_debit, total_credit, solde.
         """
-        from django.db.models import Sum, Q
-
-        accounts = Account.objects.filter(
-            is_active=True, delete_at__isnull=True
-        ).order_by('code')
-
-        result = []
-        for account in accounts:
-            filters = {
-                'entry__is_validated': True,
-                'account': account,
-                'delete_at__isnull': True,
-            }
-            if exercise:
-                filters['entry__exercise'] = exercise
-
-            totals = JournalEntryLine.objects.filter(**filters).aggregate(
-                total_debit=Sum('debit'),
-                total_credit=Sum('credit'),
-            )
-            total_debit = totals['total_debit'] or Decimal('0')
-            total_credit = totals['total_credit'] or Decimal('0')
-            balance = account.get_balance(exercise)
-
-            if total_debit > 0 or total_credit > 0:
-                result.append({
-                    'account': account,
-                    'total_debit': total_debit,
-                    'total_credit': total_credit,
-                    'balance': balance,
-                })
-        return result
+        return FinancialReportService(exercise, date_from, date_to).trial_balance()
 
     @staticmethod
     def get_general_ledger(account, exercise=None):
         """
         Retourne le grand livre pour un compte donné :
         liste des lignes d'écriture avec solde progressif.
+        Pour les comptes volumineux, préférer GeneralLedgerService.get_page
+        ou GeneralLedgerService.iter_lines.
         """
-        filters = {
-            'account': account,
-            'entry__is_validated': True,
-            'delete_at__isnull': True,
-        }
-        if exercise:
-            filters['entry__exercise'] = exercise
-
-        lines = (
-            JournalEntryLine.objects
-            .filter(**filters)
-            .select_related('entry')
-            .order_by('entry__date', 'entry__create_at')
-        )
-
-        result = []
-        running_balance = Decimal('0')
-        for line in lines:
-            if account.account_type in ('ACTIF', 'CHARGE'):
-                running_balance += line.debit - line.credit
-            else:
-                running_balance += line.credit - line.debit
-            result.append({
-                'line': line,
-                'running_balance': running_balance,
-            })
-        return result
+        return list(GeneralLedgerService.iter_lines(account, exercise))
 
     # ══════════════════════════════════════════════════════════════════
     # Phase 3 — Rapports financiers
     # ══════════════════════════════════════════════════════════════════
 
     @staticmethod
-    def get_income_statement(exercise=None):
+    def get_income_statement(exercise=None, date_from=None, date_to=None):
         """
         Compte de résultat : produits − charges = résultat net.
         Retourne dict avec listes de charges/produits et totaux.
         """
-        filters = {
-            'entry__is_validated': True,
-            'delete_at__isnull': True,
-        }
-        if exercise:
-            filters['entry__exercise'] = exercise
-
-        # Comptes de charges (classe 6)
-        charges = Account.objects.filter(
-            is_active=True, delete_at__isnull=True,
-            code__startswith='6',
-        ).order_by('code')
-
-        charges_detail = []
-        total_charges = Decimal('0')
-        for account in charges:
-            f = dict(filters)
-            f['account'] = account
-            totals = JournalEntryLine.objects.filter(**f).aggregate(
-                total_debit=Coalesce(Sum('debit'), Value(Decimal('0'))),
-                total_credit=Coalesce(Sum('credit'), Value(Decimal('0'))),
-            )
-            balance = totals['total_debit'] - totals['total_credit']
-            if balance != 0:
-                charges_detail.append({
-                    'account': account,
-                    'total_debit': totals['total_debit'],
-                    'total_credit': totals['total_credit'],
-                    'balance': balance,
-                })
-                total_charges += balance
-
-        # Comptes de produits (classe 7)
-        produits = Account.objects.filter(
-            is_active=True, delete_at__isnull=True,
-            code__startswith='7',
-        ).order_by('code')
-
-        produits_detail = []
-        total_produits = Decimal('0')
-        for account in produits:
-            f = dict(filters)
-            f['account'] = account
-            totals = JournalEntryLine.objects.filter(**f).aggregate(
-                total_debit=Coalesce(Sum('debit'), Value(Decimal('0'))),
-                total_credit=Coalesce(Sum('credit'), Value(Decimal('0'))),
-            )
-            balance = totals['total_credit'] - totals['total_debit']
-            if balance != 0:
-                produits_detail.append({
-                    'account': account,
-                    'total_debit': totals['total_debit'],
-                    'total_credit': totals['total_credit'],
-                    'balance': balance,
-                })
-                total_produits += balance
-
-        resultat_net = total_produits - total_charges
-
-        return {
-            'charges': charges_detail,
-            'produits': produits_detail,
-            'total_charges': total_charges,
-            'total_produits': total_produits,
-            'resultat_net': resultat_net,
-            'is_benefice': resultat_net >= 0,
-        }
+        return FinancialReportService(exercise, date_from, date_to).income_statement()
 
     @staticmethod
-    def get_balance_sheet(exercise=None):
+    def get_balance_sheet(exercise=None, date_from=None, date_to=None):
         """
         Bilan comptable simplifié :
         ACTIF (classes 1–5 type ACTIF) = PASSIF (classes 1–5 type PASSIF)
         Le résultat de l'exercice est intégré côté passif.
         """
-        filters = {
-            'entry__is_validated': True,
-            'delete_at__isnull': True,
-        }
-        if exercise:
-            filters['entry__exercise'] = exercise
-
-        def _get_accounts(account_type, code_prefixes):
-            """Retourne les comptes avec leur solde."""
-            result = []
-            total = Decimal('0')
-            for prefix in code_prefixes:
-                accounts = Account.objects.filter(
-                    is_active=True, delete_at__isnull=True,
-                    account_type=account_type,
-                    code__startswith=prefix,
-                ).order_by('code')
-                for account in accounts:
-                    balance = account.get_balance(exercise)
-                    if balance != 0:
-                        result.append({
-                            'account': account,
-                            'balance': abs(balance),
-                        })
-                        total += abs(balance)
-            return result, total
-
-        # ACTIF
-        actif_immobilise, total_immo = _get_accounts('ACTIF', ['2'])
-        actif_circulant, total_circ = _get_accounts('ACTIF', ['3', '4'])
-        tresorerie_actif, total_treso = _get_accounts('ACTIF', ['5'])
-        total_actif = total_immo + total_circ + total_treso
-
-        # PASSIF
-        capitaux, total_capitaux = _get_accounts('PASSIF', ['1'])
-        dettes, total_dettes = _get_accounts('PASSIF', ['4'])
-        tresorerie_passif, total_treso_passif = _get_accounts('PASSIF', ['5'])
-
-        # Résultat de l'exercice
-        income = AccountingService.get_income_statement(exercise)
-        resultat_net = income['resultat_net']
-
-        total_passif = total_capitaux + total_dettes + total_treso_passif + max(resultat_net, Decimal('0'))
-
-        return {
-            'actif_immobilise': actif_immobilise,
-            'actif_circulant': actif_circulant,
-            'tresorerie_actif': tresorerie_actif,
-            'total_immo': total_immo,
-            'total_circ': total_circ,
-            'total_treso': total_treso,
-            'total_actif': total_actif,
-            'capitaux': capitaux,
-            'dettes': dettes,
-            'tresorerie_passif': tresorerie_passif,
-            'total_capitaux': total_capitaux,
-            'total_dettes': total_dettes,
-            'total_treso_passif': total_treso_passif,
-            'resultat_net': resultat_net,
-            'total_passif': total_passif,
-        }
+        return FinancialReportService(exercise, date_from, date_to).balance_sheet()
 
     @staticmethod
-    def get_aged_balance(balance_type='client', exercise=None):
+    def get_aged_balance(balance_type='client', exercise=None, cursor=None, per_page=None, base_params=None):
         """
-        Balance âgée : créances clients ou dettes fournisseurs
-        regroupées par tranche d'ancienneté.
-        balance_type : 'client' ou 'supplier'
+        Balance âgée : créances clients ou dettes fournisseurs encore ouvertes,
+        regroupées par tranche d'ancienneté (totaux calculés par la base).
+        balance_type : 'client' ou 'supplier'. Les éléments ouverts ne dépendent
+        pas de l'exercice (paramètre conservé pour compatibilité).
+        `items` contient une page du détail, `page_obj` la page (curseur).
         """
-        from core.models.sale_models import CreditSale
-        from core.models.inventory_models import Supply
-
-        today = date.today()
-        tranches = [
-            ('0-30', 0, 30),
-            ('31-60', 31, 60),
-            ('61-90', 61, 90),
-            ('90+', 91, 9999),
-        ]
-
-        if balance_type == 'client':
-            # Créances clients = CreditSale non fully paid
-            items = CreditSale.objects.filter(
-                is_fully_paid=False,
-                delete_at__isnull=True,
-            ).select_related('sale__client', 'sale__daily')
-
-            result = []
-            totals = {t[0]: Decimal('0') for t in tranches}
-            grand_total = Decimal('0')
-
-            for cs in items:
-                remaining = Decimal(str(cs.amount_remaining or 0))
-                if remaining <= 0:
-                    continue
-                sale_date = cs.sale.create_at.date() if cs.sale.create_at else today
-                age_days = (today - sale_date).days
-
-                tranche_key = '90+'
-                for label, low, high in tranches:
-                    if low <= age_days <= high:
-                        tranche_key = label
-                        break
-
-                client_name = ''
-                if cs.sale.client:
-                    client_name = f"{cs.sale.client.firstname} {cs.sale.client.lastname}"
-
-                result.append({
-                    'reference': f"Vente #{cs.sale_id}",
-                    'tiers': client_name or 'Client anonyme',
-                    'date': sale_date,
-                    'due_date': cs.due_date,
-                    'age_days': age_days,
-                    'tranche': tranche_key,
-                    'amount': remaining,
-                })
-                totals[tranche_key] += remaining
-                grand_total += remaining
-
-            return {
-                'items': result,
-                'tranches_data': [
-                    {'label': label, 'amount': totals[label]}
-                    for label, _, _ in tranches
-                ],
-                'totals': totals,
-                'grand_total': grand_total,
-                'balance_type': 'client',
-                'title': 'Créances clients',
-            }
-            return {
-                'items': result,
-                'totals': totals,
-                'grand_total': grand_total,
-                'tranches': [t[0] for t in tranches],
-                'balance_type': 'client',
-                'title': 'Créances clients',
-            }
-
-        else:  # supplier
-            # Dettes fournisseurs : solde du compte 401
-            account_401 = Account.objects.filter(code='401').first()
-            balance_401 = account_401.get_balance(exercise) if account_401 else Decimal('0')
-
-            # Détail des lignes d'écriture sur le 401
-            filters = {
-                'account': account_401,
-                'entry__is_validated': True,
-                'delete_at__isnull': True,
-            }
-            if exercise:
-                filters['entry__exercise'] = exercise
-
-            lines = JournalEntryLine.objects.filter(
-                **filters
-            ).select_related('entry').order_by('entry__date')
-
-            result = []
-            totals = {t[0]: Decimal('0') for t in tranches}
-            grand_total = Decimal('0')
-
-            for line in lines:
-                net = line.credit - line.debit
-                if net <= 0:
-                    continue
-                entry_date = line.entry.date
-                age_days = (today - entry_date).days
-
-                tranche_key = '90+'
-                for label, low, high in tranches:
-                    if low <= age_days <= high:
-                        tranche_key = label
-                        break
-
-                result.append({
-                    'reference': line.entry.reference,
-                    'tiers': line.entry.description,
-                    'date': entry_date,
-                    'due_date': None,
-                    'age_days': age_days,
-                    'tranche': tranche_key,
-                    'amount': net,
-                })
-                totals[tranche_key] += net
-                grand_total += net
-
-            return {
-                'items': result,
-                'tranches_data': [
-                    {'label': label, 'amount': totals[label]}
-                    for label, _, _ in tranches
-                ],
-                'totals': totals,
-                'grand_total': grand_total,
-                'balance_type': 'client',
-                'title': 'Créances clients',
-}
-            return {
-                'items': result,
-                'totals': totals,
-                'grand_total': grand_total,
-                'tranches': [t[0] for t in tranches],
-                'balance_type': 'supplier',
-                'title': 'Dettes fournisseurs',
-            }
-
-
+        service = AgedBalanceService(balance_type)
+        page_obj, items = service.get_page(cursor, per_page, base_params)
+        return {**service.summary(), 'items': items, 'page_obj': page_obj}
 
     @staticmethod
-    def get_product_margins(exercise=None):
+    def get_product_margins(exercise=None, date_from=None, date_to=None):
         """
         Rapport de marge par produit :
-        CA (chiffre d'affaires) − Coût d'achat = Marge brute
+        CA (chiffre d'affaires) − Coût d'achat = Marge brute,
+        le coût étant le prix d'achat relevé au moment de chaque vente.
         """
-        from core.models.sale_models import SaleProduct
-        from core.models.product_models import Product
-
-        products = Product.objects.filter(
-            delete_at__isnull=True
-        ).order_by('name')
-
-        filters = {'sale__delete_at__isnull': True, 'delete_at__isnull': True}
-        if exercise:
-            filters['sale__daily__exercise'] = exercise
-
-        result = []
-        total_ca = Decimal('0')
-        total_cost = Decimal('0')
-        total_margin = Decimal('0')
-
-        for product in products:
-            sp_qs = SaleProduct.objects.filter(
-                product=product, **filters
-            )
-            agg = sp_qs.aggregate(
-                total_qty=Coalesce(Sum('quantity'), Value(0)),
-                total_revenue=Coalesce(
-                    Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
-                    Value(Decimal('0')),
-                ),
-            )
-            qty_sold = agg['total_qty']
-            revenue = agg['total_revenue']
-
-            if qty_sold == 0:
-                continue
-
-            # Coût d'achat = last_purchase_price × quantité vendue
-            purchase_price = product.last_purchase_price or Decimal('0')
-            cost = purchase_price * qty_sold
-            margin = revenue - cost
-            margin_pct = (margin / revenue * 100) if revenue else Decimal('0')
-
-            result.append({
-                'product': product,
-                'qty_sold': qty_sold,
-                'revenue': revenue,
-                'purchase_price': purchase_price,
-                'cost': cost,
-                'margin': margin,
-                'margin_pct': margin_pct,
-            })
-            total_ca += revenue
-            total_cost += cost
-            total_margin += margin
-
-        # Trier par marge décroissante
-        result.sort(key=lambda x: x['margin'], reverse=True)
-
-        total_margin_pct = (total_margin / total_ca * 100) if total_ca else Decimal('0')
-
-        return {
-            'items': result,
-            'total_ca': total_ca,
-            'total_cost': total_cost,
-            'total_margin': total_margin,
-            'total_margin_pct': total_margin_pct,
-        }
+        return ProductMarginService.get_margins(exercise, date_from, date_to)
 
     # ── Déclaration TVA ──────────────────────────────────────────────
 
@@ -1501,23 +1165,15 @@ class AccountingService:
     def import_bank_statements(cls, account_code, lines):
         """
         Importe des lignes de relevé bancaire.
-        `lines` = liste de dicts : {date, description, amount, type, reference?}
+        `lines` = liste de dicts : {date, description, amount, type, reference?},
+        date en objet ou en texte ('2026-01-02', '02/01/2026'), dans n'importe
+        quel ordre. Les lignes déjà importées (même empreinte) sont ignorées.
         Retourne le nombre de lignes importées.
         """
-        from core.models.accounting_models import BankStatement
         account = cls.get_account(account_code)
-        created = []
-        for line in lines:
-            created.append(BankStatement(
-                account=account,
-                statement_date=line['date'],
-                description=line['description'],
-                amount=Decimal(str(line['amount'])),
-                statement_type=line['type'],  # CREDIT ou DEBIT
-                reference=line.get('reference', ''),
-            ))
-        BankStatement.objects.bulk_create(created)
-        return len(created)
+        # Tri stable par date : import_rows exige des opérations groupées par date
+        lines = sorted(lines, key=lambda line: BankStatementImportService._parse_date(line['date']))
+        return BankStatementImportService.import_rows(account, lines)['imported']
 
     @classmethod
     def get_bank_reconciliation(cls, account_code, date_start=None, date_end=None):
@@ -1623,235 +1279,17 @@ class AccountingService:
     # ── Clôture d'exercice ───────────────────────────────────────────
 
     @classmethod
-    def close_exercise(cls, exercise, user=None):
+    def close_exercise(cls, exercise, user=None, progress=None):
         """
-        Clôture un exercice comptable :
-        1. Calcule le résultat (Produits classe 7 − Charges classe 6)
-        2. Solde les comptes 6 et 7 vers le compte 12 (Résultat de l'exercice)
-        3. Ferme l'exercice (end_date = now)
-        4. Enregistre l'historique dans ExerciseClosing
+        Clôture un exercice comptable (voir ExerciseClosingService.close_exercise).
         Retourne l'objet ExerciseClosing créé.
         """
-        from core.models.accounting_models import ExerciseClosing
-
-        if not exercise.is_active():
-            raise ValueError("Cet exercice est déjà clôturé.")
-
-        zero = Decimal('0')
-
-        with transaction.atomic():
-            # Calculer soldes des classes 6 et 7
-            accounts_6 = Account.objects.filter(
-                code__startswith='6', delete_at__isnull=True
-            )
-            accounts_7 = Account.objects.filter(
-                code__startswith='7', delete_at__isnull=True
-            )
-
-            total_charges = zero
-            total_produits = zero
-            closing_lines = []
-
-            # Classe 6 - Charges (solde = debit - credit)
-            for acc in accounts_6:
-                balance = acc.get_balance(exercise)
-                if balance != zero:
-                    total_charges += balance
-                    # Solder : écriture inverse (crédit pour solder un solde débiteur)
-                    if balance > 0:
-                        closing_lines.append({'account': acc, 'debit': zero, 'credit': balance})
-                    else:
-                        closing_lines.append({'account': acc, 'debit': abs(balance), 'credit': zero})
-
-            # Classe 7 - Produits (solde = credit - debit)
-            for acc in accounts_7:
-                balance = acc.get_balance(exercise)
-                if balance != zero:
-                    total_produits += balance
-                    # Solder : écriture inverse (débit pour solder un solde créditeur)
-                    if balance > 0:
-                        closing_lines.append({'account': acc, 'debit': balance, 'credit': zero})
-                    else:
-                        closing_lines.append({'account': acc, 'debit': zero, 'credit': abs(balance)})
-
-            resultat = total_produits - total_charges
-
-            # Écriture de clôture
-            ref = cls._generate_reference('CL')
-            closing_entry = JournalEntry.objects.create(
-                reference=ref,
-                date=timezone.now().date(),
-                description=f"Clôture exercice {exercise} — Résultat: {resultat} FCFA",
-                journal='OD',  # Opérations diverses
-                exercise=exercise,
-                is_validated=True,
-            )
-
-            # Lignes de solde des comptes 6 et 7
-            entry_lines = []
-            for line in closing_lines:
-                entry_lines.append(JournalEntryLine(
-                    entry=closing_entry,
-                    account=line['account'],
-                    debit=line['debit'],
-                    credit=line['credit'],
-                    description=f"Clôture {line['account'].code} — {line['account'].name}",
-                ))
-
-            # Ligne résultat vers compte 12
-            compte_12 = cls.get_account('12')
-            if resultat >= 0:
-                # Bénéfice → Crédit 12
-                entry_lines.append(JournalEntryLine(
-                    entry=closing_entry,
-                    account=compte_12,
-                    debit=zero, credit=resultat,
-                    description=f"Résultat de l'exercice (bénéfice)",
-                ))
-            else:
-                # Perte → Débit 12
-                entry_lines.append(JournalEntryLine(
-                    entry=closing_entry,
-                    account=compte_12,
-                    debit=abs(resultat), credit=zero,
-                    description=f"Résultat de l'exercice (perte)",
-                ))
-
-            JournalEntryLine.objects.bulk_create(entry_lines)
-
-            # Fermer l'exercice
-            exercise.end_date = timezone.now()
-            exercise.save()
-
-            # Historique
-            closing = ExerciseClosing.objects.create(
-                exercise=exercise,
-                closed_at=timezone.now(),
-                closed_by=user,
-                result_amount=resultat,
-                closing_entry=closing_entry,
-            )
-
-        return closing
+        return ExerciseClosingService.close_exercise(exercise, user=user, progress=progress)
 
     @classmethod
-    def open_new_exercise(cls, closing, user=None):
+    def open_new_exercise(cls, closing, user=None, progress=None):
         """
-        Ouvre un nouvel exercice avec report à nouveau des comptes de bilan (classes 1-5).
-        1. Crée un nouvel exercice
-        2. Crée une écriture d'ouverture avec les soldes des comptes 1-5
-        3. Reporte le résultat (compte 12) vers le report à nouveau (131/139)
-        Retourne le nouvel exercice créé.
+        Ouvre un nouvel exercice avec report à nouveau des comptes de bilan
+        (voir ExerciseClosingService.open_new_exercise). Retourne le nouvel exercice.
         """
-        from core.models.accounting_models import Exercise
-
-        old_exercise = closing.exercise
-        zero = Decimal('0')
-
-        with transaction.atomic():
-            # Créer le nouvel exercice
-            new_exercise = Exercise.objects.create(
-                start_date=timezone.now(),
-                end_date=None,
-            )
-
-            # Écriture d'ouverture (report à nouveau)
-            ref = cls._generate_reference('AN')  # À-Nouveau
-            opening_entry = JournalEntry.objects.create(
-                reference=ref,
-                date=timezone.now().date(),
-                description=f"Report à nouveau — ouverture exercice {new_exercise}",
-                journal='AN',
-                exercise=new_exercise,
-                is_validated=True,
-            )
-
-            entry_lines = []
-
-            # Reporter les soldes des comptes de bilan (classes 1-5)
-            bilan_accounts = Account.objects.filter(
-                delete_at__isnull=True
-            ).exclude(
-                code__startswith='6'
-            ).exclude(
-                code__startswith='7'
-            ).order_by('code')
-
-            for acc in bilan_accounts:
-                balance = acc.get_balance(old_exercise)
-                if balance == zero:
-                    continue
-
-                if acc.account_type in ('ACTIF', 'CHARGE'):
-                    # Solde normalement débiteur
-                    if balance > 0:
-                        entry_lines.append(JournalEntryLine(
-                            entry=opening_entry,
-                            account=acc,
-                            debit=balance, credit=zero,
-                            description=f"Report à nouveau {acc.code}",
-                        ))
-                    else:
-                        entry_lines.append(JournalEntryLine(
-                            entry=opening_entry,
-                            account=acc,
-                            debit=zero, credit=abs(balance),
-                            description=f"Report à nouveau {acc.code}",
-                        ))
-                else:
-                    # PASSIF/PRODUIT — solde normalement créditeur
-                    if balance > 0:
-                        entry_lines.append(JournalEntryLine(
-                            entry=opening_entry,
-                            account=acc,
-                            debit=zero, credit=balance,
-                            description=f"Report à nouveau {acc.code}",
-                        ))
-                    else:
-                        entry_lines.append(JournalEntryLine(
-                            entry=opening_entry,
-                            account=acc,
-                            debit=abs(balance), credit=zero,
-                            description=f"Report à nouveau {acc.code}",
-                        ))
-
-            # Reporter le résultat (12) vers report à nouveau (131 ou 139)
-            resultat = closing.result_amount
-            if resultat > 0:
-                # Bénéfice → vider 12 (débit) → 131 (crédit)
-                entry_lines.append(JournalEntryLine(
-                    entry=opening_entry,
-                    account=cls.get_account('12'),
-                    debit=resultat, credit=zero,
-                    description="Affectation résultat bénéficiaire",
-                ))
-                entry_lines.append(JournalEntryLine(
-                    entry=opening_entry,
-                    account=cls.get_account('131'),
-                    debit=zero, credit=resultat,
-                    description="Report à nouveau — bénéfice",
-                ))
-            elif resultat < 0:
-                # Perte → vider 12 (crédit) → 139 (débit)
-                entry_lines.append(JournalEntryLine(
-                    entry=opening_entry,
-                    account=cls.get_account('12'),
-                    debit=zero, credit=abs(resultat),
-                    description="Affectation résultat déficitaire",
-                ))
-                entry_lines.append(JournalEntryLine(
-                    entry=opening_entry,
-                    account=cls.get_account('139'),
-                    debit=abs(resultat), credit=zero,
-                    description="Report à nouveau — perte",
-                ))
-
-            if entry_lines:
-                JournalEntryLine.objects.bulk_create(entry_lines)
-
-            # Mettre à jour le closing
-            closing.opening_entry = opening_entry
-            closing.new_exercise = new_exercise
-            closing.save()
-
-        return new_exercise
+        return ExerciseClosingService.open_new_exercise(closing, user=user, progress=progress)
@@ -0,0 +1,155 @@
+"""
+Balance âgée des créances clients (CreditSale) et des dettes fournisseurs
+(CreditSupply), sur les seuls éléments encore ouverts (`amount_remaining`).
+
+Les totaux par tranche d'ancienneté sont calculés par la base en une seule
+agrégation conditionnelle (`SUM(CASE WHEN date ≥ … THEN montant END)`), les
+bornes de chaque tranche étant converties en dates une fois pour toutes ; le
+détail est lu par pages (pagination par curseur), la tranche de chaque ligne
+étant elle aussi calculée en SQL (`CASE WHEN`).
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from core.models import CreditSale, CreditSupply
+from core.pagination import COUNT_NONE, KeysetPaginator
+
+
+# (libellé, âge minimum en jours, âge maximum en jours ou None)
+TRANCHES = [
+    ('0-30', 0, 30),
+    ('31-60', 31, 60),
+    ('61-90', 61, 90),
+    ('90+', 91, None),
+]
+
+
+class AgedBalanceService:
+
+    PAGE_SIZE = 50
+    EXPORT_CHUNK_SIZE = 2000
+
+    def __init__(self, balance_type='client', today=None):
+        self.balance_type = 'supplier' if balance_type == 'supplier' else 'client'
+        self.today = today or timezone.localdate()
+        if self.balance_type == 'client':
+            self.date_field = 'sale__create_at'
+            self.title = 'Créances clients'
+        else:
+            self.date_field = 'supply__create_at'
+            self.title = 'Dettes fournisseurs'
+
+    # ── Tranches ──────────────────────────────────────────────────────
+
+    def _start_of_day(self, days_ago):
+        day = self.today - timedelta(days=days_ago)
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def _tranche_q(self, low, high):
+        """Éléments âgés de `low` à `high` jours, exprimé en bornes de dates."""
+        q = Q()
+        if low > 0:
+            # âge ≥ low  ⇔  créé avant le début du jour (today − low + 1)
+            q &= Q(**{f'{self.date_field}__lt': self._start_of_day(low - 1)})
+        if high is not None:
+            q &= Q(**{f'{self.date_field}__gte': self._start_of_day(high)})
+        return q
+
+    def _tranche_case(self):
+        return Case(
+            *[
+                When(self._tranche_q(low, high), then=Value(label))
+                for label, low, high in TRANCHES
+            ],
+            default=Value(TRANCHES[-1][0]),
+            output_field=CharField(),
+        )
+
+    # ── Lecture ───────────────────────────────────────────────────────
+
+    def open_items(self):
+        """Créances (ou dettes) non soldées, ventes/approvisionnements supprimés exclus."""
+        if self.balance_type == 'client':
+            items = CreditSale.objects.filter(sale__delete_at__isnull=True).select_related('sale__client')
+        else:
+            items = CreditSupply.objects.filter(supply__delete_at__isnull=True).select_related(
+                'supply__supplier', 'supply__product',
+            )
+        return items.filter(is_fully_paid=False, delete_at__isnull=True, amount_remaining__gt=0)
+
+    def summary(self):
+        """Totaux par tranche, total général et nombre d'éléments, en une requête."""
+        aggregates = {
+            f'tranche_{index}': Sum('amount_remaining', filter=self._tranche_q(low, high))
+            for index, (_label, low, high) in enumerate(TRANCHES)
+        }
+        row = self.open_items().order_by().aggregate(
+            grand_total=Sum('amount_remaining'), count=Count('id'), **aggregates,
+        )
+        totals = {
+            label: row[f'tranche_{index}'] or Decimal('0')
+            for index, (label, _low, _high) in enumerate(TRANCHES)
+        }
+        return {
+            'tranches_data': [{'label': label, 'amount': totals[label]} for label, _, _ in TRANCHES],
+            'tranches': [label for label, _, _ in TRANCHES],
+            'totals': totals,
+            'grand_total': row['grand_total'] or Decimal('0'),
+            'count': row['count'],
+            'balance_type': self.balance_type,
+            'title': self.title,
+        }
+
+    def _detail_queryset(self):
+        # Tri sur la date du document (vente / approvisionnement), qui fixe
+        # l'ancienneté : la ligne de crédit peut être bien plus récente (un
+        # CreditSupply n'est créé qu'au premier règlement)
+        return self.open_items().annotate(
+            tranche=self._tranche_case(), document_date=F(self.date_field),
+        )
+
+    def _describe(self, item):
+        if self.balance_type == 'client':
+            created = item.sale.create_at
+            client = item.sale.client
+            tiers = f"{client.firstname} {client.lastname}" if client else ''
+            reference = f"Vente #{item.sale_id}"
+            tiers = tiers or 'Client anonyme'
+        else:
+            created = item.supply.create_at
+            supplier = item.supply.supplier
+            tiers = supplier.name if supplier else 'Fournisseur inconnu'
+            reference = f"Appro. #{item.supply_id} — {item.supply.product.name}"
+        item_date = timezone.localdate(created) if created else self.today
+        return {
+            'reference': reference,
+            'tiers': tiers,
+            'date': item_date,
+            'due_date': item.due_date,
+            'age_days': (self.today - item_date).days,
+            'tranche': item.tranche,
+            'amount': item.amount_remaining,
+        }
+
+    def get_page(self, cursor=None, per_page=None, base_params=None):
+        """
+        Une page du détail, du document le plus ancien au plus récent :
+        (KeysetPage, lignes).
+        Lève InvalidCursor si le curseur est illisible.
+        """
+        paginator = KeysetPaginator(
+            self._detail_queryset(), per_page=per_page or self.PAGE_SIZE,
+            descending=False, count_mode=COUNT_NONE, order_field='document_date',
+        )
+        page = paginator.get_page(cursor, base_params=base_params)
+        return page, [self._describe(item) for item in page.object_list]
+
+    def iter_items(self, chunk_size=None):
+        """Tout le détail, lu par lots (export CSV)."""
+        items = self._detail_queryset().order_by('document_date', 'id')
+        for item in items.iterator(chunk_size=chunk_size or self.EXPORT_CHUNK_SIZE):
+            yield self._describe(item)
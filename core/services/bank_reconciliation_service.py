@@ -0,0 +1,281 @@
+"""
+Rapprochement bancaire automatique.
+
+Les lignes de relevé non rapprochées sont appariées aux lignes d'écriture du
+compte bancaire (521, 585) de même montant exact : les lignes d'écriture sont
+rangées par (sens, montant) dans des seaux triés par date, et chaque ligne de
+relevé ne compare que les candidats de son seau situés dans la fenêtre de
+dates (recherche dichotomique), au lieu de toutes les paires.
+
+Chaque paire reçoit une confiance (0–100) combinant l'écart de dates et la
+ressemblance des libellés/références ; les paires retenues sont appliquées en
+masse et consignées dans un BankReconciliationRun, annulable en bloc.
+"""
+
+import bisect
+import re
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from core.models import (
+    BankReconciliationMatch, BankReconciliationRun, BankStatement, JournalEntryLine,
+)
+from core.services.accounting_cache_service import AccountingCacheService
+
+
+_WORD_RE = re.compile(r'\w{3,}')
+
+
+class BankReconciliationService:
+
+    BULK_BATCH_SIZE = 1000
+
+    # Poids de la confiance : proximité des dates / ressemblance des libellés
+    DATE_WEIGHT = 50
+    TEXT_WEIGHT = 50
+
+    @staticmethod
+    def _date_window():
+        return getattr(settings, 'BANK_MATCH_DATE_WINDOW_DAYS', 5)
+
+    @staticmethod
+    def default_min_confidence():
+        return getattr(settings, 'BANK_MATCH_MIN_CONFIDENCE', 60)
+
+    # ── Chargement ────────────────────────────────────────────────────
+
+    @staticmethod
+    def _statements(account, date_start=None, date_end=None):
+        rows = BankStatement.objects.filter(account=account, is_reconciled=False, delete_at__isnull=True)
+        if date_start:
+            rows = rows.filter(statement_date__gte=date_start)
+        if date_end:
+            rows = rows.filter(statement_date__lte=date_end)
+        return list(rows.values('id', 'statement_date', 'amount', 'statement_type', 'reference', 'description'))
+
+    @staticmethod
+    def _entry_lines(account, date_start, date_end):
+        """Lignes d'écriture du compte, non encore rapprochées, entre deux dates."""
+        reconciled = BankStatement.objects.filter(
+            reconciled_entry=OuterRef('pk'), is_reconciled=True, delete_at__isnull=True,
+        )
+        return list(
+            JournalEntryLine.objects.filter(
+                account=account,
+                entry__is_validated=True,
+                entry__delete_at__isnull=True,
+                delete_at__isnull=True,
+                entry__date__gte=date_start,
+                entry__date__lte=date_end,
+            ).exclude(Exists(reconciled)).values(
+                'id', 'debit', 'credit', 'description', 'entry__date',
+                'entry__reference', 'entry__description',
+            )
+        )
+
+    # ── Appariement ───────────────────────────────────────────────────
+
+    @staticmethod
+    def _words(*texts):
+        return {word for text in texts if text for word in _WORD_RE.findall(text.casefold())}
+
+    @classmethod
+    def _text_score(cls, statement, line, line_words):
+        """Ressemblance (0–1) : référence bancaire retrouvée, sinon indice de Jaccard des mots."""
+        reference = (statement['reference'] or '').strip().casefold()
+        if reference and (
+            reference == (line['entry__reference'] or '').casefold()
+            or reference in (line['description'] or '').casefold()
+            or reference in (line['entry__description'] or '').casefold()
+        ):
+            return 1.0
+        statement_words = cls._words(statement['description'], statement['reference'])
+        if not statement_words or not line_words:
+            return 0.0
+        return len(statement_words & line_words) / len(statement_words | line_words)
+
+    @classmethod
+    def find_matches(cls, account, date_start=None, date_end=None, min_confidence=None, window=None):
+        """
+        Paires proposées pour les lignes de relevé non rapprochées du compte :
+        [{'statement_id', 'entry_line_id', 'confidence', 'statement', 'line'}],
+        par confiance décroissante. Une ligne n'apparaît que dans une paire.
+        """
+        window = cls._date_window() if window is None else window
+        min_confidence = cls.default_min_confidence() if min_confidence is None else min_confidence
+        statements = cls._statements(account, date_start, date_end)
+        if not statements:
+            return []
+
+        span = timedelta(days=window)
+        lines = cls._entry_lines(
+            account,
+            min(s['statement_date'] for s in statements) - span,
+            max(s['statement_date'] for s in statements) + span,
+        )
+
+        # Seaux (sens, montant) → lignes triées par date. Un crédit du relevé
+        # (entrée d'argent) correspond à un débit du compte de banque.
+        buckets = defaultdict(list)
+        for line in lines:
+            if line['debit']:
+                buckets[('CREDIT', line['debit'])].append(line)
+            if line['credit']:
+                buckets[('DEBIT', line['credit'])].append(line)
+        dates = {}
+        for key, bucket in buckets.items():
+            bucket.sort(key=lambda line: (line['entry__date'], line['id']))
+            dates[key] = [line['entry__date'] for line in bucket]
+
+        line_words = {}
+        candidates = []
+        for statement in statements:
+            key = (statement['statement_type'], statement['amount'])
+            bucket = buckets.get(key)
+            if not bucket:
+                continue
+            day = statement['statement_date']
+            start = bisect.bisect_left(dates[key], day - span)
+            end = bisect.bisect_right(dates[key], day + span)
+            for line in bucket[start:end]:
+                words = line_words.get(line['id'])
+                if words is None:
+                    words = line_words[line['id']] = cls._words(
+                        line['description'], line['entry__reference'], line['entry__description'],
+                    )
+                gap = abs((line['entry__date'] - day).days)
+                date_score = 1 - gap / (window + 1)
+                confidence = round(
+                    cls.DATE_WEIGHT * date_score + cls.TEXT_WEIGHT * cls._text_score(statement, line, words)
+                )
+                if confidence >= min_confidence:
+                    candidates.append((confidence, -gap, statement, line))
+
+        # Glouton : les paires les plus sûres d'abord, chaque ligne une seule fois
+        candidates.sort(key=lambda c: (-c[0], -c[1], c[2]['id'], c[3]['id']))
+        used_statements, used_lines, matches = set(), set(), []
+        for confidence, _gap, statement, line in candidates:
+            if statement['id'] in used_statements or line['id'] in used_lines:
+                continue
+            used_statements.add(statement['id'])
+            used_lines.add(line['id'])
+            matches.append({
+                'statement_id': statement['id'],
+                'entry_line_id': line['id'],
+                'confidence': confidence,
+                'statement': statement,
+                'line': line,
+            })
+        return matches
+
+    # ── Application / annulation ──────────────────────────────────────
+
+    @classmethod
+    def apply_matches(cls, account, matches, user=None, min_confidence=None):
+        """
+        Applique les paires en masse et les consigne. Les paires dont la ligne
+        de relevé ou la ligne d'écriture a été rapprochée entre-temps sont
+        écartées. Retourne le BankReconciliationRun (None si rien n'est appliqué).
+        """
+        if not matches:
+            return None
+        now = timezone.now()
+        with transaction.atomic():
+            run = BankReconciliationRun.objects.create(
+                account=account,
+                created_by=user,
+                min_confidence=cls.default_min_confidence() if min_confidence is None else min_confidence,
+            )
+            BankReconciliationMatch.objects.bulk_create(
+                [
+                    BankReconciliationMatch(
+                        run=run,
+                        statement_id=match['statement_id'],
+                        entry_line_id=match['entry_line_id'],
+                        confidence=match['confidence'],
+                    )
+                    for match in matches
+                ],
+                batch_size=cls.BULK_BATCH_SIZE,
+            )
+            run_matches = BankReconciliationMatch.objects.filter(run=run)
+            run_matches.filter(
+                Q(statement__is_reconciled=True)
+                | Q(entry_line_id__in=BankStatement.objects.filter(is_reconciled=True).values('reconciled_entry_id'))
+            ).delete()
+            # Une seule requête UPDATE, la ligne d'écriture étant relue dans le journal du run
+            matched_count = BankStatement.objects.filter(
+                pk__in=run_matches.values('statement_id'),
+                is_reconciled=False,
+            ).update(
+                is_reconciled=True,
+                reconciled_entry_id=Subquery(
+                    run_matches.filter(statement_id=OuterRef('pk')).values('entry_line_id')[:1]
+                ),
+                reconciled_at=now,
+                reconciled_by=user,
+            )
+            if not matched_count:
+                run.delete()
+                return None
+            run.matched_count = matched_count
+            run.save(update_fields=['matched_count'])
+        return run
+
+    @classmethod
+    def auto_reconcile(cls, account_code, date_start=None, date_end=None, user=None,
+                       min_confidence=None, dry_run=False):
+        """
+        Apparie et applique les rapprochements d'un compte bancaire.
+        Retourne {'run', 'matches', 'duration_ms'} (run = None en dry-run ou sans paire).
+        """
+        started = time.monotonic()
+        account = AccountingCacheService.get_account(account_code)
+        matches = cls.find_matches(account, date_start, date_end, min_confidence)
+        run = None
+        if not dry_run:
+            run = cls.apply_matches(account, matches, user=user, min_confidence=min_confidence)
+        return {
+            'run': run,
+            'matches': matches,
+            'duration_ms': round((time.monotonic() - started) * 1000),
+        }
+
+    @staticmethod
+    def undo_run(run_id, user=None):
+        """
+        Annule un rapprochement automatique : les lignes de relevé encore
+        rapprochées comme il les avait laissées redeviennent non rapprochées.
+        Retourne le nombre de lignes rétablies.
+        """
+        with transaction.atomic():
+            run = BankReconciliationRun.objects.select_for_update().get(pk=run_id)
+            if run.undone_at:
+                raise ValueError("Ce rapprochement automatique a déjà été annulé.")
+            restored = BankStatement.objects.filter(
+                Exists(BankReconciliationMatch.objects.filter(
+                    run=run, statement=OuterRef('pk'), entry_line=OuterRef('reconciled_entry'),
+                )),
+                is_reconciled=True,
+            ).update(
+                is_reconciled=False,
+                reconciled_entry=None,
+                reconciled_at=None,
+                reconciled_by=None,
+            )
+            run.undone_at = timezone.now()
+            run.undone_by = user
+            run.save(update_fields=['undone_at', 'undone_by'])
+        return restored
+
+    @staticmethod
+    def recent_runs(account, limit=10):
+        return BankReconciliationRun.objects.filter(account=account).select_related(
+            'created_by', 'undone_by',
+        )[:limit]
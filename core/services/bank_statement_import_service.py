@@ -0,0 +1,323 @@
+"""
+Import de relevés bancaires (CSV, OFX) en flux.
+
+Le fichier est lu ligne à ligne (jamais chargé en entier) ; chaque opération
+reçoit une empreinte SHA-256 de (compte, date, type, montant, référence,
+rang), le rang distinguant des opérations identiques d'un même fichier. Les
+rangs ne sont tenus que pour la date en cours (les relevés bancaires sont
+groupés par date) : la mémoire dépend du nombre de jours couverts, non du
+nombre de lignes, et un relevé dont une date reviendrait après une autre est
+refusé. Les lignes sont insérées par lots : pour chaque lot, les empreintes
+déjà connues (colonne indexée `content_hash`) sont écartées en une requête,
+puis le reste est créé par bulk_create. Réimporter un relevé, ou un relevé qui en chevauche
+un autre, n'ajoute donc que les opérations nouvelles ; un import interrompu
+peut être relancé tel quel.
+"""
+
+import csv
+import hashlib
+import io
+import itertools
+import re
+import unicodedata
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from core.models import BankStatement
+from core.services.accounting_cache_service import AccountingCacheService
+
+
+CSV_COLUMNS = {
+    'date': {'date', 'dateoperation', 'dateope', 'datecomptable'},
+    'description': {'libelle', 'description', 'designation', 'label', 'intitule', 'operation'},
+    'reference': {'reference', 'ref', 'numero', 'fitid'},
+    'amount': {'montant', 'amount'},
+    'debit': {'debit', 'sortie', 'retrait'},
+    'credit': {'credit', 'entree', 'depot'},
+    'type': {'type', 'sens'},
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%Y%m%d')
+
+_OFX_TAG_RE = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+class BankStatementImportService:
+
+    CHUNK_SIZE = 500
+    MAX_ERRORS = 50
+
+    # ── Empreinte ─────────────────────────────────────────────────────
+
+    @staticmethod
+    def content_hash(account_id, statement_date, statement_type, amount, reference, occurrence=0):
+        raw = '|'.join([
+            str(account_id),
+            statement_date.isoformat(),
+            statement_type,
+            f'{Decimal(amount):.2f}',
+            (reference or '').strip(),
+            str(occurrence),
+        ])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # ── Lecture des champs ────────────────────────────────────────────
+
+    @staticmethod
+    def _parse_date(value):
+        """Date d'une opération : objet date/datetime ou texte dans l'un des DATE_FORMATS."""
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        value = (value or '').strip()
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value[:10] if fmt != '%Y%m%d' else value[:8], fmt).date()
+            except ValueError:
+                continue
+        raise ValueError(f"date illisible '{value}'")
+
+    @staticmethod
+    def _parse_amount(value):
+        """Montant au format français ou anglais : '1 234,50', '1,234.50', '-800'."""
+        value = re.sub(r'\s', '', value or '')
+        if not value:
+            return Decimal('0')
+        if ',' in value and '.' in value:
+            value = value.replace('.', '') if value.rfind(',') > value.rfind('.') else value.replace(',', '')
+        try:
+            return Decimal(value.replace(',', '.'))
+        except InvalidOperation:
+            raise ValueError(f"montant illisible '{value}'") from None
+
+    @staticmethod
+    def _normalize_header(value):
+        value = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode()
+        return re.sub(r'[^a-z]', '', value.lower())
+
+    # ── Formats ───────────────────────────────────────────────────────
+
+    @classmethod
+    def parse_csv(cls, stream):
+        """
+        Opérations d'un CSV (séparateur ';', ',' ou tabulation, détecté sur
+        l'en-tête), lues au fil du flux. Colonnes reconnues : date, libellé,
+        référence, et soit montant signé (avec type/sens facultatif), soit
+        débit/crédit. Produit des dicts {line, date, description, amount,
+        type, reference} ou {line, error}.
+        """
+        header_line = stream.readline()
+        if not header_line:
+            return
+        delimiter = max(';,\t', key=header_line.count)
+        reader = csv.reader(itertools.chain([header_line], stream), delimiter=delimiter)
+        header = [cls._normalize_header(name) for name in next(reader)]
+        columns = {}
+        for field, aliases in CSV_COLUMNS.items():
+            columns[field] = next((i for i, name in enumerate(header) if name in aliases), None)
+        if columns['date'] is None or (columns['amount'] is None and columns['credit'] is None
+                                       and columns['debit'] is None):
+            raise ValueError("En-tête CSV non reconnu : colonnes date et montant (ou débit/crédit) requises.")
+
+        def cell(row, field):
+            index = columns[field]
+            return row[index].strip() if index is not None and index < len(row) else ''
+
+        for line_number, row in enumerate(reader, start=2):
+            if not any(value.strip() for value in row):
+                continue
+            try:
+                if columns['amount'] is not None:
+                    amount = cls._parse_amount(cell(row, 'amount'))
+                    kind = cls._normalize_header(cell(row, 'type'))
+                    if kind.startswith('d'):
+                        amount = -abs(amount)
+                    elif kind.startswith('c'):
+                        amount = abs(amount)
+                else:
+                    amount = cls._parse_amount(cell(row, 'credit')) - cls._parse_amount(cell(row, 'debit'))
+                if amount == 0:
+                    raise ValueError("montant nul")
+                yield {
+                    'line': line_number,
+                    'date': cls._parse_date(cell(row, 'date')),
+                    'description': cell(row, 'description'),
+                    'amount': abs(amount),
+                    'type': 'CREDIT' if amount > 0 else 'DEBIT',
+                    'reference': cell(row, 'reference'),
+                }
+            except ValueError as e:
+                yield {'line': line_number, 'error': str(e)}
+
+    @classmethod
+    def parse_ofx(cls, stream):
+        """
+        Opérations (<STMTTRN>) d'un fichier OFX, SGML (1.x) ou XML (2.x),
+        lues balise par balise au fil du flux.
+        """
+        transaction_tags = None
+        start_line = 0
+
+        def emit(tags, line_number):
+            try:
+                amount = cls._parse_amount(tags.get('TRNAMT'))
+                if amount == 0:
+                    raise ValueError("montant nul")
+                description = ' — '.join(dict.fromkeys(
+                    value for value in (tags.get('NAME'), tags.get('MEMO')) if value
+                ))
+                return {
+                    'line': line_number,
+                    'date': cls._parse_date(tags.get('DTPOSTED')),
+                    'description': description or tags.get('TRNTYPE', ''),
+                    'amount': abs(amount),
+                    'type': 'CREDIT' if amount > 0 else 'DEBIT',
+                    'reference': tags.get('FITID') or tags.get('CHECKNUM') or '',
+                }
+            except ValueError as e:
+                return {'line': line_number, 'error': str(e)}
+
+        for line_number, text in enumerate(stream, start=1):
+            for closing, tag, value in _OFX_TAG_RE.findall(text):
+                tag = tag.upper()
+                if tag == 'STMTTRN':
+                    # Fermeture explicite, ou nouvelle transaction (SGML sans balise fermante)
+                    if transaction_tags is not None:
+                        yield emit(transaction_tags, start_line)
+                    transaction_tags = None if closing else {}
+                    start_line = line_number
+                elif transaction_tags is None:
+                    continue
+                elif closing:
+                    if tag in ('BANKTRANLIST', 'STMTRS', 'CCSTMTRS'):
+                        yield emit(transaction_tags, start_line)
+                        transaction_tags = None
+                elif value.strip():
+                    transaction_tags[tag] = value.strip()
+        if transaction_tags:
+            yield emit(transaction_tags, start_line)
+
+    # ── Import ────────────────────────────────────────────────────────
+
+    @classmethod
+    def _flush(cls, account, chunk):
+        """Insère les lignes du lot dont l'empreinte est inconnue. Retourne le nombre créé."""
+        if not chunk:
+            return 0
+        with transaction.atomic():
+            known = set(
+                BankStatement.objects.filter(
+                    account=account, content_hash__in=[stmt.content_hash for stmt in chunk],
+                ).values_list('content_hash', flat=True)
+            )
+            new = [stmt for stmt in chunk if stmt.content_hash not in known]
+            BankStatement.objects.bulk_create(new)
+        return len(new)
+
+    @classmethod
+    def import_rows(cls, account, rows, chunk_size=None):
+        """
+        Importe des opérations {date, description, amount, type, reference?}
+        (ou {line, error}) en écartant les doublons. Retourne {'lines',
+        'imported', 'duplicates', 'error_count', 'errors'}.
+        Les opérations doivent être groupées par date (ordre croissant ou
+        décroissant) : lève ValueError si une date déjà close réapparaît. Les
+        lots déjà insérés restent valides, l'import peut être relancé sur le
+        relevé trié.
+        """
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        # Rangs des opérations identiques de la date en cours uniquement
+        occurrences = Counter()
+        current_date, closed_dates = None, set()
+        result = {'lines': 0, 'imported': 0, 'duplicates': 0, 'error_count': 0, 'errors': []}
+        chunk = []
+        for row in rows:
+            if 'error' in row:
+                result['error_count'] += 1
+                if len(result['errors']) < cls.MAX_ERRORS:
+                    result['errors'].append(f"Ligne {row['line']} : {row['error']}")
+                continue
+            statement_date = cls._parse_date(row['date'])
+            if statement_date != current_date:
+                if statement_date in closed_dates:
+                    raise ValueError(
+                        f"Ligne {row.get('line', '?')} : opérations du {statement_date:%d/%m/%Y} non groupées, "
+                        "le relevé doit être trié par date."
+                    )
+                if current_date is not None:
+                    closed_dates.add(current_date)
+                current_date = statement_date
+                occurrences.clear()
+            result['lines'] += 1
+            amount = Decimal(str(row['amount']))
+            reference = (row.get('reference') or '').strip()[:100]
+            base = cls.content_hash(account.id, statement_date, row['type'], amount, reference)
+            occurrence = occurrences[base]
+            occurrences[base] += 1
+            chunk.append(BankStatement(
+                account=account,
+                statement_date=statement_date,
+                description=(row.get('description') or '')[:500],
+                amount=amount,
+                statement_type=row['type'],
+                reference=reference,
+                content_hash=cls.content_hash(account.id, statement_date, row['type'], amount, reference, occurrence),
+            ))
+            if len(chunk) >= chunk_size:
+                result['imported'] += cls._flush(account, chunk)
+                chunk = []
+        result['imported'] += cls._flush(account, chunk)
+        result['duplicates'] = result['lines'] - result['imported']
+        return result
+
+    @staticmethod
+    def detect_format(filename):
+        name = (filename or '').lower()
+        if name.endswith(('.ofx', '.qfx')):
+            return 'ofx'
+        if name.endswith(('.csv', '.txt')):
+            return 'csv'
+        raise ValueError("Le relevé doit être un fichier CSV, TXT ou OFX.")
+
+    @classmethod
+    def import_file(cls, account_code, binary_file, filename=None, file_format=None,
+                    encoding='utf-8-sig', chunk_size=None):
+        """
+        Importe un relevé depuis un fichier binaire (upload ou fichier ouvert en
+        'rb'), lu en flux. Lève ValueError si le format ou l'en-tête est invalide.
+        """
+        account = AccountingCacheService.get_account(account_code)
+        file_format = file_format or cls.detect_format(filename or getattr(binary_file, 'name', ''))
+        stream = io.TextIOWrapper(binary_file, encoding=encoding, errors='replace', newline='')
+        try:
+            rows = cls.parse_ofx(stream) if file_format == 'ofx' else cls.parse_csv(stream)
+            return cls.import_rows(account, rows, chunk_size)
+        finally:
+            # Rendre le fichier à l'appelant sans le fermer
+            stream.detach()
+
+
+def ensure_bank_statement_hashes(sender, **kwargs):
+    """
+    Handler post_migrate : calcule l'empreinte des lignes de relevé importées
+    avant l'ajout de la colonne, pour qu'un nouvel import les reconnaisse.
+    """
+    rows = BankStatement.objects.filter(content_hash__isnull=True).order_by('account_id', 'id')
+    if not rows.exists():
+        return
+    occurrences = Counter()
+    batch = []
+    for stmt in rows.iterator():
+        args = (stmt.account_id, stmt.statement_date, stmt.statement_type, stmt.amount, stmt.reference)
+        base = BankStatementImportService.content_hash(*args)
+        stmt.content_hash = BankStatementImportService.content_hash(*args, occurrences[base])
+        occurrences[base] += 1
+        batch.append(stmt)
+        if len(batch) >= BankStatementImportService.CHUNK_SIZE:
+            BankStatement.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    BankStatement.objects.bulk_update(batch, ['content_hash'])
@@ -0,0 +1,174 @@
+"""
+Synchronisation incrémentale du catalogue pour les terminaux mobiles.
+
+Le terminal envoie le curseur reçu lors de la synchronisation précédente et
+ne reçoit que les lignes modifiées depuis (produits, images, catégories,
+rayons, gammes, types de grammage). Les lignes supprimées (delete_at
+renseigné) sont renvoyées sous forme de simples identifiants. Sans curseur,
+tout le catalogue est renvoyé : c'est la resynchronisation complète de la
+première installation.
+
+Le curseur contient, par type, la position (updated_at, id) de la dernière
+ligne transmise ; les lignes sont lues dans cet ordre, par lots de `limit`.
+
+updated_at est daté à l'écriture, pas à la validation : une transaction encore
+ouverte peut valider plus tard une ligne datée d'avant le curseur. La lecture
+s'arrête donc avant le début de la plus ancienne transaction d'écriture en
+cours (INNODB_TRX sous MySQL, pg_stat_activity sous PostgreSQL), moins
+CATALOG_SYNC_LAG_SECONDS (décalage d'horloge application/base). Sans accès à
+ces vues (SQLite, droit PROCESS manquant sous MySQL), seule la marge s'applique
+et elle doit dépasser la plus longue transaction d'écriture du catalogue.
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Category, Gamme, GrammageType, Product, ProductImage, Rayon
+
+
+class InvalidSyncCursor(ValueError):
+    """Curseur de synchronisation illisible."""
+
+
+class CatalogSyncService:
+    """Flux des modifications du catalogue (« changed since »)."""
+
+    DEFAULT_LIMIT = 500
+    MAX_LIMIT = 2000
+
+    # type → (modèle, champs transmis)
+    FEEDS = {
+        'products': (Product, (
+            'id', 'code', 'name', 'brand', 'color', 'stock', 'stock_limit',
+            'actual_price', 'max_salable_price', 'is_price_reducible', 'has_vat',
+            'grammage', 'exp_alert_period',
+            'category_id', 'gamme_id', 'rayon_id', 'grammage_type_id',
+        )),
+        'images': (ProductImage, ('id', 'product_id', 'image', 'is_primary')),
+        'categories': (Category, ('id', 'name', 'description')),
+        'rayons': (Rayon, ('id', 'name', 'description')),
+        'gammes': (Gamme, ('id', 'name', 'description')),
+        'grammage_types': (GrammageType, ('id', 'name', 'description')),
+    }
+
+    # ── Curseur ───────────────────────────────────────────────────────
+
+    @staticmethod
+    def encode_cursor(positions):
+        raw = json.dumps(positions, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """Retourne {type: (updated_at, id)} ; {} pour une première synchronisation."""
+        if not cursor:
+            return {}
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            positions = json.loads(raw)
+            return {
+                feed: (datetime.fromisoformat(position[0]), int(position[1]))
+                for feed, position in positions.items()
+                if feed in cls.FEEDS
+            }
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as exc:
+            raise InvalidSyncCursor("Curseur de synchronisation invalide.") from exc
+
+    # ── Flux ──────────────────────────────────────────────────────────
+
+    # Âge (secondes) de la plus ancienne transaction ouverte ayant écrit,
+    # hors connexion courante ; NULL s'il n'y en a pas.
+    OPEN_WRITE_AGE_SQL = {
+        'mysql': (
+            "SELECT TIMESTAMPDIFF(MICROSECOND, MIN(trx_started), NOW()) / 1000000 "
+            "FROM information_schema.INNODB_TRX "
+            "WHERE trx_rows_modified > 0 AND trx_mysql_thread_id <> CONNECTION_ID()"
+        ),
+        'postgresql': (
+            "SELECT EXTRACT(EPOCH FROM clock_timestamp() - MIN(xact_start)) "
+            "FROM pg_stat_activity WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+        ),
+    }
+
+    @classmethod
+    def _oldest_open_write_age(cls):
+        """
+        Âge en secondes de la plus ancienne transaction d'écriture en cours :
+        0 s'il n'y en a pas, None si la base ne l'expose pas.
+        """
+        sql = cls.OPEN_WRITE_AGE_SQL.get(connection.vendor)
+        if sql is None:
+            return None
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql)
+                age = cursor.fetchone()[0]
+        except DatabaseError:
+            return None
+        return max(float(age or 0), 0.0)
+
+    @classmethod
+    def _safe_upper_bound(cls):
+        """
+        Borne de lecture : aucune transaction encore ouverte ne peut valider
+        une ligne datée d'avant. Elle recule jusqu'au début de la plus ancienne
+        transaction d'écriture en cours, moins la marge CATALOG_SYNC_LAG_SECONDS.
+        """
+        lag = getattr(settings, 'CATALOG_SYNC_LAG_SECONDS', 2)
+        open_write_age = cls._oldest_open_write_age() or 0
+        return timezone.now() - timedelta(seconds=lag + open_write_age)
+
+    @classmethod
+    def get_changes(cls, cursor=None, limit=None):
+        """
+        Modifications du catalogue depuis `cursor`.
+        Retourne un dict prêt à sérialiser : curseur suivant, `has_more`,
+        et pour chaque type {'changed': [...], 'deleted': [ids]}.
+        """
+        positions = cls.decode_cursor(cursor)
+        limit = min(max(int(limit or cls.DEFAULT_LIMIT), 1), cls.MAX_LIMIT)
+        upper_bound = cls._safe_upper_bound()
+
+        result = {'full_resync': not positions, 'has_more': False}
+        next_positions = {feed: [ts.isoformat(), pk] for feed, (ts, pk) in positions.items()}
+        for feed, (model, fields) in cls.FEEDS.items():
+            queryset = model.objects.filter(updated_at__lte=upper_bound)
+            position = positions.get(feed)
+            if position:
+                updated_at, last_id = position
+                queryset = queryset.filter(
+                    Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=last_id)
+                )
+            else:
+                # Première synchronisation : inutile d'envoyer les suppressions
+                queryset = queryset.filter(delete_at__isnull=True)
+            rows = list(
+                queryset.order_by('updated_at', 'id')
+                .values(*fields, 'updated_at', 'delete_at')[:limit + 1]
+            )
+            if len(rows) > limit:
+                result['has_more'] = True
+                rows = rows[:limit]
+            if rows:
+                next_positions[feed] = [rows[-1]['updated_at'].isoformat(), rows[-1]['id']]
+            elif feed not in next_positions:
+                # Type encore vide : rien n'existe jusqu'à la borne de lecture
+                next_positions[feed] = [upper_bound.isoformat(), 0]
+
+            changed, deleted = [], []
+            for row in rows:
+                row.pop('updated_at')
+                if row.pop('delete_at') is not None:
+                    deleted.append(row['id'])
+                else:
+                    changed.append(row)
+            result[feed] = {'changed': changed, 'deleted': deleted}
+
+        result['cursor'] = cls.encode_cursor(next_positions)
+        return result
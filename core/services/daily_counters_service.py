@@ -0,0 +1,212 @@
+"""
+Compteurs du tableau de bord par journée de caisse (DailyCounters).
+
+Chaque vente, annulation, retour partiel, approvisionnement, dépense ou
+recette incrémente la ligne de sa journée par un UPDATE `F()` unique, dans la
+transaction de l'opération : le tableau de bord et le résumé de caisse lisent
+une seule ligne au lieu de réagréger les ventes, lignes de vente, dépenses,
+recettes et approvisionnements de la journée à chaque rafraîchissement.
+
+Les modifications et suppressions d'approvisionnements, dépenses ou recettes
+(hors création) recalculent la ligne de leur journée. La clôture de journée et
+la commande `reconcile_daily_counters` (planifiée chaque nuit) comparent les
+compteurs aux tables vivantes et corrigent toute dérive.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import (
+    Daily, DailyCounters, DailyExpense, DailyRecipe, Sale, SaleProduct, Supply,
+)
+
+
+ZERO = Decimal('0')
+
+COUNTER_FIELDS = (
+    'revenue', 'sales_count', 'cancelled_sales_count', 'products_sold',
+    'expenses_total', 'recipes_total', 'supplies_count', 'supplies_total', 'first_sale_at',
+)
+
+
+class DailyCountersService:
+
+    # ── Incréments ────────────────────────────────────────────────────
+
+    @classmethod
+    def increment(cls, daily_id, first_sale_at=None, **deltas):
+        """
+        Ajoute `deltas` ({champ: valeur}) aux compteurs de la journée, en un
+        UPDATE. Si la journée n'a pas encore de ligne (journée antérieure aux
+        compteurs), la ligne est calculée depuis les tables vivantes, opération
+        en cours comprise. `first_sale_at` est soit l'heure d'une nouvelle vente
+        (retenue si c'est la première), soit une expression qui la remplace.
+        """
+        values = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        if hasattr(first_sale_at, 'resolve_expression'):
+            values['first_sale_at'] = first_sale_at
+        elif first_sale_at is not None:
+            values['first_sale_at'] = Coalesce(F('first_sale_at'), Value(first_sale_at))
+        if not values:
+            return
+        values['updated_at'] = timezone.now()
+        if not DailyCounters.objects.filter(daily_id=daily_id).update(**values):
+            cls.reconcile([daily_id])
+
+    @classmethod
+    def record_sale(cls, sale, quantity, count=0, amount=ZERO, cancelled=0):
+        """
+        Reporte une vente (count=1), son annulation (count=-1, cancelled=1) ou
+        un retour partiel (count=0) : `quantity` et `amount` sont signés.
+        À l'annulation, la première vente est relue parmi les autres ventes
+        actives de la journée, dans le même UPDATE.
+        """
+        first_sale_at = None
+        if count > 0:
+            first_sale_at = sale.create_at
+        elif count < 0:
+            first_sale_at = Subquery(
+                Sale.objects.filter(daily_id=sale.daily_id, delete_at__isnull=True).exclude(pk=sale.pk)
+                .order_by('create_at').values('create_at')[:1]
+            )
+        cls.increment(
+            sale.daily_id,
+            first_sale_at=first_sale_at,
+            revenue=amount,
+            sales_count=count,
+            cancelled_sales_count=cancelled,
+            products_sold=quantity,
+        )
+
+    @classmethod
+    def record_created(cls, instance):
+        """Reporte un approvisionnement, une dépense ou une recette qui vient d'être créé."""
+        if isinstance(instance, Supply):
+            cls.increment(instance.daily_id, supplies_count=1, supplies_total=Decimal(instance.total_price or 0))
+        elif isinstance(instance, DailyExpense):
+            cls.increment(instance.daily_id, expenses_total=Decimal(instance.amount or 0))
+        else:
+            cls.increment(instance.daily_id, recipes_total=Decimal(instance.amount or 0))
+
+    @classmethod
+    def refresh(cls, instance):
+        """Recalcule les compteurs de la journée de `instance` (modification, annulation)."""
+        return cls.reconcile([instance.daily_id])
+
+    # ── Lecture ───────────────────────────────────────────────────────
+
+    @classmethod
+    def get_counters(cls, daily):
+        """Ligne de compteurs de la journée, calculée à la volée si elle manque encore."""
+        try:
+            return daily.counters
+        except DailyCounters.DoesNotExist:
+            cls.reconcile([daily.id])
+            return DailyCounters.objects.get(daily=daily)
+
+    # ── Recalcul depuis les tables vivantes ───────────────────────────
+
+    @staticmethod
+    def empty():
+        return {
+            'revenue': ZERO, 'sales_count': 0, 'cancelled_sales_count': 0, 'products_sold': 0,
+            'expenses_total': ZERO, 'recipes_total': ZERO, 'supplies_count': 0, 'supplies_total': ZERO,
+            'first_sale_at': None,
+        }
+
+    @staticmethod
+    def compute(daily_ids=None):
+        """{daily_id: {champ: valeur}} recalculés depuis les tables vivantes (une requête par table)."""
+        def scoped(queryset, field='daily_id'):
+            if daily_ids is not None:
+                queryset = queryset.filter(**{f'{field}__in': daily_ids})
+            return queryset.order_by()
+
+        expected = {}
+
+        def row(daily_id):
+            if daily_id not in expected:
+                expected[daily_id] = DailyCountersService.empty()
+            return expected[daily_id]
+
+        active = Q(delete_at__isnull=True)
+        for sales in scoped(Sale.objects.all()).values('daily_id').annotate(
+            revenue=Sum('total', filter=active),
+            sales_count=Count('id', filter=active),
+            cancelled_sales_count=Count('id', filter=Q(delete_at__isnull=False)),
+            first_sale_at=Min('create_at', filter=active),
+        ):
+            row(sales['daily_id']).update(
+                revenue=sales['revenue'] or ZERO,
+                sales_count=sales['sales_count'],
+                cancelled_sales_count=sales['cancelled_sales_count'],
+                first_sale_at=sales['first_sale_at'],
+            )
+        for lines in scoped(
+            SaleProduct.objects.filter(delete_at__isnull=True, sale__delete_at__isnull=True), 'sale__daily_id',
+        ).values('sale__daily_id').annotate(quantity=Sum('quantity')):
+            row(lines['sale__daily_id'])['products_sold'] = lines['quantity'] or 0
+        for field, model in (('expenses_total', DailyExpense), ('recipes_total', DailyRecipe)):
+            for amounts in scoped(model.objects.filter(delete_at__isnull=True)).values('daily_id').annotate(
+                total=Sum('amount'),
+            ):
+                row(amounts['daily_id'])[field] = amounts['total'] or ZERO
+        for supplies in scoped(Supply.objects.filter(delete_at__isnull=True)).values('daily_id').annotate(
+            count=Count('id'), total=Sum('total_price'),
+        ):
+            row(supplies['daily_id']).update(supplies_count=supplies['count'], supplies_total=supplies['total'] or ZERO)
+        return expected
+
+    @classmethod
+    def reconcile(cls, daily_ids=None):
+        """
+        Rapproche les compteurs des journées `daily_ids` (toutes si None) des
+        tables vivantes : crée les lignes manquantes et corrige les compteurs
+        divergents. Retourne le nombre de lignes corrigées.
+        """
+        if daily_ids is not None:
+            daily_ids = list(daily_ids)
+        expected = cls.compute(daily_ids)
+        dailies = Daily.objects.all() if daily_ids is None else Daily.objects.filter(pk__in=daily_ids)
+
+        now = timezone.now()
+        with transaction.atomic():
+            rows = {
+                row.daily_id: row
+                for row in DailyCounters.objects.filter(daily__in=dailies).select_for_update().order_by('pk')
+            }
+            changed, missing = [], []
+            for daily_id in dailies.values_list('pk', flat=True):
+                values = expected.get(daily_id) or cls.empty()
+                counters = rows.get(daily_id)
+                if counters is None:
+                    missing.append(DailyCounters(daily_id=daily_id, updated_at=now, **values))
+                elif any(getattr(counters, name) != value for name, value in values.items()):
+                    for name, value in values.items():
+                        setattr(counters, name, value)
+                    counters.updated_at = now
+                    changed.append(counters)
+            if changed:
+                DailyCounters.objects.bulk_update(changed, list(COUNTER_FIELDS) + ['updated_at'])
+            if missing:
+                DailyCounters.objects.bulk_create(missing, ignore_conflicts=True)
+        return len(changed) + len(missing)
+
+    @classmethod
+    def reconcile_daily(cls, daily):
+        """Rapproche les compteurs d'une journée (clôture)."""
+        return cls.reconcile([daily.id])
+
+
+def ensure_daily_counters(sender, **kwargs):
+    """
+    Handler post_migrate : à la première installation de la table, calcule les
+    compteurs de toutes les journées existantes.
+    """
+    if DailyCounters.objects.exists() or not Daily.objects.exists():
+        return
+    DailyCountersService.reconcile()
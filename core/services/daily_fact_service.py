@@ -0,0 +1,336 @@
+"""
+Table de faits des statistiques (DailyFact), au grain jour × produit ×
+personnel × client × type de paiement, plus fournisseur et type de dépense ou
+de recette.
+
+Chaque écriture reporte ses mesures (nombre d'opérations, quantité, montant)
+dans la ligne journalière de ses dimensions :
+
+- vente : un fait SALE (en-tête) et un fait ITEM par produit, retranchés au
+  retour partiel et à l'annulation, au jour de la vente d'origine ; le nombre
+  d'un fait ITEM est celui des ventes distinctes contenant le produit ;
+- approvisionnement, dépense, recette : incrément à la création, recalcul du
+  jour concerné à toute modification (annulation, retour fournisseur…).
+
+`reconcile()` recalcule les faits d'une période depuis les tables vivantes et
+corrige les écarts (appelé à la clôture de la journée) ; `rebuild()` et la
+commande `rebuild_daily_facts` reconstruisent toute la table en agrégations
+GROUP BY.
+
+Les pages de statistiques lisent ces faits ; `as_facts()` expose une table
+vivante sous les mêmes noms de champs (`day`, `count`, `amount`) quand un
+filtre porte sur un attribut absent de la table de faits (recherche libre,
+statut de paiement).
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Sum, Value, When,
+)
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from core.models import DailyExpense, DailyFact, DailyRecipe, Sale, SaleProduct, Supply
+
+
+ZERO = Decimal('0')
+
+# Ordre des dimensions d'un fait, après (type, jour)
+DIMENSIONS = ('product_id', 'staff_id', 'client_id', 'supplier_id', 'expense_type_id', 'recipe_type_id', 'is_credit')
+
+KIND_MODELS = {
+    DailyFact.KIND_SUPPLY: Supply,
+    DailyFact.KIND_EXPENSE: DailyExpense,
+    DailyFact.KIND_RECIPE: DailyRecipe,
+}
+
+
+class DailyFactService:
+
+    REBUILD_BATCH_SIZE = 1000
+
+    # ── Clés ──────────────────────────────────────────────────────────
+
+    @staticmethod
+    def make_key(kind, day, product_id=None, staff_id=None, client_id=None, supplier_id=None,
+                 expense_type_id=None, recipe_type_id=None, is_credit=False):
+        """Tuple (type, jour, dimensions…) identifiant une ligne de faits."""
+        return (kind, day, product_id, staff_id, client_id, supplier_id, expense_type_id, recipe_type_id, bool(is_credit))
+
+    @staticmethod
+    def key_string(key):
+        kind, day, *dimensions = key
+        return '|'.join([kind, day.isoformat(), *('' if value is None else str(int(value)) for value in dimensions)])
+
+    @classmethod
+    def _row_key(cls, row):
+        return cls.make_key(row.kind, row.day, *(getattr(row, name) for name in DIMENSIONS))
+
+    @classmethod
+    def _new_row(cls, key, count, quantity, amount):
+        return DailyFact(
+            key=cls.key_string(key), kind=key[0], day=key[1],
+            **dict(zip(DIMENSIONS, key[2:])),
+            count=count, quantity=quantity, amount=amount,
+        )
+
+    # ── Mise à jour incrémentale ──────────────────────────────────────
+
+    @classmethod
+    def add_many(cls, deltas):
+        """
+        Reporte {clé: [nombre, quantité, montant]} en deux requêtes, quelle
+        que soit la taille du panier : un INSERT groupé des lignes absentes (à
+        zéro, les conflits d'une caisse concurrente étant ignorés), puis un
+        UPDATE unique qui incrémente chaque ligne (expressions F et CASE).
+        """
+        deltas = {cls.key_string(key): (key, values) for key, values in deltas.items() if any(values)}
+        if not deltas:
+            return
+
+        def increments(index, output_field):
+            return Case(
+                *[When(key=string, then=Value(values[index])) for string, (_key, values) in deltas.items()],
+                default=Value(0), output_field=output_field,
+            )
+
+        with transaction.atomic():
+            DailyFact.objects.bulk_create(
+                [cls._new_row(key, 0, 0, ZERO) for key, _values in deltas.values()],
+                ignore_conflicts=True,
+            )
+            DailyFact.objects.filter(key__in=deltas).update(
+                count=F('count') + increments(0, IntegerField()),
+                quantity=F('quantity') + increments(1, IntegerField()),
+                amount=F('amount') + increments(2, DecimalField(max_digits=17, decimal_places=2)),
+            )
+
+    @classmethod
+    def record_sale(cls, sale, lines=(), count=0, amount=ZERO, removed_products=()):
+        """
+        Reporte un mouvement de vente : (nombre, montant) sur l'en-tête et
+        [(SaleProduct, quantité)] sur les articles, positifs à la vente,
+        négatifs au retour ou à l'annulation. `count` s'applique une fois par
+        produit ; au retour partiel, `removed_products` liste les produits dont
+        la vente n'a plus aucune ligne.
+        """
+        day = timezone.localdate(sale.create_at)
+        dimensions = {'staff_id': sale.staff_id, 'client_id': sale.client_id, 'is_credit': sale.is_credit}
+        deltas = defaultdict(lambda: [0, 0, ZERO])
+        header = deltas[cls.make_key(DailyFact.KIND_SALE, day, **dimensions)]
+        header[0] += count
+        header[2] += Decimal(amount)
+
+        def item(product_id):
+            return deltas[cls.make_key(DailyFact.KIND_ITEM, day, product_id=product_id, **dimensions)]
+
+        for sale_product, quantity in lines:
+            item(sale_product.product_id)[1] += quantity
+            item(sale_product.product_id)[2] += Decimal(sale_product.unit_price) * quantity
+        for product_id in {sale_product.product_id for sale_product, _quantity in lines}:
+            item(product_id)[0] += count
+        for product_id in removed_products:
+            item(product_id)[0] -= 1
+        cls.add_many(deltas)
+
+    @classmethod
+    def record_created(cls, instance):
+        """Reporte un approvisionnement, une dépense ou une recette qui vient d'être créé."""
+        kind = next(kind for kind, model in KIND_MODELS.items() if isinstance(instance, model))
+        day = timezone.localdate(instance.create_at)
+        if kind == DailyFact.KIND_SUPPLY:
+            key = cls.make_key(
+                kind, day, product_id=instance.product_id, staff_id=instance.staff_id,
+                supplier_id=instance.supplier_id, is_credit=instance.is_credit,
+            )
+            values = [1, instance.quantity or 0, Decimal(instance.total_price or 0)]
+        elif kind == DailyFact.KIND_EXPENSE:
+            key = cls.make_key(kind, day, staff_id=instance.staff_id, expense_type_id=instance.expense_type_id)
+            values = [1, 0, Decimal(instance.amount or 0)]
+        else:
+            key = cls.make_key(kind, day, staff_id=instance.staff_id, recipe_type_id=instance.recipe_type_id)
+            values = [1, 0, Decimal(instance.amount or 0)]
+        cls.add_many({key: values})
+
+    @classmethod
+    def refresh_day(cls, instance):
+        """Recalcule les faits du jour et du type de `instance` (modification, annulation)."""
+        kind = next(kind for kind, model in KIND_MODELS.items() if isinstance(instance, model))
+        day = timezone.localdate(instance.create_at)
+        return cls.reconcile(day, day, kinds=[kind])
+
+    # ── Recalcul depuis les tables vivantes ───────────────────────────
+
+    @staticmethod
+    def _period(queryset, field, date_from, date_to):
+        if date_from:
+            queryset = queryset.filter(**{f'{field}__date__gte': date_from})
+        if date_to:
+            queryset = queryset.filter(**{f'{field}__date__lte': date_to})
+        return queryset.order_by()
+
+    @classmethod
+    def _grouped(cls, kind, date_from=None, date_to=None):
+        """Agrégation GROUP BY des faits d'un type : itère sur (clé, [nombre, quantité, montant])."""
+        amount = DecimalField(max_digits=17, decimal_places=2)
+        if kind == DailyFact.KIND_SALE:
+            rows = cls._period(Sale.objects.filter(delete_at__isnull=True), 'create_at', date_from, date_to).values(
+                'staff_id', 'client_id', 'is_credit', day=TruncDate('create_at'),
+            ).annotate(fact_count=Count('id'), fact_quantity=Value(0, output_field=IntegerField()), fact_amount=Sum('total'))
+        elif kind == DailyFact.KIND_ITEM:
+            lines = SaleProduct.objects.filter(delete_at__isnull=True, sale__delete_at__isnull=True)
+            rows = cls._period(lines, 'sale__create_at', date_from, date_to).values(
+                'product_id', staff_id=F('sale__staff_id'), client_id=F('sale__client_id'),
+                is_credit=F('sale__is_credit'), day=TruncDate('sale__create_at'),
+            ).annotate(
+                fact_count=Count('sale_id', distinct=True),
+                fact_quantity=Sum('quantity'),
+                fact_amount=Sum(ExpressionWrapper(F('quantity') * F('unit_price'), output_field=amount)),
+            )
+        elif kind == DailyFact.KIND_SUPPLY:
+            rows = cls._period(Supply.objects.filter(delete_at__isnull=True), 'create_at', date_from, date_to).values(
+                'product_id', 'staff_id', 'supplier_id', 'is_credit', day=TruncDate('create_at'),
+            ).annotate(fact_count=Count('id'), fact_quantity=Sum('quantity'), fact_amount=Sum('total_price'))
+        else:
+            model, type_field = (DailyExpense, 'expense_type_id') if kind == DailyFact.KIND_EXPENSE else (DailyRecipe, 'recipe_type_id')
+            rows = cls._period(model.objects.filter(delete_at__isnull=True), 'create_at', date_from, date_to).values(
+                'staff_id', type_field, day=TruncDate('create_at'),
+            ).annotate(fact_count=Count('id'), fact_quantity=Value(0, output_field=IntegerField()), fact_amount=Sum('amount'))
+
+        for row in rows.iterator():
+            key = cls.make_key(kind, row['day'], **{name: row[name] for name in DIMENSIONS if name in row})
+            yield key, [row['fact_count'] or 0, row['fact_quantity'] or 0, row['fact_amount'] or ZERO]
+
+    @classmethod
+    def compute(cls, date_from=None, date_to=None, kinds=None):
+        """{clé: [nombre, quantité, montant]} recalculés depuis les tables vivantes."""
+        facts = {}
+        for kind in kinds or [kind for kind, _label in DailyFact.KIND_CHOICES]:
+            facts.update(cls._grouped(kind, date_from, date_to))
+        return facts
+
+    @classmethod
+    def reconcile(cls, date_from=None, date_to=None, kinds=None):
+        """
+        Rapproche les faits d'une période des tables vivantes : crée les lignes
+        manquantes, corrige les mesures divergentes et supprime les lignes sans
+        opération. Retourne le nombre de lignes corrigées.
+        """
+        kinds = kinds or [kind for kind, _label in DailyFact.KIND_CHOICES]
+        expected = cls.compute(date_from, date_to, kinds)
+        rows = DailyFact.objects.filter(kind__in=kinds)
+        if date_from:
+            rows = rows.filter(day__gte=date_from)
+        if date_to:
+            rows = rows.filter(day__lte=date_to)
+
+        corrected = 0
+        with transaction.atomic():
+            stale, changed = [], []
+            for row in rows.select_for_update().order_by('pk'):
+                values = expected.pop(cls._row_key(row), None)
+                if values is None:
+                    if row.count or row.quantity or row.amount:
+                        corrected += 1
+                    stale.append(row.pk)
+                    continue
+                if [row.count, row.quantity, row.amount] != values:
+                    row.count, row.quantity, row.amount = values
+                    changed.append(row)
+            if stale:
+                DailyFact.objects.filter(pk__in=stale).delete()
+            if changed:
+                DailyFact.objects.bulk_update(changed, ['count', 'quantity', 'amount'])
+            if expected:
+                DailyFact.objects.bulk_create(
+                    [cls._new_row(key, *values) for key, values in expected.items()],
+                    batch_size=cls.REBUILD_BATCH_SIZE,
+                )
+        return corrected + len(changed) + len(expected)
+
+    @staticmethod
+    def _local_day(moment):
+        return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+
+    @classmethod
+    def reconcile_daily(cls, daily):
+        """Rapproche les jours couverts par une journée de caisse (clôture)."""
+        date_to = cls._local_day(daily.end_date) if daily.end_date else timezone.localdate()
+        date_from = cls._local_day(daily.start_date) if daily.start_date else date_to
+        return cls.reconcile(min(date_from, date_to), max(date_from, date_to))
+
+    @classmethod
+    def rebuild(cls):
+        """Reconstruit toute la table depuis les tables vivantes. Retourne le nombre de lignes écrites."""
+        written = 0
+        with transaction.atomic():
+            DailyFact.objects.all().delete()
+            for kind, _label in DailyFact.KIND_CHOICES:
+                batch = []
+                for key, values in cls._grouped(kind):
+                    batch.append(cls._new_row(key, *values))
+                    if len(batch) >= cls.REBUILD_BATCH_SIZE:
+                        DailyFact.objects.bulk_create(batch)
+                        written += len(batch)
+                        batch = []
+                DailyFact.objects.bulk_create(batch)
+                written += len(batch)
+        return written
+
+    # ── Lecture ───────────────────────────────────────────────────────
+
+    @staticmethod
+    def facts(kind, date_from=None, date_to=None):
+        """Faits d'un type sur une période (jours inclus)."""
+        rows = DailyFact.objects.filter(kind=kind)
+        if date_from:
+            rows = rows.filter(day__gte=date_from)
+        if date_to:
+            rows = rows.filter(day__lte=date_to)
+        return rows
+
+    @staticmethod
+    def as_facts(queryset, kind):
+        """
+        Expose une table vivante (Sale, Supply, DailyExpense, DailyRecipe) sous
+        les noms de champs des faits — `day`, `count`, `amount` — pour les
+        filtres que la table de faits ne porte pas.
+        """
+        queryset = queryset.annotate(day=TruncDate('create_at'), count=Value(1, output_field=IntegerField()))
+        if kind == DailyFact.KIND_SALE:
+            return queryset.annotate(amount=F('total'))
+        if kind == DailyFact.KIND_SUPPLY:
+            return queryset.annotate(amount=F('total_price'))
+        return queryset
+
+    @staticmethod
+    def bucket(start_date=None, end_date=None):
+        """
+        Granularité des courbes selon la période : (expression sur `day`,
+        'day'|'week'|'month'). Sans borne, regroupement mensuel.
+        """
+        if not start_date and not end_date:
+            return TruncMonth('day'), 'month'
+        effective_end = end_date or timezone.localdate()
+        effective_start = start_date or (effective_end - timedelta(days=180))
+        span_days = max((effective_end - effective_start).days + 1, 1)
+        if span_days <= 31:
+            return F('day'), 'day'
+        if span_days <= 120:
+            return TruncWeek('day'), 'week'
+        return TruncMonth('day'), 'month'
+
+
+def ensure_daily_facts(sender, **kwargs):
+    """
+    Handler post_migrate : à la première installation de la table, la remplit
+    depuis les ventes, approvisionnements, dépenses et recettes existants.
+    """
+    if DailyFact.objects.exists():
+        return
+    if Sale.objects.exists() or any(model.objects.exists() for model in KIND_MODELS.values()):
+        DailyFactService.rebuild()
@@ -0,0 +1,316 @@
+"""
+Clôture d'exercice et ouverture du suivant, en traitement ensembliste.
+
+Les soldes de tous les comptes sont lus en une seule agrégation GROUP BY sur
+les lignes d'écriture de l'exercice ; l'écriture de clôture (classes 6 et 7
+soldées vers le compte 12) et l'écriture d'ouverture (report à nouveau des
+comptes de bilan) sont créées par bulk_create.
+
+L'opération se fait en deux étapes, chacune dans sa propre transaction :
+clôture (écriture + ExerciseClosing + fin de l'exercice), puis ouverture.
+Relancée après une interruption, elle reprend à l'étape manquante. Un aperçu
+(dry-run) calcule l'écriture de clôture sans rien écrire.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import Account, Exercise, ExerciseClosing, JournalEntry, JournalEntryLine
+from core.services.account_balance_service import AccountBalanceService
+from core.services.accounting_cache_service import AccountingCacheService
+from core.services.sequence_service import SequenceService
+
+
+ZERO = Decimal('0')
+
+
+class ExerciseClosingService:
+
+    BULK_BATCH_SIZE = 1000
+    STEPS = 4
+
+    # ── Calcul (lecture seule) ────────────────────────────────────────
+
+    @staticmethod
+    def _account_balances(exercise, account_filter):
+        """
+        [(compte, solde signé)] des comptes retenus ayant un solde non nul,
+        triés par code : une requête pour les comptes, une pour les totaux.
+        """
+        accounts = [
+            account for account in Account.objects.filter(delete_at__isnull=True).order_by('code')
+            if account_filter(account)
+        ]
+        totals = {
+            row['account_id']: (row['total_debit'] or ZERO, row['total_credit'] or ZERO)
+            for row in JournalEntryLine.objects.filter(
+                entry__exercise=exercise,
+                entry__is_validated=True,
+                delete_at__isnull=True,
+            ).order_by().values('account_id').annotate(
+                total_debit=Sum('debit'), total_credit=Sum('credit'),
+            )
+        }
+        result = []
+        for account in accounts:
+            if account.id not in totals:
+                continue
+            balance = AccountBalanceService.signed_balance(account, *totals[account.id])
+            if balance != ZERO:
+                result.append((account, balance))
+        return result
+
+    @classmethod
+    def compute_closing(cls, exercise):
+        """
+        Écriture de clôture calculée, sans écriture en base :
+        {'lines': [{'account', 'debit', 'credit', 'description'}], 'total_charges',
+        'total_produits', 'resultat'}.
+        """
+        lines = []
+        total_charges = total_produits = ZERO
+        balances = cls._account_balances(exercise, lambda a: a.code[:1] in ('6', '7'))
+        for account, balance in balances:
+            # Solder le compte : écriture inverse de son solde
+            is_charge = account.code.startswith('6')
+            signed = balance if account.account_type in ('ACTIF', 'CHARGE') else -balance
+            if is_charge:
+                total_charges += signed
+            else:
+                total_produits -= signed
+            lines.append({
+                'account': account,
+                'debit': -signed if signed < 0 else ZERO,
+                'credit': signed if signed > 0 else ZERO,
+                'description': f"Clôture {account.code} — {account.name}",
+            })
+
+        resultat = total_produits - total_charges
+        compte_12 = AccountingCacheService.get_account('12')
+        if resultat >= 0:
+            # Bénéfice → Crédit 12
+            lines.append({
+                'account': compte_12, 'debit': ZERO, 'credit': resultat,
+                'description': "Résultat de l'exercice (bénéfice)",
+            })
+        else:
+            # Perte → Débit 12
+            lines.append({
+                'account': compte_12, 'debit': abs(resultat), 'credit': ZERO,
+                'description': "Résultat de l'exercice (perte)",
+            })
+        return {
+            'lines': lines,
+            'total_charges': total_charges,
+            'total_produits': total_produits,
+            'resultat': resultat,
+        }
+
+    @classmethod
+    def compute_opening(cls, exercise, resultat):
+        """Lignes de l'écriture d'ouverture : soldes des comptes de bilan et affectation du résultat."""
+        lines = []
+        balances = cls._account_balances(exercise, lambda a: a.code[:1] not in ('6', '7'))
+        for account, balance in balances:
+            # Débit si le solde est du côté naturel d'un compte ACTIF/CHARGE
+            debit_side = (account.account_type in ('ACTIF', 'CHARGE')) == (balance > 0)
+            lines.append({
+                'account': account,
+                'debit': abs(balance) if debit_side else ZERO,
+                'credit': ZERO if debit_side else abs(balance),
+                'description': f"Report à nouveau {account.code}",
+            })
+
+        # Reporter le résultat (12) vers report à nouveau (131 ou 139)
+        if resultat > 0:
+            lines.append({
+                'account': AccountingCacheService.get_account('12'), 'debit': resultat, 'credit': ZERO,
+                'description': "Affectation résultat bénéficiaire",
+            })
+            lines.append({
+                'account': AccountingCacheService.get_account('131'), 'debit': ZERO, 'credit': resultat,
+                'description': "Report à nouveau — bénéfice",
+            })
+        elif resultat < 0:
+            lines.append({
+                'account': AccountingCacheService.get_account('12'), 'debit': ZERO, 'credit': abs(resultat),
+                'description': "Affectation résultat déficitaire",
+            })
+            lines.append({
+                'account': AccountingCacheService.get_account('139'), 'debit': abs(resultat), 'credit': ZERO,
+                'description': "Report à nouveau — perte",
+            })
+        return lines
+
+    @classmethod
+    def preview(cls, exercise):
+        """Aperçu JSON de l'écriture de clôture (dry-run)."""
+        closing = cls.compute_closing(exercise)
+        lines = [
+            {
+                'account': line['account'].code,
+                'account_name': line['account'].name,
+                'debit': str(line['debit']),
+                'credit': str(line['credit']),
+                'description': line['description'],
+            }
+            for line in closing['lines']
+        ]
+        return {
+            'exercise_id': exercise.id,
+            'total_charges': str(closing['total_charges']),
+            'total_produits': str(closing['total_produits']),
+            'resultat': str(closing['resultat']),
+            'is_benefice': closing['resultat'] >= 0,
+            'total_debit': str(sum((line['debit'] for line in closing['lines']), ZERO)),
+            'total_credit': str(sum((line['credit'] for line in closing['lines']), ZERO)),
+            'lines': lines,
+        }
+
+    # ── Écriture ──────────────────────────────────────────────────────
+
+    @classmethod
+    def _write_lines(cls, entry, lines):
+        JournalEntryLine.objects.bulk_create(
+            [
+                JournalEntryLine(
+                    entry=entry,
+                    account=line['account'],
+                    debit=line['debit'],
+                    credit=line['credit'],
+                    description=line['description'],
+                )
+                for line in lines
+            ],
+            batch_size=cls.BULK_BATCH_SIZE,
+        )
+
+    @staticmethod
+    def _report(progress, step, message):
+        if progress:
+            progress(step, ExerciseClosingService.STEPS, message)
+
+    @classmethod
+    def close_exercise(cls, exercise, user=None, progress=None):
+        """
+        Clôture un exercice comptable :
+        1. Calcule le résultat (Produits classe 7 − Charges classe 6)
+        2. Solde les comptes 6 et 7 vers le compte 12 (Résultat de l'exercice)
+        3. Ferme l'exercice (end_date = now)
+        4. Enregistre l'historique dans ExerciseClosing
+        Retourne l'objet ExerciseClosing créé.
+        """
+        if not exercise.is_active():
+            raise ValueError("Cet exercice est déjà clôturé.")
+
+        cls._report(progress, 1, "Calcul des soldes des comptes de charges et de produits")
+        closing_data = cls.compute_closing(exercise)
+        resultat = closing_data['resultat']
+
+        cls._report(progress, 2, f"Écriture de clôture ({len(closing_data['lines'])} lignes)")
+        today = timezone.now().date()
+        with transaction.atomic():
+            # Verrou : deux clôtures simultanées du même exercice
+            exercise = Exercise.objects.select_for_update().get(pk=exercise.pk)
+            if not exercise.is_active():
+                raise ValueError("Cet exercice est déjà clôturé.")
+            closing_entry = JournalEntry.objects.create(
+                reference=SequenceService.next_reference('CL', today),
+                date=today,
+                description=f"Clôture exercice {exercise} — Résultat: {resultat} FCFA",
+                journal='OD',  # Opérations diverses
+                exercise=exercise,
+                is_validated=True,
+            )
+            cls._write_lines(closing_entry, closing_data['lines'])
+
+            # Fermer l'exercice
+            exercise.end_date = timezone.now()
+            exercise.save()
+
+            # Historique
+            closing = ExerciseClosing.objects.create(
+                exercise=exercise,
+                closed_at=timezone.now(),
+                closed_by=user,
+                result_amount=resultat,
+                closing_entry=closing_entry,
+            )
+        return closing
+
+    @classmethod
+    def open_new_exercise(cls, closing, user=None, progress=None):
+        """
+        Ouvre un nouvel exercice avec report à nouveau des comptes de bilan (classes 1-5).
+        1. Crée un nouvel exercice (ou reprend celui déjà ouvert après la clôture)
+        2. Crée une écriture d'ouverture avec les soldes des comptes 1-5
+        3. Reporte le résultat (compte 12) vers le report à nouveau (131/139)
+        Retourne le nouvel exercice.
+        """
+        if closing.opening_entry_id:
+            return closing.new_exercise
+
+        old_exercise = closing.exercise
+        cls._report(progress, 3, "Calcul des soldes des comptes de bilan")
+        lines = cls.compute_opening(old_exercise, closing.result_amount)
+
+        cls._report(progress, 4, f"Écriture d'ouverture ({len(lines)} lignes)")
+        today = timezone.now().date()
+        with transaction.atomic():
+            closing = ExerciseClosing.objects.select_for_update().get(pk=closing.pk)
+            if closing.opening_entry_id:
+                return closing.new_exercise
+
+            new_exercise = closing.new_exercise or Exercise.objects.filter(
+                end_date__isnull=True,
+            ).exclude(pk=old_exercise.pk).order_by('-start_date').first()
+            if new_exercise is None:
+                new_exercise = Exercise.objects.create(start_date=timezone.now(), end_date=None)
+
+            # Écriture d'ouverture (report à nouveau)
+            opening_entry = JournalEntry.objects.create(
+                reference=SequenceService.next_reference('AN', today),  # À-Nouveau
+                date=today,
+                description=f"Report à nouveau — ouverture exercice {new_exercise}",
+                journal='AN',
+                exercise=new_exercise,
+                is_validated=True,
+            )
+            cls._write_lines(opening_entry, lines)
+
+            closing.opening_entry = opening_entry
+            closing.new_exercise = new_exercise
+            closing.save()
+        return new_exercise
+
+    @staticmethod
+    def get_pending_closing():
+        """Clôture interrompue avant l'ouverture de l'exercice suivant, s'il y en a une."""
+        return ExerciseClosing.objects.filter(
+            delete_at__isnull=True, opening_entry__isnull=True,
+        ).select_related('exercise', 'new_exercise').order_by('-closed_at').first()
+
+    @classmethod
+    def close_and_open(cls, exercise, user=None, progress=None):
+        """
+        Clôture `exercise` et ouvre le suivant. Reprend une clôture
+        interrompue (écriture d'ouverture manquante) de ce même exercice au lieu
+        d'en commencer une autre ; refuse si l'interruption concerne un autre
+        exercice. Retourne (closing, nouvel exercice).
+        """
+        closing = cls.get_pending_closing()
+        if closing is None:
+            closing = cls.close_exercise(exercise, user=user, progress=progress)
+        elif closing.exercise_id != exercise.pk:
+            raise ValueError(
+                f"Une clôture est déjà en cours pour l'exercice {closing.exercise} : "
+                f"reprenez-la avant de clôturer un autre exercice."
+            )
+        else:
+            cls._report(progress, 2, f"Reprise de la clôture de l'exercice {closing.exercise}")
+        new_exercise = cls.open_new_exercise(closing, user=user, progress=progress)
+        closing.refresh_from_db()
+        return closing, new_exercise
@@ -0,0 +1,136 @@
+"""
+Moteur des états financiers OHADA (balance générale, compte de résultat, bilan).
+
+Les totaux de tous les comptes sont lus en une seule agrégation GROUP BY sur
+les soldes journaliers (AccountBalance), pour un exercice et une période
+donnés ; chaque état est ensuite dérivé en mémoire de ce même résultat. Un
+rapport coûte ainsi deux requêtes (plan comptable + totaux), quel que soit le
+nombre de comptes, et le bilan réutilise les totaux du compte de résultat.
+"""
+
+from decimal import Decimal
+
+from core.models import Account
+from core.services.account_balance_service import AccountBalanceService
+
+
+ZERO = Decimal('0')
+
+
+class FinancialReportService:
+    """Totaux par compte pour (exercice, période), chargés une seule fois."""
+
+    def __init__(self, exercise=None, date_from=None, date_to=None):
+        self.exercise = exercise
+        self.date_from = date_from
+        self.date_to = date_to
+        self._accounts = None
+        self._totals = None
+
+    def _load(self):
+        if self._accounts is None:
+            self._accounts = list(
+                Account.objects.filter(is_active=True, delete_at__isnull=True).order_by('code')
+            )
+            self._totals = AccountBalanceService.get_totals(
+                exercise=self.exercise, date_from=self.date_from, date_to=self.date_to,
+            )
+        return self._accounts, self._totals
+
+    def _rows(self, account_filter=None):
+        """(compte, total débit, total crédit) pour les comptes retenus, triés par code."""
+        accounts, totals = self._load()
+        for account in accounts:
+            if account_filter and not account_filter(account):
+                continue
+            total_debit, total_credit = totals.get(account.id, (ZERO, ZERO))
+            yield account, total_debit, total_credit
+
+    # ── États ─────────────────────────────────────────────────────────
+
+    def trial_balance(self):
+        """Balance générale : comptes mouvementés avec total_debit, total_credit, solde."""
+        return [
+            {
+                'account': account,
+                'total_debit': total_debit,
+                'total_credit': total_credit,
+                'balance': AccountBalanceService.signed_balance(account, total_debit, total_credit),
+            }
+            for account, total_debit, total_credit in self._rows()
+            if total_debit > 0 or total_credit > 0
+        ]
+
+    def _income_side(self, prefix, debit_side):
+        detail, total = [], ZERO
+        for account, total_debit, total_credit in self._rows(lambda a: a.code.startswith(prefix)):
+            balance = total_debit - total_credit if debit_side else total_credit - total_debit
+            if balance != 0:
+                detail.append({
+                    'account': account,
+                    'total_debit': total_debit,
+                    'total_credit': total_credit,
+                    'balance': balance,
+                })
+                total += balance
+        return detail, total
+
+    def income_statement(self):
+        """Compte de résultat : produits (classe 7) − charges (classe 6)."""
+        charges_detail, total_charges = self._income_side('6', debit_side=True)
+        produits_detail, total_produits = self._income_side('7', debit_side=False)
+        resultat_net = total_produits - total_charges
+        return {
+            'charges': charges_detail,
+            'produits': produits_detail,
+            'total_charges': total_charges,
+            'total_produits': total_produits,
+            'resultat_net': resultat_net,
+            'is_benefice': resultat_net >= 0,
+        }
+
+    def _balance_sheet_side(self, account_type, code_prefixes):
+        result, total = [], ZERO
+        for prefix in code_prefixes:
+            rows = self._rows(lambda a: a.account_type == account_type and a.code.startswith(prefix))
+            for account, total_debit, total_credit in rows:
+                balance = AccountBalanceService.signed_balance(account, total_debit, total_credit)
+                if balance != 0:
+                    result.append({'account': account, 'balance': abs(balance)})
+                    total += abs(balance)
+        return result, total
+
+    def balance_sheet(self):
+        """
+        Bilan simplifié : ACTIF (classes 2–5) et PASSIF (classes 1, 4, 5),
+        le résultat de l'exercice étant intégré côté passif.
+        """
+        actif_immobilise, total_immo = self._balance_sheet_side('ACTIF', ['2'])
+        actif_circulant, total_circ = self._balance_sheet_side('ACTIF', ['3', '4'])
+        tresorerie_actif, total_treso = self._balance_sheet_side('ACTIF', ['5'])
+        total_actif = total_immo + total_circ + total_treso
+
+        capitaux, total_capitaux = self._balance_sheet_side('PASSIF', ['1'])
+        dettes, total_dettes = self._balance_sheet_side('PASSIF', ['4'])
+        tresorerie_passif, total_treso_passif = self._balance_sheet_side('PASSIF', ['5'])
+
+        resultat_net = self.income_statement()['resultat_net']
+        total_passif = total_capitaux + total_dettes + total_treso_passif + max(resultat_net, ZERO)
+
+        return {
+            'actif_immobilise': actif_immobilise,
+            'actif_circulant': actif_circulant,
+            'tresorerie_actif': tresorerie_actif,
+            'total_immo': total_immo,
+            'total_circ': total_circ,
+            'total_treso': total_treso,
+            'total_actif': total_actif,
+            'capitaux': capitaux,
+            'dettes': dettes,
+            'tresorerie_passif': tresorerie_passif,
+            'total_capitaux': total_capitaux,
+            'total_dettes': total_dettes,
+            'total_treso_passif': total_treso_passif,
+            'resultat_net': resultat_net,
+            'total_passif': total_passif,
+        }
@@ -0,0 +1,139 @@
+"""
+Grand livre d'un compte, lu par pages.
+
+Le solde progressif est calculé par la base (`SUM(...) OVER (ORDER BY date,
+id)`) sur les seules lignes de la page ; le solde à l'entrée de la page
+(report) voyage dans le curseur, avec la position (date, id) de la dernière
+ligne lue. Aucune page ne charge plus de `per_page` lignes, et l'export CSV
+parcourt le compte page après page.
+"""
+
+import base64
+import json
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum, Window
+
+from core.models import JournalEntryLine
+from core.pagination import InvalidCursor
+from core.services.account_balance_service import AccountBalanceService
+
+
+class GeneralLedgerService:
+
+    PAGE_SIZE = 100
+    EXPORT_CHUNK_SIZE = 2000
+
+    # ── Curseur ───────────────────────────────────────────────────────
+
+    @staticmethod
+    def encode_cursor(line_date, line_id, balance, number):
+        raw = json.dumps(
+            {'v': [line_date.isoformat(), line_id], 'b': str(balance), 'n': number},
+            separators=(',', ':'),
+        ).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Retourne ((date, id), solde reporté, numéro de page)."""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            line_date, line_id = data['v']
+            return (date.fromisoformat(line_date), int(line_id)), Decimal(data['b']), max(int(data['n']), 1)
+        except (ValueError, TypeError, KeyError, AttributeError, InvalidOperation) as exc:
+            raise InvalidCursor("Curseur de pagination invalide.") from exc
+
+    # ── Lecture ───────────────────────────────────────────────────────
+
+    @staticmethod
+    def _queryset(account, exercise=None, date_from=None, date_to=None):
+        lines = JournalEntryLine.objects.filter(
+            account=account,
+            entry__is_validated=True,
+            delete_at__isnull=True,
+        )
+        if exercise:
+            lines = lines.filter(entry__exercise=exercise)
+        if date_from:
+            lines = lines.filter(entry__date__gte=date_from)
+        if date_to:
+            lines = lines.filter(entry__date__lte=date_to)
+        return lines
+
+    @staticmethod
+    def _signed_amount(account):
+        if account.account_type in ('ACTIF', 'CHARGE'):
+            amount = F('debit') - F('credit')
+        else:
+            amount = F('credit') - F('debit')
+        return ExpressionWrapper(amount, output_field=DecimalField(max_digits=17, decimal_places=2))
+
+    @staticmethod
+    def opening_balance(account, exercise=None, date_from=None):
+        """Solde du compte avant `date_from` (report à nouveau de la période)."""
+        if not date_from:
+            return Decimal('0')
+        return AccountBalanceService.get_balance(account, exercise, date_to=date_from - timedelta(days=1))
+
+    @staticmethod
+    def period_totals(account, exercise=None, date_from=None, date_to=None):
+        """(total débit, total crédit) de la période, depuis les soldes journaliers."""
+        totals = AccountBalanceService.get_totals([account.id], exercise, date_from, date_to)
+        return totals.get(account.id, (Decimal('0'), Decimal('0')))
+
+    @classmethod
+    def get_page(cls, account, exercise=None, date_from=None, date_to=None, cursor=None, per_page=None):
+        """
+        Une page du grand livre : {'lines': [{'line', 'running_balance'}],
+        'opening_balance', 'closing_balance', 'number', 'has_next', 'next_cursor'}.
+        Lève InvalidCursor si le curseur est illisible.
+        """
+        per_page = per_page or cls.PAGE_SIZE
+        lines = cls._queryset(account, exercise, date_from, date_to)
+        if cursor:
+            (last_date, last_id), opening, number = cls.decode_cursor(cursor)
+            lines = lines.filter(
+                Q(entry__date__gt=last_date) | Q(entry__date=last_date, id__gt=last_id)
+            )
+        else:
+            opening, number = cls.opening_balance(account, exercise, date_from), 1
+
+        ordering = [F('entry__date').asc(), F('id').asc()]
+        rows = list(
+            lines.select_related('entry')
+            .annotate(running=Window(expression=Sum(cls._signed_amount(account)), order_by=ordering))
+            .order_by(*ordering)[:per_page + 1]
+        )
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+
+        items = [{'line': line, 'running_balance': opening + line.running} for line in rows]
+        closing = items[-1]['running_balance'] if items else opening
+        next_cursor = None
+        if has_next:
+            last = rows[-1]
+            next_cursor = cls.encode_cursor(last.entry.date, last.id, closing, number + 1)
+        return {
+            'lines': items,
+            'opening_balance': opening,
+            'closing_balance': closing,
+            'number': number,
+            'has_next': has_next,
+            'next_cursor': next_cursor,
+        }
+
+    @classmethod
+    def iter_lines(cls, account, exercise=None, date_from=None, date_to=None, chunk_size=None):
+        """Toutes les lignes de la période, lues par pages de `chunk_size` (export)."""
+        cursor = None
+        while True:
+            page = cls.get_page(
+                account, exercise, date_from, date_to,
+                cursor=cursor, per_page=chunk_size or cls.EXPORT_CHUNK_SIZE,
+            )
+            yield from page['lines']
+            if not page['has_next']:
+                return
+            cursor = page['next_cursor']
@@ -0,0 +1,186 @@
+"""
+Contrôle d'intégrité du journal, en requêtes groupées.
+
+Au lieu d'appeler `JournalEntry.is_balanced()` écriture par écriture, chaque
+contrôle est une agrégation GROUP BY … HAVING exécutée par tranches d'ids
+(l'index de la clé étrangère borne chaque tranche), si bien que le nombre de
+requêtes dépend du volume du journal divisé par la taille de tranche, et non
+du nombre d'écritures :
+
+- écritures déséquilibrées : SUM(debit) <> SUM(credit) par écriture ;
+- lignes orphelines : lignes actives d'une écriture supprimée ;
+- liens vers une vente / un approvisionnement supprimé (annulé) dont les
+  écritures rattachées ne se compensent pas compte par compte, c'est-à-dire
+  une annulation sans contrepassation complète.
+
+Le rapport est un dict sérialisable en JSON.
+"""
+
+import time
+from decimal import Decimal
+
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from core.models import JournalEntry, JournalEntryLine
+
+
+ZERO = Decimal('0')
+
+CHECKS = [
+    ('unbalanced_entries', "Écritures déséquilibrées"),
+    ('orphan_lines', "Lignes d'écritures supprimées"),
+    ('deleted_sale_links', "Ventes annulées sans contrepassation complète"),
+    ('deleted_supply_links', "Approvisionnements annulés sans contrepassation complète"),
+]
+
+
+class JournalIntegrityService:
+
+    CHUNK_SIZE = 50000
+    # Anomalies détaillées par contrôle (le compte, lui, est toujours complet)
+    MAX_ITEMS = 1000
+
+    def __init__(self, exercise=None, chunk_size=None, max_items=None):
+        self.exercise = exercise
+        self.chunk_size = self.CHUNK_SIZE if chunk_size is None else chunk_size
+        if self.chunk_size <= 0:
+            raise ValueError("La taille des tranches doit être strictement positive.")
+        self.max_items = self.MAX_ITEMS if max_items is None else max_items
+        self.queries = 0
+
+    # ── Tranches ──────────────────────────────────────────────────────
+
+    def _lines(self):
+        lines = JournalEntryLine.objects.filter(delete_at__isnull=True)
+        if self.exercise is not None:
+            lines = lines.filter(entry__exercise=self.exercise)
+        return lines.order_by()
+
+    def _ranges(self, queryset, field):
+        """Tranches [début, fin[ de `field` couvrant le queryset."""
+        bounds = queryset.aggregate(low=Min(field), high=Max(field))
+        self.queries += 1
+        if bounds['low'] is None:
+            return
+        start = bounds['low']
+        while start <= bounds['high']:
+            yield start, start + self.chunk_size
+            start += self.chunk_size
+
+    def _chunks(self, queryset, field):
+        for start, end in self._ranges(queryset, field):
+            self.queries += 1
+            yield queryset.filter(**{f'{field}__gte': start, f'{field}__lt': end})
+
+    # ── Contrôles ─────────────────────────────────────────────────────
+
+    def unbalanced_entries(self):
+        lines = self._lines().filter(entry__delete_at__isnull=True)
+        for chunk in self._chunks(lines, 'entry_id'):
+            rows = chunk.values('entry_id').annotate(
+                total_debit=Sum('debit'), total_credit=Sum('credit'),
+            ).filter(~Q(total_debit=F('total_credit'))).order_by('entry_id')
+            for row in rows:
+                debit, credit = row['total_debit'] or ZERO, row['total_credit'] or ZERO
+                yield {
+                    'entry_id': row['entry_id'],
+                    'total_debit': debit,
+                    'total_credit': credit,
+                    'difference': debit - credit,
+                }
+
+    def orphan_lines(self):
+        lines = self._lines().filter(entry__delete_at__isnull=False)
+        for chunk in self._chunks(lines, 'entry_id'):
+            rows = chunk.values('entry_id').annotate(
+                line_count=Count('id'), total_debit=Sum('debit'), total_credit=Sum('credit'),
+            ).order_by('entry_id')
+            for row in rows:
+                yield {
+                    'entry_id': row['entry_id'],
+                    'line_count': row['line_count'],
+                    'total_debit': row['total_debit'] or ZERO,
+                    'total_credit': row['total_credit'] or ZERO,
+                }
+
+    def deleted_links(self, link):
+        """Soldes non nuls, par (vente|approvisionnement supprimé, compte), des écritures rattachées."""
+        field = f'entry__{link}_id'
+        lines = self._lines().filter(**{
+            'entry__delete_at__isnull': True,
+            f'entry__{link}__delete_at__isnull': False,
+        })
+        for chunk in self._chunks(lines, field):
+            rows = chunk.values(field, 'account__code').annotate(
+                total_debit=Sum('debit'), total_credit=Sum('credit'), entry_count=Count('entry_id', distinct=True),
+            ).filter(~Q(total_debit=F('total_credit'))).order_by(field, 'account__code')
+            for row in rows:
+                debit, credit = row['total_debit'] or ZERO, row['total_credit'] or ZERO
+                yield {
+                    f'{link}_id': row[field],
+                    'account': row['account__code'],
+                    'entry_count': row['entry_count'],
+                    'balance': debit - credit,
+                }
+
+    # ── Rapport ───────────────────────────────────────────────────────
+
+    def _collect(self, rows):
+        items, count = [], 0
+        for row in rows:
+            count += 1
+            if len(items) < self.max_items:
+                items.append(row)
+        return {'count': count, 'truncated': count > len(items), 'items': items}
+
+    def _describe_entries(self, results):
+        """Complète les anomalies par écriture (référence, date, journal) en une requête."""
+        entry_ids = {
+            item['entry_id']
+            for key in ('unbalanced_entries', 'orphan_lines')
+            for item in results[key]['items']
+        }
+        if not entry_ids:
+            return
+        entries = {
+            entry['id']: entry
+            for entry in JournalEntry.objects.filter(id__in=entry_ids).values(
+                'id', 'reference', 'date', 'journal', 'is_validated',
+            )
+        }
+        self.queries += 1
+        for key in ('unbalanced_entries', 'orphan_lines'):
+            for item in results[key]['items']:
+                entry = entries.get(item['entry_id'], {})
+                item['reference'] = entry.get('reference')
+                item['date'] = entry.get('date')
+                item['journal'] = entry.get('journal')
+
+    def run(self):
+        """
+        Exécute tous les contrôles : {'generated_at', 'duration_ms', 'exercise',
+        'queries', 'is_clean', 'anomalies', 'checks': {nom: {'label', 'count',
+        'truncated', 'items'}}}.
+        """
+        started = time.monotonic()
+        self.queries = 0
+        results = {
+            'unbalanced_entries': self._collect(self.unbalanced_entries()),
+            'orphan_lines': self._collect(self.orphan_lines()),
+            'deleted_sale_links': self._collect(self.deleted_links('sale')),
+            'deleted_supply_links': self._collect(self.deleted_links('supply')),
+        }
+        self._describe_entries(results)
+        for key, label in CHECKS:
+            results[key] = {'label': label, **results[key]}
+        anomalies = sum(check['count'] for check in results.values())
+        return {
+            'generated_at': timezone.now(),
+            'duration_ms': round((time.monotonic() - started) * 1000),
+            'exercise': self.exercise.id if self.exercise is not None else None,
+            'queries': self.queries,
+            'is_clean': anomalies == 0,
+            'anomalies': anomalies,
+            'checks': results,
+        }
@@ -0,0 +1,126 @@
+"""
+Lecture du journal comptable (vue `accounting_journal`).
+
+Les filtres (journal, période, recherche) s'expriment une seule fois et
+s'appliquent aussi bien aux écritures qu'à leurs lignes (préfixe `entry__`) :
+les totaux débit/crédit de tout le filtre sont une agrégation unique sur
+JournalEntryLine, mise en cache par worker sous la clé (filtre, version du
+journal). Toute écriture dans le journal incrémente la version (DataVersion
+'journal'), si bien que parcourir les pages d'un même filtre ne recalcule pas
+les totaux, sans jamais servir un total périmé.
+
+Les lignes de la page sont lues en une requête `values()` réduite aux
+colonnes affichées.
+"""
+
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from core.models import DataVersion, JournalEntry, JournalEntryLine
+
+
+JOURNAL_VERSION_KEY = 'journal'
+
+ZERO = Decimal('0')
+
+
+class JournalService:
+
+    TOTALS_CACHE_SIZE = 256
+
+    _totals = OrderedDict()
+    _lock = threading.Lock()
+
+    # ── Filtres ───────────────────────────────────────────────────────
+
+    @staticmethod
+    def filter_q(journal='', date_from=None, date_to=None, search='', prefix=''):
+        """Filtres du journal, sur les écritures (prefix='') ou leurs lignes (prefix='entry__')."""
+        q = Q(**{f'{prefix}delete_at__isnull': True})
+        if journal:
+            q &= Q(**{f'{prefix}journal': journal})
+        if date_from:
+            q &= Q(**{f'{prefix}date__gte': date_from})
+        if date_to:
+            q &= Q(**{f'{prefix}date__lte': date_to})
+        if search:
+            q &= Q(**{f'{prefix}reference__icontains': search}) | Q(**{f'{prefix}description__icontains': search})
+        return q
+
+    @classmethod
+    def entries(cls, **filters):
+        """Écritures du filtre, réduites aux colonnes affichées par la liste."""
+        return JournalEntry.objects.filter(cls.filter_q(**filters)).only(
+            'id', 'create_at', 'date', 'reference', 'journal', 'description',
+        )
+
+    # ── Totaux ────────────────────────────────────────────────────────
+
+    @classmethod
+    def _compute_totals(cls, filters):
+        count = JournalEntry.objects.filter(cls.filter_q(**filters)).count()
+        totals = JournalEntryLine.objects.filter(
+            cls.filter_q(prefix='entry__', **filters), delete_at__isnull=True,
+        ).aggregate(total_debit=Sum('debit'), total_credit=Sum('credit'))
+        return {
+            'count': count,
+            'total_debit': totals['total_debit'] or ZERO,
+            'total_credit': totals['total_credit'] or ZERO,
+        }
+
+    @classmethod
+    def get_totals(cls, **filters):
+        """
+        {'count', 'total_debit', 'total_credit'} de tout le filtre (et non de
+        la seule page affichée), depuis le cache si le journal n'a pas changé.
+        """
+        key = tuple(sorted((name, str(value or '')) for name, value in filters.items()))
+        version = DataVersion.current(JOURNAL_VERSION_KEY)
+        with cls._lock:
+            cached = cls._totals.get(key)
+            if cached is not None and cached[0] == version:
+                cls._totals.move_to_end(key)
+                return dict(cached[1])
+
+        totals = cls._compute_totals(filters)
+        with cls._lock:
+            cls._totals[key] = (version, totals)
+            cls._totals.move_to_end(key)
+            while len(cls._totals) > cls.TOTALS_CACHE_SIZE:
+                cls._totals.popitem(last=False)
+        return dict(totals)
+
+    @classmethod
+    def invalidate(cls):
+        """Invalide les totaux en cache dans tous les workers."""
+        DataVersion.bump_on_commit(JOURNAL_VERSION_KEY)
+
+    @classmethod
+    def clear(cls):
+        """Vide le cache du processus courant."""
+        with cls._lock:
+            cls._totals.clear()
+
+    # ── Lignes de la page ─────────────────────────────────────────────
+
+    @staticmethod
+    def attach_lines(entries):
+        """
+        Charge en une requête les lignes actives des écritures de la page dans
+        `entry.journal_lines` : [{'account__code', 'account__name', 'debit', 'credit'}].
+        """
+        entries = list(entries)
+        by_entry = {entry.id: entry for entry in entries}
+        for entry in entries:
+            entry.journal_lines = []
+        if not by_entry:
+            return entries
+        lines = JournalEntryLine.objects.filter(
+            entry_id__in=by_entry, delete_at__isnull=True,
+        ).order_by('entry_id', 'id').values('entry_id', 'account__code', 'account__name', 'debit', 'credit')
+        for line in lines:
+            by_entry[line['entry_id']].journal_lines.append(line)
+        return entries
@@ -0,0 +1,105 @@
+"""
+Cache en mémoire (par worker) des fiches produit sérialisées, pour les
+lectures répétées de la caisse (scan code-barres).
+
+Chaque entrée est associée à la version du catalogue (DataVersion 'catalog')
+au moment de la sérialisation. À chaque lecture, une requête légère relit
+l'identifiant, le stock et la version du catalogue : une entrée dont la
+version a changé est reconstruite, et le stock renvoyé est toujours frais.
+"""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Subquery
+
+from core.models import DataVersion, Product
+from core.serializers.product_serializers import ProductDetailSerializer
+from core.services.product_service import ProductService
+
+
+CATALOG_VERSION_KEY = 'catalog'
+
+
+class ProductCacheService:
+    """Cache LRU borné de ProductDetailSerializer, clé (produit, hôte)."""
+
+    _entries = OrderedDict()
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def _max_size():
+        return getattr(settings, 'PRODUCT_PAYLOAD_CACHE_SIZE', 2048)
+
+    @staticmethod
+    def _side_read(product_id=None, code=None):
+        """(id, stock, version du catalogue) en une seule requête indexée."""
+        queryset = Product.objects.filter(delete_at__isnull=True)
+        if product_id is not None:
+            queryset = queryset.filter(id=product_id)
+        else:
+            queryset = queryset.filter(code=code)
+        version = DataVersion.objects.filter(key=CATALOG_VERSION_KEY).values('version')[:1]
+        return queryset.annotate(
+            catalog_version=Subquery(version),
+        ).values_list('id', 'stock', 'catalog_version').first()
+
+    @classmethod
+    def _get(cls, key, version):
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None or entry[0] != version:
+                cls.misses += 1
+                return None
+            cls._entries.move_to_end(key)
+            cls.hits += 1
+            return entry[1]
+
+    @classmethod
+    def _set(cls, key, version, payload):
+        with cls._lock:
+            cls._entries[key] = (version, payload)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > cls._max_size():
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def get_payload(cls, request, product_id=None, code=None):
+        """
+        Fiche produit sérialisée (comme ProductDetailSerializer) ou None si
+        le produit n'existe pas. Le stock vient toujours de la base.
+        """
+        row = cls._side_read(product_id=product_id, code=code)
+        if row is None:
+            return None
+        found_id, stock, version = row
+        version = version or 0
+        # Les URL d'images sont absolues : la clé inclut l'hôte de la requête
+        key = (found_id, request.build_absolute_uri('/'))
+
+        payload = cls._get(key, version)
+        if payload is None:
+            product = ProductService.get_by_id(found_id)
+            if product is None:
+                return None
+            payload = ProductDetailSerializer(product, context={'request': request}).data
+            cls._set(key, version, payload)
+
+        payload = dict(payload)
+        payload['stock'] = stock
+        return payload
+
+    @classmethod
+    def invalidate(cls):
+        """Invalide les fiches en cache dans tous les workers."""
+        DataVersion.bump_on_commit(CATALOG_VERSION_KEY)
+
+    @classmethod
+    def clear(cls):
+        """Vide le cache du processus courant."""
+        with cls._lock:
+            cls._entries.clear()
+            cls.hits = cls.misses = 0
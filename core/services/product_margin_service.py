@@ -0,0 +1,224 @@
+"""
+Marges par produit, matérialisées par (produit, exercice, jour de vente).
+
+Chaque ligne de vente reporte sa quantité, son chiffre d'affaires et son coût
+d'achat (prix d'achat relevé au moment de la vente, `SaleProduct.unit_cost`)
+dans la ligne journalière ProductDailyMargin de son produit. Les retours
+partiels et les annulations retranchent leurs quantités du jour de la vente
+d'origine : la table reste égale à l'agrégation des lignes de vente actives,
+et le rapport de marge d'une période n'est qu'une somme par produit sur
+quelques lignes journalières. La commande `rebuild_product_margins`
+reconstruit la table depuis les ventes en une agrégation GROUP BY.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from core.models import Product, ProductDailyMargin, Sale, SaleProduct
+
+
+ZERO = Decimal('0')
+
+
+class ProductMarginService:
+
+    REBUILD_BATCH_SIZE = 1000
+
+    # ── Mise à jour ──────────────────────────────────────────────────
+
+    @staticmethod
+    def _add(key, quantity, revenue, cost):
+        """Ajoute (quantité, CA, coût) à la ligne `key` = (produit, exercice, jour)."""
+        product_id, exercise_id, day = key
+        rows = ProductDailyMargin.objects.filter(product_id=product_id, exercise_id=exercise_id, day=day)
+        changes = {
+            'quantity': F('quantity') + quantity,
+            'revenue': F('revenue') + revenue,
+            'cost': F('cost') + cost,
+        }
+        if rows.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                ProductDailyMargin.objects.create(
+                    product_id=product_id, exercise_id=exercise_id, day=day,
+                    quantity=quantity, revenue=revenue, cost=cost,
+                )
+        except IntegrityError:
+            # Créée entre-temps par une autre caisse
+            rows.update(**changes)
+
+    @staticmethod
+    def unit_cost(sale_product):
+        """Coût unitaire d'une ligne : relevé à la vente, sinon dernier prix d'achat (lignes anciennes)."""
+        if sale_product.unit_cost is not None:
+            return Decimal(sale_product.unit_cost)
+        return Decimal(sale_product.product.last_purchase_price or 0)
+
+    @classmethod
+    def record(cls, sale, movements):
+        """
+        Reporte des mouvements [(SaleProduct, quantité)] d'une vente : quantité
+        positive à la vente, négative au retour ou à l'annulation.
+        """
+        day = timezone.localdate(sale.create_at)
+        totals = defaultdict(lambda: [0, ZERO, ZERO])
+        for sale_product, quantity in movements:
+            if not quantity:
+                continue
+            key = (sale_product.product_id, sale.daily.exercise_id, day)
+            totals[key][0] += quantity
+            totals[key][1] += Decimal(sale_product.unit_price) * quantity
+            totals[key][2] += cls.unit_cost(sale_product) * quantity
+        if not totals:
+            return
+        cls._add_many(totals)
+
+    @classmethod
+    def _add_many(cls, totals):
+        """
+        Reporte {(produit, exercice, jour): [quantité, CA, coût]} en un nombre
+        constant de requêtes, quelle que soit la taille du panier : lecture des
+        lignes existantes, un UPDATE groupé (expressions F), un INSERT groupé.
+        """
+        existing = {}
+        lookup = Q()
+        for product_id, exercise_id, day in totals:
+            lookup |= Q(product_id=product_id, exercise_id=exercise_id, day=day)
+        with transaction.atomic():
+            for row in ProductDailyMargin.objects.select_for_update().filter(lookup).order_by('pk'):
+                existing[(row.product_id, row.exercise_id, row.day)] = row
+            for key, row in existing.items():
+                quantity, revenue, cost = totals[key]
+                row.quantity = F('quantity') + quantity
+                row.revenue = F('revenue') + revenue
+                row.cost = F('cost') + cost
+            if existing:
+                ProductDailyMargin.objects.bulk_update(existing.values(), ['quantity', 'revenue', 'cost'])
+            missing = [key for key in totals if key not in existing]
+            if not missing:
+                return
+            try:
+                with transaction.atomic():
+                    ProductDailyMargin.objects.bulk_create([
+                        ProductDailyMargin(
+                            product_id=key[0], exercise_id=key[1], day=key[2],
+                            quantity=totals[key][0], revenue=totals[key][1], cost=totals[key][2],
+                        )
+                        for key in missing
+                    ])
+            except IntegrityError:
+                # Lignes créées entre-temps par une autre caisse : repli ligne par ligne
+                for key in sorted(missing):
+                    cls._add(key, *totals[key])
+
+    @classmethod
+    def rebuild(cls, exercise=None):
+        """
+        Reconstruit les marges journalières (d'un exercice ou de toutes) depuis
+        les lignes de vente actives, en une agrégation GROUP BY.
+        Retourne le nombre de lignes écrites.
+        """
+        rows = ProductDailyMargin.objects.all()
+        lines = SaleProduct.objects.filter(sale__delete_at__isnull=True, delete_at__isnull=True, quantity__gt=0)
+        if exercise is not None:
+            rows = rows.filter(exercise=exercise)
+            lines = lines.filter(sale__daily__exercise=exercise)
+
+        amount = DecimalField(max_digits=17, decimal_places=2)
+        grouped = lines.order_by().values(
+            'product_id', 'sale__daily__exercise_id', day=TruncDate('sale__create_at'),
+        ).annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(ExpressionWrapper(F('quantity') * F('unit_price'), output_field=amount)),
+            total_cost=Sum(ExpressionWrapper(
+                F('quantity') * Coalesce('unit_cost', 'product__last_purchase_price', ZERO),
+                output_field=amount,
+            )),
+        )
+        written = 0
+        with transaction.atomic():
+            rows.delete()
+            batch = []
+            for row in grouped.iterator():
+                batch.append(ProductDailyMargin(
+                    product_id=row['product_id'],
+                    exercise_id=row['sale__daily__exercise_id'],
+                    day=row['day'],
+                    quantity=row['total_quantity'] or 0,
+                    revenue=row['total_revenue'] or ZERO,
+                    cost=row['total_cost'] or ZERO,
+                ))
+                if len(batch) >= cls.REBUILD_BATCH_SIZE:
+                    ProductDailyMargin.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            ProductDailyMargin.objects.bulk_create(batch)
+            written += len(batch)
+        return written
+
+    # ── Lecture ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def get_margins(exercise=None, date_from=None, date_to=None):
+        """
+        Rapport de marge par produit sur une période, en une requête groupée :
+        {'items': [{'product', 'qty_sold', 'revenue', 'purchase_price', 'cost',
+        'margin', 'margin_pct'}], 'total_ca', 'total_cost', 'total_margin',
+        'total_margin_pct'}. `purchase_price` est le coût unitaire moyen réel.
+        """
+        period = Q()
+        if exercise is not None:
+            period &= Q(daily_margins__exercise=exercise)
+        if date_from:
+            period &= Q(daily_margins__day__gte=date_from)
+        if date_to:
+            period &= Q(daily_margins__day__lte=date_to)
+        products = Product.objects.filter(delete_at__isnull=True).filter(period).annotate(
+            sold_quantity=Sum('daily_margins__quantity'),
+            sold_revenue=Sum('daily_margins__revenue'),
+            sold_cost=Sum('daily_margins__cost'),
+        ).filter(sold_quantity__gt=0)
+
+        result = []
+        total_ca = total_cost = ZERO
+        for product in products:
+            revenue = product.sold_revenue or ZERO
+            cost = product.sold_cost or ZERO
+            margin = revenue - cost
+            result.append({
+                'product': product,
+                'qty_sold': product.sold_quantity,
+                'revenue': revenue,
+                'purchase_price': (cost / product.sold_quantity).quantize(Decimal('0.01')),
+                'cost': cost,
+                'margin': margin,
+                'margin_pct': (margin / revenue * 100) if revenue else ZERO,
+            })
+            total_ca += revenue
+            total_cost += cost
+
+        # Trier par marge décroissante
+        result.sort(key=lambda item: (-item['margin'], item['product'].name))
+        total_margin = total_ca - total_cost
+        return {
+            'items': result,
+            'total_ca': total_ca,
+            'total_cost': total_cost,
+            'total_margin': total_margin,
+            'total_margin_pct': (total_margin / total_ca * 100) if total_ca else ZERO,
+        }
+
+
+def ensure_product_margins(sender, **kwargs):
+    """
+    Handler post_migrate : à la première installation de la table, la remplit
+    depuis les ventes existantes.
+    """
+    if not ProductDailyMargin.objects.exists() and Sale.objects.exists():
+        ProductMarginService.rebuild()
@@ -0,0 +1,181 @@
+"""
+Index de recherche plein texte des produits (caisse, liste produits, statistiques).
+
+Le texte indexé (`Product.search_text`) est normalisé sans accents ni casse.
+Selon la base :
+  - SQLite : table virtuelle FTS5 `product_search` synchronisée par triggers ;
+  - MySQL  : index FULLTEXT (parser ngram) sur `product.search_text` ;
+  - autres : repli sur un `contains` du texte normalisé.
+L'index est (re)créé après chaque `migrate` et via `rebuild_product_search_index`.
+"""
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from core.models import Product
+from core.models.product_models import normalize_search_text
+
+
+FTS_TABLE = 'product_search'
+MYSQL_INDEX = 'product_search_ft'
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        search_text, content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+]
+
+
+class ProductSearchService:
+    """Création de l'index et recherche classée par pertinence."""
+
+    @staticmethod
+    def _vendor(using='default'):
+        return connections[using].vendor
+
+    @staticmethod
+    def _tokens(search_input):
+        return normalize_search_text(search_input).split()
+
+    # ── Index ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def backfill_search_text(only_missing=True, batch_size=500):
+        """Calcule `search_text` des produits (ceux sans texte indexé par défaut)."""
+        queryset = Product.objects.only('id', 'code', 'name', 'brand', 'search_text').order_by('id')
+        if only_missing:
+            queryset = queryset.filter(search_text='')
+        updated = 0
+        batch = []
+        for product in queryset.iterator(chunk_size=batch_size):
+            product.search_text = product.build_search_text()
+            batch.append(product)
+            if len(batch) >= batch_size:
+                updated += Product.objects.bulk_update(batch, ['search_text'])
+                batch = []
+        if batch:
+            updated += Product.objects.bulk_update(batch, ['search_text'])
+        return updated
+
+    @classmethod
+    def ensure_index(cls, using='default', rebuild=False):
+        """
+        Crée l'index propre à la base s'il est absent. Avec `rebuild`, le
+        contenu FTS5 est reconstruit (une migration SQLite recrée la table
+        `product` et supprime ses triggers). Retourne True si un index natif est actif.
+        """
+        vendor = cls._vendor(using)
+        with connections[using].cursor() as cursor:
+            if vendor == 'sqlite':
+                for statement in SQLITE_DDL:
+                    cursor.execute(statement)
+                if rebuild:
+                    cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+                return True
+            if vendor == 'mysql':
+                cursor.execute(
+                    "SELECT COUNT(*) FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() AND table_name = 'product' AND index_name = %s",
+                    [MYSQL_INDEX],
+                )
+                if not cursor.fetchone()[0]:
+                    cursor.execute(
+                        f"ALTER TABLE product ADD FULLTEXT INDEX {MYSQL_INDEX} (search_text) WITH PARSER ngram"
+                    )
+                return True
+        return False
+
+    @classmethod
+    def rebuild(cls, using='default'):
+        """Recalcule le texte de tous les produits et reconstruit l'index."""
+        updated = cls.backfill_search_text(only_missing=False)
+        cls.ensure_index(using=using, rebuild=True)
+        return updated
+
+    # ── Recherche ─────────────────────────────────────────────────────
+
+    @classmethod
+    def _match_expression(cls, tokens):
+        if cls._vendor() == 'sqlite':
+            # Préfixe sur chaque mot : « coca col » trouve « Coca-Cola 1.5L »
+            return ' '.join(f'"{token}"*' for token in tokens)
+        # ngram (2 caractères) : chaque mot doit apparaître comme sous-chaîne ;
+        # les mots d'un seul caractère ne sont pas indexés
+        tokens = [token for token in tokens if len(token) > 1] or tokens
+        return ' '.join(f'+"{token}"' for token in tokens)
+
+    @classmethod
+    def filter_queryset(cls, queryset, search_input):
+        """Restreint un queryset de produits aux résultats de la recherche."""
+        tokens = cls._tokens(search_input)
+        if not tokens:
+            return queryset
+        vendor = cls._vendor()
+        match = cls._match_expression(tokens)
+        if vendor == 'sqlite':
+            return queryset.filter(id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match],
+            ))
+        if vendor == 'mysql':
+            return queryset.filter(id__in=RawSQL(
+                "SELECT id FROM product WHERE MATCH(search_text) AGAINST (%s IN BOOLEAN MODE)", [match],
+            ))
+        for token in tokens:
+            queryset = queryset.filter(search_text__contains=token)
+        return queryset
+
+    @classmethod
+    def search(cls, search_input, offset=0, limit=20):
+        """
+        Produits actifs correspondant à la recherche, du plus pertinent au
+        moins pertinent (puis par nom). Retourne une liste de Product.
+        """
+        tokens = cls._tokens(search_input)
+        if not tokens:
+            return []
+        vendor = cls._vendor()
+        match = cls._match_expression(tokens)
+        if vendor == 'sqlite':
+            sql = (
+                f"SELECT p.id FROM {FTS_TABLE} s JOIN product p ON p.id = s.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s AND p.delete_at IS NULL "
+                "ORDER BY s.rank, p.name LIMIT %s OFFSET %s"
+            )
+            params = [match, limit, offset]
+        elif vendor == 'mysql':
+            sql = (
+                "SELECT id FROM product "
+                "WHERE MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) AND delete_at IS NULL "
+                "ORDER BY MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) DESC, name LIMIT %s OFFSET %s"
+            )
+            params = [match, match, limit, offset]
+        else:
+            queryset = cls.filter_queryset(Product.objects.filter(delete_at__isnull=True), search_input)
+            return list(queryset.select_related(
+                'category', 'gamme', 'rayon', 'grammage_type',
+            ).order_by('name')[offset:offset + limit])
+
+        with connections['default'].cursor() as cursor:
+            cursor.execute(sql, params)
+            ranked_ids = [row[0] for row in cursor.fetchall()]
+        products = Product.objects.select_related(
+            'category', 'gamme', 'rayon', 'grammage_type',
+        ).in_bulk(ranked_ids)
+        return [products[product_id] for product_id in ranked_ids if product_id in products]
+
+
+def ensure_product_search_index(sender, using='default', **kwargs):
+    """Handler post_migrate : complète `search_text` et (re)crée l'index."""
+    ProductSearchService.backfill_search_text()
+    ProductSearchService.ensure_index(using=using, rebuild=True)
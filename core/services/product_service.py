@@ -5,12 +5,13 @@ Service pour la gestion des produits.
 import os
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Q
 
 from core.models import (
     Product, ProductImage, Supply, Inventory,
     Category, Gamme, Rayon, GrammageType,
 )
+from core.pagination import COUNT_NONE, KeysetPaginator
+from core.services.product_search_service import ProductSearchService
 
 
 class ProductService:
@@ -28,15 +29,24 @@ class ProductService:
         ).prefetch_related('images')[offset:offset + count]
 
     @staticmethod
-    def search_products(search_input: str, page: int = 1, count: int = 20):
-        """Recherche de produits par nom ou code."""
-        offset = (page) * count
-        return Product.objects.filter(
-            Q(name__icontains=search_input) | Q(code__icontains=search_input),
+    def get_product_page(cursor: str = None, count: int = 20):
+        """
+        Page de produits actifs par curseur (create_at, id), sans OFFSET.
+        Lève InvalidCursor si le curseur est illisible.
+        """
+        queryset = Product.objects.filter(
             delete_at__isnull=True,
         ).select_related(
             'category', 'gamme', 'rayon', 'grammage_type',
-        )[offset:offset + count]
+        ).prefetch_related('images')
+        paginator = KeysetPaginator(queryset, per_page=count, descending=False, count_mode=COUNT_NONE)
+        return paginator.get_page(cursor or None)
+
+    @staticmethod
+    def search_products(search_input: str, page: int = 1, count: int = 20):
+        """Recherche plein texte par code, nom ou marque, classée par pertinence."""
+        offset = (page) * count
+        return ProductSearchService.search(search_input, offset=offset, limit=count)
 
     @staticmethod
     def get_by_id(product_id: int):
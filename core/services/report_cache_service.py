@@ -0,0 +1,147 @@
+"""
+Cache des rapports financiers (compte de résultat, bilan, balance âgée, marges
+par produit, déclaration de TVA), partagé par les pages et leurs exports CSV.
+
+La clé d'un rapport est (rapport, exercice, filtres, versions des domaines
+dont il dépend) : toute écriture du journal, d'une vente ou d'un
+approvisionnement incrémente la version de son domaine (DataVersion
+'journal', 'sales', 'supplies'), si bien qu'un rapport en cache n'est jamais
+servi après une modification de ses données ; les anciennes entrées expirent
+après REPORT_CACHE_TIMEOUT_SECONDS secondes.
+
+Le stockage est le cache Django 'reports' (CACHES) : locmem par worker, fichier
+ou Redis partagés entre workers selon REPORT_CACHE_BACKEND. Les compteurs de
+succès et d'échecs y sont tenus aussi, pour suivre le taux de succès
+(commande `report_cache_stats`).
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.models import DataVersion
+from core.services.accounting_service import AccountingService
+from core.services.aged_balance_service import AgedBalanceService
+
+
+SALES_VERSION_KEY = 'sales'
+SUPPLIES_VERSION_KEY = 'supplies'
+
+# Rapport → (domaines dont dépendent les données, calcul(exercise, **filtres))
+REPORTS = {
+    'income_statement': (
+        ('journal', 'chart_of_accounts'),
+        lambda exercise, **filters: AccountingService.get_income_statement(exercise, **filters),
+    ),
+    'balance_sheet': (
+        ('journal', 'chart_of_accounts'),
+        lambda exercise, **filters: AccountingService.get_balance_sheet(exercise, **filters),
+    ),
+    'vat_declaration': (
+        ('journal',),
+        lambda exercise, **filters: AccountingService.get_vat_declaration(exercise, **filters),
+    ),
+    'product_margins': (
+        (SALES_VERSION_KEY, 'catalog'),
+        lambda exercise, **filters: AccountingService.get_product_margins(exercise, **filters),
+    ),
+    # Totaux par tranche seulement : le détail est paginé par curseur. Les
+    # tranches dépendent du jour, passé en filtre `today`.
+    'aged_balance': (
+        (SALES_VERSION_KEY, SUPPLIES_VERSION_KEY),
+        lambda exercise, balance_type='client', today=None: AgedBalanceService(balance_type, today).summary(),
+    ),
+}
+
+MISSING = object()
+
+
+class ReportCacheService:
+
+    HITS_KEY = 'report-cache:hits'
+    MISSES_KEY = 'report-cache:misses'
+
+    @staticmethod
+    def _cache():
+        alias = getattr(settings, 'REPORT_CACHE_ALIAS', 'reports')
+        return caches[alias if alias in settings.CACHES else 'default']
+
+    @staticmethod
+    def _versions(domains):
+        """Versions des domaines, en une requête."""
+        versions = dict(DataVersion.objects.filter(key__in=domains).values_list('key', 'version'))
+        return '.'.join(str(versions.get(domain, 0)) for domain in domains)
+
+    @classmethod
+    def make_key(cls, report, exercise=None, **filters):
+        """Clé (rapport, exercice, empreinte des filtres, versions des domaines)."""
+        domains, _compute = REPORTS[report]
+        digest = hashlib.sha1(
+            json.dumps(sorted((name, str(value)) for name, value in filters.items())).encode(),
+        ).hexdigest()[:16]
+        exercise_id = exercise.pk if exercise is not None else '-'
+        return f"report:{report}:{exercise_id}:{digest}:{cls._versions(domains)}"
+
+    @classmethod
+    def get_report(cls, report, exercise=None, **filters):
+        """
+        Données du rapport `report` pour l'exercice et les filtres, depuis le
+        cache si aucune donnée dont il dépend n'a changé.
+        """
+        filters = {name: value for name, value in filters.items() if value not in (None, '')}
+        key = cls.make_key(report, exercise, **filters)
+        cache = cls._cache()
+        data = cache.get(key, MISSING)
+        if data is not MISSING:
+            cls._count(cls.HITS_KEY)
+            return data
+
+        cls._count(cls.MISSES_KEY)
+        _domains, compute = REPORTS[report]
+        data = compute(exercise, **filters)
+        cache.set(key, data, getattr(settings, 'REPORT_CACHE_TIMEOUT_SECONDS', 3600))
+        return data
+
+    @classmethod
+    def invalidate(cls, domain):
+        """Invalide, dans tous les workers, les rapports qui dépendent du domaine."""
+        DataVersion.bump_on_commit(domain)
+
+    @classmethod
+    def clear(cls):
+        """
+        Vide le cache des rapports et ses compteurs (tout le répertoire ou
+        toute la base Redis configurés : à réserver aux rapports).
+        """
+        cls._cache().clear()
+
+    # ── Taux de succès ────────────────────────────────────────────────
+
+    @classmethod
+    def _count(cls, key):
+        cache = cls._cache()
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Compteur absent (premier accès ou expiré) : créé à 1
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+    @classmethod
+    def stats(cls):
+        """{'hits', 'misses', 'hit_rate'} depuis le dernier vidage, hit_rate en %."""
+        counts = cls._cache().get_many([cls.HITS_KEY, cls.MISSES_KEY])
+        hits = counts.get(cls.HITS_KEY, 0)
+        misses = counts.get(cls.MISSES_KEY, 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits * 100 / total, 1) if total else 0.0,
+        }
+
+    @classmethod
+    def reset_stats(cls):
+        cls._cache().delete_many([cls.HITS_KEY, cls.MISSES_KEY])
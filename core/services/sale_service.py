@@ -2,19 +2,26 @@
 Service pour la gestion des ventes.
 """
 
+import hashlib
+import json
 from decimal import Decimal
 
 from django.db import transaction
-from django.db.models import Q, Sum
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
 from django.utils import timezone
 
 from core.models import (
     Sale, SaleProduct, SaleReturn, SaleReturnLine, CreditSale, Product, Client, Refund,
+    SaleIdempotencyKey,
 )
 from core.models.inventory_models import PaymentSchedule
 from core.models.settings_models import SystemSettings
 from core.services.daily_service import DailyService
 from core.services.accounting_service import AccountingService
+from core.services.accounting_outbox_service import AccountingOutboxService
+from core.services.daily_counters_service import DailyCountersService
+from core.services.daily_fact_service import DailyFactService
+from core.services.product_margin_service import ProductMarginService
 
 
 class SaleService:
@@ -54,6 +61,58 @@ class SaleService:
             schedule.save(update_fields=['amount_due', 'amount_paid', 'status', 'notes'])
             remaining_reduction -= reduction
 
+    # ── Stock (opérations ensemblistes) ───────────────────────────────
+
+    @staticmethod
+    def _lock_products(items_data):
+        """
+        Charge et verrouille tous les produits du panier en une requête
+        (ordonnée par id pour éviter les interblocages entre caisses), puis
+        valide le stock et les prix contre cette photo en mémoire.
+        Retourne ({id: Product}, {id: quantité totale demandée}).
+        """
+        quantities = {}
+        for item in items_data:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+
+        products = {
+            product.id: product
+            for product in Product.objects.select_for_update().filter(
+                id__in=quantities.keys(), delete_at__isnull=True,
+            ).order_by('id')
+        }
+
+        for item in items_data:
+            product = products.get(item['product_id'])
+            if product is None:
+                raise ValueError(f"Produit #{item['product_id']} introuvable.")
+            errors = product.check_sale_item(quantities[item['product_id']], item['unit_price'])
+            if errors:
+                raise ValueError(f"{product.name} : {next(iter(errors.values()))}")
+        return products, quantities
+
+    @staticmethod
+    def _decrement_stock(quantities):
+        """
+        Décrémente le stock de plusieurs produits en un seul UPDATE conditionnel.
+        Chaque ligne n'est modifiée que si son stock couvre la quantité demandée ;
+        si une ligne échoue, toute la vente est annulée.
+        """
+        if not quantities:
+            return
+        condition = Q()
+        for product_id, quantity in quantities.items():
+            condition |= Q(id=product_id, stock__gte=quantity)
+        updated = Product.objects.filter(condition).update(
+            stock=F('stock') - Case(
+                *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                output_field=IntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            raise ValueError("Stock insuffisant pour au moins un article du panier.")
+
     # ── Lecture ────────────────────────────────────────────────────────
 
     @staticmethod
@@ -61,7 +120,9 @@ class SaleService:
         """Récupère une vente par son ID."""
         return Sale.objects.filter(
             id=sale_id, delete_at__isnull=True,
-        ).select_related('client', 'staff', 'daily').first()
+        ).select_related('client', 'staff', 'daily').prefetch_related(
+            'sale_products__product',
+        ).first()
 
     @staticmethod
     def search_sales(query: str = ''):
@@ -86,15 +147,51 @@ class SaleService:
             ).distinct()
         return qs.order_by('-create_at')
 
+    # ── Idempotence ───────────────────────────────────────────────────
+
+    @staticmethod
+    def compute_request_hash(payload) -> str:
+        """Empreinte stable d'une requête de vente (clés triées)."""
+        if hasattr(payload, 'dict'):
+            payload = payload.dict()
+        payload = {k: v for k, v in dict(payload).items() if k != 'idempotency_key'}
+        canonical = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def find_replayed_sale(idempotency_key: str, staff, request_hash: str):
+        """
+        Retourne la vente déjà créée pour cette clé, ou None si la clé est
+        inconnue ou expirée. Lecture seule : aucun verrou, aucune écriture
+        sur le chemin de création.
+        Lève ValueError si la clé a servi à une requête différente.
+        """
+        if not idempotency_key:
+            return None
+        record = SaleIdempotencyKey.objects.filter(key=idempotency_key).first()
+        if record is None:
+            return None
+        if record.is_expired():
+            record.delete()
+            return None
+        if record.request_hash != request_hash or record.staff_id != getattr(staff, 'id', None):
+            raise ValueError("Cette clé d'idempotence a déjà été utilisée pour une autre vente.")
+        return SaleService.get_by_id(record.sale_id)
+
     # ── Écriture ──────────────────────────────────────────────────────
 
     @staticmethod
     @transaction.atomic
-    def create_sale(validated_data: dict, staff):
+    def create_sale(validated_data: dict, staff, idempotency_key=None, request_hash=''):
         """
         Crée une vente complète (vente, articles, crédit éventuel).
         Correspond à l'ancien endpoint Flask: POST /sale
+
+        Si `idempotency_key` est fourni, la clé est enregistrée dans la même
+        transaction que la vente : une requête concurrente portant la même clé
+        échoue sur la contrainte d'unicité et rien n'est écrit en double.
         """
+        validated_data.pop('idempotency_key', None)
         items_data = validated_data.pop('items')
         client_id = validated_data.pop('client_id', None)
         is_credit = validated_data.get('is_credit', False)
@@ -106,6 +203,10 @@ class SaleService:
         if not daily:
             raise ValueError("Aucune session Daily ouverte.")
 
+        # Verrouiller tous les produits du panier en un seul SELECT ... FOR UPDATE
+        products, quantities = SaleService._lock_products(items_data)
+        has_vat = any(product.has_vat for product in products.values())
+
         # Calculer le total
         total = sum(
             item['unit_price'] * item['quantity']
@@ -120,27 +221,29 @@ class SaleService:
             total=total,
             is_credit=is_credit,
             is_paid=not is_credit,
-            has_vat=False,  # Sera mis à jour après
+            has_vat=has_vat,
         )
 
-        # Créer les articles et mettre à jour le stock
-        has_vat = False
-        for item_data in items_data:
-            product = Product.objects.select_for_update().get(id=item_data['product_id'])
-            if product.has_vat:
-                has_vat = True
-            SaleProduct.objects.create(
+        # Créer les articles en un seul INSERT puis décrémenter le stock.
+        # Le prix d'achat courant est figé sur la ligne pour le calcul des marges.
+        sale_lines = SaleProduct.objects.bulk_create([
+            SaleProduct(
                 sale=sale,
-                product=product,
+                product=products[item_data['product_id']],
                 quantity=item_data['quantity'],
                 unit_price=item_data['unit_price'],
+                unit_cost=products[item_data['product_id']].last_purchase_price,
             )
-            product.stock -= item_data['quantity']
-            product.save(update_fields=['stock'])
-
-        # Mettre à jour le champ has_vat sur la vente
-        sale.has_vat = has_vat
-        sale.save(update_fields=['has_vat'])
+            for item_data in items_data
+        ])
+        SaleService._decrement_stock(quantities)
+        ProductMarginService.record(sale, [(line, line.quantity) for line in sale_lines])
+        DailyFactService.record_sale(
+            sale, [(line, line.quantity) for line in sale_lines], count=1, amount=total,
+        )
+        DailyCountersService.record_sale(
+            sale, sum(line.quantity for line in sale_lines), count=1, amount=total,
+        )
 
         # Récupérer les paramètres système
         settings = SystemSettings.get_settings()
@@ -169,29 +272,43 @@ class SaleService:
                     status='PENDING',
                 )
 
-        # Enregistrer l'écriture comptable
-        try:
-            AccountingService.record_sale(
+        # Mettre l'écriture comptable en file (générée par le worker outbox)
+        AccountingOutboxService.enqueue_sale(
+            sale=sale,
+            daily=daily,
+            exercise=daily.exercise,
+            payment_method=payment_method,
+            apply_tax=apply_tax_now,
+        )
+
+        if idempotency_key:
+            SaleIdempotencyKey.objects.create(
+                key=idempotency_key,
+                request_hash=request_hash,
                 sale=sale,
-                daily=daily,
-                exercise=daily.exercise,
-                payment_method=payment_method,
-                apply_tax=apply_tax_now,
+                staff=staff,
+                expires_at=SaleIdempotencyKey.compute_expiry(),
             )
-            # Marquer les écritures TVA comme créées si on est en mode immédiat
-            if apply_tax_now:
-                sale.tva_accounting_created = True
-                sale.save(update_fields=['tva_accounting_created'])
-        except Exception:
-            pass  # Ne pas bloquer la vente si la comptabilité échoue
 
         return sale
 
+    @staticmethod
+    def _ensure_sale_posted(sale):
+        """Refuse la contrepassation tant que l'écriture d'origine n'est pas au journal."""
+        if AccountingOutboxService.unposted_count(sale=sale):
+            raise ValueError(
+                "L'écriture comptable de cette vente n'a pas encore pu être générée "
+                "(voir l'état de l'outbox comptable). Réessayez après son traitement."
+            )
+
     @staticmethod
     @transaction.atomic
     def cancel_sale(sale, reason='', refund_payment_method='CASH'):
         """Annule totalement une vente avec remise en stock et contrepassation."""
         cancel_at = timezone.now()
+        # L'écriture d'origine doit exister avant sa contrepassation
+        AccountingOutboxService.process_pending(sale=sale)
+        SaleService._ensure_sale_posted(sale)
         sale = Sale.objects.select_for_update().select_related(
             'daily', 'daily__exercise', 'credit_info', 'invoice'
         ).prefetch_related('sale_products__product', 'credit_info__payments').get(id=sale.id)
@@ -224,6 +341,14 @@ class SaleService:
             product = Product.objects.select_for_update().get(id=sale_product.product_id)
             product.stock += sale_product.quantity
             product.save(update_fields=['stock'])
+        ProductMarginService.record(sale, [(line, -line.quantity) for line in sale_lines])
+        DailyFactService.record_sale(
+            sale, [(line, -line.quantity) for line in sale_lines], count=-1, amount=-Decimal(str(sale.total or 0)),
+        )
+        DailyCountersService.record_sale(
+            sale, -sum(line.quantity for line in sale_lines),
+            count=-1, amount=-Decimal(str(sale.total or 0)), cancelled=1,
+        )
 
         if refund_amount > 0:
             Refund.objects.create(
@@ -258,6 +383,9 @@ class SaleService:
     def partial_return_sale(sale, returned_items, reason='', refund_payment_method='CASH'):
         """Enregistre un retour partiel avec ajustement stock/compta/crédit."""
         return_at = timezone.now()
+        # L'écriture d'origine doit exister avant sa contrepassation
+        AccountingOutboxService.process_pending(sale=sale)
+        SaleService._ensure_sale_posted(sale)
         sale = Sale.objects.select_for_update().select_related(
             'daily', 'daily__exercise', 'credit_info', 'invoice'
         ).prefetch_related('sale_products__product').get(id=sale.id)
@@ -347,6 +475,24 @@ class SaleService:
                 update_fields.append('delete_at')
             sale_product.save(update_fields=update_fields)
 
+        ProductMarginService.record(
+            sale, [(item['sale_product'], -item['quantity']) for item in validated_items],
+        )
+        remaining_products = {
+            sale_product.product_id for sale_product in sale_products.values() if sale_product.delete_at is None
+        }
+        DailyFactService.record_sale(
+            sale,
+            [(item['sale_product'], -item['quantity']) for item in validated_items],
+            amount=-return_total,
+            removed_products={
+                item['sale_product'].product_id for item in validated_items
+            } - remaining_products,
+        )
+        DailyCountersService.record_sale(
+            sale, -sum(item['quantity'] for item in validated_items), amount=-return_total,
+        )
+
         refund_amount = Decimal('0')
         credit_sale = getattr(sale, 'credit_info', None) if sale.is_credit else None
         if sale.is_credit:
@@ -0,0 +1,107 @@
+"""
+Service de numérotation : références d'écritures (VE-20260225-001) et
+numéros de facture (FAC-20260225-001) attribués via le compteur
+ReferenceSequence, sans parcours de la table des écritures.
+"""
+
+import threading
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models.accounting_models import Invoice, JournalEntry, ReferenceSequence
+
+
+class SequenceService:
+    """Attribution atomique des numéros par journal et par jour."""
+
+    # Blocs pré-réservés par processus : {(journal, jour): [prochain, dernier]}
+    _blocks = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _block_size():
+        return max(getattr(settings, 'REFERENCE_SEQUENCE_BLOCK_SIZE', 1), 1)
+
+    @staticmethod
+    def _legacy_last_value(journal, prefix):
+        """
+        Dernier numéro attribué avant la création du compteur du jour
+        (numérotation antérieure au compteur). Appelé une fois par jour et par journal.
+        """
+        if journal == 'FAC':
+            references = Invoice.objects.filter(invoice_number__startswith=f"{prefix}-").values_list('invoice_number', flat=True)
+        else:
+            references = JournalEntry.objects.filter(reference__startswith=f"{prefix}-").values_list('reference', flat=True)
+        suffixes = (ref.rsplit('-', 1)[-1] for ref in references)
+        return max((int(suffix) for suffix in suffixes if suffix.isdigit()), default=0)
+
+    @classmethod
+    def _take_from_block(cls, key):
+        with cls._lock:
+            block = cls._blocks.get(key)
+            if block and block[0] <= block[1]:
+                value = block[0]
+                block[0] += 1
+                return value
+            cls._blocks.pop(key, None)
+            return None
+
+    @classmethod
+    def _store_block(cls, key, first, last):
+        with cls._lock:
+            cls._blocks[key] = [first, last]
+
+    @classmethod
+    def next_value(cls, journal, day=None):
+        """
+        Retourne le prochain numéro du journal pour le jour donné.
+        Avec REFERENCE_SEQUENCE_BLOCK_SIZE > 1, chaque processus réserve un
+        bloc de numéros et le consomme en mémoire : les numéros restent
+        uniques mais peuvent présenter des trous (redémarrage, annulation).
+        """
+        day = day or date.today()
+        key = (journal, day)
+        value = cls._take_from_block(key)
+        if value is not None:
+            return value
+
+        size = cls._block_size()
+        prefix = f"{journal}-{day.strftime('%Y%m%d')}"
+        first = ReferenceSequence.allocate(
+            journal, day, count=size,
+            initial=lambda: cls._legacy_last_value(journal, prefix),
+        )
+        if size > 1:
+            # Le reste du bloc n'est utilisable qu'une fois la réservation validée
+            transaction.on_commit(lambda: cls._store_block(key, first + 1, first + size - 1))
+        return first
+
+    @classmethod
+    def next_reference(cls, journal, day=None):
+        """Génère une référence unique : VE-20260225-001 (sans limite à 999)."""
+        day = day or date.today()
+        return f"{journal}-{day.strftime('%Y%m%d')}-{cls.next_value(journal, day):03d}"
+
+    @classmethod
+    def next_references(cls, journal, count, day=None):
+        """
+        Réserve `count` références consécutives en un seul incrément du
+        compteur (passations groupées). Les blocs par processus ne sont pas utilisés.
+        """
+        if count <= 0:
+            return []
+        day = day or date.today()
+        prefix = f"{journal}-{day.strftime('%Y%m%d')}"
+        first = ReferenceSequence.allocate(
+            journal, day, count=count,
+            initial=lambda: cls._legacy_last_value(journal, prefix),
+        )
+        return [f"{prefix}-{value:03d}" for value in range(first, first + count)]
+
+    @classmethod
+    def reset_blocks(cls):
+        """Oublie les blocs pré-réservés du processus (tests, changement de réglage)."""
+        with cls._lock:
+            cls._blocks.clear()
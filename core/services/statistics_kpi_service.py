@@ -0,0 +1,251 @@
+"""
+Indicateurs de la page de statistiques globales (vue `statistics`).
+
+Les compteurs d'une même table sont calculés en une seule agrégation
+conditionnelle (`COUNT(*) FILTER (WHERE …)`, `SUM(…) FILTER (WHERE …)`) au lieu
+d'une requête `.count()` / `.aggregate()` par indicateur ; les cumuls de ventes,
+approvisionnements, dépenses et recettes viennent de la table de faits
+journaliers.
+
+Le résultat est mis en cache par worker pour STATISTICS_CACHE_TTL_SECONDS
+secondes, sous la version 'statistics' (DataVersion) : toute écriture de
+vente, d'approvisionnement ou d'inventaire incrémente la version, si bien que
+le cache n'est jamais servi après une opération de caisse. `generated_at`
+indique l'heure du calcul affiché.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from core.models import (
+    Category, Client, CreditSale, CreditSupply, CustomUser, Daily, DailyExpense, DailyFact, DailyRecipe,
+    DataVersion, Gamme, Inventory, InventorySnapshot, Invoice, Payment, PaymentSchedule, Product, Rayon,
+    Sale, SaleProduct, Supplier, SupplierPayment, Supply,
+)
+
+
+STATISTICS_VERSION_KEY = 'statistics'
+
+
+class StatisticsKpiService:
+
+    _cache = {}
+    _lock = threading.Lock()
+
+    # ── Cache ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, 'STATISTICS_CACHE_TTL_SECONDS', 60)
+
+    @classmethod
+    def get_kpis(cls, current_daily=None):
+        """
+        Indicateurs de la page, depuis le cache s'il est récent et que ni les
+        ventes, ni les approvisionnements, ni les inventaires n'ont changé.
+        """
+        key = (current_daily.id if current_daily else None, timezone.localdate())
+        version = DataVersion.current(STATISTICS_VERSION_KEY)
+        now = time.monotonic()
+        with cls._lock:
+            cached = cls._cache.get(key)
+            if cached is not None and cached[0] == version and cached[1] > now:
+                return cached[2]
+
+        kpis = cls.compute(current_daily)
+        with cls._lock:
+            # Une seule journée active à la fois : on ne garde que la dernière clé
+            cls._cache = {key: (version, now + cls._ttl(), kpis)}
+        return kpis
+
+    @classmethod
+    def invalidate(cls):
+        """Invalide les indicateurs en cache dans tous les workers."""
+        DataVersion.bump_on_commit(STATISTICS_VERSION_KEY)
+
+    @classmethod
+    def clear(cls):
+        """Vide le cache du processus courant."""
+        with cls._lock:
+            cls._cache = {}
+
+    # ── Calcul ────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _activity():
+        """Cumuls globaux depuis la table de faits, en une requête."""
+        sale = Q(kind=DailyFact.KIND_SALE)
+        supply = Q(kind=DailyFact.KIND_SUPPLY)
+        row = DailyFact.objects.aggregate(
+            total_revenue=Sum('amount', filter=sale),
+            sales_count=Sum('count', filter=sale),
+            credit_sales_count=Sum('count', filter=sale & Q(is_credit=True)),
+            products_sold_count=Sum('quantity', filter=Q(kind=DailyFact.KIND_ITEM)),
+            total_expenses=Sum('amount', filter=Q(kind=DailyFact.KIND_EXPENSE)),
+            total_recipes=Sum('amount', filter=Q(kind=DailyFact.KIND_RECIPE)),
+            total_supplies=Sum('amount', filter=supply),
+            supplies_count=Sum('count', filter=supply),
+        )
+        return {name: value or 0 for name, value in row.items()}
+
+    @staticmethod
+    def _sales(current_daily):
+        """Statut de paiement (modifiable après la vente) et ventes de la journée active."""
+        aggregates = {
+            'paid_sales_count': Count('id', filter=Q(is_paid=True)),
+            'unpaid_sales_count': Count('id', filter=Q(is_paid=False)),
+        }
+        if current_daily:
+            aggregates['today_revenue'] = Sum('total', filter=Q(daily=current_daily))
+            aggregates['today_sales_count'] = Count('id', filter=Q(daily=current_daily))
+        row = Sale.objects.filter(delete_at__isnull=True).aggregate(**aggregates)
+        row['today_revenue'] = row.get('today_revenue') or 0
+        row['today_sales_count'] = row.get('today_sales_count') or 0
+        row['today_products_sold'] = 0
+        if current_daily:
+            row['today_products_sold'] = SaleProduct.objects.filter(
+                delete_at__isnull=True, sale__delete_at__isnull=True, sale__daily=current_daily,
+            ).aggregate(total=Sum('quantity'))['total'] or 0
+        return row
+
+    @staticmethod
+    def _today_cash(current_daily):
+        if not current_daily:
+            return {'today_expenses': 0, 'today_recipes': 0, 'today_supplies_count': 0, 'today_supplies_total': 0}
+        supplies = Supply.objects.filter(delete_at__isnull=True, daily=current_daily).aggregate(
+            count=Count('id'), total=Sum('total_price'),
+        )
+        return {
+            'today_expenses': DailyExpense.objects.filter(
+                delete_at__isnull=True, daily=current_daily,
+            ).aggregate(total=Sum('amount'))['total'] or 0,
+            'today_recipes': DailyRecipe.objects.filter(
+                delete_at__isnull=True, daily=current_daily,
+            ).aggregate(total=Sum('amount'))['total'] or 0,
+            'today_supplies_count': supplies['count'],
+            'today_supplies_total': supplies['total'] or 0,
+        }
+
+    @staticmethod
+    def _balances():
+        return {
+            'receivables_total': CreditSale.objects.filter(
+                delete_at__isnull=True, sale__delete_at__isnull=True,
+            ).aggregate(total=Sum('amount_remaining'))['total'] or 0,
+            'supplier_debt_total': CreditSupply.objects.filter(
+                delete_at__isnull=True, supply__delete_at__isnull=True,
+            ).aggregate(total=Sum('amount_remaining'))['total'] or 0,
+            'payments_received_total': Payment.objects.filter(
+                delete_at__isnull=True,
+            ).aggregate(total=Sum('amount'))['total'] or 0,
+            'supplier_payments_total': SupplierPayment.objects.filter(
+                delete_at__isnull=True,
+            ).aggregate(total=Sum('amount'))['total'] or 0,
+        }
+
+    @staticmethod
+    def _stock():
+        low_stock = Q(stock__lte=F('stock_limit'), stock_limit__isnull=False)
+        row = Product.objects.filter(delete_at__isnull=True).aggregate(
+            total_products=Count('id'),
+            in_stock_count=Count('id', filter=Q(stock__gt=0)),
+            out_of_stock_count=Count('id', filter=Q(stock=0)),
+            low_stock_count=Count('id', filter=low_stock & Q(stock__gt=0)),
+            stock_alert_count=Count('id', filter=low_stock),
+            total_stock_units=Sum('stock'),
+            products_with_category_count=Count('id', filter=Q(category__isnull=False, category__delete_at__isnull=True)),
+            products_with_gamme_count=Count('id', filter=Q(gamme__isnull=False, gamme__delete_at__isnull=True)),
+            products_with_rayon_count=Count('id', filter=Q(rayon__isnull=False, rayon__delete_at__isnull=True)),
+        )
+        row['total_stock_units'] = row['total_stock_units'] or 0
+        row['categories_count'] = Category.objects.filter(delete_at__isnull=True).count()
+        row['gammes_count'] = Gamme.objects.filter(delete_at__isnull=True).count()
+        row['rayons_count'] = Rayon.objects.filter(delete_at__isnull=True).count()
+        return row
+
+    @staticmethod
+    def _people():
+        row = CustomUser.objects.filter(delete_at__isnull=True).aggregate(
+            staff_count=Count('id'),
+            active_users_count=Count('id', filter=Q(is_active=True)),
+            inactive_users_count=Count('id', filter=Q(is_active=False)),
+        )
+        row['clients_count'] = Client.objects.filter(delete_at__isnull=True).count()
+        row['suppliers_count'] = Supplier.objects.filter(delete_at__isnull=True).count()
+        row['open_dailies_count'] = Daily.objects.filter(delete_at__isnull=True, end_date__isnull=True).count()
+        return row
+
+    @staticmethod
+    def _inventories():
+        row = Inventory.objects.filter(delete_at__isnull=True).aggregate(
+            inventory_sessions_count=Count('id'),
+            valid_inventory_units=Sum('valid_product_count'),
+            invalid_inventory_units=Sum('invalid_product_count'),
+        )
+        row['valid_inventory_units'] = row['valid_inventory_units'] or 0
+        row['invalid_inventory_units'] = row['invalid_inventory_units'] or 0
+        row['inventory_snapshot_count'] = InventorySnapshot.objects.filter(delete_at__isnull=True).count()
+        return row
+
+    @staticmethod
+    def _invoices():
+        return Invoice.objects.filter(delete_at__isnull=True).aggregate(
+            invoice_total=Count('id'),
+            paid_invoices_count=Count('id', filter=Q(status='PAID')),
+            sent_invoices_count=Count('id', filter=Q(status='SENT')),
+            draft_invoices_count=Count('id', filter=Q(status='DRAFT')),
+            cancelled_invoices_count=Count('id', filter=Q(status='CANCELLED')),
+        )
+
+    @staticmethod
+    def _lists(today):
+        products = Product.objects.filter(delete_at__isnull=True)
+        low_stock = products.filter(stock__lte=F('stock_limit')).exclude(stock_limit__isnull=True)
+        return {
+            'recent_sales': list(
+                Sale.objects.filter(delete_at__isnull=True).select_related('client', 'staff').order_by('-create_at')[:6]
+            ),
+            'low_stock_products': list(low_stock.order_by('stock', 'name')[:6]),
+            'top_products': list(
+                products.filter(daily_facts__kind=DailyFact.KIND_ITEM).annotate(
+                    total_quantity=Sum('daily_facts__quantity'),
+                    sales_frequency=Sum('daily_facts__count'),
+                ).filter(total_quantity__gt=0).order_by('-total_quantity', 'name')[:6]
+            ),
+            'overdue_schedules': list(
+                PaymentSchedule.objects.filter(
+                    delete_at__isnull=True,
+                    due_date__lt=today,
+                ).exclude(status='PAID').select_related(
+                    'credit_sale__sale__client',
+                    'credit_supply__supply__supplier',
+                ).order_by('due_date')[:6]
+            ),
+        }
+
+    @classmethod
+    def compute(cls, current_daily=None):
+        """Tous les indicateurs de la page, sans cache."""
+        started = time.monotonic()
+        kpis = {}
+        kpis.update(cls._activity())
+        kpis.update(cls._sales(current_daily))
+        kpis.update(cls._today_cash(current_daily))
+        kpis.update(cls._balances())
+        kpis.update(cls._stock())
+        kpis.update(cls._people())
+        kpis.update(cls._inventories())
+        kpis.update(cls._invoices())
+        kpis.update(cls._lists(timezone.localdate()))
+
+        sales_count = kpis['sales_count']
+        kpis['average_ticket'] = (kpis['total_revenue'] / sales_count) if sales_count else 0
+        kpis['net_result'] = kpis['total_revenue'] + kpis['total_recipes'] - kpis['total_expenses']
+        kpis['today_net'] = kpis['today_revenue'] + kpis['today_recipes'] - kpis['today_expenses']
+        kpis['generated_at'] = timezone.now()
+        kpis['duration_ms'] = round((time.monotonic() - started) * 1000)
+        return kpis
@@ -6,6 +6,7 @@ from django.utils import timezone
 from core.models import Product, Supply, SupplyReturn
 from core.models.inventory_models import CreditSupply, PaymentSchedule
 from core.services.accounting_service import AccountingService
+from core.services.accounting_outbox_service import AccountingOutboxService
 from core.services.daily_service import DailyService
 
 
@@ -58,6 +59,8 @@ class SupplyService:
     @transaction.atomic
     def cancel_supply(supply, reason='', refund_payment_method='CASH'):
         cancel_at = timezone.now()
+        # L'écriture d'origine doit exister avant sa contrepassation
+        AccountingOutboxService.process_pending(supply=supply)
         supply = Supply.objects.select_for_update().select_related(
             'product', 'supplier', 'daily', 'daily__exercise', 'credit_info', 'tax_rate'
         ).get(id=supply.id)
@@ -106,6 +109,8 @@ class SupplyService:
     @staticmethod
     @transaction.atomic
     def partial_return_supply(supply, returned_quantity, reason='', refund_payment_method='CASH'):
+        # L'écriture d'origine doit exister avant sa contrepassation
+        AccountingOutboxService.process_pending(supply=supply)
         supply = Supply.objects.select_for_update().select_related(
             'product', 'supplier', 'daily', 'daily__exercise', 'credit_info', 'tax_rate'
         ).get(id=supply.id)
@@ -0,0 +1,215 @@
+"""
+Signaux de l'application core : invalidation des caches partagés entre workers
+(catalogue, plan comptable, totaux du journal, indicateurs statistiques, rapports
+financiers), tenue des soldes de comptes matérialisés, des faits statistiques
+journaliers et des compteurs de journée.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import (
+    Account, Category, CreditSale, CreditSupply, Daily, DailyCounters, DailyExpense, DailyInventory, DailyRecipe, Gamme,
+    GrammageType, Inventory, JournalEntry, JournalEntryLine, Payment, Product, ProductImage, Rayon, Sale, Supply,
+    SupplierPayment, TaxRate,
+)
+from core.services.account_balance_service import AccountBalanceService
+from core.services.accounting_cache_service import AccountingCacheService
+from core.services.daily_counters_service import DailyCountersService
+from core.services.daily_fact_service import DailyFactService
+from core.services.journal_service import JournalService
+from core.services.product_cache_service import ProductCacheService
+from core.services.report_cache_service import SALES_VERSION_KEY, SUPPLIES_VERSION_KEY, ReportCacheService
+from core.services.statistics_kpi_service import StatisticsKpiService
+
+
+# Champs produit absents de la fiche mise en cache (le stock est relu à chaque requête)
+PRODUCT_UNCACHED_FIELDS = {'stock', 'last_purchase_price', 'updated_at'}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache_on_product_change(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= PRODUCT_UNCACHED_FIELDS:
+        return
+    ProductCacheService.invalidate()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Gamme)
+@receiver(post_delete, sender=Gamme)
+@receiver(post_save, sender=Rayon)
+@receiver(post_delete, sender=Rayon)
+@receiver(post_save, sender=GrammageType)
+@receiver(post_delete, sender=GrammageType)
+def invalidate_product_cache_on_reference_change(sender, **kwargs):
+    ProductCacheService.invalidate()
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=TaxRate)
+@receiver(post_delete, sender=TaxRate)
+def invalidate_accounting_cache(sender, **kwargs):
+    AccountingCacheService.invalidate()
+
+
+@receiver(post_save, sender=JournalEntry)
+@receiver(post_delete, sender=JournalEntry)
+@receiver(post_save, sender=JournalEntryLine)
+@receiver(post_delete, sender=JournalEntryLine)
+def invalidate_journal_totals(sender, raw=False, **kwargs):
+    if not raw:
+        JournalService.invalidate()
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Supply)
+@receiver(post_delete, sender=Supply)
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+@receiver(post_save, sender=DailyInventory)
+@receiver(post_delete, sender=DailyInventory)
+def invalidate_statistics_kpis(sender, raw=False, **kwargs):
+    if not raw:
+        StatisticsKpiService.invalidate()
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=CreditSale)
+@receiver(post_delete, sender=CreditSale)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_sales_reports(sender, raw=False, **kwargs):
+    if not raw:
+        ReportCacheService.invalidate(SALES_VERSION_KEY)
+
+
+@receiver(post_save, sender=Supply)
+@receiver(post_delete, sender=Supply)
+@receiver(post_save, sender=CreditSupply)
+@receiver(post_delete, sender=CreditSupply)
+@receiver(post_save, sender=SupplierPayment)
+@receiver(post_delete, sender=SupplierPayment)
+def invalidate_supplies_reports(sender, raw=False, **kwargs):
+    if not raw:
+        ReportCacheService.invalidate(SUPPLIES_VERSION_KEY)
+
+
+# ── Faits statistiques (DailyFact) ─────────────────────────────────────
+# Les ventes sont reportées par SaleService ; ici, approvisionnements, dépenses
+# et recettes : incrément à la création, recalcul du jour sinon.
+
+@receiver(post_save, sender=Supply)
+@receiver(post_save, sender=DailyExpense)
+@receiver(post_save, sender=DailyRecipe)
+def update_daily_facts_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        DailyFactService.record_created(instance)
+    else:
+        DailyFactService.refresh_day(instance)
+
+
+@receiver(post_delete, sender=Supply)
+@receiver(post_delete, sender=DailyExpense)
+@receiver(post_delete, sender=DailyRecipe)
+def update_daily_facts_on_delete(sender, instance, **kwargs):
+    DailyFactService.refresh_day(instance)
+
+
+# ── Compteurs de journée (DailyCounters) ───────────────────────────────
+# Ligne créée avec la journée ; les ventes sont reportées par SaleService, ici
+# approvisionnements, dépenses et recettes : incrément à la création, recalcul
+# de la journée sinon.
+
+@receiver(post_save, sender=Daily)
+def create_daily_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        DailyCounters.objects.get_or_create(daily=instance)
+
+
+@receiver(post_save, sender=Supply)
+@receiver(post_save, sender=DailyExpense)
+@receiver(post_save, sender=DailyRecipe)
+def update_daily_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        DailyCountersService.record_created(instance)
+    else:
+        DailyCountersService.refresh(instance)
+
+
+@receiver(post_delete, sender=Supply)
+@receiver(post_delete, sender=DailyExpense)
+@receiver(post_delete, sender=DailyRecipe)
+def update_daily_counters_on_delete(sender, instance, **kwargs):
+    DailyCountersService.refresh(instance)
+
+
+# ── Soldes de comptes (AccountBalance) ─────────────────────────────────
+# Les lignes créées par bulk_create sont reportées par JournalEntryLineQuerySet ;
+# ici, les créations et modifications unitaires (admin, saisie manuelle).
+
+def _line_key(account_id, entry_id):
+    entry = JournalEntry.objects.filter(pk=entry_id).values('exercise_id', 'date').first()
+    if entry is None:
+        return None
+    return (account_id, entry['exercise_id'], entry['date'])
+
+
+@receiver(pre_save, sender=JournalEntryLine)
+def remember_line_balance_key(sender, instance, raw=False, **kwargs):
+    instance._previous_balance_key = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = JournalEntryLine.objects.filter(pk=instance.pk).values('account_id', 'entry_id').first()
+    if previous:
+        instance._previous_balance_key = _line_key(previous['account_id'], previous['entry_id'])
+
+
+@receiver(post_save, sender=JournalEntryLine)
+def update_balance_on_line_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        AccountBalanceService.record_lines([instance])
+        return
+    keys = {getattr(instance, '_previous_balance_key', None), _line_key(instance.account_id, instance.entry_id)}
+    AccountBalanceService.refresh(key for key in keys if key)
+
+
+@receiver(post_delete, sender=JournalEntryLine)
+def update_balance_on_line_delete(sender, instance, **kwargs):
+    key = _line_key(instance.account_id, instance.entry_id)
+    if key:
+        AccountBalanceService.refresh([key])
+
+
+@receiver(pre_save, sender=JournalEntry)
+def remember_entry_balance_state(sender, instance, raw=False, **kwargs):
+    instance._previous_balance_state = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_balance_state = JournalEntry.objects.filter(pk=instance.pk).values_list(
+        'exercise_id', 'date', 'is_validated',
+    ).first()
+
+
+@receiver(post_save, sender=JournalEntry)
+def update_balance_on_entry_change(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_balance_state', None)
+    if raw or created or previous is None:
+        return
+    if previous == (instance.exercise_id, instance.date, instance.is_validated):
+        return
+    keys = AccountBalanceService.keys_for_entry(instance.pk, previous[0], previous[1])
+    keys |= AccountBalanceService.keys_for_entry(instance.pk, instance.exercise_id, instance.date)
+    AccountBalanceService.refresh(keys)
@@ -1,29 +1,53 @@
 import json
+import os
+import tempfile
+from io import BytesIO, StringIO
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, timedelta
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
 from core.models import (
+    Account,
+    AccountBalance,
+    AccountingOutbox,
     AppModule,
+    BankReconciliationRun,
+    BankStatement,
     CreditSale,
     CreditSupply,
+    Category,
     Client,
     Daily,
+    DailyCounters,
     DailyExpense,
+    DailyInventory,
+    DailyFact,
+    DataVersion,
     DailyRecipe,
     Exercise,
+    ExerciseClosing,
     ExpenseType,
     Invoice,
     JournalEntry,
+    JournalEntryLine,
     Product,
+    ProductDailyMargin,
     Payment,
     PaymentSchedule,
     Refund,
     RecipeType,
+    ReferenceSequence,
     Sale,
     SaleReturn,
     SaleReturnLine,
@@ -35,8 +59,30 @@ from core.models import (
     SystemSettings,
     TaxRate,
 )
+from core.pagination import KeysetPaginator
+from core.services.accounting_cache_service import AccountingCacheService
+from core.services.accounting_outbox_service import AccountingOutboxService
 from core.services.accounting_service import AccountingService
+from core.services.daily_counters_service import DailyCountersService
+from core.services.daily_fact_service import DailyFactService
+from core.services.aged_balance_service import AgedBalanceService
+from core.services.bank_reconciliation_service import BankReconciliationService
+from core.services.bank_statement_import_service import (
+    BankStatementImportService,
+    ensure_bank_statement_hashes,
+)
+from core.services.catalog_sync_service import CatalogSyncService
+from core.services.excercise_service import ExerciseService
+from core.services.exercise_closing_service import ExerciseClosingService
+from core.services.general_ledger_service import GeneralLedgerService
+from core.services.journal_integrity_service import JournalIntegrityService
+from core.services.journal_service import JournalService
+from core.services.product_cache_service import ProductCacheService
+from core.services.product_margin_service import ProductMarginService
+from core.services.report_cache_service import ReportCacheService
 from core.services.sale_service import SaleService
+from core.services.sequence_service import SequenceService
+from core.services.statistics_kpi_service import StatisticsKpiService
 from core.services.supply_service import SupplyService
 
 
@@ -464,6 +510,49 @@ class SalesCancellationTests(TestCase):
         self.assertEqual(entry.lines.get(account__code='701').debit, Decimal('1925.00'))
         self.assertEqual(entry.lines.get(account__code='4431').credit, Decimal('1925.00'))
 
+    def _deferred_sales(self, count):
+        settings_obj = SystemSettings.get_settings()
+        settings_obj.tva_accounting_mode = 'DEFERRED'
+        settings_obj.save(update_fields=['tva_accounting_mode'])
+        product = self._create_product(code=f'PRD-TVA-{count}', name='Gel douche TVA')
+        return [self._create_sale(product, apply_tax=False) for _ in range(count)]
+
+    def test_deferred_tva_batch_query_count_does_not_grow_with_sales(self):
+        # Premier passage : création des compteurs et soldes du jour
+        self._deferred_sales(1)
+        AccountingService.post_deferred_tva(self.daily)
+
+        self._deferred_sales(2)
+        with CaptureQueriesContext(connection) as small:
+            AccountingService.post_deferred_tva(self.daily)
+
+        sales = self._deferred_sales(6)
+        with CaptureQueriesContext(connection) as large:
+            stats = AccountingService.post_deferred_tva(self.daily)
+
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        self.assertEqual(stats['entries'], 6)
+        self.assertEqual(stats['sales'], 6)
+        self.assertGreaterEqual(stats['duration_ms'], 0)
+        self.assertFalse(Sale.objects.filter(id__in=[sale.id for sale in sales], tva_accounting_created=False).exists())
+        references = list(JournalEntry.objects.filter(
+            sale__in=sales, description__icontains='TVA collectée',
+        ).values_list('reference', flat=True))
+        self.assertEqual(len(set(references)), 6)
+
+    @override_settings(DEFERRED_TVA_CONSOLIDATED=True)
+    def test_deferred_tva_consolidated_entry(self):
+        self._deferred_sales(3)
+
+        stats = AccountingService.post_deferred_tva(self.daily)
+
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['sales'], 3)
+        entry = JournalEntry.objects.get(daily=self.daily, sale__isnull=True, description__icontains='TVA collectée')
+        self.assertTrue(entry.is_balanced())
+        self.assertEqual(entry.lines.get(account__code='4431').credit, Decimal('5775.00'))
+        self.assertEqual(AccountingService.post_deferred_tva(self.daily)['entries'], 0)
+
     def test_cancel_cash_sale_restores_stock_creates_refund_and_cancels_invoice(self):
         product = self._create_product(code='PRD-CASH', name='Savon comptant')
         sale = self._create_sale(product, is_credit=False, apply_tax=True)
@@ -1126,4 +1215,2130 @@ class SupplyCancellationTests(TestCase):
         self.assertEqual(supply.quantity, 1)
         self.assertEqual(supply.total_price, Decimal('11925.00'))
         self.assertTrue(SupplyReturn.objects.filter(supply=supply).exists())
-        self.assertContains(response, '1 retour partiel enregistré')
\ No newline at end of file
+        self.assertContains(response, '1 retour partiel enregistré')
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SaleCreationTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-pos',
+            email='admin-pos@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+
+        AccountingService.init_chart_of_accounts()
+        settings_obj = SystemSettings.get_settings()
+        settings_obj.enable_tva_accounting = True
+        settings_obj.tva_accounting_mode = 'IMMEDIATE'
+        settings_obj.save()
+
+        TaxRate.objects.create(
+            name='TVA standard',
+            rate=Decimal('19.25'),
+            is_default=True,
+            is_active=True,
+        )
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+
+    def _create_products(self, count, stock=10):
+        return [
+            Product.objects.create(
+                code=f'POS-{index:03d}',
+                name=f'Article caisse {index}',
+                stock=stock,
+                actual_price=Decimal('1000'),
+                max_salable_price=Decimal('1500'),
+            )
+            for index in range(count)
+        ]
+
+    def _sale_payload(self, products, quantity=1):
+        return {
+            'items': [
+                {'product_id': product.id, 'quantity': quantity, 'unit_price': '1000'}
+                for product in products
+            ],
+        }
+
+    def _post_sale(self, payload):
+        return self.client.post(
+            reverse('api:create_sale'),
+            data=json.dumps(payload),
+            content_type='application/json',
+        )
+
+    def test_create_sale_query_count_does_not_grow_with_basket_size(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        small_basket = self._create_products(1)
+        with CaptureQueriesContext(connection) as small_ctx:
+            response = self._post_sale(self._sale_payload(small_basket))
+        self.assertEqual(response.status_code, 201)
+
+        Product.objects.all().delete()
+        large_basket = self._create_products(25)
+        with CaptureQueriesContext(connection) as large_ctx:
+            response = self._post_sale(self._sale_payload(large_basket, quantity=2))
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(len(small_ctx.captured_queries), len(large_ctx.captured_queries))
+        sale = Sale.objects.get(id=response.json()['sale']['id'])
+        self.assertEqual(sale.sale_products.count(), 25)
+        self.assertEqual(sale.total, Decimal('50000.00'))
+        self.assertTrue(all(product.stock == 8 for product in Product.objects.all()))
+
+    def test_create_sale_rejects_basket_exceeding_stock_for_repeated_product(self):
+        product = self._create_products(1, stock=3)[0]
+        payload = {'items': [
+            {'product_id': product.id, 'quantity': 2, 'unit_price': '1000'},
+            {'product_id': product.id, 'quantity': 2, 'unit_price': '1000'},
+        ]}
+
+        response = self._post_sale(payload)
+
+        product.refresh_from_db()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(product.stock, 3)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_create_sale_reports_item_errors_from_single_lookup(self):
+        product = self._create_products(1, stock=1)[0]
+        payload = {'items': [
+            {'product_id': product.id, 'quantity': 5, 'unit_price': '1000'},
+            {'product_id': 999999, 'quantity': 1, 'unit_price': '1000'},
+        ]}
+
+        response = self._post_sale(payload)
+
+        self.assertEqual(response.status_code, 400)
+        item_errors = response.json()['errors']['items']
+        self.assertIn('quantity', item_errors[0])
+        self.assertIn('product_id', item_errors[1])
+
+    def test_replayed_sale_with_same_idempotency_key_returns_original_sale(self):
+        products = self._create_products(2)
+        payload = self._sale_payload(products)
+
+        first = self.client.post(
+            reverse('api:create_sale'), data=json.dumps(payload),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1-0001',
+        )
+        replay = self.client.post(
+            reverse('api:create_sale'), data=json.dumps(payload),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1-0001',
+        )
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(replay.status_code, 200)
+        self.assertTrue(replay.json()['replayed'])
+        self.assertEqual(replay.json()['sale'], first.json()['sale'])
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(AccountingOutbox.objects.filter(event_type='SALE').count(), 1)
+        self.assertTrue(all(product.stock == 9 for product in Product.objects.all()))
+
+    def test_idempotency_key_reused_with_different_payload_is_rejected(self):
+        products = self._create_products(2)
+
+        self.client.post(
+            reverse('api:create_sale'), data=json.dumps(self._sale_payload(products[:1])),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1-0002',
+        )
+        response = self.client.post(
+            reverse('api:create_sale'), data=json.dumps(self._sale_payload(products)),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1-0002',
+        )
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_expired_idempotency_key_allows_new_sale(self):
+        from core.models import SaleIdempotencyKey
+
+        products = self._create_products(1)
+        payload = self._sale_payload(products)
+        self.client.post(
+            reverse('api:create_sale'), data=json.dumps(payload),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1-0003',
+        )
+        SaleIdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        response = self.client.post(
+            reverse('api:create_sale'), data=json.dumps(payload),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1-0003',
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(SaleIdempotencyKey.objects.count(), 1)
+
+    def test_invalid_idempotency_key_is_rejected_before_sale(self):
+        products = self._create_products(1)
+        payload = self._sale_payload(products)
+
+        not_text = self.client.post(
+            reverse('api:create_sale'), data=json.dumps({**payload, 'idempotency_key': 12}),
+            content_type='application/json',
+        )
+        too_long = self.client.post(
+            reverse('api:create_sale'), data=json.dumps(payload),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='k' * 101,
+        )
+        list_body = self.client.post(
+            reverse('api:create_sale'), data=json.dumps([payload]),
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1-0004',
+        )
+
+        self.assertEqual(not_text.status_code, 400)
+        self.assertEqual(too_long.status_code, 400)
+        self.assertEqual(list_body.status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_batch_sync_reports_conflicts_per_sale_without_aborting(self):
+        import uuid
+
+        product = self._create_products(1, stock=3)[0]
+        sales = [
+            {'client_uuid': str(uuid.uuid4()), **self._sale_payload([product], quantity=2)},
+            {'client_uuid': str(uuid.uuid4()), **self._sale_payload([product], quantity=2)},
+            {'client_uuid': str(uuid.uuid4()), **self._sale_payload([product], quantity=1)},
+        ]
+
+        response = self.client.post(
+            reverse('api:create_sales_batch'),
+            data=json.dumps({'sales': sales}),
+            content_type='application/json',
+        )
+
+        product.refresh_from_db()
+        payload = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in payload['results']], ['created', 'error', 'created'])
+        self.assertIn('items', payload['results'][1]['errors'])
+        self.assertEqual(payload['summary'], {'created': 2, 'replayed': 0, 'error': 1})
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Sale.objects.count(), 2)
+
+        replay = self.client.post(
+            reverse('api:create_sales_batch'),
+            data=json.dumps({'sales': [sales[0], sales[2]]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(replay.json()['summary'], {'created': 0, 'replayed': 2, 'error': 0})
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_batch_sync_requires_client_uuid(self):
+        product = self._create_products(1)[0]
+
+        response = self.client.post(
+            reverse('api:create_sales_batch'),
+            data=json.dumps({'sales': [self._sale_payload([product])]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.json()['results'][0]['status'], 'error')
+        self.assertFalse(Sale.objects.exists())
+
+
+class AccountingOutboxTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-outbox',
+            email='admin-outbox@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+
+        AccountingService.init_chart_of_accounts()
+        settings_obj = SystemSettings.get_settings()
+        settings_obj.enable_tva_accounting = True
+        settings_obj.tva_accounting_mode = 'IMMEDIATE'
+        settings_obj.save()
+
+        TaxRate.objects.create(
+            name='TVA standard',
+            rate=Decimal('19.25'),
+            is_default=True,
+            is_active=True,
+        )
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.product = Product.objects.create(
+            code='OUTBOX-001',
+            name='Produit outbox',
+            stock=10,
+            actual_price=Decimal('1000'),
+            max_salable_price=Decimal('1500'),
+            is_price_reducible=True,
+        )
+
+    def _create_sale(self):
+        return SaleService.create_sale(
+            {'items': [{'product_id': self.product.id, 'quantity': 2, 'unit_price': Decimal('1000')}]},
+            staff=self.user,
+        )
+
+    def test_create_sale_enqueues_event_without_posting(self):
+        sale = self._create_sale()
+
+        event = AccountingOutbox.objects.get(sale=sale)
+        self.assertEqual(event.event_type, 'SALE')
+        self.assertEqual(event.status, 'PENDING')
+        self.assertFalse(JournalEntry.objects.filter(sale=sale).exists())
+
+    def test_process_batch_posts_balanced_entry_and_marks_event_done(self):
+        sale = self._create_sale()
+
+        result = AccountingOutboxService.process_batch()
+
+        event = AccountingOutbox.objects.get(sale=sale)
+        entry = JournalEntry.objects.get(sale=sale)
+        self.assertEqual(result, {'processed': 1, 'failed': 0})
+        self.assertEqual(event.status, 'DONE')
+        self.assertEqual(event.journal_entry, entry)
+        self.assertTrue(entry.is_balanced())
+        self.assertEqual(AccountingOutboxService.process_batch(), {'processed': 0, 'failed': 0})
+        self.assertEqual(JournalEntry.objects.filter(sale=sale).count(), 1)
+
+    def test_failed_event_is_rescheduled_with_backoff(self):
+        sale = self._create_sale()
+
+        with mock.patch.object(AccountingService, 'record_sale', side_effect=RuntimeError('compte manquant')):
+            result = AccountingOutboxService.process_batch()
+
+        event = AccountingOutbox.objects.get(sale=sale)
+        self.assertEqual(result, {'processed': 0, 'failed': 1})
+        self.assertEqual(event.status, 'PENDING')
+        self.assertEqual(event.attempts, 1)
+        self.assertIn('compte manquant', event.last_error)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        self.assertEqual(AccountingOutboxService.process_batch(), {'processed': 0, 'failed': 0})
+        self.assertFalse(JournalEntry.objects.filter(sale=sale).exists())
+
+    def test_cancel_sale_flushes_pending_event_before_reversal(self):
+        sale = self._create_sale()
+
+        SaleService.cancel_sale(sale, reason='Erreur caisse')
+
+        self.assertEqual(AccountingOutbox.objects.get(sale=sale).status, 'DONE')
+        self.assertEqual(JournalEntry.objects.filter(sale=sale, journal='VE').count(), 2)
+
+    def test_cancel_sale_refused_while_original_entry_is_unposted(self):
+        sale = self._create_sale()
+
+        with mock.patch.object(AccountingService, 'record_sale', side_effect=RuntimeError('compte manquant')):
+            with self.assertRaises(ValueError):
+                SaleService.cancel_sale(sale, reason='Erreur caisse')
+
+        sale.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertIsNone(sale.delete_at)
+        self.assertEqual(self.product.stock, 8)
+        self.assertEqual(AccountingOutbox.objects.get(sale=sale).status, 'PENDING')
+        self.assertFalse(JournalEntry.objects.filter(sale=sale).exists())
+
+    def test_close_exercise_refused_while_events_are_unposted(self):
+        self._create_sale()
+
+        with mock.patch.object(AccountingService, 'record_sale', side_effect=RuntimeError('compte manquant')):
+            self.client.post(reverse('close_exercise_action'))
+            with self.assertRaisesMessage(CommandError, '1 événement(s) comptable(s) en attente'):
+                call_command('close_exercise', exercise=self.exercise.pk, stdout=StringIO())
+
+        self.assertFalse(ExerciseClosing.objects.exists())
+        self.assertIsNone(Exercise.objects.get(pk=self.exercise.pk).end_date)
+
+    def test_status_view_reports_queue_lag(self):
+        self._create_sale()
+        AccountingOutbox.objects.update(create_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.client.get(reverse('accounting_outbox_status'))
+
+        payload = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(payload['pending'], 1)
+        self.assertGreaterEqual(payload['lag_seconds'], 300)
+
+
+class ReferenceSequenceTests(TestCase):
+    def setUp(self):
+        SequenceService.reset_blocks()
+        self.exercise = Exercise.objects.create(start_date=timezone.now())
+
+    def tearDown(self):
+        SequenceService.reset_blocks()
+
+    def test_references_are_sequential_per_journal_and_day(self):
+        today = date.today().strftime('%Y%m%d')
+
+        self.assertEqual(AccountingService._generate_reference('VE'), f'VE-{today}-001')
+        self.assertEqual(AccountingService._generate_reference('VE'), f'VE-{today}-002')
+        self.assertEqual(AccountingService._generate_reference('AC'), f'AC-{today}-001')
+        self.assertEqual(Invoice.generate_invoice_number(), f'FAC-{today}-001')
+
+    def test_numbering_is_not_capped_at_999(self):
+        ReferenceSequence.objects.create(journal='VE', day=date.today(), last_value=999)
+
+        reference = AccountingService._generate_reference('VE')
+
+        self.assertTrue(reference.endswith('-1000'))
+
+    def test_counter_resumes_after_existing_references(self):
+        today = date.today().strftime('%Y%m%d')
+        JournalEntry.objects.create(
+            reference=f'OD-{today}-041', date=date.today(), description='Reprise', journal='OD', exercise=self.exercise,
+        )
+
+        self.assertEqual(AccountingService._generate_reference('OD'), f'OD-{today}-042')
+
+    @override_settings(REFERENCE_SEQUENCE_BLOCK_SIZE=10)
+    def test_block_preallocation_serves_numbers_from_memory(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = SequenceService.next_value('VE')
+        with CaptureQueriesContext(connection) as ctx:
+            following = [SequenceService.next_value('VE') for _ in range(9)]
+
+        self.assertEqual([first] + following, list(range(1, 11)))
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(ReferenceSequence.objects.get(journal='VE').last_value, 10)
+        self.assertEqual(SequenceService.next_value('VE'), 11)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-search',
+            email='admin-search@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        self.coffee = Product.objects.create(code='CAF-001', name='Café Crème moulu', brand='Mokéla', stock=5)
+        self.coffee_beans = Product.objects.create(code='CAF-002', name='Grains de café', brand='Arabica', stock=5)
+        self.cola = Product.objects.create(code='BOI-010', name='Coca-Cola 1.5L', brand='Coca', stock=5)
+
+    def _search(self, term):
+        response = self.client.get(reverse('api:search_products'), {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return [item['code'] for item in response.json()]
+
+    def test_search_is_accent_and_case_insensitive(self):
+        self.assertEqual(set(self._search('CAFE')), {'CAF-001', 'CAF-002'})
+        self.assertEqual(self._search('creme'), ['CAF-001'])
+        self.assertEqual(self._search('mokela'), ['CAF-001'])
+
+    def test_search_matches_word_prefixes_and_codes(self):
+        self.assertEqual(self._search('coca col'), ['BOI-010'])
+        self.assertEqual(self._search('boi-01'), ['BOI-010'])
+
+    def test_index_follows_product_updates_and_deletions(self):
+        self.cola.name = 'Limonade pétillante'
+        self.cola.save(update_fields=['name'])
+        self.coffee_beans.soft_delete()
+
+        self.assertEqual(self._search('petillante'), ['BOI-010'])
+        self.assertEqual(self._search('cola'), [])
+        self.assertEqual(self._search('cafe'), ['CAF-001'])
+
+    def test_search_ranks_most_relevant_product_first(self):
+        Product.objects.create(code='CAF-003', name='Café café café', brand='Maison', stock=5)
+
+        self.assertEqual(self._search('cafe')[0], 'CAF-003')
+
+    def test_products_page_uses_search_index(self):
+        response = self.client.get(reverse('products'), {'search': 'crème'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product.code for product in response.context['products']], ['CAF-001'])
+
+
+class ProductCacheTests(TestCase):
+    def setUp(self):
+        ProductCacheService.clear()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-cache',
+            email='admin-cache@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        self.product = Product.objects.create(code='SCAN-001', name='Lait concentré', stock=8, actual_price=Decimal('750'))
+
+    def tearDown(self):
+        ProductCacheService.clear()
+
+    def _scan(self):
+        response = self.client.get(reverse('api:product_by_code', args=[self.product.code]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_repeated_scan_is_served_from_cache(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as first_ctx:
+            first = self._scan()
+        with CaptureQueriesContext(connection) as second_ctx:
+            second = self._scan()
+
+        self.assertEqual(first, second)
+        self.assertEqual(ProductCacheService.hits, 1)
+        self.assertLess(len(second_ctx.captured_queries), len(first_ctx.captured_queries))
+
+    def test_cached_payload_returns_fresh_stock(self):
+        self._scan()
+        Product.objects.filter(id=self.product.id).update(stock=3)
+
+        payload = self._scan()
+
+        self.assertEqual(payload['stock'], 3)
+        self.assertEqual(ProductCacheService.hits, 1)
+
+    def test_product_change_bumps_catalog_version(self):
+        self._scan()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 5
+            self.product.save(update_fields=['stock'])
+        self.assertEqual(DataVersion.current('catalog'), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Lait concentré sucré'
+            self.product.save()
+        payload = self._scan()
+
+        self.assertEqual(DataVersion.current('catalog'), 1)
+        self.assertEqual(payload['name'], 'Lait concentré sucré')
+        self.assertEqual(ProductCacheService.hits, 0)
+
+    def test_unknown_code_is_not_cached(self):
+        response = self.client.get(reverse('api:product_by_code', args=['INCONNU']))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.content)
+        self.assertEqual(ProductCacheService.misses, 0)
+
+
+@override_settings(CATALOG_SYNC_LAG_SECONDS=0)
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-sync',
+            email='admin-sync@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name='Boissons')
+        self.products = [
+            Product.objects.create(code=f'SYNC-{index}', name=f'Produit {index}', stock=4, category=self.category)
+            for index in range(3)
+        ]
+
+    def _changes(self, cursor=None, limit=None):
+        params = {}
+        if cursor:
+            params['cursor'] = cursor
+        if limit:
+            params['limit'] = limit
+        response = self.client.get(reverse('api:catalog_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_returns_full_catalog_in_pages(self):
+        first = self._changes(limit=2)
+        second = self._changes(first['cursor'], limit=2)
+
+        self.assertTrue(first['full_resync'])
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        codes = [row['code'] for row in first['products']['changed'] + second['products']['changed']]
+        self.assertEqual(codes, ['SYNC-0', 'SYNC-1', 'SYNC-2'])
+        self.assertEqual(first['categories']['changed'][0]['name'], 'Boissons')
+        self.assertEqual(first['products']['changed'][0]['category_id'], self.category.id)
+
+    def test_delta_contains_only_changes_and_tombstones(self):
+        cursor = self._changes()['cursor']
+        self.products[0].name = 'Produit renommé'
+        self.products[0].save()
+        self.products[1].soft_delete()
+
+        delta = self._changes(cursor)
+
+        self.assertFalse(delta['full_resync'])
+        self.assertEqual([row['name'] for row in delta['products']['changed']], ['Produit renommé'])
+        self.assertEqual(delta['products']['deleted'], [self.products[1].id])
+        self.assertEqual(delta['categories'], {'changed': [], 'deleted': []})
+        self.assertEqual(self._changes(delta['cursor'])['products'], {'changed': [], 'deleted': []})
+
+    def test_stock_decrement_appears_in_delta(self):
+        cursor = self._changes()['cursor']
+        SaleService._decrement_stock({self.products[2].id: 1})
+
+        delta = self._changes(cursor)
+
+        self.assertEqual([(row['code'], row['stock']) for row in delta['products']['changed']], [('SYNC-2', 3)])
+
+    def test_open_write_transaction_holds_back_the_cursor(self):
+        now = timezone.now()
+        Product.objects.update(updated_at=now - timedelta(minutes=10))
+        cursor = self._changes()['cursor']
+        self.products[1].name = 'Validé tout de suite'
+        self.products[1].save()
+
+        # Une transaction ouverte depuis 60 s a daté sa ligne d'il y a 30 s
+        with mock.patch.object(CatalogSyncService, '_oldest_open_write_age', return_value=60):
+            delta = self._changes(cursor)
+        Product.objects.filter(pk=self.products[0].pk).update(
+            name='Import long', updated_at=now - timedelta(seconds=30),
+        )
+        after_commit = self._changes(delta['cursor'])
+
+        self.assertEqual(delta['products'], {'changed': [], 'deleted': []})
+        self.assertEqual(
+            [row['name'] for row in after_commit['products']['changed']],
+            ['Import long', 'Validé tout de suite'],
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('api:catalog_changes'), {'cursor': 'pas-un-curseur'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-keyset',
+            email='admin-keyset@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        self.products = [
+            Product.objects.create(code=f'KEY-{index}', name=f'Produit {index}', stock=1)
+            for index in range(5)
+        ]
+
+    def test_api_cursor_pages_through_all_products_without_offset(self):
+        codes, cursor = [], ''
+        with CaptureQueriesContext(connection) as queries:
+            while cursor is not None:
+                response = self.client.get(reverse('api:product_list'), {'cursor': cursor, 'count': 2})
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                codes += [row['code'] for row in data['results']]
+                cursor = data['next_cursor']
+
+        self.assertEqual(codes, [f'KEY-{index}' for index in range(5)])
+        self.assertFalse(any('OFFSET' in query['sql'].upper() for query in queries.captured_queries))
+
+    def test_api_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('api:product_list'), {'cursor': 'pas-un-curseur'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_paginator_walks_back_and_forth(self):
+        paginator = KeysetPaginator(Product.objects.all(), per_page=2)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        back = paginator.get_page(second.previous_cursor)
+
+        self.assertEqual([p.code for p in first], ['KEY-4', 'KEY-3'])
+        self.assertEqual([p.code for p in second], ['KEY-2', 'KEY-1'])
+        self.assertEqual(second.number, 2)
+        self.assertEqual([p.code for p in back], ['KEY-4', 'KEY-3'])
+        self.assertFalse(back.has_previous)
+        self.assertEqual(back.number, 1)
+
+    def test_approximate_count_is_capped(self):
+        page = KeysetPaginator(Product.objects.all(), per_page=2, count_cap=3).get_page()
+
+        self.assertTrue(page.count_is_approximate)
+        self.assertEqual(page.count_display, '3+')
+        self.assertEqual(page.num_pages_display, '2+')
+
+    def test_sales_history_links_use_cursor_and_keep_filters(self):
+        now = timezone.now()
+        daily = Daily.objects.create(start_date=now, exercise=Exercise.objects.create(start_date=now))
+        for _ in range(25):
+            Sale.objects.create(staff=self.user, daily=daily, total=Decimal('100'))
+
+        response = self.client.get(reverse('sales_history'), {'type': 'cash'})
+        self.assertEqual(response.status_code, 200)
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 20)
+        self.assertIn('cursor=', page_obj.next_querystring)
+        self.assertIn('type=cash', page_obj.next_querystring)
+
+        response = self.client.get(reverse('sales_history') + '?' + page_obj.next_querystring)
+        self.assertEqual(len(response.context['page_obj']), 5)
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def test_history_pages_render_with_keyset_pagination(self):
+        for name in ('supplies', 'inventory', 'accounting_journal'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200, name)
+            self.assertFalse(response.context['page_obj'].has_previous)
+
+
+class AccountBalanceTests(TestCase):
+    def setUp(self):
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.cash = Account.objects.get(code='571')
+        self.sales = Account.objects.get(code='701')
+        self.bank = Account.objects.get(code='521')
+
+    def _post(self, amount, day=None, debit_account=None):
+        entry = JournalEntry.objects.create(
+            reference=f'TEST-{JournalEntry.objects.count() + 1}',
+            date=day or date.today(),
+            description='Vente test',
+            journal='VE',
+            exercise=self.exercise,
+        )
+        JournalEntryLine.objects.bulk_create([
+            JournalEntryLine(entry=entry, account=debit_account or self.cash, debit=Decimal(amount)),
+            JournalEntryLine(entry=entry, account=self.sales, credit=Decimal(amount)),
+        ])
+        return entry
+
+    def _raw_balance(self, account):
+        lines = JournalEntryLine.objects.filter(account=account, entry__is_validated=True)
+        return sum(line.debit - line.credit for line in lines)
+
+    def test_bulk_created_lines_update_daily_balances(self):
+        self._post('1000')
+        self._post('500')
+        self._post('200', day=date.today() - timedelta(days=1))
+
+        self.assertEqual(AccountBalance.objects.filter(account=self.cash).count(), 2)
+        self.assertEqual(self.cash.get_balance(self.exercise), Decimal('1700'))
+        self.assertEqual(self.sales.get_balance(self.exercise), Decimal('1700'))
+        self.assertEqual(self.cash.get_balance(date_from=date.today()), Decimal('1500'))
+
+    def test_get_balance_reads_a_single_query(self):
+        self._post('1000')
+
+        with self.assertNumQueries(1):
+            self.cash.get_balance(self.exercise)
+
+    def test_line_edit_and_entry_invalidation_refresh_balances(self):
+        entry = self._post('1000')
+        line = entry.lines.get(account=self.cash)
+        line.account = self.bank
+        line.save()
+
+        self.assertEqual(self.cash.get_balance(), 0)
+        self.assertEqual(self.bank.get_balance(), Decimal('1000'))
+
+        entry.is_validated = False
+        entry.save()
+
+        self.assertEqual(self.bank.get_balance(), 0)
+        self.assertEqual(self.sales.get_balance(), 0)
+
+    def test_single_line_create_and_delete(self):
+        entry = self._post('1000')
+        extra = JournalEntryLine.objects.create(entry=entry, account=self.cash, debit=Decimal('50'))
+        self.assertEqual(self.cash.get_balance(), Decimal('1050'))
+
+        extra.delete()
+        self.assertEqual(self.cash.get_balance(), Decimal('1000'))
+
+    def test_rebuild_matches_incremental_balances(self):
+        self._post('1000')
+        self._post('300', day=date.today() - timedelta(days=3))
+        incremental = list(AccountBalance.objects.order_by('account_id', 'day').values_list(
+            'account_id', 'day', 'debit', 'credit',
+        ))
+        AccountBalance.objects.update(debit=0, credit=0)
+
+        call_command('rebuild_account_balances', stdout=StringIO())
+
+        rebuilt = list(AccountBalance.objects.order_by('account_id', 'day').values_list(
+            'account_id', 'day', 'debit', 'credit',
+        ))
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(self.cash.get_balance(), self._raw_balance(self.cash))
+
+
+class FinancialReportTests(TestCase):
+    def setUp(self):
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.accounts = {account.code: account for account in Account.objects.all()}
+
+    def _post(self, debit_code, credit_code, amount, day=None):
+        entry = JournalEntry.objects.create(
+            reference=f'RPT-{JournalEntry.objects.count() + 1}',
+            date=day or date.today(),
+            description='Écriture test',
+            exercise=self.exercise,
+        )
+        JournalEntryLine.objects.bulk_create([
+            JournalEntryLine(entry=entry, account=self.accounts[debit_code], debit=Decimal(amount)),
+            JournalEntryLine(entry=entry, account=self.accounts[credit_code], credit=Decimal(amount)),
+        ])
+
+    def _post_activity(self):
+        self._post('571', '701', '10000')
+        self._post('601', '401', '6000')
+        self._post('401', '571', '2500')
+
+    def test_reports_derive_from_single_aggregation(self):
+        self._post_activity()
+
+        with self.assertNumQueries(2):
+            trial = AccountingService.get_trial_balance(self.exercise)
+        with self.assertNumQueries(2):
+            income = AccountingService.get_income_statement(self.exercise)
+        with self.assertNumQueries(2):
+            sheet = AccountingService.get_balance_sheet(self.exercise)
+
+        by_code = {row['account'].code: row for row in trial}
+        self.assertEqual(by_code['571']['balance'], Decimal('7500'))
+        self.assertEqual(by_code['401']['total_debit'], Decimal('2500'))
+        self.assertEqual(income['total_produits'], Decimal('10000'))
+        self.assertEqual(income['total_charges'], Decimal('6000'))
+        self.assertEqual(income['resultat_net'], Decimal('4000'))
+        self.assertEqual(sheet['total_treso'], Decimal('7500'))
+        self.assertEqual(sheet['total_dettes'], Decimal('3500'))
+        self.assertEqual(sheet['resultat_net'], Decimal('4000'))
+
+    def test_query_count_does_not_grow_with_accounts(self):
+        self._post_activity()
+        for index in range(20):
+            Account.objects.create(code=f'60{index + 10}', name=f'Charge {index}', account_type='CHARGE')
+            self.accounts = {account.code: account for account in Account.objects.all()}
+            self._post(f'60{index + 10}', '571', '10')
+
+        with self.assertNumQueries(2):
+            income = AccountingService.get_income_statement(self.exercise)
+
+        self.assertEqual(income['total_charges'], Decimal('6200'))
+
+    def test_period_filter(self):
+        self._post('571', '701', '1000', day=date.today() - timedelta(days=10))
+        self._post('571', '701', '300')
+
+        income = AccountingService.get_income_statement(self.exercise, date_from=date.today())
+
+        self.assertEqual(income['total_produits'], Decimal('300'))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class GeneralLedgerTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-ledger',
+            email='admin-ledger@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        self.exercise = ExerciseService.get_or_create_current_exercise()
+        self.cash = Account.objects.get(code='571')
+        self.sales = Account.objects.get(code='701')
+        today = date.today()
+        for index, (amount, debit) in enumerate([(100, True), (40, False), (250, True), (10, False), (5, True)]):
+            entry = JournalEntry.objects.create(
+                reference=f'GL-{index}',
+                date=today - timedelta(days=5 - index),
+                description=f'Mouvement {index}',
+                exercise=self.exercise,
+            )
+            other = self.sales
+            JournalEntryLine.objects.bulk_create([
+                JournalEntryLine(entry=entry, account=self.cash if debit else other, debit=Decimal(amount)),
+                JournalEntryLine(entry=entry, account=other if debit else self.cash, credit=Decimal(amount)),
+            ])
+
+    def test_pages_carry_running_balance(self):
+        first = GeneralLedgerService.get_page(self.cash, self.exercise, per_page=2)
+        second = GeneralLedgerService.get_page(self.cash, self.exercise, cursor=first['next_cursor'], per_page=2)
+        third = GeneralLedgerService.get_page(self.cash, self.exercise, cursor=second['next_cursor'], per_page=2)
+
+        self.assertEqual([item['running_balance'] for item in first['lines']], [Decimal('100'), Decimal('60')])
+        self.assertEqual(second['opening_balance'], Decimal('60'))
+        self.assertEqual([item['running_balance'] for item in second['lines']], [Decimal('310'), Decimal('300')])
+        self.assertEqual([item['running_balance'] for item in third['lines']], [Decimal('305')])
+        self.assertFalse(third['has_next'])
+        self.assertEqual(third['number'], 3)
+
+    def test_page_uses_window_function(self):
+        with CaptureQueriesContext(connection) as queries:
+            GeneralLedgerService.get_page(self.cash, self.exercise, per_page=2)
+
+        self.assertTrue(any('OVER' in query['sql'].upper() for query in queries.captured_queries))
+
+    def test_date_filter_carries_opening_balance(self):
+        start = date.today() - timedelta(days=3)
+        page = GeneralLedgerService.get_page(self.cash, self.exercise, date_from=start)
+
+        self.assertEqual(page['opening_balance'], Decimal('60'))
+        self.assertEqual(page['lines'][0]['running_balance'], Decimal('310'))
+
+    def test_ledger_view_and_streaming_export(self):
+        response = self.client.get(reverse('accounting_ledger'), {'account': '571'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['balance'], Decimal('305'))
+        self.assertEqual(len(response.context['ledger_lines']), 5)
+
+        response = self.client.get(reverse('export_general_ledger'), {'account': '571'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = [row for row in content.splitlines() if row.startswith(('0', '1', '2', '3'))]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(Decimal(rows[-1].split(';')[-1]), Decimal('305'))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AccountingCacheTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-chart',
+            email='admin-chart@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        self.tax_rate = TaxRate.objects.create(name='TVA', rate=Decimal('19.25'), is_default=True, is_active=True)
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        AccountingCacheService.clear()
+
+    def test_lookups_are_served_from_memory_once_loaded(self):
+        AccountingService.get_account('701')
+        AccountingService.get_default_tax_rate()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(AccountingService.get_account('4431').code, '4431')
+            self.assertEqual(AccountingService.get_default_tax_rate(), self.tax_rate)
+            self.assertEqual(AccountingCacheService.get_tax_rate(self.tax_rate.id), self.tax_rate)
+
+    def test_unknown_account_still_raises(self):
+        with self.assertRaises(Account.DoesNotExist):
+            AccountingService.get_account('999999')
+
+    def test_posting_does_not_read_chart_of_accounts(self):
+        AccountingService.get_account('701')
+        expense = DailyExpense.objects.create(
+            amount=1200,
+            description='Transport',
+            daily=self.daily,
+            expense_type=ExpenseType.objects.create(name='Transport'),
+            staff=self.user,
+            exercise=self.exercise,
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            AccountingService.record_expense(expense, self.daily, self.exercise)
+
+        self.assertFalse(any('FROM "account"' in query['sql'] for query in queries.captured_queries))
+
+    def test_account_and_tax_rate_changes_invalidate_cache(self):
+        account = AccountingService.get_account('701')
+        Account.objects.filter(pk=account.pk).update(name='Renommé hors ORM')
+        self.assertNotEqual(AccountingService.get_account('701').name, 'Renommé hors ORM')
+
+        account.name = 'Ventes renommées'
+        account.save()
+        self.assertEqual(AccountingService.get_account('701').name, 'Ventes renommées')
+
+        self.tax_rate.is_active = False
+        self.tax_rate.save()
+        self.assertIsNone(AccountingService.get_default_tax_rate())
+
+    @override_settings(CHART_CACHE_CHECK_SECONDS=0)
+    def test_version_bump_from_another_worker_reloads(self):
+        AccountingService.get_account('701')
+        Account.objects.filter(code='701').update(name='Modifié ailleurs')
+        DataVersion.bump('chart_of_accounts')
+
+        self.assertEqual(AccountingService.get_account('701').name, 'Modifié ailleurs')
+
+    def test_import_chart_of_accounts_refreshes_cache(self):
+        AccountingService.get_account('701')
+        upload = SimpleUploadedFile(
+            'plan.csv',
+            'Code;Libellé;Type;Parent;Description;Actif\n7011;Ventes importées;PRODUIT;;;Oui\n'.encode('utf-8'),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('import_chart_of_accounts'), {'file': upload})
+
+        self.assertEqual(AccountingService.get_account('7011').name, 'Ventes importées')
+        self.assertGreater(DataVersion.current('chart_of_accounts'), 0)
+
+
+class ExerciseClosingTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-closing',
+            email='admin-closing@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        self.exercise = ExerciseService.get_or_create_current_exercise()
+        self.accounts = {account.code: account for account in Account.objects.all()}
+        self._post('571', '701', '10000')
+        self._post('601', '401', '6000')
+
+    def _post(self, debit_code, credit_code, amount):
+        entry = JournalEntry.objects.create(
+            reference=f'CLO-{JournalEntry.objects.count() + 1}',
+            date=date.today(),
+            description='Écriture test',
+            exercise=self.exercise,
+        )
+        JournalEntryLine.objects.bulk_create([
+            JournalEntryLine(entry=entry, account=self.accounts[debit_code], debit=Decimal(amount)),
+            JournalEntryLine(entry=entry, account=self.accounts[credit_code], credit=Decimal(amount)),
+        ])
+
+    def test_close_and_open_carries_balances(self):
+        steps = []
+        closing, new_exercise = ExerciseClosingService.close_and_open(
+            self.exercise, user=self.user, progress=lambda step, total, message: steps.append(step),
+        )
+
+        self.assertEqual(steps, [1, 2, 3, 4])
+        self.assertEqual(closing.result_amount, Decimal('4000'))
+        self.assertTrue(closing.closing_entry.is_balanced())
+        self.assertTrue(closing.opening_entry.is_balanced())
+        self.assertEqual(self.accounts['701'].get_balance(self.exercise), 0)
+        self.assertEqual(self.accounts['601'].get_balance(self.exercise), 0)
+        self.assertEqual(self.accounts['571'].get_balance(new_exercise), Decimal('10000'))
+        self.assertEqual(self.accounts['401'].get_balance(new_exercise), Decimal('6000'))
+        self.assertEqual(self.accounts['131'].get_balance(new_exercise), Decimal('4000'))
+        self.assertEqual(self.accounts['12'].get_balance(new_exercise), 0)
+
+    def test_compute_closing_is_a_single_aggregation(self):
+        AccountingService.get_account('12')
+
+        with self.assertNumQueries(2):
+            closing = ExerciseClosingService.compute_closing(self.exercise)
+
+        self.assertEqual(closing['resultat'], Decimal('4000'))
+
+    def test_preview_endpoint_does_not_write(self):
+        entries_before = JournalEntry.objects.count()
+
+        response = self.client.get(reverse('close_exercise_preview'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(Decimal(data['resultat']), Decimal('4000'))
+        self.assertEqual(data['total_debit'], data['total_credit'])
+        self.assertEqual(JournalEntry.objects.count(), entries_before)
+        self.assertIsNone(Exercise.objects.get(pk=self.exercise.pk).end_date)
+
+    def test_interrupted_closing_resumes_at_opening(self):
+        with mock.patch.object(ExerciseClosingService, 'compute_opening', side_effect=RuntimeError('coupure')):
+            with self.assertRaises(RuntimeError):
+                ExerciseClosingService.close_and_open(self.exercise)
+
+        pending = ExerciseClosingService.get_pending_closing()
+        self.assertIsNotNone(pending)
+
+        response = self.client.post(reverse('close_exercise_action'))
+
+        self.assertEqual(response.status_code, 302)
+        pending.refresh_from_db()
+        self.assertIsNotNone(pending.opening_entry_id)
+        self.assertIsNone(ExerciseClosingService.get_pending_closing())
+        self.assertEqual(ExerciseClosing.objects.count(), 1)
+        self.assertEqual(Exercise.objects.filter(end_date__isnull=True).count(), 1)
+
+    def test_pending_closing_of_another_exercise_is_not_resumed(self):
+        with mock.patch.object(ExerciseClosingService, 'compute_opening', side_effect=RuntimeError('coupure')):
+            with self.assertRaises(RuntimeError):
+                ExerciseClosingService.close_and_open(self.exercise)
+        other = Exercise.objects.create(start_date=timezone.now())
+
+        with self.assertRaisesMessage(ValueError, 'déjà en cours'):
+            ExerciseClosingService.close_and_open(other)
+
+        self.assertIsNotNone(ExerciseClosingService.get_pending_closing())
+        self.assertIsNone(Exercise.objects.get(pk=other.pk).end_date)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BankReconciliationMatcherTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-bank',
+            email='admin-bank@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        self.exercise = ExerciseService.get_or_create_current_exercise()
+        self.bank = Account.objects.get(code='521')
+        self.other = Account.objects.get(code='411')
+        self.day = date(2026, 3, 10)
+
+    def _entry(self, amount, day, reference, debit=True, description='Virement client'):
+        entry = JournalEntry.objects.create(
+            reference=reference, date=day, description=description, exercise=self.exercise,
+        )
+        bank_line = JournalEntryLine(
+            entry=entry, account=self.bank, description=description,
+            debit=Decimal(amount) if debit else Decimal('0'),
+            credit=Decimal('0') if debit else Decimal(amount),
+        )
+        JournalEntryLine.objects.bulk_create([
+            bank_line,
+            JournalEntryLine(
+                entry=entry, account=self.other,
+                debit=bank_line.credit, credit=bank_line.debit,
+            ),
+        ])
+        return JournalEntryLine.objects.get(entry=entry, account=self.bank)
+
+    def _statement(self, amount, day, reference='', statement_type='CREDIT', description='VIR RECU'):
+        return BankStatement.objects.create(
+            account=self.bank, statement_date=day, description=description,
+            amount=Decimal(amount), statement_type=statement_type, reference=reference,
+        )
+
+    def test_matches_exact_amount_within_window_and_prefers_reference(self):
+        near = self._entry('5000', self.day, 'BQ-1')
+        referenced = self._entry('5000', self.day + timedelta(days=3), 'BQ-2', description='Virement VIR-778')
+        self._entry('5000', self.day + timedelta(days=30), 'BQ-3')
+        outgoing = self._entry('1200', self.day, 'BQ-4', debit=False, description='Frais tenue de compte')
+        stmt_ref = self._statement('5000', self.day, reference='VIR-778')
+        stmt_plain = self._statement('5000', self.day + timedelta(days=1))
+        stmt_fee = self._statement('1200', self.day, statement_type='DEBIT', description='FRAIS TENUE COMPTE')
+        self._statement('999', self.day)
+
+        matches = BankReconciliationService.find_matches(self.bank, min_confidence=0)
+        pairs = {m['statement_id']: m['entry_line_id'] for m in matches}
+
+        self.assertEqual(pairs[stmt_ref.id], referenced.id)
+        self.assertEqual(pairs[stmt_plain.id], near.id)
+        self.assertEqual(pairs[stmt_fee.id], outgoing.id)
+        self.assertEqual(len(matches), 3)
+        confidence = {m['statement_id']: m['confidence'] for m in matches}
+        self.assertGreater(confidence[stmt_ref.id], confidence[stmt_plain.id])
+
+    def test_auto_reconcile_applies_and_undo_restores(self):
+        line = self._entry('7500', self.day, 'BQ-10', description='Virement VIR-55')
+        stmt = self._statement('7500', self.day, reference='VIR-55')
+        manual_line = self._entry('300', self.day, 'BQ-11')
+        manual = self._statement('300', self.day)
+
+        result = BankReconciliationService.auto_reconcile('521', user=self.user, min_confidence=90)
+        run = result['run']
+        self.assertEqual(run.matched_count, 1)
+        stmt.refresh_from_db()
+        self.assertTrue(stmt.is_reconciled)
+        self.assertEqual(stmt.reconciled_entry_id, line.id)
+        self.assertFalse(BankStatement.objects.get(pk=manual.pk).is_reconciled)
+
+        # Une ligne déjà rapprochée n'est plus proposée
+        AccountingService.reconcile_statement(manual.id, manual_line.id, user=self.user)
+        self.assertEqual(BankReconciliationService.find_matches(self.bank, min_confidence=0), [])
+
+        self.assertEqual(BankReconciliationService.undo_run(run.id, user=self.user), 1)
+        stmt.refresh_from_db()
+        self.assertFalse(stmt.is_reconciled)
+        self.assertIsNone(stmt.reconciled_entry_id)
+        self.assertTrue(BankStatement.objects.get(pk=manual.pk).is_reconciled)
+        with self.assertRaises(ValueError):
+            BankReconciliationService.undo_run(run.id)
+
+    def test_undo_keeps_statements_reconciled_again_by_hand(self):
+        line = self._entry('800', self.day, 'BQ-20')
+        other_line = self._entry('800', self.day, 'BQ-21')
+        stmt = self._statement('800', self.day)
+        run = BankReconciliationService.auto_reconcile('521', min_confidence=0)['run']
+        stmt.refresh_from_db()
+        rematched = other_line if stmt.reconciled_entry_id == line.id else line
+        AccountingService.reconcile_statement(stmt.id, rematched.id)
+
+        self.assertEqual(BankReconciliationService.undo_run(run.id), 0)
+        stmt.refresh_from_db()
+        self.assertEqual(stmt.reconciled_entry_id, rematched.id)
+
+    def test_apply_skips_pairs_reconciled_since_matching(self):
+        line_a = self._entry('900', self.day, 'BQ-30', description='Virement VIR-30')
+        line_b = self._entry('950', self.day, 'BQ-31', description='Virement VIR-31')
+        stmt_a = self._statement('900', self.day, reference='VIR-30')
+        stmt_b = self._statement('950', self.day, reference='VIR-31')
+        line_c = self._entry('990', self.day, 'BQ-32', description='Virement VIR-32')
+        stmt_c = self._statement('990', self.day, reference='VIR-32')
+        manual = self._statement('950', self.day)
+        matches = BankReconciliationService.find_matches(self.bank, min_confidence=90)
+        self.assertEqual(len(matches), 3)
+
+        # Rapprochements manuels entre l'appariement et son application
+        AccountingService.reconcile_statement(stmt_a.id, line_b.id)
+        AccountingService.reconcile_statement(manual.id, line_a.id)
+        run = BankReconciliationService.apply_matches(self.bank, matches)
+
+        stmt_a.refresh_from_db()
+        stmt_b.refresh_from_db()
+        stmt_c.refresh_from_db()
+        self.assertEqual(run.matched_count, 1)
+        self.assertEqual(run.matches.get().statement_id, stmt_c.id)
+        self.assertEqual(stmt_a.reconciled_entry_id, line_b.id)
+        self.assertFalse(stmt_b.is_reconciled)
+        self.assertEqual(stmt_c.reconciled_entry_id, line_c.id)
+
+    def test_matching_uses_constant_queries(self):
+        for i in range(40):
+            day = self.day + timedelta(days=i % 20)
+            self._entry(str(1000 + i), day, f'BQ-{100 + i}')
+            self._statement(str(1000 + i), day, reference=f'BQ-{100 + i}')
+        with self.assertNumQueries(2):
+            matches = BankReconciliationService.find_matches(self.bank)
+        self.assertEqual(len(matches), 40)
+
+    def test_views_run_and_undo(self):
+        self._entry('4200', self.day, 'BQ-30', description='Virement VIR-9')
+        stmt = self._statement('4200', self.day, reference='VIR-9')
+
+        response = self.client.post(reverse('bank_auto_reconcile'), {'account': '521'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(BankStatement.objects.get(pk=stmt.pk).is_reconciled)
+
+        page = self.client.get(reverse('bank_reconciliation'))
+        self.assertContains(page, 'Rapprochements automatiques')
+
+        run = BankReconciliationRun.objects.get()
+        response = self.client.post(reverse('bank_reconciliation_undo', args=[run.id]), {'account': '521'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(BankStatement.objects.get(pk=stmt.pk).is_reconciled)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BankStatementImportTests(TestCase):
+    CSV = (
+        "Date;Libellé;Référence;Débit;Crédit\n"
+        "10/03/2026;VIR RECU CLIENT A;VIR-1;;150 000,00\n"
+        "11/03/2026;FRAIS TENUE COMPTE;;2 500;\n"
+        "11/03/2026;FRAIS TENUE COMPTE;;2 500;\n"
+        "12/03/2026;LIGNE INVALIDE;;abc;\n"
+    )
+    OFX = (
+        "OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n"
+        "<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20260310\n<TRNAMT>150000.00\n<FITID>VIR-1\n<NAME>VIR RECU CLIENT A\n</STMTTRN>\n"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260313120000<TRNAMT>-8000<FITID>CHQ-44<NAME>CHEQUE 44</STMTTRN>\n"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+    )
+
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-import',
+            email='admin-import@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        self.bank = Account.objects.get(code='521')
+
+    def _import(self, content, name='releve.csv', **kwargs):
+        return BankStatementImportService.import_file('521', BytesIO(content.encode()), name, **kwargs)
+
+    def test_csv_import_keeps_identical_lines_and_skips_reimport(self):
+        result = self._import(self.CSV)
+        self.assertEqual(result['imported'], 3)
+        self.assertEqual(result['error_count'], 1)
+        self.assertIn('Ligne 5', result['errors'][0])
+        fees = BankStatement.objects.filter(reference='', statement_type='DEBIT')
+        self.assertEqual(fees.count(), 2)
+        self.assertEqual(fees.first().amount, Decimal('2500'))
+        credit = BankStatement.objects.get(reference='VIR-1')
+        self.assertEqual((credit.statement_type, credit.amount), ('CREDIT', Decimal('150000')))
+
+        again = self._import(self.CSV)
+        self.assertEqual((again['imported'], again['duplicates']), (0, 3))
+        self.assertEqual(BankStatement.objects.count(), 3)
+
+    def test_overlapping_ofx_only_adds_new_operations(self):
+        self._import(self.CSV)
+        result = self._import(self.OFX, name='releve.ofx')
+        self.assertEqual((result['imported'], result['duplicates']), (1, 1))
+        cheque = BankStatement.objects.get(reference='CHQ-44')
+        self.assertEqual(cheque.statement_date, date(2026, 3, 13))
+        self.assertEqual((cheque.statement_type, cheque.amount), ('DEBIT', Decimal('8000')))
+
+    def test_chunked_inserts_check_duplicates_per_chunk(self):
+        rows = ''.join(f"2026-03-{1 + i // 2:02d};OP {i};REF-{i};{100 + i}\n" for i in range(25))
+        content = "date;libelle;reference;montant\n" + rows
+        with CaptureQueriesContext(connection) as ctx:
+            result = self._import(content, chunk_size=10)
+        self.assertEqual(result['imported'], 25)
+        selects = [q for q in ctx.captured_queries if 'content_hash' in q['sql'] and q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 3)
+
+    def test_ranks_are_kept_per_date_and_ungrouped_dates_are_rejected(self):
+        descending = (
+            "date;libelle;reference;montant\n"
+            "2026-03-12;FRAIS;;-500\n2026-03-12;FRAIS;;-500\n"
+            "2026-03-11;FRAIS;;-500\n2026-03-11;FRAIS;;-500\n"
+        )
+        self.assertEqual(self._import(descending)['imported'], 4)
+
+        ungrouped = "date;libelle;reference;montant\n2026-03-10;A;;1\n2026-03-11;B;;2\n2026-03-10;C;;3\n"
+        with self.assertRaisesMessage(ValueError, 'trié par date'):
+            self._import(ungrouped)
+
+    def test_unknown_header_and_format_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self._import("foo;bar\n1;2\n")
+        with self.assertRaises(ValueError):
+            self._import(self.CSV, name='releve.pdf')
+
+    def test_legacy_rows_get_hash_and_list_import_dedups(self):
+        lines = [{'date': date(2026, 3, 10), 'description': 'VIR', 'amount': '150000',
+                  'type': 'CREDIT', 'reference': 'VIR-1'}]
+        self.assertEqual(AccountingService.import_bank_statements('521', lines), 1)
+        self.assertEqual(AccountingService.import_bank_statements('521', lines), 0)
+
+        BankStatement.objects.update(content_hash=None)
+        ensure_bank_statement_hashes(sender=None)
+        self.assertEqual(self._import(self.CSV)['duplicates'], 1)
+
+    def test_list_import_accepts_text_dates_in_any_order(self):
+        lines = [
+            {'date': '2026-01-02', 'description': 'VIR A', 'amount': '1000', 'type': 'CREDIT'},
+            {'date': '03/01/2026', 'description': 'FRAIS', 'amount': '500', 'type': 'DEBIT'},
+            {'date': date(2026, 1, 2), 'description': 'VIR A', 'amount': '1000', 'type': 'CREDIT'},
+        ]
+
+        self.assertEqual(AccountingService.import_bank_statements('521', lines), 3)
+        self.assertEqual(AccountingService.import_bank_statements('521', list(reversed(lines))), 0)
+        self.assertEqual(
+            sorted(BankStatement.objects.values_list('statement_date', flat=True)),
+            [date(2026, 1, 2), date(2026, 1, 2), date(2026, 1, 3)],
+        )
+
+    def test_upload_view_and_command(self):
+        upload = SimpleUploadedFile('releve.csv', self.CSV.encode(), content_type='text/csv')
+        response = self.client.post(reverse('import_bank_statement'), {'account': '521', 'file': upload})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(BankStatement.objects.count(), 3)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.ofx', delete=False) as handle:
+            handle.write(self.OFX)
+        try:
+            out = StringIO()
+            call_command('import_bank_statement', handle.name, stdout=out)
+        finally:
+            os.unlink(handle.name)
+        self.assertIn('1 opération(s) importée(s)', out.getvalue())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AgedBalanceTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-aged',
+            email='admin-aged@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.customer = Client.objects.create(firstname='Paul', lastname='Biya', phone_number='690000001')
+        self.supplier = Supplier.objects.create(name='Grossiste Douala')
+        self.product = Product.objects.create(
+            code='AGED-1', name='Huile', brand='Blanco', stock=5,
+            actual_price=Decimal('1000'), max_salable_price=Decimal('1200'),
+        )
+        self.today = timezone.localdate()
+        ReportCacheService.clear()
+
+    def _backdate(self, obj, days):
+        created = timezone.now() - timedelta(days=days)
+        type(obj).objects.filter(pk=obj.pk).update(create_at=created)
+
+    def _credit_sale(self, remaining, days, paid=False):
+        sale = Sale.objects.create(
+            client=self.customer, staff=self.user, daily=self.daily,
+            total=Decimal(remaining), is_credit=True, is_paid=paid,
+        )
+        credit = CreditSale.objects.create(
+            sale=sale, amount_remaining=Decimal(remaining), is_fully_paid=paid,
+        )
+        self._backdate(sale, days)
+        self._backdate(credit, days)
+        return credit
+
+    def _credit_supply(self, remaining, days, credit_days=None):
+        supply = Supply.objects.create(
+            product=self.product, supplier=self.supplier, staff=self.user, daily=self.daily,
+            quantity=1, purchase_cost=Decimal(remaining), total_price=Decimal(remaining),
+            is_credit=True, is_paid=False,
+        )
+        credit = CreditSupply.objects.create(supply=supply, amount_remaining=Decimal(remaining))
+        self._backdate(supply, days)
+        self._backdate(credit, days if credit_days is None else credit_days)
+        return credit
+
+    def test_client_tranches_are_aggregated_in_one_query(self):
+        self._credit_sale('100', 0)
+        self._credit_sale('200', 30)
+        self._credit_sale('300', 31)
+        self._credit_sale('400', 75)
+        self._credit_sale('500', 120)
+        self._credit_sale('999', 10, paid=True)
+
+        with self.assertNumQueries(1):
+            summary = AgedBalanceService('client').summary()
+        self.assertEqual(summary['totals'], {
+            '0-30': Decimal('300'), '31-60': Decimal('300'),
+            '61-90': Decimal('400'), '90+': Decimal('500'),
+        })
+        self.assertEqual(summary['grand_total'], Decimal('1500'))
+        self.assertEqual(summary['count'], 5)
+
+    def test_detail_is_paged_oldest_first_with_sql_tranche(self):
+        for days in (5, 45, 100):
+            self._credit_sale('100', days)
+        data = AccountingService.get_aged_balance('client', per_page=2)
+        self.assertEqual([item['tranche'] for item in data['items']], ['90+', '31-60'])
+        self.assertEqual(data['items'][0]['age_days'], 100)
+        self.assertEqual(data['items'][0]['tiers'], 'Paul Biya')
+        self.assertTrue(data['page_obj'].has_next)
+
+        following = AccountingService.get_aged_balance(
+            'client', per_page=2, cursor=data['page_obj'].next_cursor,
+        )
+        self.assertEqual([item['age_days'] for item in following['items']], [5])
+        self.assertFalse(following['page_obj'].has_next)
+
+    def test_supplier_side_uses_open_credit_supplies(self):
+        self._credit_supply('7000', 40)
+        settled = self._credit_supply('3000', 5)
+        CreditSupply.objects.filter(pk=settled.pk).update(amount_remaining=0, is_fully_paid=True)
+
+        data = AccountingService.get_aged_balance('supplier')
+        self.assertEqual(data['balance_type'], 'supplier')
+        self.assertEqual(data['grand_total'], Decimal('7000'))
+        self.assertEqual(data['totals']['31-60'], Decimal('7000'))
+        self.assertEqual(len(data['items']), 1)
+        self.assertEqual(data['items'][0]['tiers'], 'Grossiste Douala')
+
+    def test_detail_is_ordered_by_document_date_not_credit_row(self):
+        # Dette ancienne dont le CreditSupply n'a été créé qu'au premier règlement, aujourd'hui
+        old_debt = self._credit_supply('7000', 100, credit_days=0)
+        recent_debt = self._credit_supply('3000', 10)
+
+        data = AccountingService.get_aged_balance('supplier', per_page=1)
+        self.assertEqual([item['age_days'] for item in data['items']], [100])
+        following = AccountingService.get_aged_balance(
+            'supplier', per_page=1, cursor=data['page_obj'].next_cursor,
+        )
+        self.assertEqual([item['age_days'] for item in following['items']], [10])
+        self.assertFalse(following['page_obj'].has_next)
+
+        exported = [item['reference'] for item in AgedBalanceService('supplier').iter_items()]
+        self.assertEqual(exported, [
+            f"Appro. #{old_debt.supply_id} — Huile", f"Appro. #{recent_debt.supply_id} — Huile",
+        ])
+
+    def test_page_and_csv_export(self):
+        self._credit_sale('2500', 3)
+        response = self.client.get(reverse('aged_balance'), {'type': 'client', 'cursor': 'invalide'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Vente #')
+
+        response = self.client.get(reverse('export_report_csv', args=['aged_balance']), {'type': 'client'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('2500', response.content.decode())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ProductMarginTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-margin',
+            email='admin-margin@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.soap = Product.objects.create(
+            code='MRG-001', name='Savon marge', stock=20,
+            actual_price=Decimal('1000'), max_salable_price=Decimal('1500'),
+            last_purchase_price=Decimal('600'), is_price_reducible=True,
+        )
+        self.oil = Product.objects.create(
+            code='MRG-002', name='Huile marge', stock=20,
+            actual_price=Decimal('2000'), max_salable_price=Decimal('2500'),
+            last_purchase_price=Decimal('1500'), is_price_reducible=True,
+        )
+        ReportCacheService.clear()
+
+    def _sell(self, *items):
+        return SaleService.create_sale(
+            {'items': [
+                {'product_id': product.id, 'quantity': quantity, 'unit_price': Decimal(price)}
+                for product, quantity, price in items
+            ]},
+            staff=self.user,
+        )
+
+    def test_report_uses_purchase_cost_recorded_at_sale_time(self):
+        self._sell((self.soap, 2, '1000'), (self.oil, 1, '2000'))
+        # Nouveau prix d'achat après la vente : sans effet sur la marge déjà réalisée
+        Product.objects.filter(pk=self.soap.pk).update(last_purchase_price=Decimal('900'))
+        self._sell((self.soap, 1, '1000'))
+
+        with self.assertNumQueries(1):
+            data = AccountingService.get_product_margins(self.exercise)
+        by_product = {item['product'].id: item for item in data['items']}
+        soap = by_product[self.soap.id]
+        self.assertEqual(soap['qty_sold'], 3)
+        self.assertEqual(soap['revenue'], Decimal('3000'))
+        self.assertEqual(soap['cost'], Decimal('2100'))
+        self.assertEqual(soap['purchase_price'], Decimal('700.00'))
+        self.assertEqual(data['total_ca'], Decimal('5000'))
+        self.assertEqual(data['total_margin'], Decimal('1400'))
+        self.assertEqual(data['items'][0]['product'].id, self.soap.id)
+
+    def test_returns_and_cancellations_are_subtracted(self):
+        sale = self._sell((self.soap, 3, '1000'), (self.oil, 2, '2000'))
+        line = sale.sale_products.get(product=self.soap)
+        SaleService.partial_return_sale(sale, [{'sale_product': line, 'quantity': 1}])
+        cancelled = self._sell((self.oil, 1, '2000'))
+        SaleService.cancel_sale(cancelled)
+
+        row = ProductDailyMargin.objects.get(product=self.soap)
+        self.assertEqual((row.quantity, row.revenue, row.cost), (2, Decimal('2000'), Decimal('1200')))
+        row = ProductDailyMargin.objects.get(product=self.oil)
+        self.assertEqual((row.quantity, row.revenue, row.cost), (2, Decimal('4000'), Decimal('3000')))
+
+        incremental = {(r.product_id, r.day): (r.quantity, r.revenue, r.cost) for r in ProductDailyMargin.objects.all()}
+        ProductMarginService.rebuild()
+        rebuilt = {(r.product_id, r.day): (r.quantity, r.revenue, r.cost) for r in ProductDailyMargin.objects.all()}
+        self.assertEqual(incremental, rebuilt)
+
+    def test_date_range_and_page(self):
+        self._sell((self.soap, 1, '1000'))
+        today = timezone.localdate()
+        ProductDailyMargin.objects.create(
+            product=self.oil, exercise=self.exercise, day=today - timedelta(days=40),
+            quantity=1, revenue=Decimal('2000'), cost=Decimal('1500'),
+        )
+        data = AccountingService.get_product_margins(self.exercise, date_from=today - timedelta(days=7))
+        self.assertEqual([item['product'].id for item in data['items']], [self.soap.id])
+
+        response = self.client.get(reverse('product_margins'), {'date_from': str(today - timedelta(days=7))})
+        self.assertContains(response, 'Savon marge')
+        self.assertNotContains(response, 'Huile marge')
+
+        out = StringIO()
+        call_command('rebuild_product_margins', stdout=out)
+        self.assertFalse(ProductDailyMargin.objects.filter(product=self.oil).exists())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class JournalIntegrityTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-integrity',
+            email='admin-integrity@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.product = Product.objects.create(
+            code='INT-001', name='Article contrôle', stock=20,
+            actual_price=Decimal('1000'), max_salable_price=Decimal('1500'),
+        )
+
+    def _sell(self):
+        sale = SaleService.create_sale(
+            {'items': [{'product_id': self.product.id, 'quantity': 1, 'unit_price': Decimal('1000')}]},
+            staff=self.user,
+        )
+        AccountingOutboxService.process_pending()
+        return sale
+
+    def _entry(self, reference, *amounts, **links):
+        entry = JournalEntry.objects.create(
+            reference=reference, date=timezone.localdate(), description=reference,
+            exercise=self.exercise, **links,
+        )
+        for code, debit, credit in amounts:
+            JournalEntryLine.objects.create(
+                entry=entry, account=AccountingCacheService.get_account(code),
+                debit=Decimal(debit), credit=Decimal(credit),
+            )
+        return entry
+
+    def test_cancelled_sale_and_balanced_entries_are_clean(self):
+        self._sell()
+        SaleService.cancel_sale(self._sell(), reason='Erreur caisse')
+        self._entry('OD-OK', ('571', '500', '0'), ('701', '0', '500'))
+
+        report = JournalIntegrityService(chunk_size=2).run()
+        self.assertTrue(report['is_clean'])
+        self.assertEqual(report['anomalies'], 0)
+
+    def test_grouped_checks_report_each_anomaly(self):
+        self._entry('OD-OK', ('571', '500', '0'), ('701', '0', '500'))
+        unbalanced = self._entry('OD-KO', ('571', '500', '0'), ('701', '0', '450'))
+        deleted = self._entry('OD-DEL', ('571', '300', '0'), ('701', '0', '300'))
+        deleted.delete_at = timezone.now()
+        deleted.save(update_fields=['delete_at'])
+        # Vente supprimée sans contrepassation de son écriture
+        sale = self._sell()
+        Sale.objects.filter(pk=sale.pk).update(delete_at=timezone.now())
+
+        service = JournalIntegrityService(exercise=self.exercise, chunk_size=2)
+        report = service.run()
+        checks = report['checks']
+        self.assertFalse(report['is_clean'])
+        self.assertEqual(checks['unbalanced_entries']['count'], 1)
+        item = checks['unbalanced_entries']['items'][0]
+        self.assertEqual((item['reference'], item['difference']), ('OD-KO', Decimal('50')))
+        self.assertEqual(item['entry_id'], unbalanced.id)
+        self.assertEqual(checks['orphan_lines']['items'][0]['line_count'], 2)
+        self.assertEqual(checks['deleted_sale_links']['count'], 2)
+        self.assertEqual({row['sale_id'] for row in checks['deleted_sale_links']['items']}, {sale.id})
+        self.assertEqual(checks['deleted_supply_links']['count'], 0)
+        self.assertEqual(report['anomalies'], 4)
+
+        truncated = JournalIntegrityService(max_items=1).run()['checks']['deleted_sale_links']
+        self.assertEqual((truncated['count'], len(truncated['items']), truncated['truncated']), (2, 1, True))
+
+    def test_query_count_does_not_grow_with_entries(self):
+        for index in range(5):
+            self._entry(f'OD-{index}', ('571', '100', '0'), ('701', '0', '90'))
+        with CaptureQueriesContext(connection) as small:
+            JournalIntegrityService().run()
+        for index in range(5, 40):
+            self._entry(f'OD-{index}', ('571', '100', '0'), ('701', '0', '90'))
+        with CaptureQueriesContext(connection) as large:
+            report = JournalIntegrityService().run()
+        self.assertEqual(report['checks']['unbalanced_entries']['count'], 40)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_command_and_page(self):
+        self._entry('OD-KO', ('571', '500', '0'), ('701', '0', '450'))
+        out = StringIO()
+        call_command('check_journal_integrity', stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(Decimal(report['checks']['unbalanced_entries']['items'][0]['difference']), Decimal('50'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'integrity.json')
+            with self.assertRaises(CommandError):
+                call_command('check_journal_integrity', output=path, strict=True, stdout=StringIO(), stderr=StringIO())
+            with open(path, encoding='utf-8') as handle:
+                self.assertEqual(json.load(handle)['anomalies'], 1)
+
+        response = self.client.get(reverse('journal_integrity'))
+        self.assertNotContains(response, 'OD-KO')
+        response = self.client.get(reverse('journal_integrity'), {'run': '1'})
+        self.assertContains(response, 'OD-KO')
+        response = self.client.get(reverse('journal_integrity'), {'format': 'json'})
+        self.assertEqual(response.json()['anomalies'], 1)
+        response = self.client.get(reverse('journal_integrity'), {'exercise': 'abc', 'run': '1'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_non_positive_chunk_size_is_rejected(self):
+        with self.assertRaises(ValueError):
+            JournalIntegrityService(chunk_size=-5)
+        with self.assertRaises(ValueError):
+            JournalIntegrityService(chunk_size=0)
+        with self.assertRaisesMessage(CommandError, '--chunk-size'):
+            call_command('check_journal_integrity', chunk_size=-5, stdout=StringIO(), stderr=StringIO())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class JournalTotalsTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-journal',
+            email='admin-journal@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        self.exercise = Exercise.objects.create(start_date=timezone.now())
+        JournalService.clear()
+
+    def _entry(self, reference, amount, journal='OD'):
+        entry = JournalEntry.objects.create(
+            reference=reference, date=timezone.localdate(), description=f"Écriture {reference}",
+            journal=journal, exercise=self.exercise,
+        )
+        JournalEntryLine.objects.bulk_create([
+            JournalEntryLine(entry=entry, account=AccountingCacheService.get_account('571'), debit=Decimal(amount)),
+            JournalEntryLine(entry=entry, account=AccountingCacheService.get_account('701'), credit=Decimal(amount)),
+        ])
+        return entry
+
+    def test_totals_cover_the_whole_filter_not_the_page(self):
+        for index in range(30):
+            self._entry(f'VE-{index:03d}', '100', journal='VE')
+        self._entry('OD-001', '5000')
+
+        response = self.client.get(reverse('accounting_journal'), {'journal': 'VE'})
+        self.assertEqual(len(response.context['entries']), 25)
+        self.assertEqual(response.context['total_debit'], Decimal('3000'))
+        self.assertEqual(response.context['total_credit'], Decimal('3000'))
+        self.assertEqual(response.context['total_count'], '30')
+        self.assertContains(response, 'VE-029')
+        self.assertEqual(len(response.context['entries'][0].journal_lines), 2)
+
+        next_page = response.context['page_obj'].next_querystring
+        response = self.client.get(reverse('accounting_journal') + '?' + next_page)
+        self.assertEqual(len(response.context['entries']), 5)
+        self.assertEqual(response.context['total_debit'], Decimal('3000'))
+
+        response = self.client.get(reverse('accounting_journal'), {'date_from': 'pas-une-date'})
+        self.assertEqual(response.context['total_debit'], Decimal('8000'))
+
+    def test_totals_are_cached_per_filter_and_journal_version(self):
+        self._entry('OD-001', '100')
+        self.assertEqual(JournalService.get_totals(journal='OD')['total_debit'], Decimal('100'))
+        # Seule la version du journal est relue
+        with self.assertNumQueries(1):
+            JournalService.get_totals(journal='OD')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._entry('OD-002', '250')
+        totals = JournalService.get_totals(journal='OD')
+        self.assertEqual((totals['count'], totals['total_debit']), (2, Decimal('350')))
+        self.assertEqual(JournalService.get_totals(journal='VE')['count'], 0)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class DailyFactTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-facts',
+            email='admin-facts@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.soap = Product.objects.create(
+            code='FCT-001', name='Savon faits', stock=20,
+            actual_price=Decimal('1000'), max_salable_price=Decimal('1500'),
+            last_purchase_price=Decimal('600'), is_price_reducible=True,
+        )
+        self.oil = Product.objects.create(
+            code='FCT-002', name='Huile faits', stock=20,
+            actual_price=Decimal('2000'), max_salable_price=Decimal('2500'),
+            last_purchase_price=Decimal('1500'), is_price_reducible=True,
+        )
+        self.buyer = Client.objects.create(firstname='Awa', lastname='Faits')
+        StatisticsKpiService.clear()
+
+    def _sell(self, *items, client=None):
+        return SaleService.create_sale(
+            {
+                'items': [
+                    {'product_id': product.id, 'quantity': quantity, 'unit_price': Decimal(price)}
+                    for product, quantity, price in items
+                ],
+                'client_id': client.id if client else None,
+            },
+            staff=self.user,
+        )
+
+    def _facts(self, kind, **dimensions):
+        return DailyFactService.facts(kind).filter(**dimensions).aggregate(
+            count=Sum('count'), quantity=Sum('quantity'), amount=Sum('amount'),
+        )
+
+    def test_sales_returns_and_cancellations_keep_facts_exact(self):
+        sale = self._sell((self.soap, 3, '1000'), (self.oil, 2, '2000'), client=self.buyer)
+        self._sell((self.soap, 1, '1000'))
+        line = sale.sale_products.get(product=self.soap)
+        SaleService.partial_return_sale(sale, [{'sale_product': line, 'quantity': 1}])
+        cancelled = self._sell((self.oil, 1, '2000'))
+        SaleService.cancel_sale(cancelled)
+
+        header = self._facts(DailyFact.KIND_SALE)
+        self.assertEqual((header['count'], header['amount']), (2, Decimal('7000')))
+        self.assertEqual(self._facts(DailyFact.KIND_SALE, client=self.buyer)['amount'], Decimal('6000'))
+        soap = self._facts(DailyFact.KIND_ITEM, product=self.soap)
+        self.assertEqual((soap['count'], soap['quantity'], soap['amount']), (2, 3, Decimal('3000')))
+        oil = self._facts(DailyFact.KIND_ITEM, product=self.oil)
+        self.assertEqual((oil['quantity'], oil['amount']), (2, Decimal('4000')))
+
+        # Tenue incrémentale égale au recalcul : seules les lignes vidées par l'annulation sont purgées
+        self.assertEqual(DailyFactService.reconcile(), 0)
+        self.assertFalse(DailyFact.objects.filter(count=0, quantity=0, amount=0).exists())
+
+    def test_item_facts_count_distinct_sales_per_product(self):
+        sale = self._sell((self.soap, 1, '1000'), (self.soap, 2, '1000'), (self.oil, 1, '2000'))
+        self._sell((self.soap, 1, '1000'))
+
+        self.assertEqual(self._facts(DailyFact.KIND_ITEM, product=self.soap)['count'], 2)
+        self.assertEqual(self._facts(DailyFact.KIND_ITEM, product=self.oil)['count'], 1)
+
+        # Retour de toute l'huile : la vente ne compte plus pour ce produit
+        oil_line = sale.sale_products.get(product=self.oil)
+        SaleService.partial_return_sale(sale, [{'sale_product': oil_line, 'quantity': 1}])
+        soap_line = sale.sale_products.filter(product=self.soap).first()
+        SaleService.partial_return_sale(sale, [{'sale_product': soap_line, 'quantity': soap_line.quantity}])
+
+        self.assertEqual(self._facts(DailyFact.KIND_ITEM, product=self.oil)['count'], 0)
+        self.assertEqual(self._facts(DailyFact.KIND_ITEM, product=self.soap)['count'], 2)
+        self.assertEqual(DailyFactService.reconcile(), 0)
+
+    def test_supplies_expenses_and_recipes_follow_writes(self):
+        supply = Supply.objects.create(
+            product=self.soap, staff=self.user, daily=self.daily, quantity=10,
+            purchase_cost=Decimal('600'), total_price=Decimal('6000'),
+        )
+        expense_type = ExpenseType.objects.create(name='Transport')
+        expense = DailyExpense.objects.create(
+            amount=Decimal('1500'), daily=self.daily, exercise=self.exercise,
+            expense_type=expense_type, staff=self.user,
+        )
+        DailyRecipe.objects.create(amount=Decimal('800'), daily=self.daily, exercise=self.exercise, staff=self.user)
+
+        supplies = self._facts(DailyFact.KIND_SUPPLY, product=self.soap)
+        self.assertEqual((supplies['count'], supplies['quantity'], supplies['amount']), (1, 10, Decimal('6000')))
+        self.assertEqual(self._facts(DailyFact.KIND_EXPENSE, expense_type=expense_type)['amount'], Decimal('1500'))
+        self.assertEqual(self._facts(DailyFact.KIND_RECIPE)['amount'], Decimal('800'))
+
+        # Annulation (suppression logique) : le jour est recalculé
+        expense.delete_at = timezone.now()
+        expense.save()
+        supply.quantity, supply.total_price = 4, Decimal('2400')
+        supply.save(update_fields=['quantity', 'total_price'])
+        self.assertFalse(DailyFact.objects.filter(kind=DailyFact.KIND_EXPENSE).exists())
+        supplies = self._facts(DailyFact.KIND_SUPPLY)
+        self.assertEqual((supplies['quantity'], supplies['amount']), (4, Decimal('2400')))
+
+    def test_reconcile_and_rebuild_repair_drift(self):
+        self._sell((self.soap, 2, '1000'))
+        DailyFact.objects.filter(kind=DailyFact.KIND_SALE).update(amount=Decimal('1'))
+        DailyFact.objects.filter(kind=DailyFact.KIND_ITEM).delete()
+
+        self.assertEqual(DailyFactService.reconcile_daily(self.daily), 2)
+        self.assertEqual(self._facts(DailyFact.KIND_SALE)['amount'], Decimal('2000'))
+        self.assertEqual(self._facts(DailyFact.KIND_ITEM)['quantity'], 2)
+
+        DailyFact.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_daily_facts', stdout=out)
+        self.assertIn('2 ligne(s)', out.getvalue())
+        self.assertEqual(self._facts(DailyFact.KIND_SALE)['amount'], Decimal('2000'))
+
+    def test_statistics_pages_read_facts(self):
+        self._sell((self.soap, 2, '1000'), client=self.buyer)
+        self._sell((self.oil, 1, '2000'))
+        SaleService.cancel_sale(self._sell((self.oil, 1, '2000')))
+
+        response = self.client.get(reverse('sales_statistics'))
+        self.assertEqual((response.context['sales_count'], response.context['total_revenue']), (2, Decimal('4000')))
+        self.assertEqual(response.context['products_sold_count'], 3)
+        self.assertEqual(response.context['anonymous_sales_count'], 1)
+        # Recherche libre : lecture des ventes, mêmes cumuls
+        response = self.client.get(reverse('sales_statistics'), {'search': 'Awa'})
+        self.assertEqual((response.context['sales_count'], response.context['total_revenue']), (1, Decimal('2000')))
+
+        response = self.client.get(reverse('product_statistics'))
+        self.assertEqual(response.context['total_units_sold'], 3)
+        self.assertEqual(response.context['top_products'][0]['product__name'], 'Savon faits')
+
+        response = self.client.get(reverse('statistics'))
+        self.assertEqual(response.context['sales_count'], 2)
+        self.assertEqual([product.name for product in response.context['top_products']], ['Savon faits', 'Huile faits'])
+
+        for name in ('client_statistics', 'supplier_statistics', 'supply_statistics', 'expense_statistics', 'personnel_statistics'):
+            for period in ('7d', '90d', '365d'):
+                response = self.client.get(reverse(name), {'period': period})
+                self.assertEqual(response.status_code, 200, name)
+        self.assertEqual(response.context['total_revenue'], Decimal('4000'))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class StatisticsKpiTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-kpi',
+            email='admin-kpi@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.soap = Product.objects.create(
+            code='KPI-001', name='Savon KPI', stock=20, stock_limit=5,
+            actual_price=Decimal('1000'), max_salable_price=Decimal('1500'),
+            last_purchase_price=Decimal('600'), is_price_reducible=True,
+        )
+        Product.objects.create(code='KPI-002', name='Huile KPI', stock=0, actual_price=Decimal('2000'))
+        StatisticsKpiService.clear()
+
+    def _sell(self, quantity, is_credit=False):
+        payload = {
+            'items': [{'product_id': self.soap.id, 'quantity': quantity, 'unit_price': Decimal('1000')}],
+            'is_credit': is_credit,
+        }
+        if is_credit:
+            payload['client_id'] = Client.objects.create(firstname='Kpi', lastname='Client').id
+            payload['due_date'] = timezone.localdate() + timedelta(days=30)
+        return SaleService.create_sale(payload, staff=self.user)
+
+    def test_kpis_use_conditional_aggregates(self):
+        cash_sale = self._sell(2)
+        self._sell(1, is_credit=True)
+        Invoice.objects.create(
+            sale=cash_sale, invoice_number='FAC-KPI-1', invoice_date=timezone.localdate(), status='PAID',
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            kpis = StatisticsKpiService.compute(self.daily)
+        self.assertLessEqual(len(ctx.captured_queries), 25)
+        self.assertEqual((kpis['sales_count'], kpis['total_revenue']), (2, Decimal('3000')))
+        self.assertEqual((kpis['paid_sales_count'], kpis['unpaid_sales_count'], kpis['credit_sales_count']), (1, 1, 1))
+        self.assertEqual((kpis['today_sales_count'], kpis['today_products_sold']), (2, 3))
+        self.assertEqual((kpis['total_products'], kpis['in_stock_count'], kpis['out_of_stock_count']), (2, 1, 1))
+        self.assertEqual((kpis['invoice_total'], kpis['paid_invoices_count']), (1, 1))
+        self.assertEqual([product.name for product in kpis['top_products']], ['Savon KPI'])
+
+    def test_cache_is_invalidated_by_sales_and_expires(self):
+        first = StatisticsKpiService.get_kpis(self.daily)
+        with self.assertNumQueries(1):
+            self.assertIs(StatisticsKpiService.get_kpis(self.daily), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._sell(2)
+        refreshed = StatisticsKpiService.get_kpis(self.daily)
+        self.assertEqual(refreshed['sales_count'], 1)
+
+        with override_settings(STATISTICS_CACHE_TTL_SECONDS=0):
+            StatisticsKpiService.clear()
+            StatisticsKpiService.get_kpis(self.daily)
+            self.assertIsNot(StatisticsKpiService.get_kpis(self.daily), refreshed)
+
+    def test_page_shows_generation_time(self):
+        response = self.client.get(reverse('statistics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'calcul :')
+        self.assertEqual(response.context['stock_out_rate'], 50.0)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class DailyCountersTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-counters',
+            email='admin-counters@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.soap = Product.objects.create(
+            code='CPT-001', name='Savon compteurs', stock=20,
+            actual_price=Decimal('1000'), max_salable_price=Decimal('1500'),
+            last_purchase_price=Decimal('600'), is_price_reducible=True,
+        )
+
+    def _sell(self, quantity):
+        return SaleService.create_sale(
+            {'items': [{'product_id': self.soap.id, 'quantity': quantity, 'unit_price': Decimal('1000')}]},
+            staff=self.user,
+        )
+
+    def _counters(self):
+        return DailyCounters.objects.get(daily=self.daily)
+
+    def test_sales_returns_and_cancellations_increment_counters(self):
+        self.assertEqual(self._counters().sales_count, 0)
+        sale = self._sell(3)
+        cancelled = self._sell(2)
+        SaleService.partial_return_sale(sale, [{'sale_product': sale.sale_products.get(), 'quantity': 1}])
+        SaleService.cancel_sale(cancelled)
+
+        counters = self._counters()
+        self.assertEqual(counters.revenue, Decimal('2000'))
+        self.assertEqual((counters.sales_count, counters.cancelled_sales_count, counters.products_sold), (1, 1, 2))
+        self.assertEqual(counters.first_sale_at, sale.create_at)
+
+    def test_cancelling_the_first_sale_moves_first_sale_at(self):
+        first = self._sell(1)
+        second = self._sell(1)
+        SaleService.cancel_sale(first)
+        self.assertEqual(self._counters().first_sale_at, second.create_at)
+        SaleService.cancel_sale(second)
+        self.assertIsNone(self._counters().first_sale_at)
+
+    def test_close_daily_freezes_reconciled_totals(self):
+        self._sell(2)
+        # Dérive (modification hors SaleService, ex. admin) : corrigée avant la clôture
+        DailyCounters.objects.filter(daily=self.daily).update(revenue=Decimal('1'))
+        response = self.client.post(
+            reverse('close_daily'), data=json.dumps({'cash_in_hand': 2000, 'cash_float': 0}),
+            content_type='application/json',
+        )
+        payload = response.json()
+        self.assertEqual(payload['counters_corrected'], 1)
+        inventory = DailyInventory.objects.get(pk=payload['daily_inventory_id'])
+        self.assertEqual(inventory.total_sales, Decimal('2000'))
+
+    def test_supplies_expenses_and_recipes_follow_writes(self):
+        supply = Supply.objects.create(
+            product=self.soap, staff=self.user, daily=self.daily, quantity=10,
+            purchase_cost=Decimal('600'), total_price=Decimal('6000'),
+        )
+        expense = DailyExpense.objects.create(
+            amount=Decimal('1500'), daily=self.daily, exercise=self.exercise, staff=self.user,
+        )
+        DailyRecipe.objects.create(amount=Decimal('800'), daily=self.daily, exercise=self.exercise, staff=self.user)
+        counters = self._counters()
+        self.assertEqual((counters.supplies_count, counters.supplies_total), (1, Decimal('6000')))
+        self.assertEqual((counters.expenses_total, counters.recipes_total), (Decimal('1500'), Decimal('800')))
+
+        expense.delete_at = timezone.now()
+        expense.save()
+        supply.total_price = Decimal('2400')
+        supply.save(update_fields=['total_price'])
+        counters = self._counters()
+        self.assertEqual((counters.expenses_total, counters.supplies_total), (Decimal('0'), Decimal('2400')))
+
+    def test_reconcile_repairs_drift_and_missing_rows(self):
+        self._sell(2)
+        DailyCounters.objects.filter(daily=self.daily).update(revenue=Decimal('1'), products_sold=99)
+        legacy = Daily.objects.create(start_date=timezone.now(), exercise=self.exercise)
+        DailyCounters.objects.filter(daily=legacy).delete()
+
+        out = StringIO()
+        call_command('reconcile_daily_counters', stdout=out)
+        self.assertIn('2 journée(s) corrigée(s)', out.getvalue())
+        counters = self._counters()
+        self.assertEqual((counters.revenue, counters.products_sold), (Decimal('2000'), 2))
+        self.assertTrue(DailyCounters.objects.filter(daily=legacy).exists())
+        self.assertEqual(DailyCountersService.reconcile(), 0)
+
+    def test_dashboard_and_summary_read_the_counters_row(self):
+        self._sell(2)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['total_revenue'], response.context['sales_count']), (Decimal('2000'), 1))
+        self.assertEqual(response.context['products_sold_count'], 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            payload = self.client.get(reverse('get_daily_summary')).json()
+        self.assertEqual(payload['total_sales'], 2000.0)
+        self.assertFalse(any('FROM "sale"' in query['sql'] for query in ctx.captured_queries))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        AppModule.init_default_modules()
+        self.user = get_user_model().objects.create_superuser(
+            username='admin-report-cache',
+            email='admin-report-cache@example.com',
+            password='password123',
+        )
+        self.client.force_login(self.user)
+        AccountingService.init_chart_of_accounts()
+        now = timezone.now()
+        self.exercise = Exercise.objects.create(start_date=now)
+        self.daily = Daily.objects.create(start_date=now, exercise=self.exercise)
+        self.soap = Product.objects.create(
+            code='RPC-001', name='Savon rapport', stock=20,
+            actual_price=Decimal('1000'), max_salable_price=Decimal('1500'),
+            last_purchase_price=Decimal('600'), is_price_reducible=True,
+        )
+        ReportCacheService.clear()
+
+    def _sell(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            return SaleService.create_sale(
+                {'items': [{'product_id': self.soap.id, 'quantity': quantity, 'unit_price': Decimal('1000')}]},
+                staff=self.user,
+            )
+
+    def test_key_covers_report_exercise_filters_and_versions(self):
+        key = ReportCacheService.make_key('product_margins', self.exercise, date_from=date(2026, 1, 1))
+        self.assertEqual(key, ReportCacheService.make_key('product_margins', self.exercise, date_from=date(2026, 1, 1)))
+        self.assertNotEqual(key, ReportCacheService.make_key('product_margins', self.exercise))
+        self.assertNotEqual(key, ReportCacheService.make_key('income_statement', self.exercise, date_from=date(2026, 1, 1)))
+        DataVersion.bump('sales')
+        self.assertNotEqual(key, ReportCacheService.make_key('product_margins', self.exercise, date_from=date(2026, 1, 1)))
+
+    def test_page_and_csv_share_the_cache_until_a_sale_bumps_the_version(self):
+        self._sell(2)
+        response = self.client.get(reverse('product_margins'))
+        self.assertContains(response, 'Savon rapport')
+        response = self.client.get(reverse('export_report_csv', args=['product_margins']))
+        self.assertIn('2000', response.content.decode('utf-8'))
+        self.assertEqual(ReportCacheService.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 50.0})
+
+        self._sell(1)
+        data = ReportCacheService.get_report('product_margins', self.exercise)
+        self.assertEqual(data['total_ca'], Decimal('3000'))
+        self.assertEqual(ReportCacheService.stats()['misses'], 2)
+
+    def test_journal_writes_invalidate_accounting_reports(self):
+        first = ReportCacheService.get_report('income_statement', self.exercise)
+        with self.assertNumQueries(1):
+            ReportCacheService.get_report('income_statement', self.exercise)
+        self._sell(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            AccountingOutboxService.process_pending()
+        refreshed = ReportCacheService.get_report('income_statement', self.exercise)
+        self.assertNotEqual(refreshed['total_produits'], first['total_produits'])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'reports': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.mkdtemp()},
+    })
+    def test_file_backend_and_stats_command(self):
+        ReportCacheService.clear()
+        ReportCacheService.get_report('aged_balance', balance_type='client', today=timezone.localdate())
+        ReportCacheService.get_report('aged_balance', balance_type='client', today=timezone.localdate())
+        out = StringIO()
+        call_command('report_cache_stats', '--clear', stdout=out)
+        self.assertIn('1 succès, 1 échec(s), taux de succès 50.0 %', out.getvalue())
+        self.assertEqual(ReportCacheService.stats()['hits'], 0)
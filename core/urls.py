@@ -49,6 +49,7 @@ urlpatterns = [
     path('accounting/journal/', views.accounting_journal, name='accounting_journal'),
     path('accounting/journal/add/', views.accounting_add_entry, name='accounting_add_entry'),
     path('accounting/ledger/', views.accounting_general_ledger, name='accounting_ledger'),
+    path('accounting/ledger/export/', views.export_general_ledger, name='export_general_ledger'),
     path('accounting/balance/', views.accounting_trial_balance, name='accounting_balance'),
     path('accounting/chart/', views.accounting_chart_of_accounts, name='accounting_chart'),
     path('accounting/chart/export/', views.export_chart_of_accounts, name='export_chart_of_accounts'),
@@ -76,6 +77,12 @@ urlpatterns = [
     path('accounting/bank-reconciliation/', views.bank_reconciliation, name='bank_reconciliation'),
     path('accounting/reconcile/', views.reconcile_entry, name='reconcile_entry'),
     path('accounting/unreconcile/', views.unreconcile_entry, name='unreconcile_entry'),
+    path('accounting/bank-reconciliation/import/', views.import_bank_statement, name='import_bank_statement'),
+    path('accounting/bank-reconciliation/auto/', views.bank_auto_reconcile, name='bank_auto_reconcile'),
+    path('accounting/bank-reconciliation/undo/<int:run_id>/', views.bank_reconciliation_undo, name='bank_reconciliation_undo'),
     path('accounting/exercise-closing/', views.exercise_closing_view, name='exercise_closing'),
     path('accounting/exercise-closing/close/', views.close_exercise_action, name='close_exercise_action'),
+    path('accounting/exercise-closing/preview/', views.close_exercise_preview, name='close_exercise_preview'),
+    path('accounting/outbox/status/', views.accounting_outbox_status, name='accounting_outbox_status'),
+    path('accounting/integrity/', views.journal_integrity, name='journal_integrity'),
 ]
@@ -11,13 +11,15 @@ from django.db import transaction
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
-from core.models.sale_models import Sale, SaleProduct, CreditSale
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+from core.models.sale_models import Sale, SaleProduct, CreditSale, DailyFact
 from core.models.user_models import Client, Supplier, CustomUser
 from core.models.accounting_models import (
-    Daily, DailyExpense, DailyRecipe, ExpenseType, Exercise,
+    Daily, DailyCounters, DailyExpense, DailyRecipe, ExpenseType, Exercise,
     Account, Payment, RecipeType, SupplierPayment, Invoice,
-    TaxRate, BankStatement, ExerciseClosing, PAYMENT_METHOD_CHOICES,
+    TaxRate, BankStatement, BankReconciliationRun, ExerciseClosing, PAYMENT_METHOD_CHOICES,
 )
 from core.models.product_models import Product, Category, Gamme, Rayon
 from core.models.inventory_models import Supply, Inventory, InventorySnapshot, DailyInventory, CreditSupply, PaymentSchedule
@@ -29,9 +31,25 @@ from core.forms import (
     SupplyCancellationForm, SupplyPartialReturnForm,
 )
 from core.services.excercise_service import ExerciseService
+from core.services.account_balance_service import AccountBalanceService
+from core.services.accounting_cache_service import AccountingCacheService
+from core.services.general_ledger_service import GeneralLedgerService
 from core.services.accounting_service import AccountingService
+from core.services.aged_balance_service import AgedBalanceService
+from core.services.bank_reconciliation_service import BankReconciliationService
+from core.services.bank_statement_import_service import BankStatementImportService
+from core.services.accounting_outbox_service import AccountingOutboxService
+from core.services.daily_counters_service import DailyCountersService
+from core.services.daily_fact_service import DailyFactService
+from core.services.exercise_closing_service import ExerciseClosingService
+from core.services.journal_integrity_service import JournalIntegrityService
+from core.services.journal_service import JournalService
+from core.services.product_search_service import ProductSearchService
+from core.services.report_cache_service import ReportCacheService
 from core.services.sale_service import SaleService
+from core.services.statistics_kpi_service import StatisticsKpiService
 from core.services.supply_service import SupplyService
+from core.pagination import paginate_request
 from core.decorators import module_required
 
 
@@ -76,32 +94,14 @@ def dashboard(request):
     current_daily = DailyService.get_or_create_active_daily()
     settings_obj = SystemSettings.get_settings()
 
-    # ── Ventes du jour ───────────────────────────────────────────
-    today_sales = Sale.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    )
-    total_revenue = today_sales.aggregate(total=Sum('total'))['total'] or 0
-    sales_count = today_sales.count()
-
-    # Ventes annulées du jour
-    cancelled_sales_count = Sale.objects.filter(
-        daily=current_daily, delete_at__isnull=False
-    ).count()
-
-    # Produits vendus (somme des quantités)
-    products_sold_count = SaleProduct.objects.filter(
-        sale__daily=current_daily, sale__delete_at__isnull=True, delete_at__isnull=True
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-
-    # ── Dépenses du jour ─────────────────────────────────────────
-    total_expenses = DailyExpense.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('amount'))['total'] or 0
-
-    # ── Recettes additionnelles du jour ──────────────────────────
-    total_recipes = DailyRecipe.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # ── Compteurs de la journée (une seule ligne, voir DailyCountersService) ──
+    counters = DailyCountersService.get_counters(current_daily)
+    total_revenue = counters.revenue
+    sales_count = counters.sales_count
+    cancelled_sales_count = counters.cancelled_sales_count
+    products_sold_count = counters.products_sold
+    total_expenses = counters.expenses_total
+    total_recipes = counters.recipes_total
 
     # Solde net = ventes + recettes - dépenses
     net_balance = float(total_revenue) + float(total_recipes) - float(total_expenses)
@@ -116,29 +116,21 @@ def dashboard(request):
     expected_cash = previous_cash_float + float(total_revenue) + float(total_recipes) - float(total_expenses)
 
     # ── Fréquence clients / heure ────────────────────────────────
-    if sales_count > 0:
-        first_sale = today_sales.order_by('create_at').first()
-        now = timezone.now()
-        if first_sale:
-            elapsed = (now - first_sale.create_at).total_seconds() / 3600
-            frequency = round(sales_count / elapsed, 1) if elapsed > 0 else sales_count
-        else:
-            frequency = 0
+    if sales_count > 0 and counters.first_sale_at:
+        elapsed = (timezone.now() - counters.first_sale_at).total_seconds() / 3600
+        frequency = round(sales_count / elapsed, 1) if elapsed > 0 else sales_count
     else:
         frequency = 0
 
     # ── Comparaison avec la veille ───────────────────────────────
     previous_daily = Daily.objects.filter(
         end_date__isnull=False, delete_at__isnull=True
-    ).order_by('-end_date').first()
+    ).select_related('counters').order_by('-end_date').first()
 
     if previous_daily:
-        yesterday_revenue = Sale.objects.filter(
-            daily=previous_daily, delete_at__isnull=True
-        ).aggregate(total=Sum('total'))['total'] or 0
-        yesterday_sales_count = Sale.objects.filter(
-            daily=previous_daily, delete_at__isnull=True
-        ).count()
+        previous_counters = DailyCountersService.get_counters(previous_daily)
+        yesterday_revenue = previous_counters.revenue
+        yesterday_sales_count = previous_counters.sales_count
     else:
         yesterday_revenue = 0
         yesterday_sales_count = 0
@@ -167,15 +159,13 @@ def dashboard(request):
     ).exclude(stock_limit__isnull=True).count()
 
     # ── Approvisionnements du jour ───────────────────────────────
-    today_supplies_count = Supply.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).count()
-    today_supplies_total = Supply.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('total_price'))['total'] or 0
+    today_supplies_count = counters.supplies_count
+    today_supplies_total = counters.supplies_total
 
     # ── Dernières ventes ─────────────────────────────────────────
-    recent_sales = today_sales.select_related('client', 'staff').order_by('-create_at')[:8]
+    recent_sales = Sale.objects.filter(
+        daily=current_daily, delete_at__isnull=True
+    ).select_related('client', 'staff').order_by('-create_at')[:8]
 
     # ── Total produits ───────────────────────────────────────────
     total_products = Product.objects.filter(delete_at__isnull=True).count()
@@ -225,184 +215,26 @@ def statistics(request):
 
     settings_obj = SystemSettings.get_settings()
     current_daily = DailyService.get_or_create_active_daily()
-    today = timezone.localdate()
-
-    sales_queryset = Sale.objects.filter(delete_at__isnull=True)
-    sale_products_queryset = SaleProduct.objects.filter(
-        delete_at__isnull=True,
-        sale__delete_at__isnull=True,
-    )
-    products_queryset = Product.objects.filter(delete_at__isnull=True)
-    supplies_queryset = Supply.objects.filter(delete_at__isnull=True)
-    expenses_queryset = DailyExpense.objects.filter(delete_at__isnull=True)
-    recipes_queryset = DailyRecipe.objects.filter(delete_at__isnull=True)
-    credit_sales_queryset = CreditSale.objects.filter(delete_at__isnull=True, sale__delete_at__isnull=True)
-    credit_supplies_queryset = CreditSupply.objects.filter(delete_at__isnull=True, supply__delete_at__isnull=True)
-    invoices_queryset = Invoice.objects.filter(delete_at__isnull=True)
-    payments_queryset = Payment.objects.filter(delete_at__isnull=True)
-    supplier_payments_queryset = SupplierPayment.objects.filter(delete_at__isnull=True)
-    inventories_queryset = Inventory.objects.filter(delete_at__isnull=True)
-    overdue_schedules = PaymentSchedule.objects.filter(
-        delete_at__isnull=True,
-        due_date__lt=today,
-    ).exclude(status='PAID').select_related(
-        'credit_sale__sale__client',
-        'credit_supply__supply__supplier',
-    ).order_by('due_date')[:6]
-
-    today_sales = sales_queryset.filter(daily=current_daily) if current_daily else Sale.objects.none()
-    today_supplies = supplies_queryset.filter(daily=current_daily) if current_daily else Supply.objects.none()
-    today_expenses_queryset = expenses_queryset.filter(daily=current_daily) if current_daily else DailyExpense.objects.none()
-    today_recipes_queryset = recipes_queryset.filter(daily=current_daily) if current_daily else DailyRecipe.objects.none()
-
-    total_revenue = sales_queryset.aggregate(total=Sum('total'))['total'] or 0
-    sales_count = sales_queryset.count()
-    products_sold_count = sale_products_queryset.aggregate(total=Sum('quantity'))['total'] or 0
-    average_ticket = (total_revenue / sales_count) if sales_count else 0
-    paid_sales_count = sales_queryset.filter(is_paid=True).count()
-    credit_sales_count = sales_queryset.filter(is_credit=True).count()
-    unpaid_sales_count = sales_queryset.filter(is_paid=False).count()
-
-    total_expenses = expenses_queryset.aggregate(total=Sum('amount'))['total'] or 0
-    total_recipes = recipes_queryset.aggregate(total=Sum('amount'))['total'] or 0
-    net_result = total_revenue + total_recipes - total_expenses
-
-    total_supplies = supplies_queryset.aggregate(total=Sum('total_price'))['total'] or 0
-    supplies_count = supplies_queryset.count()
-    receivables_total = credit_sales_queryset.aggregate(total=Sum('amount_remaining'))['total'] or 0
-    supplier_debt_total = credit_supplies_queryset.aggregate(total=Sum('amount_remaining'))['total'] or 0
-    payments_received_total = payments_queryset.aggregate(total=Sum('amount'))['total'] or 0
-    supplier_payments_total = supplier_payments_queryset.aggregate(total=Sum('amount'))['total'] or 0
-
-    total_products = products_queryset.count()
-    in_stock_count = products_queryset.filter(stock__gt=0).count()
-    out_of_stock_count = products_queryset.filter(stock=0).count()
-    low_stock_queryset = products_queryset.filter(stock__lte=F('stock_limit')).exclude(stock_limit__isnull=True)
-    low_stock_count = low_stock_queryset.filter(stock__gt=0).count()
-    stock_alert_count = low_stock_queryset.count()
-    total_stock_units = products_queryset.aggregate(total=Sum('stock'))['total'] or 0
-    categories_count = Category.objects.filter(delete_at__isnull=True).count()
-    gammes_count = Gamme.objects.filter(delete_at__isnull=True).count()
-    rayons_count = Rayon.objects.filter(delete_at__isnull=True).count()
-    products_with_category_count = products_queryset.filter(
-        category__isnull=False,
-        category__delete_at__isnull=True,
-    ).count()
-    products_with_gamme_count = products_queryset.filter(
-        gamme__isnull=False,
-        gamme__delete_at__isnull=True,
-    ).count()
-    products_with_rayon_count = products_queryset.filter(
-        rayon__isnull=False,
-        rayon__delete_at__isnull=True,
-    ).count()
-
-    clients_count = Client.objects.filter(delete_at__isnull=True).count()
-    staff_count = CustomUser.objects.filter(delete_at__isnull=True).count()
-    suppliers_count = Supplier.objects.filter(delete_at__isnull=True).count()
-    active_users_count = CustomUser.objects.filter(delete_at__isnull=True, is_active=True).count()
-    inactive_users_count = CustomUser.objects.filter(delete_at__isnull=True, is_active=False).count()
-    open_dailies_count = Daily.objects.filter(delete_at__isnull=True, end_date__isnull=True).count()
-    inventory_sessions_count = inventories_queryset.count()
-    valid_inventory_units = inventories_queryset.aggregate(total=Sum('valid_product_count'))['total'] or 0
-    invalid_inventory_units = inventories_queryset.aggregate(total=Sum('invalid_product_count'))['total'] or 0
-    inventory_snapshot_count = InventorySnapshot.objects.filter(delete_at__isnull=True).count()
-
-    today_revenue = today_sales.aggregate(total=Sum('total'))['total'] or 0
-    today_sales_count = today_sales.count()
-    today_products_sold = sale_products_queryset.filter(sale__daily=current_daily).aggregate(total=Sum('quantity'))['total'] or 0
-    today_expenses = today_expenses_queryset.aggregate(total=Sum('amount'))['total'] or 0
-    today_recipes = today_recipes_queryset.aggregate(total=Sum('amount'))['total'] or 0
-    today_supplies_count = today_supplies.count()
-    today_supplies_total = today_supplies.aggregate(total=Sum('total_price'))['total'] or 0
-    today_net = today_revenue + today_recipes - today_expenses
-
-    invoice_total = invoices_queryset.count()
-    paid_invoices_count = invoices_queryset.filter(status='PAID').count()
-    sent_invoices_count = invoices_queryset.filter(status='SENT').count()
-    draft_invoices_count = invoices_queryset.filter(status='DRAFT').count()
-    cancelled_invoices_count = invoices_queryset.filter(status='CANCELLED').count()
-
-    recent_sales = sales_queryset.select_related('client', 'staff').order_by('-create_at')[:6]
-    low_stock_products = low_stock_queryset.order_by('stock', 'name')[:6]
-    top_products = products_queryset.filter(
-        sale_products__delete_at__isnull=True,
-        sale_products__sale__delete_at__isnull=True,
-    ).annotate(
-        total_quantity=Sum('sale_products__quantity'),
-        sales_frequency=Count('sale_products__sale', distinct=True),
-    ).order_by('-total_quantity', 'name')[:6]
+    kpis = StatisticsKpiService.get_kpis(current_daily)
+    sales_count = kpis['sales_count']
+    total_products = kpis['total_products']
+    invoice_total = kpis['invoice_total']
 
     context = {
+        **kpis,
         'page_title': 'Statistiques',
         'currency': settings_obj.currency_symbol,
-        'generated_at': timezone.now(),
         'current_daily': current_daily,
-        'total_revenue': total_revenue,
-        'sales_count': sales_count,
-        'products_sold_count': products_sold_count,
-        'average_ticket': average_ticket,
-        'paid_sales_count': paid_sales_count,
-        'credit_sales_count': credit_sales_count,
-        'unpaid_sales_count': unpaid_sales_count,
-        'total_expenses': total_expenses,
-        'total_recipes': total_recipes,
-        'net_result': net_result,
-        'total_supplies': total_supplies,
-        'supplies_count': supplies_count,
-        'receivables_total': receivables_total,
-        'supplier_debt_total': supplier_debt_total,
-        'payments_received_total': payments_received_total,
-        'supplier_payments_total': supplier_payments_total,
-        'total_products': total_products,
-        'in_stock_count': in_stock_count,
-        'out_of_stock_count': out_of_stock_count,
-        'low_stock_count': low_stock_count,
-        'stock_alert_count': stock_alert_count,
-        'total_stock_units': total_stock_units,
-        'categories_count': categories_count,
-        'gammes_count': gammes_count,
-        'rayons_count': rayons_count,
-        'products_with_category_count': products_with_category_count,
-        'products_with_gamme_count': products_with_gamme_count,
-        'products_with_rayon_count': products_with_rayon_count,
-        'clients_count': clients_count,
-        'staff_count': staff_count,
-        'suppliers_count': suppliers_count,
-        'active_users_count': active_users_count,
-        'inactive_users_count': inactive_users_count,
-        'open_dailies_count': open_dailies_count,
-        'inventory_sessions_count': inventory_sessions_count,
-        'valid_inventory_units': valid_inventory_units,
-        'invalid_inventory_units': invalid_inventory_units,
-        'inventory_snapshot_count': inventory_snapshot_count,
-        'today_revenue': today_revenue,
-        'today_sales_count': today_sales_count,
-        'today_products_sold': today_products_sold,
-        'today_expenses': today_expenses,
-        'today_recipes': today_recipes,
-        'today_supplies_count': today_supplies_count,
-        'today_supplies_total': today_supplies_total,
-        'today_net': today_net,
-        'invoice_total': invoice_total,
-        'paid_invoices_count': paid_invoices_count,
-        'sent_invoices_count': sent_invoices_count,
-        'draft_invoices_count': draft_invoices_count,
-        'cancelled_invoices_count': cancelled_invoices_count,
-        'sales_paid_rate': to_percentage(paid_sales_count, sales_count),
-        'sales_credit_rate': to_percentage(credit_sales_count, sales_count),
-        'sales_unpaid_rate': to_percentage(unpaid_sales_count, sales_count),
-        'stock_available_rate': to_percentage(in_stock_count, total_products),
-        'stock_alert_rate': to_percentage(stock_alert_count, total_products),
-        'stock_out_rate': to_percentage(out_of_stock_count, total_products),
-        'invoice_paid_rate': to_percentage(paid_invoices_count, invoice_total),
-        'invoice_sent_rate': to_percentage(sent_invoices_count, invoice_total),
-        'invoice_draft_rate': to_percentage(draft_invoices_count, invoice_total),
-        'invoice_cancelled_rate': to_percentage(cancelled_invoices_count, invoice_total),
-        'recent_sales': recent_sales,
-        'low_stock_products': low_stock_products,
-        'top_products': top_products,
-        'overdue_schedules': overdue_schedules,
+        'sales_paid_rate': to_percentage(kpis['paid_sales_count'], sales_count),
+        'sales_credit_rate': to_percentage(kpis['credit_sales_count'], sales_count),
+        'sales_unpaid_rate': to_percentage(kpis['unpaid_sales_count'], sales_count),
+        'stock_available_rate': to_percentage(kpis['in_stock_count'], total_products),
+        'stock_alert_rate': to_percentage(kpis['stock_alert_count'], total_products),
+        'stock_out_rate': to_percentage(kpis['out_of_stock_count'], total_products),
+        'invoice_paid_rate': to_percentage(kpis['paid_invoices_count'], invoice_total),
+        'invoice_sent_rate': to_percentage(kpis['sent_invoices_count'], invoice_total),
+        'invoice_draft_rate': to_percentage(kpis['draft_invoices_count'], invoice_total),
+        'invoice_cancelled_rate': to_percentage(kpis['cancelled_invoices_count'], invoice_total),
     }
     return render(request, 'core/statistics.html', context)
 
@@ -422,20 +254,6 @@ def product_statistics(request):
             return f"Jusqu'au {end.strftime('%d/%m/%Y')}"
         return "Toutes les données disponibles"
 
-    def chart_bucket_for_range(start, end):
-        if not start and not end:
-            return TruncMonth('sale__create_at'), 'month'
-
-        effective_end = end or timezone.localdate()
-        effective_start = start or (effective_end - timedelta(days=180))
-        span_days = max((effective_end - effective_start).days + 1, 1)
-
-        if span_days <= 31:
-            return TruncDate('sale__create_at'), 'day'
-        if span_days <= 120:
-            return TruncWeek('sale__create_at'), 'week'
-        return TruncMonth('sale__create_at'), 'month'
-
     def format_bucket_label(bucket_value, bucket_kind):
         if hasattr(bucket_value, 'date'):
             bucket_date = timezone.localtime(bucket_value).date() if timezone.is_aware(bucket_value) else bucket_value.date()
@@ -494,9 +312,7 @@ def product_statistics(request):
     ).select_related('category', 'gamme', 'rayon')
 
     if search:
-        products_queryset = products_queryset.filter(
-            Q(name__icontains=search) | Q(code__icontains=search) | Q(brand__icontains=search)
-        )
+        products_queryset = ProductSearchService.filter_queryset(products_queryset, search)
     if category_id:
         products_queryset = products_queryset.filter(category_id=category_id)
     if gamme_id:
@@ -506,25 +322,13 @@ def product_statistics(request):
 
     product_ids = products_queryset.values('id')
 
-    sales_queryset = SaleProduct.objects.filter(
-        delete_at__isnull=True,
-        sale__delete_at__isnull=True,
+    # Ventes et approvisionnements lus dans la table de faits journaliers
+    sales_queryset = DailyFactService.facts(DailyFact.KIND_ITEM, range_start, range_end).filter(
         product_id__in=product_ids,
-    ).select_related('sale', 'product', 'product__category', 'product__gamme', 'product__rayon')
-
-    supplies_queryset = Supply.objects.filter(
-        delete_at__isnull=True,
+    )
+    supplies_queryset = DailyFactService.facts(DailyFact.KIND_SUPPLY, range_start, range_end).filter(
         product_id__in=product_ids,
-    ).select_related('product', 'supplier')
-
-    if range_start:
-        sales_queryset = sales_queryset.filter(sale__create_at__date__gte=range_start)
-        supplies_queryset = supplies_queryset.filter(create_at__date__gte=range_start)
-    if range_end:
-        sales_queryset = sales_queryset.filter(sale__create_at__date__lte=range_end)
-        supplies_queryset = supplies_queryset.filter(create_at__date__lte=range_end)
-
-    sales_queryset = sales_queryset.annotate(line_total=F('quantity') * F('unit_price'))
+    )
 
     total_products = products_queryset.count()
     total_stock_units = products_queryset.aggregate(total=Sum('stock'))['total'] or 0
@@ -532,13 +336,31 @@ def product_statistics(request):
         stock_value=F('stock') * F('actual_price')
     ).aggregate(total=Sum('stock_value'))['total'] or 0
 
-    total_revenue = sales_queryset.aggregate(total=Sum('line_total'))['total'] or 0
-    total_units_sold = sales_queryset.aggregate(total=Sum('quantity'))['total'] or 0
-    sales_count = sales_queryset.values('sale_id').distinct().count()
+    sales_totals = sales_queryset.aggregate(revenue=Sum('amount'), quantity=Sum('quantity'))
+    total_revenue = sales_totals['revenue'] or 0
+    total_units_sold = sales_totals['quantity'] or 0
+    if search or category_id or gamme_id or rayon_id:
+        # Nombre de ventes distinctes d'une sélection de produits : non additif
+        # entre produits, compté sur les lignes de vente
+        sale_lines = SaleProduct.objects.filter(
+            delete_at__isnull=True,
+            sale__delete_at__isnull=True,
+            product_id__in=product_ids,
+        )
+        if range_start:
+            sale_lines = sale_lines.filter(sale__create_at__date__gte=range_start)
+        if range_end:
+            sale_lines = sale_lines.filter(sale__create_at__date__lte=range_end)
+        sales_count = sale_lines.values('sale_id').distinct().count()
+    else:
+        sales_count = DailyFactService.facts(
+            DailyFact.KIND_SALE, range_start, range_end,
+        ).aggregate(total=Sum('count'))['total'] or 0
     average_sale_value = (total_revenue / sales_count) if sales_count else 0
 
-    total_supplied_units = supplies_queryset.aggregate(total=Sum('quantity'))['total'] or 0
-    total_supplies_amount = supplies_queryset.aggregate(total=Sum('total_price'))['total'] or 0
+    supplies_totals = supplies_queryset.aggregate(quantity=Sum('quantity'), amount=Sum('amount'))
+    total_supplied_units = supplies_totals['quantity'] or 0
+    total_supplies_amount = supplies_totals['amount'] or 0
 
     out_of_stock_count = products_queryset.filter(stock=0).count()
     low_stock_count = products_queryset.filter(
@@ -557,9 +379,9 @@ def product_statistics(request):
         'product__gamme__name',
     ).annotate(
         total_quantity=Sum('quantity'),
-        total_revenue=Sum('line_total'),
-        sales_frequency=Count('sale_id', distinct=True),
-    ).order_by('-total_revenue', '-total_quantity', 'product__name')[:8]
+        total_revenue=Sum('amount'),
+        sales_frequency=Sum('count'),
+    ).filter(total_quantity__gt=0).order_by('-total_revenue', '-total_quantity', 'product__name')[:8]
 
     low_stock_products = products_queryset.filter(
         Q(stock=0) | Q(stock__lte=F('stock_limit')),
@@ -567,11 +389,11 @@ def product_statistics(request):
         Q(stock__gt=0) & Q(stock_limit__isnull=True)
     ).order_by('stock', 'name')[:8]
 
-    chart_bucket, bucket_kind = chart_bucket_for_range(range_start, range_end)
+    chart_bucket, bucket_kind = DailyFactService.bucket(range_start, range_end)
     sales_trend_rows = sales_queryset.annotate(
         bucket=chart_bucket,
     ).values('bucket').annotate(
-        total_revenue=Sum('line_total'),
+        total_revenue=Sum('amount'),
         total_quantity=Sum('quantity'),
     ).order_by('bucket')
 
@@ -662,20 +484,6 @@ def sales_statistics(request):
             return f"Jusqu'au {end.strftime('%d/%m/%Y')}"
         return "Toutes les données disponibles"
 
-    def chart_bucket_for_range(start, end):
-        if not start and not end:
-            return TruncMonth('create_at'), 'month'
-
-        effective_end = end or timezone.localdate()
-        effective_start = start or (effective_end - timedelta(days=180))
-        span_days = max((effective_end - effective_start).days + 1, 1)
-
-        if span_days <= 31:
-            return TruncDate('create_at'), 'day'
-        if span_days <= 120:
-            return TruncWeek('create_at'), 'week'
-        return TruncMonth('create_at'), 'month'
-
     def format_bucket_label(bucket_value, bucket_kind):
         if hasattr(bucket_value, 'date'):
             bucket_date = timezone.localtime(bucket_value).date() if timezone.is_aware(bucket_value) else bucket_value.date()
@@ -764,36 +572,65 @@ def sales_statistics(request):
         sales_queryset = sales_queryset.filter(create_at__date__lte=range_end)
 
     sale_ids = sales_queryset.values('id')
-    sale_products_queryset = SaleProduct.objects.filter(
-        delete_at__isnull=True,
-        sale__delete_at__isnull=True,
-        sale_id__in=sale_ids,
-    )
     credit_sales_queryset = CreditSale.objects.filter(
         delete_at__isnull=True,
         sale__delete_at__isnull=True,
         sale_id__in=sale_ids,
     )
 
-    total_revenue = sales_queryset.aggregate(total=Sum('total'))['total'] or 0
-    sales_count = sales_queryset.count()
-    products_sold_count = sale_products_queryset.aggregate(total=Sum('quantity'))['total'] or 0
+    # Cumuls lus dans la table de faits ; la recherche libre et le statut de
+    # paiement ne sont pas des dimensions des faits : lecture des ventes alors
+    if search or payment_status:
+        facts_queryset = DailyFactService.as_facts(sales_queryset, DailyFact.KIND_SALE)
+        products_sold_count = SaleProduct.objects.filter(
+            delete_at__isnull=True,
+            sale__delete_at__isnull=True,
+            sale_id__in=sale_ids,
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+    else:
+        dimensions = {}
+        if client_id:
+            dimensions['client_id'] = client_id
+        if staff_id:
+            dimensions['staff_id'] = staff_id
+        if sale_type in ('cash', 'credit'):
+            dimensions['is_credit'] = sale_type == 'credit'
+        facts_queryset = DailyFactService.facts(DailyFact.KIND_SALE, range_start, range_end).filter(**dimensions)
+        products_sold_count = DailyFactService.facts(
+            DailyFact.KIND_ITEM, range_start, range_end,
+        ).filter(**dimensions).aggregate(total=Sum('quantity'))['total'] or 0
+
+    sales_totals = facts_queryset.aggregate(
+        revenue=Sum('amount'),
+        sales=Sum('count'),
+        credit_sales=Sum('count', filter=Q(is_credit=True)),
+        anonymous_sales=Sum('count', filter=Q(client__isnull=True)),
+    )
+    status_totals = sales_queryset.aggregate(
+        paid_sales=Count('id', filter=Q(is_paid=True)),
+        unpaid_sales=Count('id', filter=Q(is_paid=False)),
+        paid_revenue=Sum('total', filter=Q(is_paid=True)),
+        unpaid_revenue=Sum('total', filter=Q(is_paid=False)),
+    )
+
+    total_revenue = sales_totals['revenue'] or 0
+    sales_count = sales_totals['sales'] or 0
     average_ticket = (total_revenue / sales_count) if sales_count else 0
-    paid_sales_count = sales_queryset.filter(is_paid=True).count()
-    unpaid_sales_count = sales_queryset.filter(is_paid=False).count()
-    credit_sales_count = sales_queryset.filter(is_credit=True).count()
+    paid_sales_count = status_totals['paid_sales']
+    unpaid_sales_count = status_totals['unpaid_sales']
+    credit_sales_count = sales_totals['credit_sales'] or 0
     cash_sales_count = max(sales_count - credit_sales_count, 0)
-    paid_revenue = sales_queryset.filter(is_paid=True).aggregate(total=Sum('total'))['total'] or 0
-    unpaid_revenue = sales_queryset.filter(is_paid=False).aggregate(total=Sum('total'))['total'] or 0
+    paid_revenue = status_totals['paid_revenue'] or 0
+    unpaid_revenue = status_totals['unpaid_revenue'] or 0
     outstanding_total = credit_sales_queryset.aggregate(total=Sum('amount_remaining'))['total'] or 0
-    anonymous_sales_count = sales_queryset.filter(client__isnull=True).count()
+    anonymous_sales_count = sales_totals['anonymous_sales'] or 0
 
-    chart_bucket, bucket_kind = chart_bucket_for_range(range_start, range_end)
-    sales_trend_rows = sales_queryset.annotate(
+    chart_bucket, bucket_kind = DailyFactService.bucket(range_start, range_end)
+    sales_trend_rows = facts_queryset.annotate(
         bucket=chart_bucket,
     ).values('bucket').annotate(
-        total_revenue=Sum('total'),
-        total_sales=Count('id'),
+        total_revenue=Sum('amount'),
+        total_sales=Sum('count'),
     ).order_by('bucket')
     sales_trend_chart = {
         'labels': [format_bucket_label(row['bucket'], bucket_kind) for row in sales_trend_rows],
@@ -812,14 +649,14 @@ def sales_statistics(request):
     }
 
     staff_rows = list(
-        sales_queryset.values(
+        facts_queryset.values(
             'staff_id',
             'staff__firstname',
             'staff__lastname',
         ).annotate(
-            total_revenue=Sum('total'),
-            total_sales=Count('id'),
-        ).order_by('-total_revenue', '-total_sales')[:8]
+            total_revenue=Sum('amount'),
+            total_sales=Sum('count'),
+        ).filter(total_sales__gt=0).order_by('-total_revenue', '-total_sales')[:8]
     )
     staff_performance_chart = {
         'labels': [
@@ -831,14 +668,14 @@ def sales_statistics(request):
     }
 
     top_client_rows = list(
-        sales_queryset.values(
+        facts_queryset.values(
             'client_id',
             'client__firstname',
             'client__lastname',
         ).annotate(
-            total_revenue=Sum('total'),
-            total_sales=Count('id'),
-        ).order_by('-total_revenue', '-total_sales')[:8]
+            total_revenue=Sum('amount'),
+            total_sales=Sum('count'),
+        ).filter(total_sales__gt=0).order_by('-total_revenue', '-total_sales')[:8]
     )
     top_clients = [
         {
@@ -1006,10 +843,9 @@ def client_statistics(request):
     client_ids = list(clients_queryset.values_list('id', flat=True))
 
     if client_ids:
-        sales_queryset = Sale.objects.filter(
-            delete_at__isnull=True,
+        sales_queryset = DailyFactService.facts(DailyFact.KIND_SALE, range_start, range_end).filter(
             client_id__in=client_ids,
-        ).select_related('client', 'staff')
+        )
         credit_sales_queryset = CreditSale.objects.filter(
             delete_at__isnull=True,
             sale__delete_at__isnull=True,
@@ -1029,17 +865,15 @@ def client_statistics(request):
             credit_sale__sale__client_id__in=client_ids,
         ).select_related('credit_sale__sale__client')
     else:
-        sales_queryset = Sale.objects.none()
+        sales_queryset = DailyFact.objects.none()
         credit_sales_queryset = CreditSale.objects.none()
         payments_queryset = Payment.objects.none()
         schedules_queryset = PaymentSchedule.objects.none()
 
     if range_start:
-        sales_queryset = sales_queryset.filter(create_at__date__gte=range_start)
         payments_queryset = payments_queryset.filter(payment_date__gte=range_start)
         schedules_queryset = schedules_queryset.filter(due_date__gte=range_start)
     if range_end:
-        sales_queryset = sales_queryset.filter(create_at__date__lte=range_end)
         payments_queryset = payments_queryset.filter(payment_date__lte=range_end)
         schedules_queryset = schedules_queryset.filter(due_date__lte=range_end)
 
@@ -1051,13 +885,16 @@ def client_statistics(request):
 
     total_clients = clients_queryset.count()
     new_clients_count = clients_created_queryset.count()
-    clients_with_sales_count = sales_queryset.values('client_id').distinct().count()
+    clients_with_sales_count = sales_queryset.values('client_id').annotate(
+        total_sales=Sum('count'),
+    ).filter(total_sales__gt=0).count()
     inactive_clients_count = max(total_clients - clients_with_sales_count, 0)
     clients_with_phone_count = clients_queryset.exclude(phone_number__isnull=True).exclude(phone_number='').count()
     clients_with_email_count = clients_queryset.exclude(email__isnull=True).exclude(email='').count()
 
-    total_revenue = sales_queryset.aggregate(total=Sum('total'))['total'] or 0
-    sales_count = sales_queryset.count()
+    sales_totals = sales_queryset.aggregate(revenue=Sum('amount'), sales=Sum('count'))
+    total_revenue = sales_totals['revenue'] or 0
+    sales_count = sales_totals['sales'] or 0
     average_revenue_per_client = (total_revenue / clients_with_sales_count) if clients_with_sales_count else 0
     credit_sales_count = credit_sales_queryset.count()
     credit_clients_count = credit_sales_queryset.values('sale__client_id').distinct().count()
@@ -1074,10 +911,10 @@ def client_statistics(request):
         'values': [int(row['total_clients'] or 0) for row in new_clients_rows],
     }
 
-    sales_bucket, sales_bucket_kind = chart_bucket_for_range('create_at', range_start, range_end)
+    sales_bucket, sales_bucket_kind = DailyFactService.bucket(range_start, range_end)
     client_sales_rows = sales_queryset.annotate(bucket=sales_bucket).values('bucket').annotate(
-        total_revenue=Sum('total'),
-        total_sales=Count('id'),
+        total_revenue=Sum('amount'),
+        total_sales=Sum('count'),
     ).order_by('bucket')
     sales_trend_chart = {
         'labels': [format_bucket_label(row['bucket'], sales_bucket_kind) for row in client_sales_rows],
@@ -1095,9 +932,9 @@ def client_statistics(request):
 
     top_client_rows = list(
         sales_queryset.values('client_id', 'client__firstname', 'client__lastname').annotate(
-            total_revenue=Sum('total'),
-            total_sales=Count('id'),
-        ).order_by('-total_revenue', '-total_sales')[:8]
+            total_revenue=Sum('amount'),
+            total_sales=Sum('count'),
+        ).filter(total_sales__gt=0).order_by('-total_revenue', '-total_sales')[:8]
     )
     outstanding_rows = list(
         credit_sales_queryset.values('sale__client_id').annotate(
@@ -1108,8 +945,18 @@ def client_statistics(request):
     payment_rows = list(
         payments_queryset.values('credit_sale__sale__client_id').annotate(total_payments=Sum('amount'))
     )
+    # Heure de la dernière vente : lue sur les ventes, pour les seuls clients affichés
+    recent_clients_list = list(clients_queryset.order_by('-create_at', '-id')[:8])
+    recent_sales_queryset = Sale.objects.filter(
+        delete_at__isnull=True,
+        client_id__in=[client.id for client in recent_clients_list],
+    )
+    if range_start:
+        recent_sales_queryset = recent_sales_queryset.filter(create_at__date__gte=range_start)
+    if range_end:
+        recent_sales_queryset = recent_sales_queryset.filter(create_at__date__lte=range_end)
     sales_activity_rows = list(
-        sales_queryset.values('client_id').annotate(
+        recent_sales_queryset.values('client_id').annotate(
             total_sales=Count('id'),
             last_sale_at=Max('create_at'),
         )
@@ -1154,7 +1001,7 @@ def client_statistics(request):
     }
 
     recent_clients = []
-    for client in clients_queryset.order_by('-create_at', '-id')[:8]:
+    for client in recent_clients_list:
         activity_data = sales_activity_map.get(client.id, {})
         debt_data = outstanding_map.get(client.id, {})
         has_sales = activity_data.get('total_sales', 0) > 0
@@ -1331,10 +1178,9 @@ def supplier_statistics(request):
     supplier_ids = list(suppliers_queryset.values_list('id', flat=True))
 
     if supplier_ids:
-        supplies_queryset = Supply.objects.filter(
-            delete_at__isnull=True,
+        supplies_queryset = DailyFactService.facts(DailyFact.KIND_SUPPLY, range_start, range_end).filter(
             supplier_id__in=supplier_ids,
-        ).select_related('supplier', 'product', 'staff', 'credit_info')
+        )
         credit_supplies_queryset = CreditSupply.objects.filter(
             delete_at__isnull=True,
             supply__delete_at__isnull=True,
@@ -1352,17 +1198,15 @@ def supplier_statistics(request):
             credit_supply__supply__supplier_id__in=supplier_ids,
         ).select_related('credit_supply__supply__supplier')
     else:
-        supplies_queryset = Supply.objects.none()
+        supplies_queryset = DailyFact.objects.none()
         credit_supplies_queryset = CreditSupply.objects.none()
         payments_queryset = SupplierPayment.objects.none()
         schedules_queryset = PaymentSchedule.objects.none()
 
     if range_start:
-        supplies_queryset = supplies_queryset.filter(create_at__date__gte=range_start)
         payments_queryset = payments_queryset.filter(payment_date__gte=range_start)
         schedules_queryset = schedules_queryset.filter(due_date__gte=range_start)
     if range_end:
-        supplies_queryset = supplies_queryset.filter(create_at__date__lte=range_end)
         payments_queryset = payments_queryset.filter(payment_date__lte=range_end)
         schedules_queryset = schedules_queryset.filter(due_date__lte=range_end)
 
@@ -1374,13 +1218,16 @@ def supplier_statistics(request):
 
     total_suppliers = suppliers_queryset.count()
     new_suppliers_count = suppliers_created_queryset.count()
-    suppliers_with_supplies_count = supplies_queryset.values('supplier_id').distinct().count()
+    suppliers_with_supplies_count = supplies_queryset.values('supplier_id').annotate(
+        total_supplies=Sum('count'),
+    ).filter(total_supplies__gt=0).count()
     inactive_suppliers_count = max(total_suppliers - suppliers_with_supplies_count, 0)
     suppliers_with_phone_count = suppliers_queryset.exclude(contact_phone__isnull=True).exclude(contact_phone='').count()
     suppliers_with_email_count = suppliers_queryset.exclude(contact_email__isnull=True).exclude(contact_email='').count()
 
-    total_supplies_amount = supplies_queryset.aggregate(total=Sum('total_price'))['total'] or 0
-    supplies_count = supplies_queryset.count()
+    supplies_totals = supplies_queryset.aggregate(amount=Sum('amount'), supplies=Sum('count'))
+    total_supplies_amount = supplies_totals['amount'] or 0
+    supplies_count = supplies_totals['supplies'] or 0
     average_supply_per_supplier = (total_supplies_amount / suppliers_with_supplies_count) if suppliers_with_supplies_count else 0
     credit_supplies_count = credit_supplies_queryset.count()
     creditor_suppliers_count = credit_supplies_queryset.values('supply__supplier_id').distinct().count()
@@ -1397,10 +1244,10 @@ def supplier_statistics(request):
         'values': [int(row['total_suppliers'] or 0) for row in new_suppliers_rows],
     }
 
-    supplies_bucket, supplies_bucket_kind = chart_bucket_for_range('create_at', range_start, range_end)
+    supplies_bucket, supplies_bucket_kind = DailyFactService.bucket(range_start, range_end)
     supplies_rows = supplies_queryset.annotate(bucket=supplies_bucket).values('bucket').annotate(
-        total_amount=Sum('total_price'),
-        total_supplies=Count('id'),
+        total_amount=Sum('amount'),
+        total_supplies=Sum('count'),
     ).order_by('bucket')
     supplies_trend_chart = {
         'labels': [format_bucket_label(row['bucket'], supplies_bucket_kind) for row in supplies_rows],
@@ -1421,9 +1268,9 @@ def supplier_statistics(request):
 
     top_supplier_rows = list(
         supplies_queryset.values('supplier_id', 'supplier__name').annotate(
-            total_amount=Sum('total_price'),
-            total_supplies=Count('id'),
-        ).order_by('-total_amount', '-total_supplies')[:8]
+            total_amount=Sum('amount'),
+            total_supplies=Sum('count'),
+        ).filter(total_supplies__gt=0).order_by('-total_amount', '-total_supplies')[:8]
     )
     outstanding_rows = list(
         credit_supplies_queryset.values('supply__supplier_id').annotate(
@@ -1434,8 +1281,19 @@ def supplier_statistics(request):
     payment_rows = list(
         payments_queryset.values('supplier_id').annotate(total_payments=Sum('amount'))
     )
+    # Heure du dernier approvisionnement : lue sur les approvisionnements, pour
+    # les seuls fournisseurs affichés
+    recent_suppliers_list = list(suppliers_queryset.order_by('-create_at', '-id')[:8])
+    recent_supplies_queryset = Supply.objects.filter(
+        delete_at__isnull=True,
+        supplier_id__in=[supplier.id for supplier in recent_suppliers_list],
+    )
+    if range_start:
+        recent_supplies_queryset = recent_supplies_queryset.filter(create_at__date__gte=range_start)
+    if range_end:
+        recent_supplies_queryset = recent_supplies_queryset.filter(create_at__date__lte=range_end)
     supplies_activity_rows = list(
-        supplies_queryset.values('supplier_id').annotate(
+        recent_supplies_queryset.values('supplier_id').annotate(
             total_supplies=Count('id'),
             last_supply_at=Max('create_at'),
         )
@@ -1490,7 +1348,7 @@ def supplier_statistics(request):
     }
 
     recent_suppliers = []
-    for supplier in suppliers_queryset.order_by('-create_at', '-id')[:8]:
+    for supplier in recent_suppliers_list:
         activity_data = supplies_activity_map.get(supplier.id, {})
         debt_data = outstanding_map.get(supplier.id, {})
         has_supplies = activity_data.get('total_supplies', 0) > 0
@@ -1569,20 +1427,6 @@ def supply_statistics(request):
             return f"Jusqu'au {end.strftime('%d/%m/%Y')}"
         return "Toutes les données disponibles"
 
-    def chart_bucket_for_range(field_name, start, end):
-        if not start and not end:
-            return TruncMonth(field_name), 'month'
-
-        effective_end = end or timezone.localdate()
-        effective_start = start or (effective_end - timedelta(days=180))
-        span_days = max((effective_end - effective_start).days + 1, 1)
-
-        if span_days <= 31:
-            return TruncDate(field_name), 'day'
-        if span_days <= 120:
-            return TruncWeek(field_name), 'week'
-        return TruncMonth(field_name), 'month'
-
     def format_bucket_label(bucket_value, bucket_kind):
         if hasattr(bucket_value, 'date'):
             bucket_date = timezone.localtime(bucket_value).date() if timezone.is_aware(bucket_value) else bucket_value.date()
@@ -1675,46 +1519,72 @@ def supply_statistics(request):
         supplies_queryset = supplies_queryset.filter(create_at__date__lte=range_end)
 
     supplies_queryset = supplies_queryset.order_by('-create_at', '-id')
-    supply_ids = list(supplies_queryset.values_list('id', flat=True))
+    supply_ids = supplies_queryset.values('id')
 
-    if supply_ids:
-        credit_supplies_queryset = CreditSupply.objects.filter(
-            delete_at__isnull=True,
-            supply__delete_at__isnull=True,
-            supply_id__in=supply_ids,
-        ).select_related('supply__supplier', 'supply__product')
-        schedules_queryset = PaymentSchedule.objects.filter(
-            delete_at__isnull=True,
-            schedule_type='SUPPLIER',
-            credit_supply__delete_at__isnull=True,
-            credit_supply__supply__delete_at__isnull=True,
-            credit_supply__supply_id__in=supply_ids,
-        ).select_related('credit_supply__supply__supplier')
+    credit_supplies_queryset = CreditSupply.objects.filter(
+        delete_at__isnull=True,
+        supply__delete_at__isnull=True,
+        supply_id__in=supply_ids,
+    ).select_related('supply__supplier', 'supply__product')
+    schedules_queryset = PaymentSchedule.objects.filter(
+        delete_at__isnull=True,
+        schedule_type='SUPPLIER',
+        credit_supply__delete_at__isnull=True,
+        credit_supply__supply__delete_at__isnull=True,
+        credit_supply__supply_id__in=supply_ids,
+    ).select_related('credit_supply__supply__supplier')
+
+    # Cumuls lus dans la table de faits ; la recherche libre et le statut de
+    # paiement ne sont pas des dimensions des faits : lecture des approvisionnements alors
+    if search or payment_status:
+        facts_queryset = DailyFactService.as_facts(supplies_queryset.order_by(), DailyFact.KIND_SUPPLY)
     else:
-        credit_supplies_queryset = CreditSupply.objects.none()
-        schedules_queryset = PaymentSchedule.objects.none()
+        dimensions = {}
+        if supplier_id:
+            dimensions['supplier_id'] = supplier_id
+        if staff_id:
+            dimensions['staff_id'] = staff_id
+        if supply_type in ('cash', 'credit'):
+            dimensions['is_credit'] = supply_type == 'credit'
+        facts_queryset = DailyFactService.facts(DailyFact.KIND_SUPPLY, range_start, range_end).filter(**dimensions)
+
+    supplies_totals = facts_queryset.aggregate(
+        supplies=Sum('count'),
+        amount=Sum('amount'),
+        quantity=Sum('quantity'),
+        credit_supplies=Sum('count', filter=Q(is_credit=True)),
+        suppliers=Count('supplier_id', distinct=True),
+        products=Count('product_id', distinct=True),
+        staff=Count('staff_id', distinct=True),
+    )
+    status_totals = supplies_queryset.order_by().aggregate(
+        paid_supplies=Count('id', filter=Q(is_paid=True)),
+        unpaid_supplies=Count('id', filter=Q(is_paid=False)),
+        paid_amount=Sum('total_price', filter=Q(is_paid=True)),
+        unpaid_amount=Sum('total_price', filter=Q(is_paid=False)),
+    )
 
-    supplies_count = supplies_queryset.count()
-    total_supplies_amount = supplies_queryset.aggregate(total=Sum('total_price'))['total'] or 0
-    total_quantity = supplies_queryset.aggregate(total=Sum('quantity'))['total'] or 0
+    supplies_count = supplies_totals['supplies'] or 0
+    total_supplies_amount = supplies_totals['amount'] or 0
+    total_quantity = supplies_totals['quantity'] or 0
     average_supply_amount = (total_supplies_amount / supplies_count) if supplies_count else 0
-    suppliers_count = supplies_queryset.exclude(supplier__isnull=True).values('supplier_id').distinct().count()
-    products_count = supplies_queryset.values('product_id').distinct().count()
-    staff_count = supplies_queryset.exclude(staff__isnull=True).values('staff_id').distinct().count()
-    credit_supplies_count = supplies_queryset.filter(is_credit=True).count()
+    suppliers_count = supplies_totals['suppliers']
+    products_count = supplies_totals['products']
+    staff_count = supplies_totals['staff']
+    credit_supplies_count = supplies_totals['credit_supplies'] or 0
     cash_supplies_count = max(supplies_count - credit_supplies_count, 0)
-    paid_supplies_count = supplies_queryset.filter(is_paid=True).count()
-    unpaid_supplies_count = supplies_queryset.filter(is_paid=False).count()
-    paid_supplies_amount = supplies_queryset.filter(is_paid=True).aggregate(total=Sum('total_price'))['total'] or 0
-    unpaid_supplies_amount = supplies_queryset.filter(is_paid=False).aggregate(total=Sum('total_price'))['total'] or 0
+    paid_supplies_count = status_totals['paid_supplies']
+    unpaid_supplies_count = status_totals['unpaid_supplies']
+    paid_supplies_amount = status_totals['paid_amount'] or 0
+    unpaid_supplies_amount = status_totals['unpaid_amount'] or 0
     outstanding_total = credit_supplies_queryset.aggregate(total=Sum('amount_remaining'))['total'] or 0
     overdue_schedules_count = schedules_queryset.exclude(status='PAID').filter(due_date__lt=today).count()
 
-    supplies_bucket, supplies_bucket_kind = chart_bucket_for_range('create_at', range_start, range_end)
-    supplies_rows = supplies_queryset.annotate(bucket=supplies_bucket).values('bucket').annotate(
-        total_amount=Sum('total_price'),
+    supplies_bucket, supplies_bucket_kind = DailyFactService.bucket(range_start, range_end)
+    supplies_rows = facts_queryset.annotate(bucket=supplies_bucket).values('bucket').annotate(
+        total_amount=Sum('amount'),
         total_quantity=Sum('quantity'),
-        total_supplies=Count('id'),
+        total_supplies=Sum('count'),
     ).order_by('bucket')
     supplies_trend_chart = {
         'labels': [format_bucket_label(row['bucket'], supplies_bucket_kind) for row in supplies_rows],
@@ -1734,14 +1604,14 @@ def supply_statistics(request):
     }
 
     top_product_rows = list(
-        supplies_queryset.values(
+        facts_queryset.values(
             'product_id',
             'product__code',
             'product__name',
         ).annotate(
             total_quantity=Sum('quantity'),
-            total_amount=Sum('total_price'),
-            total_supplies=Count('id'),
+            total_amount=Sum('amount'),
+            total_supplies=Sum('count'),
             total_suppliers=Count('supplier_id', distinct=True),
         ).order_by('-total_amount', '-total_quantity', 'product__name')[:8]
     )
@@ -1752,10 +1622,10 @@ def supply_statistics(request):
     }
 
     top_supplier_rows = list(
-        supplies_queryset.values('supplier_id', 'supplier__name').annotate(
-            total_amount=Sum('total_price'),
+        facts_queryset.values('supplier_id', 'supplier__name').annotate(
+            total_amount=Sum('amount'),
             total_quantity=Sum('quantity'),
-            total_supplies=Count('id'),
+            total_supplies=Sum('count'),
         ).order_by('-total_amount', '-total_quantity', 'supplier__name')[:8]
     )
     outstanding_rows = list(
@@ -1839,20 +1709,6 @@ def expense_statistics(request):
             return f"Jusqu'au {end.strftime('%d/%m/%Y')}"
         return "Toutes les données disponibles"
 
-    def chart_bucket_for_range(field_name, start, end):
-        if not start and not end:
-            return TruncMonth(field_name), 'month'
-
-        effective_end = end or timezone.localdate()
-        effective_start = start or (effective_end - timedelta(days=180))
-        span_days = max((effective_end - effective_start).days + 1, 1)
-
-        if span_days <= 31:
-            return TruncDate(field_name), 'day'
-        if span_days <= 120:
-            return TruncWeek(field_name), 'week'
-        return TruncMonth(field_name), 'month'
-
     def format_bucket_label(bucket_value, bucket_kind):
         if hasattr(bucket_value, 'date'):
             bucket_date = timezone.localtime(bucket_value).date() if timezone.is_aware(bucket_value) else bucket_value.date()
@@ -1955,28 +1811,50 @@ def expense_statistics(request):
     expenses_queryset = expenses_queryset.order_by('-create_at', '-id')
     recipes_queryset = recipes_queryset.order_by('-create_at', '-id')
 
-    expenses_count = expenses_queryset.count()
-    recipes_count = recipes_queryset.count()
+    # Cumuls lus dans la table de faits ; la recherche libre (description,
+    # compte…) n'est pas une dimension des faits : lecture des opérations alors
+    if search:
+        expense_facts = DailyFactService.as_facts(expenses_queryset.order_by(), DailyFact.KIND_EXPENSE)
+        recipe_facts = DailyFactService.as_facts(recipes_queryset.order_by(), DailyFact.KIND_RECIPE)
+    else:
+        expense_facts = DailyFactService.facts(DailyFact.KIND_EXPENSE, range_start, range_end)
+        recipe_facts = DailyFactService.facts(DailyFact.KIND_RECIPE, range_start, range_end)
+        if staff_id:
+            expense_facts = expense_facts.filter(staff_id=staff_id)
+            recipe_facts = recipe_facts.filter(staff_id=staff_id)
+        if expense_type_id:
+            expense_facts = expense_facts.filter(expense_type_id=expense_type_id)
+        if recipe_type_id:
+            recipe_facts = recipe_facts.filter(recipe_type_id=recipe_type_id)
+
+    expense_totals = expense_facts.aggregate(
+        operations=Sum('count'), amount=Sum('amount'), types=Count('expense_type_id', distinct=True),
+    )
+    recipe_totals = recipe_facts.aggregate(
+        operations=Sum('count'), amount=Sum('amount'), types=Count('recipe_type_id', distinct=True),
+    )
+    expenses_count = expense_totals['operations'] or 0
+    recipes_count = recipe_totals['operations'] or 0
     operations_count = expenses_count + recipes_count
-    total_expenses = expenses_queryset.aggregate(total=Sum('amount'))['total'] or 0
-    total_recipes = recipes_queryset.aggregate(total=Sum('amount'))['total'] or 0
+    total_expenses = expense_totals['amount'] or 0
+    total_recipes = recipe_totals['amount'] or 0
     net_result = total_recipes - total_expenses
     average_expense_amount = total_expenses / expenses_count if expenses_count else 0
     average_recipe_amount = total_recipes / recipes_count if recipes_count else 0
-    expense_types_count = expenses_queryset.exclude(expense_type__isnull=True).values('expense_type_id').distinct().count()
-    recipe_types_count = recipes_queryset.exclude(recipe_type__isnull=True).values('recipe_type_id').distinct().count()
-    staff_ids = set(expenses_queryset.exclude(staff__isnull=True).values_list('staff_id', flat=True))
-    staff_ids.update(recipes_queryset.exclude(staff__isnull=True).values_list('staff_id', flat=True))
+    expense_types_count = expense_totals['types']
+    recipe_types_count = recipe_totals['types']
+    staff_ids = set(expense_facts.exclude(staff__isnull=True).values_list('staff_id', flat=True).distinct())
+    staff_ids.update(recipe_facts.exclude(staff__isnull=True).values_list('staff_id', flat=True).distinct())
     staff_count = len(staff_ids)
 
-    flow_bucket, flow_bucket_kind = chart_bucket_for_range('create_at', range_start, range_end)
-    expense_rows = expenses_queryset.annotate(bucket=flow_bucket).values('bucket').annotate(
+    flow_bucket, flow_bucket_kind = DailyFactService.bucket(range_start, range_end)
+    expense_rows = expense_facts.annotate(bucket=flow_bucket).values('bucket').annotate(
         total_amount=Sum('amount'),
-        total_operations=Count('id'),
+        total_operations=Sum('count'),
     ).order_by('bucket')
-    recipe_rows = recipes_queryset.annotate(bucket=flow_bucket).values('bucket').annotate(
+    recipe_rows = recipe_facts.annotate(bucket=flow_bucket).values('bucket').annotate(
         total_amount=Sum('amount'),
-        total_operations=Count('id'),
+        total_operations=Sum('count'),
     ).order_by('bucket')
 
     bucket_map = {}
@@ -2010,9 +1888,9 @@ def expense_statistics(request):
             'total_amount': row['total_amount'] or 0,
             'total_operations': int(row['total_operations'] or 0),
         }
-        for row in expenses_queryset.values('expense_type__name').annotate(
+        for row in expense_facts.values('expense_type__name').annotate(
             total_amount=Sum('amount'),
-            total_operations=Count('id'),
+            total_operations=Sum('count'),
         ).order_by('-total_amount', '-total_operations', 'expense_type__name')[:8]
     ]
     top_recipe_types = [
@@ -2021,9 +1899,9 @@ def expense_statistics(request):
             'total_amount': row['total_amount'] or 0,
             'total_operations': int(row['total_operations'] or 0),
         }
-        for row in recipes_queryset.values('recipe_type__name').annotate(
+        for row in recipe_facts.values('recipe_type__name').annotate(
             total_amount=Sum('amount'),
-            total_operations=Count('id'),
+            total_operations=Sum('count'),
         ).order_by('-total_amount', '-total_operations', 'recipe_type__name')[:8]
     ]
 
@@ -2037,9 +1915,9 @@ def expense_statistics(request):
     }
 
     staff_map = {}
-    for row in expenses_queryset.values(
+    for row in expense_facts.values(
         'staff_id', 'staff__firstname', 'staff__lastname', 'staff__username',
-    ).annotate(total_amount=Sum('amount'), total_operations=Count('id')):
+    ).annotate(total_amount=Sum('amount'), total_operations=Sum('count')):
         staff_key = row['staff_id'] if row['staff_id'] is not None else 'unassigned'
         staff_map[staff_key] = {
             'label': format_person_label(row['staff__firstname'], row['staff__lastname'], row['staff__username']),
@@ -2047,9 +1925,9 @@ def expense_statistics(request):
             'recipe_total': 0,
             'operations': int(row['total_operations'] or 0),
         }
-    for row in recipes_queryset.values(
+    for row in recipe_facts.values(
         'staff_id', 'staff__firstname', 'staff__lastname', 'staff__username',
-    ).annotate(total_amount=Sum('amount'), total_operations=Count('id')):
+    ).annotate(total_amount=Sum('amount'), total_operations=Sum('count')):
         staff_key = row['staff_id'] if row['staff_id'] is not None else 'unassigned'
         staff_entry = staff_map.setdefault(staff_key, {
             'label': format_person_label(row['staff__firstname'], row['staff__lastname'], row['staff__username']),
@@ -2177,6 +2055,11 @@ def personnel_statistics(request):
             return TruncWeek(field_name), 'week'
         return TruncMonth(field_name), 'month'
 
+    def bucket_day(bucket_value):
+        if hasattr(bucket_value, 'date'):
+            return timezone.localtime(bucket_value).date() if timezone.is_aware(bucket_value) else bucket_value.date()
+        return bucket_value
+
     def format_bucket_label(bucket_value, bucket_kind):
         if hasattr(bucket_value, 'date'):
             bucket_date = timezone.localtime(bucket_value).date() if timezone.is_aware(bucket_value) else bucket_value.date()
@@ -2273,24 +2156,24 @@ def personnel_statistics(request):
     staff_ids = list(staff_queryset.values_list('id', flat=True))
 
     if staff_ids:
-        sales_queryset = Sale.objects.filter(delete_at__isnull=True, staff_id__in=staff_ids)
-        supplies_queryset = Supply.objects.filter(delete_at__isnull=True, staff_id__in=staff_ids)
+        sales_queryset = DailyFactService.facts(DailyFact.KIND_SALE, range_start, range_end).filter(
+            staff_id__in=staff_ids, count__gt=0,
+        )
+        supplies_queryset = DailyFactService.facts(DailyFact.KIND_SUPPLY, range_start, range_end).filter(
+            staff_id__in=staff_ids,
+        )
         inventories_queryset = Inventory.objects.filter(delete_at__isnull=True, staff_id__in=staff_ids)
         daily_inventories_queryset = DailyInventory.objects.filter(delete_at__isnull=True, staff_id__in=staff_ids)
     else:
-        sales_queryset = Sale.objects.none()
-        supplies_queryset = Supply.objects.none()
+        sales_queryset = DailyFact.objects.none()
+        supplies_queryset = DailyFact.objects.none()
         inventories_queryset = Inventory.objects.none()
         daily_inventories_queryset = DailyInventory.objects.none()
 
     if range_start:
-        sales_queryset = sales_queryset.filter(create_at__date__gte=range_start)
-        supplies_queryset = supplies_queryset.filter(create_at__date__gte=range_start)
         inventories_queryset = inventories_queryset.filter(create_at__date__gte=range_start)
         daily_inventories_queryset = daily_inventories_queryset.filter(create_at__date__gte=range_start)
     if range_end:
-        sales_queryset = sales_queryset.filter(create_at__date__lte=range_end)
-        supplies_queryset = supplies_queryset.filter(create_at__date__lte=range_end)
         inventories_queryset = inventories_queryset.filter(create_at__date__lte=range_end)
         daily_inventories_queryset = daily_inventories_queryset.filter(create_at__date__lte=range_end)
 
@@ -2308,15 +2191,16 @@ def personnel_statistics(request):
         joined_staff_queryset = joined_staff_queryset.filter(date_joined__date__lte=range_end)
     joined_staff_count = joined_staff_queryset.count()
 
-    sales_count = sales_queryset.count()
-    total_revenue = sales_queryset.aggregate(total=Sum('total'))['total'] or 0
-    supplies_count = supplies_queryset.count()
+    sales_totals = sales_queryset.aggregate(sales=Sum('count'), revenue=Sum('amount'))
+    sales_count = sales_totals['sales'] or 0
+    total_revenue = sales_totals['revenue'] or 0
+    supplies_count = supplies_queryset.aggregate(total=Sum('count'))['total'] or 0
     inventory_sessions_count = inventories_queryset.count()
     daily_inventory_count = daily_inventories_queryset.count()
     stock_actions_count = supplies_count + inventory_sessions_count + daily_inventory_count
 
-    active_contributor_ids = set(sales_queryset.exclude(staff_id__isnull=True).values_list('staff_id', flat=True))
-    active_contributor_ids.update(supplies_queryset.exclude(staff_id__isnull=True).values_list('staff_id', flat=True))
+    active_contributor_ids = set(sales_queryset.exclude(staff_id__isnull=True).values_list('staff_id', flat=True).distinct())
+    active_contributor_ids.update(supplies_queryset.exclude(staff_id__isnull=True).values_list('staff_id', flat=True).distinct())
     active_contributor_ids.update(inventories_queryset.exclude(staff_id__isnull=True).values_list('staff_id', flat=True))
     active_contributor_ids.update(daily_inventories_queryset.exclude(staff_id__isnull=True).values_list('staff_id', flat=True))
     active_contributors_count = len(active_contributor_ids)
@@ -2335,16 +2219,16 @@ def personnel_statistics(request):
         'values': [int(row['total_users'] or 0) for row in role_rows],
     }
 
-    sales_bucket, bucket_kind = chart_bucket_for_range('create_at', range_start, range_end)
-    supplies_bucket, _ = chart_bucket_for_range('create_at', range_start, range_end)
+    sales_bucket, bucket_kind = DailyFactService.bucket(range_start, range_end)
+    supplies_bucket, _ = DailyFactService.bucket(range_start, range_end)
     inventories_bucket, _ = chart_bucket_for_range('create_at', range_start, range_end)
     daily_bucket, _ = chart_bucket_for_range('create_at', range_start, range_end)
 
     sales_trend_rows = list(
-        sales_queryset.annotate(bucket=sales_bucket).values('bucket').annotate(total_sales=Count('id')).order_by('bucket')
+        sales_queryset.annotate(bucket=sales_bucket).values('bucket').annotate(total_sales=Sum('count')).order_by('bucket')
     )
     supplies_trend_rows = list(
-        supplies_queryset.annotate(bucket=supplies_bucket).values('bucket').annotate(total_supplies=Count('id')).order_by('bucket')
+        supplies_queryset.annotate(bucket=supplies_bucket).values('bucket').annotate(total_supplies=Sum('count')).order_by('bucket')
     )
     inventories_trend_rows = list(
         inventories_queryset.annotate(bucket=inventories_bucket).values('bucket').annotate(total_inventories=Count('id')).order_by('bucket')
@@ -2355,8 +2239,9 @@ def personnel_statistics(request):
 
     sales_trend_map = {row['bucket']: int(row['total_sales'] or 0) for row in sales_trend_rows if row['bucket'] is not None}
     supplies_trend_map = {row['bucket']: int(row['total_supplies'] or 0) for row in supplies_trend_rows if row['bucket'] is not None}
-    inventories_trend_map = {row['bucket']: int(row['total_inventories'] or 0) for row in inventories_trend_rows if row['bucket'] is not None}
-    daily_trend_map = {row['bucket']: int(row['total_daily'] or 0) for row in daily_trend_rows if row['bucket'] is not None}
+    # Les faits sont groupés par jour (date) : même clé pour les inventaires
+    inventories_trend_map = {bucket_day(row['bucket']): int(row['total_inventories'] or 0) for row in inventories_trend_rows if row['bucket'] is not None}
+    daily_trend_map = {bucket_day(row['bucket']): int(row['total_daily'] or 0) for row in daily_trend_rows if row['bucket'] is not None}
     trend_buckets = sorted(
         set(sales_trend_map.keys())
         | set(supplies_trend_map.keys())
@@ -2377,12 +2262,12 @@ def personnel_statistics(request):
             'staff__lastname',
             'staff__username',
         ).annotate(
-            total_revenue=Sum('total'),
-            total_sales=Count('id'),
+            total_revenue=Sum('amount'),
+            total_sales=Sum('count'),
         ).order_by('-total_revenue', '-total_sales')
     )
     supplies_activity_rows = list(
-        supplies_queryset.exclude(staff_id__isnull=True).values('staff_id').annotate(total_supplies=Count('id'))
+        supplies_queryset.exclude(staff_id__isnull=True).values('staff_id').annotate(total_supplies=Sum('count'))
     )
     inventories_activity_rows = list(
         inventories_queryset.exclude(staff_id__isnull=True).values('staff_id').annotate(total_inventories=Count('id'))
@@ -2591,7 +2476,6 @@ def sales_history(request):
     payment_status = request.GET.get('status', '')
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
-    page_number = request.GET.get('page', 1)
     view_mode = request.GET.get('view_mode', 'sales')  # 'sales' or 'products'
 
     if view_mode == 'products':
@@ -2639,16 +2523,13 @@ def sales_history(request):
         if date_to:
             queryset = queryset.filter(sale__create_at__date__lte=date_to)
 
-        queryset = queryset.order_by('-sale__create_at')
-
         # Total des produits vendus (quantité * prix unitaire)
         from django.db.models import Sum as DbSum
         total_products_amount = queryset.annotate(
             line_total=F('quantity') * F('unit_price')
         ).aggregate(total=DbSum('line_total'))['total'] or 0
 
-        paginator = Paginator(queryset, 20)
-        page_obj = paginator.get_page(page_number)
+        page_obj = paginate_request(request, queryset, per_page=20)
 
         # Listes pour les dropdowns
         clients_list = Client.objects.filter(delete_at__isnull=True).order_by('firstname')
@@ -2670,7 +2551,7 @@ def sales_history(request):
             'current_date_to': date_to,
             'current_full_path': request.get_full_path(),
             'payment_method_choices': PAYMENT_METHOD_CHOICES,
-            'total_count': paginator.count,
+            'total_count': page_obj.count_display,
             'total_sales_amount': total_products_amount,
         }
         return render(request, 'core/sales_history.html', context)
@@ -2719,13 +2600,10 @@ def sales_history(request):
     if date_to:
         queryset = queryset.filter(create_at__date__lte=date_to)
 
-    queryset = queryset.order_by('-create_at')
-
     # Total des ventes filtrées
     total_sales_amount = queryset.aggregate(total=Sum('total'))['total'] or 0
 
-    paginator = Paginator(queryset, 20)
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_request(request, queryset, per_page=20)
 
     # Listes pour les dropdowns
     clients_list = Client.objects.filter(delete_at__isnull=True).order_by('firstname')
@@ -2747,7 +2625,7 @@ def sales_history(request):
         'current_date_to': date_to,
         'current_full_path': request.get_full_path(),
         'payment_method_choices': PAYMENT_METHOD_CHOICES,
-        'total_count': paginator.count,
+        'total_count': page_obj.count_display,
         'total_sales_amount': total_sales_amount,
     }
     return render(request, 'core/sales_history.html', context)
@@ -2942,9 +2820,7 @@ def products(request):
 
     # Appliquer les filtres
     if search:
-        queryset = queryset.filter(
-            Q(name__icontains=search) | Q(code__icontains=search) | Q(brand__icontains=search)
-        )
+        queryset = ProductSearchService.filter_queryset(queryset, search)
     if category_id:
         queryset = queryset.filter(category_id=category_id)
     if gamme_id:
@@ -3026,7 +2902,6 @@ def inventory(request):
         exercise_id = str(current_ex.id)
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
-    page_number = request.GET.get('page', 1)
 
     # Nombre d'éléments par page (10, 25, 50, 100)
     try:
@@ -3053,13 +2928,10 @@ def inventory(request):
     if date_to:
         queryset = queryset.filter(create_at__date__lte=date_to)
 
-    queryset = queryset.order_by('-create_at')
-
     total_valid = queryset.aggregate(total=Sum('valid_product_count'))['total'] or 0
     total_invalid = queryset.aggregate(total=Sum('invalid_product_count'))['total'] or 0
 
-    paginator = Paginator(queryset, per_page)
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_request(request, queryset, per_page=per_page)
 
     staff_list = CustomUser.objects.filter(delete_at__isnull=True, is_active=True).order_by('firstname')
     exercises = Exercise.objects.filter(delete_at__isnull=True).order_by('-start_date')
@@ -3077,7 +2949,7 @@ def inventory(request):
         'current_date_to': date_to,
         'current_per_page': per_page,
         'per_page_choices': INVENTORY_PER_PAGE_CHOICES,
-        'total_count': paginator.count,
+        'total_count': page_obj.count_display,
         'total_valid': total_valid,
         'total_invalid': total_invalid,
     }
@@ -3467,7 +3339,6 @@ def supplies(request):
     supplier_id = request.GET.get('supplier', '')
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
-    page_number = request.GET.get('page', 1)
 
     queryset = Supply.objects.filter(
         delete_at__isnull=True,
@@ -3484,10 +3355,7 @@ def supplies(request):
     if date_to:
         queryset = queryset.filter(create_at__date__lte=date_to)
 
-    queryset = queryset.order_by('-create_at')
-
-    paginator = Paginator(queryset, 20)
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_request(request, queryset, per_page=20)
 
     suppliers_for_filter = Supplier.objects.filter(delete_at__isnull=True).order_by('name')
 
@@ -3502,7 +3370,7 @@ def supplies(request):
         'current_date_to': date_to,
         'current_full_path': request.get_full_path(),
         'payment_method_choices': PAYMENT_METHOD_CHOICES,
-        'total_count': paginator.count,
+        'total_count': page_obj.count_display,
     }
     return render(request, 'core/supplies.html', context)
 
@@ -3541,12 +3409,12 @@ def add_supply(request):
                 settings.default_supply_expense_type = selected_expense_type
                 settings.save()
             
-            supply.save()
+            with transaction.atomic():
+                supply.save()
 
-            # Enregistrer l'écriture comptable
-            payment_method = form.cleaned_data.get('payment_method', 'CASH')
-            try:
-                AccountingService.record_supply(
+                # Mettre l'écriture comptable en file (générée par le worker outbox)
+                payment_method = form.cleaned_data.get('payment_method', 'CASH')
+                AccountingOutboxService.enqueue_supply(
                     supply=supply,
                     daily=supply.daily,
                     exercise=supply.daily.exercise,
@@ -3554,39 +3422,37 @@ def add_supply(request):
                     is_credit=is_credit_purchase,
                     tax_rate=supply.tax_rate,  # Passer le taux de TVA depuis l'approvisionnement
                 )
-            except Exception:
-                pass  # Ne pas bloquer l'approvisionnement si la comptabilité échoue
 
-            # Créer CreditSupply + PaymentSchedule si achat à crédit
-            if is_credit_purchase:
-                due_date = form.cleaned_data.get('due_date')
-                credit_supply = CreditSupply.objects.create(
-                    supply=supply,
-                    amount_paid=0,
-                    amount_remaining=supply.total_price,
-                    due_date=due_date,
-                    is_fully_paid=False,
-                )
-                # Créer une échéance de paiement
-                if due_date:
-                    PaymentSchedule.objects.create(
-                        schedule_type='SUPPLIER',
-                        credit_supply=credit_supply,
+                # Créer CreditSupply + PaymentSchedule si achat à crédit
+                if is_credit_purchase:
+                    due_date = form.cleaned_data.get('due_date')
+                    credit_supply = CreditSupply.objects.create(
+                        supply=supply,
+                        amount_paid=0,
+                        amount_remaining=supply.total_price,
                         due_date=due_date,
-                        amount_due=supply.total_price,
-                        status='PENDING',
+                        is_fully_paid=False,
                     )
-
-            # Mettre à jour le stock du produit
-            product = supply.product
-            product.stock = (product.stock or 0) + supply.quantity
-            # Mettre à jour le dernier prix d'achat
-            product.last_purchase_price = supply.purchase_cost
-            # Mettre à jour le prix de vente si renseigné
-            selling_price = form.cleaned_data.get('selling_price')
-            if selling_price:
-                product.actual_price = selling_price
-            product.save()
+                    # Créer une échéance de paiement
+                    if due_date:
+                        PaymentSchedule.objects.create(
+                            schedule_type='SUPPLIER',
+                            credit_supply=credit_supply,
+                            due_date=due_date,
+                            amount_due=supply.total_price,
+                            status='PENDING',
+                        )
+
+                # Mettre à jour le stock du produit
+                product = supply.product
+                product.stock = (product.stock or 0) + supply.quantity
+                # Mettre à jour le dernier prix d'achat
+                product.last_purchase_price = supply.purchase_cost
+                # Mettre à jour le prix de vente si renseigné
+                selling_price = form.cleaned_data.get('selling_price')
+                if selling_price:
+                    product.actual_price = selling_price
+                product.save()
 
             # Retourner JSON si c'est une requête AJAX
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -3894,19 +3760,11 @@ def get_daily_summary(request):
     if not current_daily:
         return JsonResponse({'success': False, 'message': 'Aucune journée active trouvée.'}, status=404)
 
-    # Calculer les totaux
-    total_sales = Sale.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('total'))['total'] or 0
-
-    total_expenses = DailyExpense.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('amount'))['total'] or 0
-
-    from core.models.accounting_models import DailyRecipe
-    total_recipes = DailyRecipe.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # Totaux de la journée (une seule ligne, voir DailyCountersService)
+    counters = DailyCountersService.get_counters(current_daily)
+    total_sales = counters.revenue
+    total_expenses = counters.expenses_total
+    total_recipes = counters.recipes_total
 
     # Récupérer le fond de caisse de la journée précédente
     previous_inventory = DailyInventory.objects.filter(
@@ -3958,19 +3816,13 @@ def close_daily(request):
     except (ValueError, TypeError):
         return JsonResponse({'success': False, 'message': 'Les montants doivent être des nombres valides.'}, status=400)
 
-    # Calculer les totaux
-    total_sales = Sale.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('total'))['total'] or 0
-
-    total_expenses = DailyExpense.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('amount'))['total'] or 0
-
-    from core.models.accounting_models import DailyRecipe
-    total_recipes = DailyRecipe.objects.filter(
-        daily=current_daily, delete_at__isnull=True
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # Totaux de la journée : compteurs rapprochés des tables vivantes avant
+    # d'être figés dans l'inventaire de clôture
+    counters_corrected = DailyCountersService.reconcile_daily(current_daily)
+    counters = DailyCounters.objects.get(daily=current_daily)
+    total_sales = counters.revenue
+    total_expenses = counters.expenses_total
+    total_recipes = counters.recipes_total
 
     # Créer le DailyInventory
     daily_inventory = DailyInventory.objects.create(
@@ -3994,16 +3846,26 @@ def close_daily(request):
     tva_mode = getattr(settings, 'tva_accounting_mode', 'IMMEDIATE')
     enable_tva = getattr(settings, 'enable_tva_accounting', True)
     
-    tva_entries_created = 0
+    # Comptabiliser les événements encore en file pour cette journée
+    AccountingOutboxService.process_pending(daily=current_daily)
+
+    tva_stats = {'entries': 0, 'sales': 0, 'duration_ms': 0}
     if enable_tva and tva_mode == 'DEFERRED':
         from core.services.accounting_service import AccountingService
-        tva_entries_created = AccountingService.record_deferred_tva_for_daily(current_daily)
+        tva_stats = AccountingService.post_deferred_tva(current_daily)
+
+    # Rapprocher les faits statistiques des jours de la journée
+    facts_corrected = DailyFactService.reconcile_daily(current_daily)
 
     return JsonResponse({
         'success': True,
         'message': 'La journée a été clôturée avec succès.',
         'daily_inventory_id': daily_inventory.id,
-        'tva_entries_created': tva_entries_created,
+        'facts_corrected': facts_corrected,
+        'counters_corrected': counters_corrected,
+        'tva_entries_created': tva_stats['entries'],
+        'tva_sales_processed': tva_stats['sales'],
+        'tva_duration_ms': tva_stats['duration_ms'],
     })
 
 
@@ -4068,7 +3930,8 @@ def data_migration(request):
 @module_required('accounting')
 def accounting_journal(request):
     """Vue du journal comptable — liste de toutes les écritures."""
-    from core.models.accounting_models import JournalEntry, JournalEntryLine, Account
+    from core.models.accounting_models import JournalEntry
+    from core.pagination import COUNT_NONE
 
     # Filtres
     journal_filter = request.GET.get('journal', '')
@@ -4076,31 +3939,24 @@ def accounting_journal(request):
     date_to = request.GET.get('date_to', '')
     search = request.GET.get('search', '')
 
-    entries = JournalEntry.objects.filter(
-        delete_at__isnull=True,
-    ).select_related('exercise', 'daily').prefetch_related('lines__account').order_by('-date', '-create_at')
-
-    if journal_filter:
-        entries = entries.filter(journal=journal_filter)
-    if date_from:
-        entries = entries.filter(date__gte=date_from)
-    if date_to:
-        entries = entries.filter(date__lte=date_to)
-    if search:
-        entries = entries.filter(
-            Q(reference__icontains=search) | Q(description__icontains=search)
-        )
-
-    paginator = Paginator(entries, 25)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    def _parse(value):
+        try:
+            return parse_date(value) if value else None
+        except ValueError:
+            return None
+
+    filters = {
+        'journal': journal_filter,
+        'date_from': _parse(date_from),
+        'date_to': _parse(date_to),
+        'search': search,
+    }
 
-    # Totaux
-    total_debit = sum(
-        line.debit for entry in page_obj for line in entry.lines.all()
-    )
-    total_credit = sum(
-        line.credit for entry in page_obj for line in entry.lines.all()
-    )
+    # Totaux de tout le filtre (en cache tant que le journal ne change pas)
+    totals = JournalService.get_totals(**filters)
+    page_obj = paginate_request(request, JournalService.entries(**filters), per_page=25, count_mode=COUNT_NONE)
+    page_obj.count = totals['count']
+    page_obj.object_list = JournalService.attach_lines(page_obj.object_list)
 
     context = {
         'page_title': 'Journal comptable',
@@ -4111,66 +3967,75 @@ def accounting_journal(request):
         'current_date_from': date_from,
         'current_date_to': date_to,
         'current_search': search,
-        'total_count': paginator.count,
-        'total_debit': total_debit,
-        'total_credit': total_credit,
+        'total_count': page_obj.count_display,
+        'total_debit': totals['total_debit'],
+        'total_credit': totals['total_credit'],
     }
     return render(request, 'core/accounting/journal.html', context)
 
 
+def _ledger_filters(request):
+    """Compte et période (dates invalides ignorées) du grand livre."""
+    account_code = request.GET.get('account', '')
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
+    account = None
+    if account_code:
+        account = Account.objects.filter(code=account_code, delete_at__isnull=True).first()
+
+    def _parse(value):
+        try:
+            return parse_date(value) if value else None
+        except ValueError:
+            return None
+
+    return account, account_code, date_from, date_to, _parse(date_from), _parse(date_to)
+
+
 @login_required
 @module_required('accounting')
 def accounting_general_ledger(request):
-    """Vue du grand livre — détail d'un compte avec solde progressif."""
-    from core.models.accounting_models import Account
+    """Vue du grand livre — détail d'un compte avec solde progressif, par pages."""
+    from core.pagination import InvalidCursor
 
     accounts = Account.objects.filter(
         is_active=True, delete_at__isnull=True
     ).order_by('code')
 
-    account_code = request.GET.get('account', '')
-    date_from = request.GET.get('date_from', '')
-    date_to = request.GET.get('date_to', '')
-
-    selected_account = None
+    selected_account, account_code, date_from, date_to, start, end = _ledger_filters(request)
+    ledger_page = None
     ledger_lines = []
     total_debit = 0
     total_credit = 0
     balance = 0
+    next_querystring = ''
+    first_querystring = ''
 
-    if account_code:
-        selected_account = Account.objects.filter(code=account_code, delete_at__isnull=True).first()
-        if selected_account:
-            exercise = ExerciseService.get_or_create_current_exercise()
-            ledger_lines = AccountingService.get_general_ledger(selected_account, exercise)
-
-            # Filtrer par date si nécessaire
-            if date_from or date_to:
-                filtered = []
-                from decimal import Decimal
-                running = Decimal('0')
-                for item in ledger_lines:
-                    line = item['line']
-                    entry_date = str(line.entry.date)
-                    if date_from and entry_date < date_from:
-                        continue
-                    if date_to and entry_date > date_to:
-                        continue
-                    if selected_account.account_type in ('ACTIF', 'CHARGE'):
-                        running += line.debit - line.credit
-                    else:
-                        running += line.credit - line.debit
-                    filtered.append({'line': line, 'running_balance': running})
-                ledger_lines = filtered
+    if selected_account:
+        exercise = ExerciseService.get_or_create_current_exercise()
+        try:
+            ledger_page = GeneralLedgerService.get_page(
+                selected_account, exercise, start, end, cursor=request.GET.get('cursor'),
+            )
+        except InvalidCursor:
+            ledger_page = GeneralLedgerService.get_page(selected_account, exercise, start, end)
+        ledger_lines = ledger_page['lines']
+
+        # Totaux et solde de la période entière (soldes journaliers)
+        total_debit, total_credit = GeneralLedgerService.period_totals(selected_account, exercise, start, end)
+        opening = GeneralLedgerService.opening_balance(selected_account, exercise, start)
+        balance = opening + AccountBalanceService.signed_balance(selected_account, total_debit, total_credit)
 
-            total_debit = sum(item['line'].debit for item in ledger_lines)
-            total_credit = sum(item['line'].credit for item in ledger_lines)
-            balance = ledger_lines[-1]['running_balance'] if ledger_lines else 0
+        base_params = {key: value for key, value in request.GET.items() if key != 'cursor'}
+        first_querystring = urlencode(base_params)
+        if ledger_page['next_cursor']:
+            next_querystring = urlencode({**base_params, 'cursor': ledger_page['next_cursor']})
 
     context = {
         'page_title': 'Grand Livre',
         'accounts': accounts,
         'selected_account': selected_account,
+        'ledger_page': ledger_page,
         'ledger_lines': ledger_lines,
         'current_account': account_code,
         'current_date_from': date_from,
@@ -4178,10 +4043,56 @@ def accounting_general_ledger(request):
         'total_debit': total_debit,
         'total_credit': total_credit,
         'balance': balance,
+        'first_querystring': first_querystring,
+        'next_querystring': next_querystring,
+        'export_querystring': urlencode({'account': account_code, 'date_from': date_from, 'date_to': date_to}),
     }
     return render(request, 'core/accounting/general_ledger.html', context)
 
 
+class _Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, value):
+        return value
+
+
+@login_required
+@module_required('accounting')
+def export_general_ledger(request):
+    """Export CSV du grand livre d'un compte, diffusé au fil de la lecture."""
+    import csv
+    from django.http import StreamingHttpResponse
+
+    account, account_code, _, _, start, end = _ledger_filters(request)
+    if account is None:
+        raise Http404("Compte introuvable")
+    exercise = ExerciseService.get_or_create_current_exercise()
+    writer = csv.writer(_Echo(), delimiter=';')
+
+    def rows():
+        yield '\ufeff'  # BOM UTF-8 pour Excel
+        yield writer.writerow(['Grand livre', f'{account.code} - {account.name}', f'Exercice {exercise}'])
+        yield writer.writerow(['Date', 'Référence', 'Libellé', 'Débit', 'Crédit', 'Solde'])
+        opening = GeneralLedgerService.opening_balance(account, exercise, start)
+        if start:
+            yield writer.writerow([start.strftime('%d/%m/%Y'), '', 'Solde reporté', '', '', str(opening)])
+        for item in GeneralLedgerService.iter_lines(account, exercise, start, end):
+            line = item['line']
+            yield writer.writerow([
+                line.entry.date.strftime('%d/%m/%Y'),
+                line.entry.reference,
+                line.description or line.entry.description,
+                str(line.debit),
+                str(line.credit),
+                str(item['running_balance']),
+            ])
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="grand_livre_{account_code}.csv"'
+    return response
+
+
 @login_required
 @module_required('accounting')
 def accounting_trial_balance(request):
@@ -4367,6 +4278,10 @@ def import_chart_of_accounts(request):
                     
             except Exception as e:
                 errors.append(f"Ligne {row_num}: {str(e)}")
+
+        # Plan comptable modifié : cache des comptes à recharger dans tous les workers
+        if accounts_created or accounts_updated:
+            AccountingCacheService.invalidate()
         
         # Message de succès/erreur
         if accounts_created > 0:
@@ -4562,33 +4477,31 @@ def record_credit_payment(request, credit_sale_id):
     if request.method == 'POST':
         form = PaymentForm(request.POST, credit_sale=credit_sale)
         if form.is_valid():
-            payment = form.save(commit=False)
-            payment.credit_sale = credit_sale
-            payment.staff = request.user
-            daily = DailyService.get_or_create_active_daily()
-            payment.daily = daily
-            payment.save()
-
-            # Mettre à jour le CreditSale
-            credit_sale.amount_paid += payment.amount
-            credit_sale.amount_remaining -= payment.amount
-            if credit_sale.amount_remaining <= 0:
-                credit_sale.amount_remaining = 0
-                credit_sale.is_fully_paid = True
-                credit_sale.sale.is_paid = True
-                credit_sale.sale.save(update_fields=['is_paid'])
-            credit_sale.save(update_fields=['amount_paid', 'amount_remaining', 'is_fully_paid'])
-
-            # Écriture comptable
-            try:
+            with transaction.atomic():
+                payment = form.save(commit=False)
+                payment.credit_sale = credit_sale
+                payment.staff = request.user
+                daily = DailyService.get_or_create_active_daily()
+                payment.daily = daily
+                payment.save()
+
+                # Mettre à jour le CreditSale
+                credit_sale.amount_paid += payment.amount
+                credit_sale.amount_remaining -= payment.amount
+                if credit_sale.amount_remaining <= 0:
+                    credit_sale.amount_remaining = 0
+                    credit_sale.is_fully_paid = True
+                    credit_sale.sale.is_paid = True
+                    credit_sale.sale.save(update_fields=['is_paid'])
+                credit_sale.save(update_fields=['amount_paid', 'amount_remaining', 'is_fully_paid'])
+
+                # Écriture comptable (générée par le worker outbox)
                 exercise = daily.exercise if daily else ExerciseService.get_or_create_current_exercise()
-                AccountingService.record_credit_payment(
+                AccountingOutboxService.enqueue_credit_payment(
                     payment=payment,
                     daily=daily,
                     exercise=exercise,
                 )
-            except Exception:
-                pass
 
             messages.success(
                 request,
@@ -4843,36 +4756,29 @@ def treasury_dashboard(request):
 
     exercise = ExerciseService.get_or_create_current_exercise()
 
-    # Comptes de trésorerie (classe 5)
+    # Comptes de trésorerie (classe 5), créances clients (411) et dettes fournisseurs (401)
     treasury_codes = ['571', '521', '585']
+    accounts = {
+        account.code: account
+        for account in Account.objects.filter(code__in=treasury_codes + ['411', '401'], delete_at__isnull=True)
+    }
+    balances = AccountBalanceService.get_balances(accounts.values(), exercise)
+
     treasury_accounts = []
     total_treasury = Decimal('0')
-
     for code in treasury_codes:
-        try:
-            account = Account.objects.get(code=code, delete_at__isnull=True)
-            balance = account.get_balance(exercise)
-            treasury_accounts.append({
-                'account': account,
-                'balance': balance,
-            })
-            total_treasury += balance
-        except Account.DoesNotExist:
-            pass
-
-    # Créances clients (411)
-    try:
-        clients_account = Account.objects.get(code='411', delete_at__isnull=True)
-        clients_balance = clients_account.get_balance(exercise)
-    except Account.DoesNotExist:
-        clients_balance = Decimal('0')
+        account = accounts.get(code)
+        if account is None:
+            continue
+        balance = balances[account.id]
+        treasury_accounts.append({
+            'account': account,
+            'balance': balance,
+        })
+        total_treasury += balance
 
-    # Dettes fournisseurs (401)
-    try:
-        suppliers_account = Account.objects.get(code='401', delete_at__isnull=True)
-        suppliers_balance = suppliers_account.get_balance(exercise)
-    except Account.DoesNotExist:
-        suppliers_balance = Decimal('0')
+    clients_balance = balances[accounts['411'].id] if '411' in accounts else Decimal('0')
+    suppliers_balance = balances[accounts['401'].id] if '401' in accounts else Decimal('0')
 
     # Derniers paiements reçus
     recent_payments = Payment.objects.filter(
@@ -4907,7 +4813,7 @@ def treasury_dashboard(request):
 def income_statement(request):
     """Compte de résultat."""
     exercise = ExerciseService.get_or_create_current_exercise()
-    data = AccountingService.get_income_statement(exercise)
+    data = ReportCacheService.get_report('income_statement', exercise)
 
     context = {
         'page_title': 'Compte de résultat',
@@ -4922,7 +4828,7 @@ def income_statement(request):
 def balance_sheet(request):
     """Bilan comptable."""
     exercise = ExerciseService.get_or_create_current_exercise()
-    data = AccountingService.get_balance_sheet(exercise)
+    data = ReportCacheService.get_report('balance_sheet', exercise)
 
     context = {
         'page_title': 'Bilan comptable',
@@ -4936,11 +4842,23 @@ def balance_sheet(request):
 @module_required('reports')
 def aged_balance(request):
     """Balance âgée (clients ou fournisseurs)."""
+    from core.pagination import InvalidCursor
+
     balance_type = request.GET.get('type', 'client')
     exercise = ExerciseService.get_or_create_current_exercise()
-    data = AccountingService.get_aged_balance(balance_type, exercise)
+    base_params = {key: value for key, value in request.GET.items() if key != 'cursor'}
+    # Totaux par tranche depuis le cache des rapports ; la page du détail est lue par curseur
+    service = AgedBalanceService(balance_type)
+    try:
+        page_obj, items = service.get_page(request.GET.get('cursor'), None, base_params)
+    except InvalidCursor:
+        page_obj, items = service.get_page(None, None, base_params)
+    data = {
+        **ReportCacheService.get_report('aged_balance', balance_type=service.balance_type, today=service.today),
+        'items': items,
+        'page_obj': page_obj,
+    }
 
-    print(data)
     context = {
         'page_title': f"Balance âgée — {data['title']}",
         'exercise': exercise,
@@ -4953,13 +4871,19 @@ def aged_balance(request):
 @login_required
 @module_required('reports')
 def product_margins(request):
-    """Rapport de marge par produit."""
+    """Rapport de marge par produit, sur l'exercice ou une période."""
     exercise = ExerciseService.get_or_create_current_exercise()
-    data = AccountingService.get_product_margins(exercise)
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
+    data = ReportCacheService.get_report(
+        'product_margins', exercise, date_from=parse_date(date_from), date_to=parse_date(date_to),
+    )
 
     context = {
         'page_title': 'Marge par produit',
         'exercise': exercise,
+        'date_from': date_from,
+        'date_to': date_to,
         **data,
     }
     return render(request, 'core/accounting/product_margins.html', context)
@@ -4980,7 +4904,7 @@ def export_report_csv(request, report_type):
 
     if report_type == 'income_statement':
         response['Content-Disposition'] = 'attachment; filename="compte_de_resultat.csv"'
-        data = AccountingService.get_income_statement(exercise)
+        data = ReportCacheService.get_report('income_statement', exercise)
         writer.writerow(['Compte de résultat', f'Exercice {exercise}'])
         writer.writerow([])
         writer.writerow(['PRODUITS'])
@@ -4999,7 +4923,7 @@ def export_report_csv(request, report_type):
 
     elif report_type == 'balance_sheet':
         response['Content-Disposition'] = 'attachment; filename="bilan_comptable.csv"'
-        data = AccountingService.get_balance_sheet(exercise)
+        data = ReportCacheService.get_report('balance_sheet', exercise)
         writer.writerow(['Bilan comptable', f'Exercice {exercise}'])
         writer.writerow([])
         writer.writerow(['ACTIF'])
@@ -5020,10 +4944,13 @@ def export_report_csv(request, report_type):
 
     elif report_type == 'product_margins':
         response['Content-Disposition'] = 'attachment; filename="marges_produits.csv"'
-        data = AccountingService.get_product_margins(exercise)
+        data = ReportCacheService.get_report(
+            'product_margins', exercise,
+            date_from=parse_date(request.GET.get('date_from', '')), date_to=parse_date(request.GET.get('date_to', '')),
+        )
         writer.writerow(['Marge par produit', f'Exercice {exercise}'])
         writer.writerow([])
-        writer.writerow(['Produit', 'Qté vendue', 'CA (FCFA)', 'Prix achat', 'Coût total', 'Marge', 'Marge %'])
+        writer.writerow(['Produit', 'Qté vendue', 'CA (FCFA)', 'Prix achat moyen', 'Coût total', 'Marge', 'Marge %'])
         for item in data['items']:
             writer.writerow([
                 item['product'].name, item['qty_sold'],
@@ -5039,11 +4966,12 @@ def export_report_csv(request, report_type):
     elif report_type == 'aged_balance':
         balance_type = request.GET.get('type', 'client')
         response['Content-Disposition'] = f'attachment; filename="balance_agee_{balance_type}.csv"'
-        data = AccountingService.get_aged_balance(balance_type, exercise)
+        service = AgedBalanceService(balance_type)
+        data = ReportCacheService.get_report('aged_balance', balance_type=service.balance_type, today=service.today)
         writer.writerow([data['title'], f'Exercice {exercise}'])
         writer.writerow([])
         writer.writerow(['Référence', 'Tiers', 'Date', 'Échéance', 'Jours', 'Tranche', 'Montant'])
-        for item in data['items']:
+        for item in service.iter_items():
             writer.writerow([
                 item['reference'], item['tiers'],
                 item['date'].strftime('%d/%m/%Y') if item['date'] else '',
@@ -5068,7 +4996,7 @@ def export_report_csv(request, report_type):
 def vat_declaration(request):
     """Déclaration de TVA."""
     exercise = ExerciseService.get_or_create_current_exercise()
-    data = AccountingService.get_vat_declaration(exercise)
+    data = ReportCacheService.get_report('vat_declaration', exercise)
 
     context = {
         'page_title': 'Déclaration de TVA',
@@ -5108,11 +5036,102 @@ def bank_reconciliation(request):
         'current_account': account_code,
         'date_start': date_start or '',
         'date_end': date_end or '',
+        'reconciliation_runs': BankReconciliationService.recent_runs(data['account']),
+        'min_confidence': BankReconciliationService.default_min_confidence(),
         **data,
     }
     return render(request, 'core/accounting/bank_reconciliation.html', context)
 
 
+def _bank_reconciliation_redirect(request):
+    params = {key: request.POST.get(key) for key in ('account', 'date_start', 'date_end') if request.POST.get(key)}
+    url = reverse('bank_reconciliation')
+    return redirect(f"{url}?{urlencode(params)}" if params else url)
+
+
+@login_required
+@module_required('accounting')
+def import_bank_statement(request):
+    """Import d'un relevé bancaire CSV ou OFX (POST), les opérations déjà importées étant ignorées."""
+    if request.method != 'POST':
+        return redirect('bank_reconciliation')
+
+    file = request.FILES.get('file')
+    if not file:
+        messages.error(request, "Aucun fichier sélectionné.")
+        return _bank_reconciliation_redirect(request)
+
+    try:
+        result = BankStatementImportService.import_file(request.POST.get('account', '521'), file, file.name)
+    except (ValueError, Account.DoesNotExist) as e:
+        messages.error(request, f"Import du relevé impossible : {e}")
+        return _bank_reconciliation_redirect(request)
+
+    messages.success(
+        request,
+        f"Relevé importé : {result['imported']} opération(s) ajoutée(s), "
+        f"{result['duplicates']} doublon(s) ignoré(s)."
+    )
+    if result['error_count']:
+        messages.error(
+            request,
+            f"{result['error_count']} ligne(s) rejetée(s) : " + ' ; '.join(result['errors'][:5])
+        )
+    return _bank_reconciliation_redirect(request)
+
+
+@login_required
+@module_required('accounting')
+def bank_auto_reconcile(request):
+    """Rapprochement automatique des lignes de relevé non rapprochées (POST)."""
+    from datetime import datetime as dt
+
+    if request.method != 'POST':
+        return redirect('bank_reconciliation')
+
+    try:
+        date_start = request.POST.get('date_start')
+        date_end = request.POST.get('date_end')
+        min_confidence = request.POST.get('min_confidence')
+        result = BankReconciliationService.auto_reconcile(
+            request.POST.get('account', '521'),
+            date_start=dt.strptime(date_start, '%Y-%m-%d').date() if date_start else None,
+            date_end=dt.strptime(date_end, '%Y-%m-%d').date() if date_end else None,
+            user=request.user,
+            min_confidence=int(min_confidence) if min_confidence else None,
+        )
+    except (ValueError, Account.DoesNotExist) as e:
+        messages.error(request, f"Rapprochement automatique impossible : {e}")
+        return _bank_reconciliation_redirect(request)
+
+    if result['run']:
+        messages.success(
+            request,
+            f"{result['run'].matched_count} ligne(s) rapprochée(s) automatiquement "
+            f"en {result['duration_ms']} ms."
+        )
+    else:
+        messages.info(request, "Aucune correspondance suffisamment fiable trouvée.")
+    return _bank_reconciliation_redirect(request)
+
+
+@login_required
+@module_required('accounting')
+def bank_reconciliation_undo(request, run_id):
+    """Annule un rapprochement automatique (POST)."""
+    if request.method != 'POST':
+        return redirect('bank_reconciliation')
+
+    try:
+        restored = BankReconciliationService.undo_run(run_id, user=request.user)
+        messages.success(request, f"Rapprochement annulé : {restored} ligne(s) rétablie(s).")
+    except BankReconciliationRun.DoesNotExist:
+        raise Http404("Rapprochement introuvable")
+    except ValueError as e:
+        messages.error(request, str(e))
+    return _bank_reconciliation_redirect(request)
+
+
 @login_required
 @module_required('accounting')
 def reconcile_entry(request):
@@ -5173,6 +5192,7 @@ def exercise_closing_view(request):
 
     # Données pour l'exercice en cours
     income_data = AccountingService.get_income_statement(exercise)
+    pending_closing = ExerciseClosingService.get_pending_closing()
 
     context = {
         'page_title': "Clôture d'exercice",
@@ -5181,6 +5201,7 @@ def exercise_closing_view(request):
         'resultat_net': income_data['resultat_net'],
         'total_produits': income_data['total_produits'],
         'total_charges': income_data['total_charges'],
+        'pending_closing': pending_closing,
     }
     return render(request, 'core/accounting/exercise_closing.html', context)
 
@@ -5194,11 +5215,15 @@ def close_exercise_action(request):
     if request.method != 'POST':
         return redirect('exercise_closing')
 
-    exercise = ExerciseService.get_or_create_current_exercise()
+    # Une clôture interrompue est reprise à l'ouverture du nouvel exercice
+    pending = ExerciseClosingService.get_pending_closing()
+    exercise = pending.exercise if pending else ExerciseService.get_or_create_current_exercise()
 
     try:
-        closing = AccountingService.close_exercise(exercise, user=request.user)
-        new_exercise = AccountingService.open_new_exercise(closing, user=request.user)
+        # Toutes les écritures en file doivent être passées avant la clôture
+        AccountingOutboxService.process_pending()
+        AccountingOutboxService.ensure_exercise_posted(exercise)
+        closing, new_exercise = ExerciseClosingService.close_and_open(exercise, user=request.user)
         messages.success(
             request,
             f"Exercice clôturé avec succès. Résultat : {closing.result_amount} FCFA. "
@@ -5210,3 +5235,48 @@ def close_exercise_action(request):
         messages.error(request, f"Erreur lors de la clôture : {str(e)}")
 
     return redirect('exercise_closing')
+
+
+@login_required
+@module_required('accounting')
+def close_exercise_preview(request):
+    """Aperçu (JSON) de l'écriture de clôture de l'exercice en cours, sans écriture en base."""
+    exercise = ExerciseService.get_or_create_current_exercise()
+    return JsonResponse(ExerciseClosingService.preview(exercise))
+
+
+@login_required
+@module_required('accounting')
+def journal_integrity(request):
+    """
+    Contrôle d'intégrité du journal. Le contrôle n'est lancé qu'à la demande
+    (?run=1) ; ?format=json renvoie le rapport brut.
+    """
+    exercises = Exercise.objects.filter(delete_at__isnull=True).order_by('-start_date')
+    exercise = None
+    exercise_id = request.GET.get('exercise')
+    if exercise_id:
+        exercise = exercises.filter(pk=exercise_id).first() if exercise_id.isdigit() else None
+        if exercise is None:
+            raise Http404("Exercice introuvable")
+
+    report = None
+    if request.GET.get('run') or request.GET.get('format') == 'json':
+        report = JournalIntegrityService(exercise).run()
+        if request.GET.get('format') == 'json':
+            return JsonResponse(report, json_dumps_params={'ensure_ascii': False})
+
+    context = {
+        'page_title': "Intégrité du journal",
+        'exercises': exercises,
+        'selected_exercise': exercise,
+        'report': report,
+    }
+    return render(request, 'core/accounting/journal_integrity.html', context)
+
+
+@login_required
+@module_required('accounting')
+def accounting_outbox_status(request):
+    """État de l'outbox comptable (JSON) : file en attente, échecs et retard."""
+    return JsonResponse(AccountingOutboxService.get_status())
@@ -1,10 +1,12 @@
 #!/bin/bash
 # set -e
 
-echo "Exécution des migrations..."
-python manage.py makemigrations --noinput
-python manage.py migrate --noinput
-python manage.py collectstatic --noinput
+if [ "$SKIP_MIGRATIONS" != "1" ]; then
+    echo "Exécution des migrations..."
+    python manage.py makemigrations --noinput
+    python manage.py migrate --noinput
+    python manage.py collectstatic --noinput
+fi
 
-echo "Démarrage de Gunicorn..."
+echo "Démarrage du processus..."
 exec "$@"